@@ -7,9 +7,13 @@ SYSTEM_OPERATIONS_PORT=$6
 
 SOURCE_PATH=/work/workspace/${MODEL_NAME}_Dev_free
 ROOT_PATH=/work/workspace/${MODEL_NAME}_Dev_free_eval
-cp -r ${SOURCE_PATH} ${ROOT_PATH}
+# 报告生成阶段被改动的不可变输入（只报告，不中止评测；评测工作目录的清单沿用原始哈希，评分前会再次报告）
+python Generation/materialize.py verify ${SOURCE_PATH}
+# 测试数据等不可变输入以 reflink / 硬链接共享，其余文件复制（见 Generation/materialize.py）
+python Generation/materialize.py tree ${SOURCE_PATH} ${ROOT_PATH} || exit 1
 bash Evaluation/start_adk_server_free.sh ${MODEL_NAME} ${ROOT_PATH} ${PORT} ${PYTHON_INTERPRETER_PORT} ${FILE_OPERATIONS_PORT} ${SYSTEM_OPERATIONS_PORT}
-sleep 15
 python Evaluation/delete_query_json.py ${ROOT_PATH}
 python Evaluation/generate_code_FD.py --local_port ${PORT} --root_path ${ROOT_PATH} --round ${ROUND}
+# 报告评测过程中被改动的测试数据，涉及项目的分数可能不可靠
+python Generation/materialize.py verify ${ROOT_PATH}
 python Evaluation/score_cal.py --base_path ${ROOT_PATH} --round ${ROUND}
\ No newline at end of file
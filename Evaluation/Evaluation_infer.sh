@@ -4,12 +4,30 @@ ROUND=$3
 PYTHON_INTERPRETER_PORT=$4
 FILE_OPERATIONS_PORT=$5
 SYSTEM_OPERATIONS_PORT=$6
+# 可选：启动的ADK服务器数量，端口从 $PORT 开始连续分配（默认1个）；ready_test 把会话分散到这些服务上
+NUM_SERVERS=${7:-1}
+PORTS=$(seq -s, ${PORT} $((PORT + NUM_SERVERS - 1)))
+# 可选：评分提示词布局，默认 legacy（与已发布的评测设置一致）；PROMPT_LAYOUT=cached 便于命中提示词缓存，
+# PROJECT_CONTEXT_CHARS>0 时 cached 布局附带项目快照。两者都会改变评分提示词，分数不能与 legacy 直接比较
+PROMPT_LAYOUT=${PROMPT_LAYOUT:-legacy}
+PROJECT_CONTEXT_CHARS=${PROJECT_CONTEXT_CHARS:-0}
 
 SOURCE_PATH=/work/workspace/${MODEL_NAME}_Dev_inference
 ROOT_PATH=/work/workspace/${MODEL_NAME}_Dev_inference_eval
-cp -r ${SOURCE_PATH} ${ROOT_PATH}
-bash Evaluation/start_adk_server.sh ${MODEL_NAME} ${ROOT_PATH} ${PORT} ${PYTHON_INTERPRETER_PORT} ${FILE_OPERATIONS_PORT} ${SYSTEM_OPERATIONS_PORT}
-sleep 15
+# 报告生成阶段被改动的不可变输入（只报告，不中止评测；评测工作目录的清单沿用原始哈希，评分前会再次报告）
+python Generation/materialize.py verify ${SOURCE_PATH}
+# 测试数据等不可变输入以 reflink / 硬链接共享，其余文件复制（见 Generation/materialize.py）
+python Generation/materialize.py tree ${SOURCE_PATH} ${ROOT_PATH} || exit 1
 python Evaluation/delete_query_json.py ${ROOT_PATH}
-python Evaluation/ready_test.py --local_port ${PORT} --model_name ${MODEL_NAME} --root_path ${ROOT_PATH} --round ${ROUND}
-python Evaluation/score_cal.py --base_path ${ROOT_PATH} --round ${ROUND}
\ No newline at end of file
+# 启动并守护 MCP 服务和 ADK 服务，全部就绪后立即开始评测，结束后停止服务
+python Evaluation/adk_launcher.py --model_name ${MODEL_NAME} --root_path ${ROOT_PATH} --ports ${PORTS} \
+    --python_port ${PYTHON_INTERPRETER_PORT} --file_port ${FILE_OPERATIONS_PORT} --system_port ${SYSTEM_OPERATIONS_PORT} \
+    -- python Evaluation/ready_test.py --local_port ${PORTS} --model_name ${MODEL_NAME} --root_path ${ROOT_PATH} --round ${ROUND} --max_workers $((8 * NUM_SERVERS)) \
+       --prompt_layout ${PROMPT_LAYOUT} --project_context_chars ${PROJECT_CONTEXT_CHARS}
+# 报告评测过程中被改动的测试数据，涉及项目的分数可能不可靠
+python Generation/materialize.py verify ${ROOT_PATH}
+python Evaluation/score_cal.py --base_path ${ROOT_PATH} --round ${ROUND}
+# 运行前 export TRACE_DIR=<目录> 时，ADK 服务和 ready_test 把工具调用、LLM 调用、HTTP 请求的 span 写入该目录，这里输出汇总
+if [ -n "${TRACE_DIR}" ]; then
+    python Evaluation/adk_example/tracing.py summary ${TRACE_DIR} --by name
+fi
@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+"""
+ADK api_server 的异步 HTTP 客户端
+
+所有驱动脚本（ready_test / generate_code_FD / generate_dev / generate_free / generate_debug）共用：
+  - 基于 aiohttp 的连接池（keep-alive），不再为每个请求新建 TCP 连接
+  - 每次调用都有截止时间，/run 卡死不会永远阻塞 worker
+  - 连接失败 / 连接被重置 / 5xx 时指数退避重试
+  - 支持取消：异步接口可直接 cancel task，同步接口超时或中断时会取消底层请求
+  - 多个 api_server 组成服务池：新会话分配给在途请求最少的健康服务，
+    服务不再响应时标记为不健康，并在其他服务上重建会话后重发请求（/run 超时除外，见 AdkServerPool.run）
+
+异步用法：
+    async with AdkClient("http://localhost:8010", "code_eval_agent_workspace_dir", "model") as client:
+        await client.create_session("s_1")
+        response = await client.run("s_1", "prompt")
+
+同步用法（线程 / 进程池中的旧代码）：
+    client = get_sync_client("http://localhost:8010", "code_eval_agent_workspace_dir", "model")
+    # 多个服务：传入地址列表，或用 base_urls_from_ports("8010,8011")
+    client = get_sync_client(base_urls_from_ports("8010,8011"), "code_eval_agent_workspace_dir", "model")
+    client.create_session("s_1")
+    response = client.run("s_1", "prompt")
+
+返回值与原来的 requests 写法保持一致：成功时为服务端返回的 JSON，
+网络错误为 {"error": "network_error", "message": ...}，响应不是 JSON 时为 {"error": "json_decode_error", "text": ...}。
+"""
+
+import asyncio
+import atexit
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+import aiohttp
+
+# span 记录与 ADK 服务共用 adk_example/tracing.py（ADK 服务由 adk api_server 把 adk_example 加入 sys.path）
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'adk_example'))
+import tracing
+
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_SESSION_TIMEOUT = 60
+DEFAULT_RUN_TIMEOUT = 3600
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF = 1.0
+DEFAULT_POOL_SIZE = 256
+# 不健康的服务至少间隔多久重新探测一次（秒）
+DEFAULT_HEALTH_INTERVAL = 10
+HEALTH_TIMEOUT = 5
+# api_server 上开销最小的只读接口，用作健康探测
+HEALTH_PATH = "/list-apps"
+
+# 会话的创建/删除是幂等的，任何 5xx 都可以重试；
+# /run 会真正执行一轮 agent，只在请求没有到达 agent 时（网关/服务不可用）重试
+SESSION_RETRY_STATUSES = frozenset({500, 502, 503, 504})
+RUN_RETRY_STATUSES = frozenset({502, 503, 504})
+
+
+class AdkRequestError(Exception):
+    """请求最终失败（重试耗尽、超时或连接错误）"""
+
+
+class AdkTimeoutError(AdkRequestError):
+    """请求超过截止时间"""
+
+
+def base_urls_from_ports(ports, host="localhost"):
+    """把 "8010,8011"（或端口列表）转换为服务地址列表"""
+    if isinstance(ports, (str, int)):
+        ports = str(ports).split(',')
+    return [f"http://{host}:{str(port).strip()}" for port in ports if str(port).strip()]
+
+
+class AdkClient:
+    """
+    ADK api_server 的异步客户端，同一个实例内的请求共用一个连接池
+
+    Args:
+        base_url: 服务地址，例如 http://localhost:8010
+        app_name: agent 包名，例如 code_eval_agent_workspace_dir
+        user_id: 用户ID（驱动脚本中使用模型名）
+        pool_size: 连接池大小上限
+        connect_timeout: 建立连接的超时时间（秒）
+        session_timeout: 会话创建/删除的截止时间（秒）
+        run_timeout: /run 的截止时间（秒）
+        max_retries: 最大重试次数
+        backoff: 重试退避的基础时间（秒），第 n 次重试等待 backoff * 2^(n-1) 加随机抖动
+    """
+
+    def __init__(self, base_url, app_name, user_id, pool_size=DEFAULT_POOL_SIZE,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT, session_timeout=DEFAULT_SESSION_TIMEOUT,
+                 run_timeout=DEFAULT_RUN_TIMEOUT, max_retries=DEFAULT_MAX_RETRIES, backoff=DEFAULT_BACKOFF):
+        self.base_url = base_url.rstrip('/')
+        self.app_name = app_name
+        self.user_id = user_id
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.session_timeout = session_timeout
+        self.run_timeout = run_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._http = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def _get_http(self):
+        # aiohttp.ClientSession 必须在事件循环内创建，这里延迟到第一次请求时
+        if self._http is None or self._http.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            self._http = aiohttp.ClientSession(connector=connector,
+                                               headers={"Content-Type": "application/json"})
+        return self._http
+
+    async def close(self):
+        if self._http is not None and not self._http.closed:
+            await self._http.close()
+        self._http = None
+
+    def session_path(self, session_id):
+        return f"/apps/{self.app_name}/users/{self.user_id}/sessions/{session_id}"
+
+    async def request(self, method, path, payload=None, timeout=None, retry_statuses=SESSION_RETRY_STATUSES):
+        """
+        发送请求，连接错误和 retry_statuses 中的状态码按指数退避重试
+
+        Returns:
+            (status, text)
+
+        Raises:
+            AdkRequestError: 重试耗尽、超时或连接错误
+            asyncio.CancelledError: 调用方取消
+        """
+        url = self.base_url + path
+        client_timeout = aiohttp.ClientTimeout(total=timeout or self.session_timeout,
+                                               sock_connect=self.connect_timeout)
+        # /run 的会话ID在请求体中，会话接口的在路径末尾
+        session_id = payload.get("sessionId") if path == "/run" and payload else path.rsplit('/', 1)[-1]
+        with tracing.span("http.run" if path == "/run" else f"http.session.{method.lower()}", "http",
+                          session_id=session_id, server=self.base_url) as http_span:
+            http_span.set(bytes_in=tracing.payload_size(payload))
+            last_error = None
+            for attempt in range(self.max_retries + 1):
+                if attempt > 0:
+                    delay = self.backoff * (2 ** (attempt - 1))
+                    await asyncio.sleep(delay + random.uniform(0, delay / 2))
+                try:
+                    async with self._get_http().request(method, url, json=payload, timeout=client_timeout) as response:
+                        text = await response.text()
+                        if response.status in retry_statuses and attempt < self.max_retries:
+                            last_error = f"HTTP {response.status}: {text[:200]}"
+                            print(f"{method} {path} 返回 {response.status}，第{attempt + 1}次重试")
+                            continue
+                        http_span.set(status_code=response.status, attempts=attempt + 1,
+                                      bytes_out=tracing.payload_size(text))
+                        return response.status, text
+                except asyncio.TimeoutError:
+                    # 超过截止时间不重试，避免把一次卡住的 /run 再执行一遍
+                    raise AdkTimeoutError(f"{method} {url} 超过截止时间 {client_timeout.total}s")
+                except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError) as e:
+                    last_error = f"{type(e).__name__}: {e}"
+                    if attempt < self.max_retries:
+                        print(f"{method} {path} 连接错误: {last_error}，第{attempt + 1}次重试")
+            raise AdkRequestError(f"{method} {url} 重试 {self.max_retries} 次后仍失败: {last_error}")
+
+    @staticmethod
+    def parse_response(status, text):
+        try:
+            return json.loads(text)
+        except ValueError:
+            return {"error": "json_decode_error", "status": status, "text": text}
+
+    async def delete_session(self, session_id):
+        """删除会话，返回状态码；网络错误时返回 None"""
+        try:
+            status, _ = await self.request("DELETE", self.session_path(session_id))
+            return status
+        except AdkRequestError as e:
+            print(f"删除会话时网络请求错误: {e}")
+            return None
+
+    async def create_session(self, session_id, state=None, replace=True):
+        """
+        创建会话（replace 为 True 时先删除同名会话）
+
+        Returns:
+            dict: 服务端返回的会话信息，或 network_error / json_decode_error
+        """
+        if replace:
+            await self.delete_session(session_id)
+        try:
+            status, text = await self.request("POST", self.session_path(session_id), payload=state)
+        except AdkRequestError as e:
+            return {"error": "network_error", "message": str(e)}
+        if status != 200:
+            print(f"创建会话失败，状态码: {status}")
+        return self.parse_response(status, text)
+
+    def run_payload(self, session_id, prompt):
+        return {
+            "appName": self.app_name,
+            "userId": self.user_id,
+            "sessionId": session_id,
+            "newMessage": {
+                "role": "user",
+                "parts": [{"text": prompt}]
+            }
+        }
+
+    async def run(self, session_id, prompt, timeout=None):
+        """
+        在会话中发送一条用户消息并等待 agent 完成
+
+        Returns:
+            服务端返回的事件列表，或 network_error / json_decode_error
+        """
+        try:
+            status, text = await self.request("POST", "/run", payload=self.run_payload(session_id, prompt),
+                                              timeout=timeout or self.run_timeout, retry_statuses=RUN_RETRY_STATUSES)
+        except AdkRequestError as e:
+            return {"error": "network_error", "message": str(e)}
+        if status != 200:
+            print(f"查询失败，状态码: {status}")
+        return self.parse_response(status, text)
+
+    async def check_health(self):
+        """服务是否能在 HEALTH_TIMEOUT 内正常响应"""
+        try:
+            async with self._get_http().get(self.base_url + HEALTH_PATH,
+                                            timeout=aiohttp.ClientTimeout(total=HEALTH_TIMEOUT)) as response:
+                await response.read()
+                return response.status < 500
+        except (asyncio.TimeoutError, aiohttp.ClientError):
+            return False
+
+
+class _PoolServer:
+    """服务池中的一个 api_server"""
+
+    def __init__(self, client):
+        self.client = client
+        self.outstanding = 0
+        self.healthy = True
+        self.last_probe = 0.0
+
+
+class AdkServerPool:
+    """
+    多个 api_server 组成的服务池，接口与 AdkClient 相同（create_session / run / delete_session / close）
+
+    - 会话绑定在创建它的服务上（api_server 的会话保存在各自进程内）
+    - 新会话分配给在途请求最少的健康服务
+    - 连接失败或重试耗尽时将服务标记为不健康，/run 超时后先探测一次健康状态再决定；
+      随后在其他服务上用相同的初始 state 重建会话并重发本次消息
+      （驱动脚本中每个会话只发一条消息，重建会话不会丢失上下文）
+    - 不健康的服务每隔 health_interval 秒在分配时重新探测，恢复后重新参与分配
+
+    Args:
+        base_urls: 服务地址列表
+        health_interval: 不健康服务的重新探测间隔（秒）
+        其余参数传给每个服务的 AdkClient
+    """
+
+    def __init__(self, base_urls, app_name, user_id, health_interval=DEFAULT_HEALTH_INTERVAL, **client_kwargs):
+        if not base_urls:
+            raise ValueError("服务池至少需要一个服务地址")
+        self.app_name = app_name
+        self.user_id = user_id
+        self.health_interval = health_interval
+        self.servers = [_PoolServer(AdkClient(url, app_name, user_id, **client_kwargs)) for url in base_urls]
+        # session_id -> (_PoolServer, 创建会话时的 state)
+        self._sessions = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        for server in self.servers:
+            await server.client.close()
+
+    def server_for(self, session_id):
+        """会话所在服务的地址，会话不存在时返回 None"""
+        binding = self._sessions.get(session_id)
+        return binding[0].client.base_url if binding else None
+
+    async def _probe(self, server):
+        server.last_probe = time.monotonic()
+        healthy = await server.client.check_health()
+        if healthy and not server.healthy:
+            print(f"ADK 服务 {server.client.base_url} 已恢复")
+        server.healthy = healthy
+        return healthy
+
+    def _mark_unhealthy(self, server, reason):
+        if server.healthy:
+            print(f"ADK 服务 {server.client.base_url} 不可用，暂停分配: {reason}")
+        server.healthy = False
+        server.last_probe = time.monotonic()
+
+    async def _pick(self, exclude=()):
+        """选择在途请求最少的健康服务；到期的不健康服务先探测一次"""
+        now = time.monotonic()
+        due = [server for server in self.servers
+               if not server.healthy and server not in exclude and now - server.last_probe >= self.health_interval]
+        if due:
+            await asyncio.gather(*[self._probe(server) for server in due])
+        candidates = [server for server in self.servers if server.healthy and server not in exclude]
+        if not candidates:
+            # 全部不健康时仍然尝试在途最少的服务，由请求本身的重试决定成败
+            candidates = [server for server in self.servers if server not in exclude] or self.servers
+        return min(candidates, key=lambda server: server.outstanding)
+
+    async def _request(self, server, method, path, **kwargs):
+        server.outstanding += 1
+        try:
+            return await server.client.request(method, path, **kwargs)
+        finally:
+            server.outstanding -= 1
+
+    async def _should_fail_over(self, server, error):
+        """请求失败后判断服务是否已不可用"""
+        if isinstance(error, AdkTimeoutError):
+            # /run 超时可能只是 agent 执行时间过长，探测通过时不切换
+            if await self._probe(server):
+                return False
+        self._mark_unhealthy(server, error)
+        return True
+
+    async def delete_session(self, session_id):
+        binding = self._sessions.pop(session_id, None)
+        if binding is None:
+            return None
+        try:
+            status, _ = await self._request(binding[0], "DELETE", binding[0].client.session_path(session_id))
+            return status
+        except AdkRequestError as e:
+            print(f"删除会话时网络请求错误: {e}")
+            return None
+
+    async def _create_on(self, server, session_id, state):
+        status, text = await self._request(server, "POST", server.client.session_path(session_id), payload=state)
+        if status != 200:
+            print(f"创建会话失败，状态码: {status}")
+        else:
+            self._sessions[session_id] = (server, state)
+        return server.client.parse_response(status, text)
+
+    async def create_session(self, session_id, state=None, replace=True):
+        """在在途请求最少的健康服务上创建会话，服务不可用时换下一个"""
+        if replace:
+            await self.delete_session(session_id)
+        tried = []
+        while True:
+            server = await self._pick(exclude=tried)
+            try:
+                return await self._create_on(server, session_id, state)
+            except AdkRequestError as e:
+                tried.append(server)
+                if not await self._should_fail_over(server, e) or len(tried) >= len(self.servers):
+                    return {"error": "network_error", "message": str(e)}
+
+    async def run(self, session_id, prompt, timeout=None):
+        """
+        在会话所在服务上发送消息；服务不可用时在其他服务上重建会话后重发，/run 超时时不重发
+
+        Returns:
+            服务端返回的事件列表，或 network_error / json_decode_error
+        """
+        binding = self._sessions.get(session_id)
+        server, state = binding if binding else (await self._pick(), None)
+        tried = []
+        while True:
+            if session_id not in self._sessions or self._sessions[session_id][0] is not server:
+                try:
+                    await self._create_on(server, session_id, state)
+                except AdkRequestError as e:
+                    if server not in tried:
+                        tried.append(server)
+                    if len(tried) >= len(self.servers) or not await self._should_fail_over(server, e):
+                        return {"error": "network_error", "message": str(e)}
+                    server = await self._pick(exclude=tried)
+                    continue
+            try:
+                status, text = await self._request(
+                    server, "POST", "/run", payload=server.client.run_payload(session_id, prompt),
+                    timeout=timeout or server.client.run_timeout, retry_statuses=RUN_RETRY_STATUSES)
+            except AdkRequestError as e:
+                if server not in tried:
+                    tried.append(server)
+                if isinstance(e, AdkTimeoutError):
+                    # 客户端超时时上一次 /run 可能仍在服务端执行，用同一个会话ID重发会让两个 agent 同时操作同一个会话，
+                    # 因此不重发；只探测服务，不可用时标记为不健康，之后的新会话不再分配到该服务
+                    await self._should_fail_over(server, e)
+                    return {"error": "network_error", "message": str(e)}
+                if len(tried) >= len(self.servers) or not await self._should_fail_over(server, e):
+                    return {"error": "network_error", "message": str(e)}
+                self._sessions.pop(session_id, None)
+                server = await self._pick(exclude=tried)
+                print(f"会话 {session_id} 切换到 {server.client.base_url} 重建后重发")
+                continue
+            if status == 404 and server not in tried:
+                # 服务重启后会话丢失：在同一服务上重建一次
+                print(f"会话 {session_id} 在 {server.client.base_url} 上不存在，重建后重发")
+                tried.append(server)
+                self._sessions.pop(session_id, None)
+                continue
+            if status != 200:
+                print(f"查询失败，状态码: {status}")
+            return server.client.parse_response(status, text)
+
+
+class SyncAdkClient:
+    """
+    AdkClient / AdkServerPool 的同步封装，供线程池 / 进程池中的旧代码使用
+
+    所有实例共用一个后台线程上的事件循环和连接池；
+    调用方超时或收到 KeyboardInterrupt 时会取消底层请求
+    """
+
+    def __init__(self, client, loop):
+        self.client = client
+        self._loop = loop
+
+    def _call(self, coro, timeout=None):
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def delete_session(self, session_id):
+        return self._call(self.client.delete_session(session_id))
+
+    def create_session(self, session_id, state=None, replace=True):
+        return self._call(self.client.create_session(session_id, state, replace))
+
+    def run(self, session_id, prompt, timeout=None):
+        return self._call(self.client.run(session_id, prompt, timeout))
+
+
+_loop = None
+_loop_pid = None
+_clients = {}
+_lock = threading.Lock()
+
+
+def _background_loop():
+    """当前进程的后台事件循环（fork 出的子进程会重新创建）"""
+    global _loop, _loop_pid
+    if _loop is None or _loop_pid != os.getpid():
+        _loop = asyncio.new_event_loop()
+        _loop_pid = os.getpid()
+        _clients.clear()
+        threading.Thread(target=_loop.run_forever, name="adk-client-loop", daemon=True).start()
+    return _loop
+
+
+def _close_clients():
+    """进程退出时关闭连接池"""
+    if _loop is None or _loop_pid != os.getpid() or not _loop.is_running():
+        return
+    for sync_client in list(_clients.values()):
+        try:
+            asyncio.run_coroutine_threadsafe(sync_client.client.close(), _loop).result(5)
+        except Exception:
+            pass
+
+
+atexit.register(_close_clients)
+
+
+def make_client(base_url, app_name, user_id, **kwargs):
+    """单个地址返回 AdkClient，多个地址返回 AdkServerPool（多地址时可额外传 health_interval）"""
+    if isinstance(base_url, (list, tuple)):
+        if len(base_url) > 1:
+            return AdkServerPool(list(base_url), app_name, user_id, **kwargs)
+        base_url = base_url[0]
+    kwargs.pop('health_interval', None)
+    return AdkClient(base_url, app_name, user_id, **kwargs)
+
+
+def get_sync_client(base_url, app_name, user_id, **kwargs):
+    """
+    获取（并缓存）同步客户端，同一进程内相同 (base_url, app_name, user_id) 且客户端参数相同时共用一个连接池
+    base_url 为地址列表时使用服务池
+    """
+    with _lock:
+        loop = _background_loop()
+        url_key = tuple(base_url) if isinstance(base_url, (list, tuple)) else base_url
+        # 超时、重试等参数也是键的一部分，参数不同的调用不会拿到按其他参数创建的客户端
+        key = (url_key, app_name, user_id, tuple(sorted(kwargs.items())))
+        if key not in _clients:
+            _clients[key] = SyncAdkClient(make_client(base_url, app_name, user_id, **kwargs), loop)
+        return _clients[key]
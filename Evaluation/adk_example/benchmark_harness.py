@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""
+编排开销的端到端基准测试（不调用真实模型）
+
+启动 mock_llm_backend.py（脚本回复或回放录制的会话，按配置的延迟分布回复），
+经 adk_launcher.py 以 ADK_MODEL=mock_local 启动 MCP 服务和 ADK 服务，运行生成驱动（run_generation.py）
+和 / 或评测驱动（ready_test.py），TRACE_DIR 下的 span（见 tracing.py）用于统计：
+  - 吞吐：每分钟完成的 metric（评测）/ 项目（生成）数
+  - 每个 metric / 项目的 p50、p99 延迟（评测为 ready_test 的 metric / metric_batch span，生成为同一会话的 http.run span）
+  - ADK 服务进程（含子进程）的 CPU 时间、平均 CPU 占用和 RSS（从 /proc 采样）
+结果写入 <workdir>/benchmark_<suite>.json，--compare 与之前的结果对比，用于发现编排开销的回退。
+
+用法（在仓库根目录运行）：
+  python Evaluation/adk_example/benchmark_harness.py --suite both --projects 1,2,3 --workdir /tmp/adk_bench
+  python Evaluation/adk_example/benchmark_harness.py --suite eval --projects 1,2 --latency lognormal:1.5,0.6 \\
+      --replay sessions.jsonl --path_map /work/workspace/gpt_5_Dev_inference_eval=/tmp/adk_bench/eval
+  python Evaluation/adk_example/benchmark_harness.py --suite eval --compare /tmp/adk_bench/benchmark_eval.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+import tracing
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(os.path.dirname(HERE))
+
+MOCK_MODEL = 'mock_local'
+BENCH_MODEL_NAME = 'bench'
+MOCK_START_TIMEOUT = 30
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+# 对比时这些指标越小越好，其余（吞吐）越大越好
+LOWER_IS_BETTER = ('latency', 'cpu', 'rss', 'wall')
+
+
+# ---------------------------------------------------------------------------
+# ADK 服务进程的 CPU / RSS 采样
+# ---------------------------------------------------------------------------
+
+def _read_proc_table():
+    """返回 {pid: (ppid, cmdline 参数列表)}"""
+    table = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat', 'r') as f:
+                stat = f.read()
+            with open(f'/proc/{name}/cmdline', 'rb') as f:
+                cmdline = f.read().decode('utf-8', errors='replace').split('\0')
+        except OSError:
+            continue
+        # comm 可能包含空格，从最后一个 ')' 之后解析
+        fields = stat[stat.rfind(')') + 2:].split()
+        table[int(name)] = (int(fields[1]), cmdline)
+    return table
+
+
+def _read_usage(pid):
+    """返回 (CPU 秒数, RSS 字节)，进程已退出时返回 None"""
+    try:
+        with open(f'/proc/{pid}/stat', 'r') as f:
+            stat = f.read()
+        with open(f'/proc/{pid}/statm', 'r') as f:
+            resident = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    fields = stat[stat.rfind(')') + 2:].split()
+    # utime / stime 是 stat 的第 14、15 个字段（从 state 开始数为第 12、13 个）
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS, resident * PAGE_SIZE
+
+
+def find_adk_server_pids(ports):
+    """找到 `adk api_server --port <port>` 进程及其所有子进程"""
+    table = _read_proc_table()
+    roots = set()
+    for pid, (_, cmdline) in table.items():
+        if 'api_server' in cmdline and '--port' in cmdline:
+            index = cmdline.index('--port')
+            if index + 1 < len(cmdline) and cmdline[index + 1] in ports:
+                roots.add(pid)
+    children = defaultdict(list)
+    for pid, (ppid, _) in table.items():
+        children[ppid].append(pid)
+    pids, stack = set(), list(roots)
+    while stack:
+        pid = stack.pop()
+        if pid not in pids:
+            pids.add(pid)
+            stack.extend(children[pid])
+    return pids
+
+
+class ProcessSampler(threading.Thread):
+    """后台定期采样 ADK 服务进程；进程重启或退出后保留其最后一次的 CPU 时间"""
+
+    def __init__(self, ports, interval=1.0):
+        super().__init__(daemon=True)
+        self.ports = [str(port) for port in ports]
+        self.interval = interval
+        self.cpu_by_pid = {}
+        self.rss_samples = []
+        self.started_at = None
+        self.stopped_at = None
+        self._halt = threading.Event()
+
+    def sample(self):
+        rss = 0
+        for pid in find_adk_server_pids(self.ports):
+            usage = _read_usage(pid)
+            if usage is None:
+                continue
+            self.cpu_by_pid[pid] = usage[0]
+            rss += usage[1]
+        if rss:
+            self.rss_samples.append(rss)
+
+    def run(self):
+        self.started_at = time.time()
+        while not self._halt.is_set():
+            self.sample()
+            self._halt.wait(self.interval)
+
+    def stop(self):
+        self._halt.set()
+        self.join()
+        self.stopped_at = time.time()
+
+    def result(self):
+        elapsed = (self.stopped_at or time.time()) - (self.started_at or time.time())
+        cpu_seconds = sum(self.cpu_by_pid.values())
+        mb = 1024 * 1024
+        return {
+            'processes': len(self.cpu_by_pid),
+            'cpu_seconds': round(cpu_seconds, 2),
+            'cpu_percent': round(100 * cpu_seconds / elapsed, 1) if elapsed > 0 else 0,
+            'peak_rss_mb': round(max(self.rss_samples) / mb, 1) if self.rss_samples else 0,
+            'mean_rss_mb': round(sum(self.rss_samples) / len(self.rss_samples) / mb, 1) if self.rss_samples else 0,
+        }
+
+
+# ---------------------------------------------------------------------------
+# 模拟后端
+# ---------------------------------------------------------------------------
+
+class MockServer:
+    """以子进程运行 mock_llm_backend.py"""
+
+    def __init__(self, args, log_path):
+        self.port = args.mock_port
+        self.command = [sys.executable, os.path.join(HERE, 'mock_llm_backend.py'), '--port', str(self.port),
+                        '--turns', str(args.turns), '--latency', args.latency,
+                        '--token_latency', str(args.token_latency)]
+        if args.seed is not None:
+            self.command += ['--seed', str(args.seed)]
+        if args.replay:
+            self.command += ['--replay', args.replay]
+        for item in args.path_map:
+            self.command += ['--path_map', item]
+        self.log_path = log_path
+        self.process = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def get(self, path):
+        with urllib.request.urlopen(self.base_url + path, timeout=5) as response:
+            return json.load(response)
+
+    def start(self):
+        log_file = open(self.log_path, 'a', encoding='utf-8')
+        self.process = subprocess.Popen(self.command, stdout=log_file, stderr=subprocess.STDOUT)
+        log_file.close()
+        deadline = time.time() + MOCK_START_TIMEOUT
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"模拟后端退出（退出码 {self.process.returncode}），见 {self.log_path}")
+            try:
+                self.get('/health')
+                return
+            except (urllib.error.URLError, OSError, ValueError):
+                time.sleep(0.2)
+        raise RuntimeError(f"模拟后端 {MOCK_START_TIMEOUT}s 内未就绪，见 {self.log_path}")
+
+    def stats(self):
+        try:
+            stats = self.get('/stats')
+        except (urllib.error.URLError, OSError, ValueError):
+            return {}
+        stats.pop('sessions', None)
+        return stats
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait()
+
+
+# ---------------------------------------------------------------------------
+# 工作目录、运行与统计
+# ---------------------------------------------------------------------------
+
+def run_step(command):
+    print(f"[bench] {' '.join(command)}")
+    subprocess.run(command, cwd=REPO_ROOT, check=True)
+
+
+def prepare_workspaces(args):
+    """
+    按 --projects 从 PRDbench 物化生成工作目录（copy_infer.py），评测工作目录再由生成目录物化（与 Evaluation_infer.sh 一致）
+
+    Returns:
+        tuple: (生成工作目录, 评测工作目录)
+    """
+    gen_root = os.path.join(args.workdir, 'gen')
+    eval_root = os.path.join(args.workdir, 'eval')
+    subset = os.path.join(args.workdir, 'source')
+    for path in (gen_root, eval_root, subset):
+        shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(subset)
+    for project in args.projects:
+        source = os.path.abspath(os.path.join(args.prdbench, project))
+        if not os.path.isdir(source):
+            raise RuntimeError(f"项目不存在: {source}")
+        os.symlink(source, os.path.join(subset, project))
+    run_step([sys.executable, 'Generation/copy_infer.py', subset, gen_root])
+    return gen_root, eval_root
+
+
+def suite_commands(suite, args, gen_root, eval_root):
+    """返回 (adk_launcher.py 所在侧, 工作目录, 工作命令)"""
+    if suite == 'gen':
+        return 'Generation', gen_root, [
+            sys.executable, 'Generation/run_generation.py', '--mode', 'dev', '--model_name', BENCH_MODEL_NAME,
+            '--ports', ','.join(args.ports), '--root_path', gen_root, '--ids', ','.join(args.projects),
+            '--max_in_flight', str(args.max_in_flight),
+        ] + args.gen_args.split()
+    return 'Evaluation', eval_root, [
+        sys.executable, 'Evaluation/ready_test.py', '--local_port', ','.join(args.ports),
+        '--model_name', BENCH_MODEL_NAME, '--root_path', eval_root, '--round', '1',
+        '--max_workers', str(args.max_in_flight),
+    ] + args.eval_args.split()
+
+
+def measure_units(spans, suite):
+    """
+    把 span 归并为评测 metric（按项目和 metric 名，包含重试）或生成项目（按会话）
+
+    Returns:
+        tuple: (每个单位的耗时列表, 完成的单位数, 开始时间, 结束时间)
+    """
+    groups = defaultdict(lambda: {'duration': 0.0, 'weight': 1, 'start': None, 'end': None})
+    for item in spans:
+        if suite == 'eval' and item.get('cat') == 'driver' and item['name'] in ('metric', 'metric_batch'):
+            key = (item.get('project_id'), item.get('metric'))
+        elif suite == 'gen' and item.get('cat') == 'http' and item['name'] == 'http.run':
+            key = item.get('session_id')
+        else:
+            continue
+        group = groups[key]
+        group['duration'] += item['dur']
+        # 合并会话按其中的 metric 数计入吞吐
+        group['weight'] = max(group['weight'], item.get('metrics') or 1)
+        end = item['ts'] + item['dur']
+        group['start'] = item['ts'] if group['start'] is None else min(group['start'], item['ts'])
+        group['end'] = end if group['end'] is None else max(group['end'], end)
+    if not groups:
+        return [], 0, None, None
+    start = min(group['start'] for group in groups.values())
+    end = max(group['end'] for group in groups.values())
+    return ([group['duration'] for group in groups.values()],
+            sum(group['weight'] for group in groups.values()), start, end)
+
+
+def run_suite(suite, args, gen_root, eval_root):
+    side, root, command = suite_commands(suite, args, gen_root, eval_root)
+    trace_dir = os.path.join(args.workdir, 'traces', suite)
+    log_dir = os.path.join(args.workdir, 'logs', suite)
+    shutil.rmtree(trace_dir, ignore_errors=True)
+    os.makedirs(log_dir, exist_ok=True)
+    if suite == 'eval':
+        run_step([sys.executable, 'Generation/materialize.py', 'tree', gen_root, eval_root])
+        run_step([sys.executable, 'Evaluation/delete_query_json.py', eval_root])
+
+    env = dict(os.environ, TRACE_DIR=trace_dir, MOCK_LLM_API_BASE=f"http://127.0.0.1:{args.mock_port}/v1")
+    mock = MockServer(args, os.path.join(log_dir, 'mock_llm_backend.log'))
+    sampler = ProcessSampler(args.ports, args.sample_interval)
+    launcher = [
+        sys.executable, f'{side}/adk_launcher.py', '--model_name', BENCH_MODEL_NAME, '--adk_model', MOCK_MODEL,
+        '--root_path', root, '--ports', ','.join(args.ports), '--python_port', str(args.python_port),
+        '--file_port', str(args.file_port), '--system_port', str(args.system_port), '--log_dir', log_dir,
+        '--',
+    ] + command
+    print(f"[bench] {suite}: {' '.join(launcher)}")
+    mock.start()
+    start_time = time.time()
+    try:
+        sampler.start()
+        exit_code = subprocess.run(launcher, cwd=REPO_ROOT, env=env).returncode
+    finally:
+        if sampler.is_alive():
+            sampler.stop()
+        mock_stats = mock.stats()
+        mock.stop()
+    elapsed = time.time() - start_time
+
+    # 服务没有启动成功时没有 span
+    spans = tracing.load_spans([trace_dir]) if os.path.isdir(trace_dir) else []
+    durations, completed, first, last = measure_units(spans, suite)
+    wall = (last - first) if durations else 0
+    unit = 'metrics' if suite == 'eval' else 'projects'
+    return {
+        'suite': suite,
+        'projects': args.projects,
+        'exit_code': exit_code,
+        'elapsed_seconds': round(elapsed, 1),
+        'wall_seconds': round(wall, 1),
+        'completed': completed,
+        'unit': unit,
+        'throughput_per_min': round(completed / wall * 60, 2) if wall > 0 else 0,
+        'latency_seconds': {
+            'p50': round(tracing._percentile(durations, 0.50), 2) if durations else None,
+            'p99': round(tracing._percentile(durations, 0.99), 2) if durations else None,
+            'mean': round(sum(durations) / len(durations), 2) if durations else None,
+            'max': round(max(durations), 2) if durations else None,
+        },
+        'adk_server': sampler.result(),
+        'mock': mock_stats,
+        'trace_dir': trace_dir,
+    }
+
+
+def _flatten(result, prefix=''):
+    flat = {}
+    for key, value in result.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict) and key != 'mock':
+            flat.update(_flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and key != 'exit_code':
+            flat[name] = value
+    return flat
+
+
+def print_result(result, baseline=None):
+    print(f"\n===== {result['suite']}：{len(result['projects'])} 个项目，退出码 {result['exit_code']} =====")
+    current = _flatten(result)
+    previous = _flatten(baseline) if baseline else {}
+    for name, value in current.items():
+        line = f"{name:<32} {value:>12}"
+        old = previous.get(name)
+        if isinstance(old, (int, float)) and old:
+            change = (value - old) / old * 100
+            worse = change > 0 if any(word in name for word in LOWER_IS_BETTER) else change < 0
+            line += f"   基线 {old:>10}  {change:+.1f}%{'  ←' if worse and abs(change) >= 10 else ''}"
+        print(line)
+    mock = result.get('mock') or {}
+    if mock.get('replay'):
+        print(f"回放: {mock['replay']}")
+    print(f"span: {result['trace_dir']}（python Evaluation/adk_example/tracing.py summary {result['trace_dir']}）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用模拟 LLM 后端端到端测量生成 / 评测驱动的编排开销")
+    parser.add_argument("--suite", type=str, default="eval", choices=["eval", "gen", "both"],
+                        help="eval: ready_test.py；gen: run_generation.py；both: 先生成再评测")
+    parser.add_argument("--projects", type=str, default="1,2", help="PRDbench 中的项目ID（逗号分隔）")
+    parser.add_argument("--prdbench", type=str, default="PRDbench", help="PRDbench 目录")
+    parser.add_argument("--workdir", type=str, default="/tmp/adk_bench", help="工作目录、日志、span 和结果的输出目录")
+    parser.add_argument("--ports", type=str, default="8810", help="ADK api_server 端口，多个用逗号分隔")
+    parser.add_argument("--python_port", type=int, default=9801, help="Python 解释器 MCP 服务端口")
+    parser.add_argument("--file_port", type=int, default=8802, help="文件操作 MCP 服务端口")
+    parser.add_argument("--system_port", type=int, default=8803, help="系统操作 MCP 服务端口")
+    parser.add_argument("--mock_port", type=int, default=18000, help="模拟后端端口（与 config.py 中 mock_local 的默认地址一致）")
+    parser.add_argument("--max_in_flight", type=int, default=8, help="驱动脚本的并发数（ready_test 的 max_workers）")
+    parser.add_argument("--turns", type=int, default=3, help="脚本回复时每个会话的模型回复轮数")
+    parser.add_argument("--latency", type=str, default="0", help="模拟后端的延迟或分布（见 mock_llm_backend.py）")
+    parser.add_argument("--token_latency", type=float, default=0.0, help="每个 completion token 额外的延迟（秒）")
+    parser.add_argument("--seed", type=int, default=None, help="延迟分布的随机种子")
+    parser.add_argument("--replay", type=str, default=None, help="回放录制的会话（mock_llm_backend.py --record 的输出）")
+    parser.add_argument("--path_map", type=str, action="append", default=[], help="回放时的路径替换：录制时的路径=回放时的路径")
+    parser.add_argument("--eval_args", type=str, default="--retry_count 0",
+                        help="追加给 ready_test.py 的参数（脚本回复不会写报告，默认不补漏重试）")
+    parser.add_argument("--gen_args", type=str, default="--max_retries 0", help="追加给 run_generation.py 的参数")
+    parser.add_argument("--sample_interval", type=float, default=1.0, help="ADK 服务 CPU / RSS 的采样间隔（秒）")
+    parser.add_argument("--compare", type=str, default=None, help="与之前的结果文件对比（--suite both 时按 suite 匹配同目录下的文件）")
+    args = parser.parse_args()
+    args.projects = [project.strip() for project in args.projects.split(',') if project.strip()]
+    args.ports = [port.strip() for port in args.ports.split(',') if port.strip()]
+    args.workdir = os.path.abspath(args.workdir)
+    os.makedirs(args.workdir, exist_ok=True)
+
+    gen_root, eval_root = prepare_workspaces(args)
+    suites = ['gen', 'eval'] if args.suite == 'both' else [args.suite]
+    exit_code = 0
+    for suite in suites:
+        result = run_suite(suite, args, gen_root, eval_root)
+        output = os.path.join(args.workdir, f'benchmark_{suite}.json')
+        baseline = None
+        compare = args.compare
+        if compare and args.suite == 'both':
+            compare = os.path.join(os.path.dirname(compare), f'benchmark_{suite}.json')
+        if compare and os.path.exists(compare):
+            with open(compare, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        print_result(result, baseline)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {output}")
+        exit_code = exit_code or result['exit_code']
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
@@ -19,6 +19,8 @@ BASIC_MODEL =LiteLlmWithSleep(
         temperature=0.1
     )
 
+# 每个模型可设置 rpm / tpm（每分钟请求数 / token 数）开启进程内共享限流，例如 rpm=60, tpm=2_000_000；
+# 未设置时不主动等待，只在收到 429 时按 Retry-After 暂停该模型的请求
 friday_model_dict = {
     "claude_3_7_sonnet": LiteLlmWithSleep(
         # model="openai/anthropic.claude-3.7-sonnet",
@@ -163,12 +165,50 @@ if not os.path.isabs(WORKSPACE_DIR):
 
 # 安全配置
 ALLOWED_EXTENSIONS = ['.py', '.txt', '.md', '.json', '.yaml', '.yml', '.csv', '.sql', '.in', '.jsonl']
-MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+
+# 工具输出预算：run_system_command / judge / read_file 单次返回给模型的输出字节数上限，<= 0 表示不限制
+# 超出时只保留首尾，完整输出写入溢出目录，agent 可用 read_file 的 offset / limit 分页查看
+TOOL_OUTPUT_MAX_BYTES = int(os.getenv('TOOL_OUTPUT_MAX_BYTES', '16384'))
+TOOL_OUTPUT_SPILL_DIR = os.getenv('TOOL_OUTPUT_SPILL_DIR', '/tmp/code_agent_tool_outputs')
+
+# list_workspace 默认跳过的文件 / 目录名（fnmatch 通配，逗号分隔）
+LIST_WORKSPACE_IGNORE = [pattern.strip() for pattern in os.getenv(
+    'LIST_WORKSPACE_IGNORE',
+    'venv,.venv,env,__pycache__,.git,.pytest_cache,.mypy_cache,node_modules,*.egg-info,*.pyc,.DS_Store'
+).split(',') if pattern.strip()]
+
+# 交互式 shell 会话池（start_interative_shell / run_interactive_shell）
+# 存活会话数上限（超出时关闭最久未使用的会话）、空闲回收时间（秒），<= 0 表示不回收
+SHELL_POOL_MAX_SESSIONS = int(os.getenv('SHELL_POOL_MAX_SESSIONS', '64'))
+SHELL_SESSION_IDLE_TTL = int(os.getenv('SHELL_SESSION_IDLE_TTL', '1800'))
+# 每个会话的 CPU 时间（秒）和单个进程的虚拟内存（MB）上限，<= 0 表示不限制
+SHELL_SESSION_CPU_SECONDS = int(os.getenv('SHELL_SESSION_CPU_SECONDS', '3600'))
+SHELL_SESSION_MEMORY_MB = int(os.getenv('SHELL_SESSION_MEMORY_MB', '16384'))
+# 预热的 bash 进程数，0 表示不预热
+SHELL_POOL_PREWARM = int(os.getenv('SHELL_POOL_PREWARM', '2'))
+# 会话池指标服务端口（GET /metrics），0 表示不启动
+SHELL_POOL_METRICS_PORT = int(os.getenv('SHELL_POOL_METRICS_PORT', '0'))
+
+# 使用异步版本的 run_system_command / start_interative_shell / run_interactive_shell / judge：
+# 子进程和 pty 输出在事件循环上等待，一个 ADK 服务可以同时处理多个评测会话；设为 false 恢复同步工具
+ASYNC_TOOLS = os.getenv('ASYNC_TOOLS', 'true').lower() == 'true'
+
+# judge / start_interative_shell 启动命令时的 conda 激活方式：
+# cached: 服务启动时执行一次激活脚本并缓存导出的环境变量，之后直接以该环境启动命令；shell: 每次用 source activate 激活
+CONDA_ACTIVATION_MODE = os.getenv('CONDA_ACTIVATION_MODE', 'cached')
 SANDBOX_MODE = True
 
 
 # 是否启用路径限制
 ENABLE_PATH_RESTRICTION = os.getenv('ENABLE_PATH_RESTRICTION', 'true').lower() == 'true'
 
+# judge 工具交互日志目录；为空时交互记录只保存在内存中并随结果返回
+JUDGE_LOG_DIR = os.getenv('JUDGE_LOG_DIR', '')
+
+# judge 交互回放缓存：源码、命令、输入文件和环境都未变化时直接返回上次的交互结果
+JUDGE_REPLAY_CACHE = os.getenv('JUDGE_REPLAY_CACHE', 'false').lower() == 'true'
+JUDGE_REPLAY_CACHE_DIR = os.getenv('JUDGE_REPLAY_CACHE_DIR', '/tmp/judge_replay_cache')
+JUDGE_REPLAY_CACHE_MAX_MB = int(os.getenv('JUDGE_REPLAY_CACHE_MAX_MB', '1024'))
+
 print(f"🚀 当前执行ID: {CURRENT_EXECUTION_ID}")
 print(f"📁 工作空间路径: {WORKSPACE_DIR}") 
\ No newline at end of file
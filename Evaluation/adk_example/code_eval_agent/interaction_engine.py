@@ -0,0 +1,327 @@
+"""
+judge 工具的自适应交互引擎
+
+原来的 judge 在每次发送输入前后都要等待固定的空闲时间（启动 2s、输入前 0.8s、输入后 0.5s），
+程序即使瞬间给出响应也要等满，20 行输入就要 25 秒以上。
+这里改为事件驱动：只要满足以下任一条件就认为程序在等待下一行输入，立即返回：
+  1. 最新输出的末尾匹配提示符（默认 `:` / `>` / `?` / `？` / `：`，可由调用方传入正则）
+  2. 子进程树中有进程阻塞在终端读操作上（读取 /proc/<pid>/stat 与 /proc/<pid>/wchan）
+固定的空闲阈值只作为兜底（例如非 Linux 环境或输出不带提示符的程序）。
+
+judge 的交互流程写成生成器，每一步 yield 一个操作（见 InteractionEngine.perform），同步版本由 run_steps 执行，
+异步版本由 run_steps_async 执行（pty 输出通过 loop.add_reader 在事件循环上等待），两个版本共用同一份流程。
+"""
+
+import asyncio
+import os
+import re
+import time
+from typing import Optional
+
+import pexpect
+
+try:
+    from .interative_shell import _wait_readable
+except ImportError:
+    from interative_shell import _wait_readable
+
+# 输出末尾的提示符：冒号、大于号、问号（含全角），允许后面跟空格或制表符；
+# 提示符必须在未换行的最后一行（\Z，不用 \s / $：两者都会匹配换行，把 "Results:\n" 这样的标题行误判为提示符）
+DEFAULT_PROMPT_PATTERN = r'[:>?？：][ \t]*\Z'
+# 进程阻塞在终端读操作时 /proc/<pid>/wchan 的常见取值
+TTY_READ_WCHANS = ('n_tty_read', 'tty_read')
+# 通用的内核等待点（较新内核上终端读也停在这里，但 socket / pipe 等待同样会出现），
+# 只有当前系统调用的 fd 参数是终端时才算终端读
+GENERIC_WAIT_WCHANS = ('wait_woken',)
+# 每次轮询读取输出的超时时间（秒）
+POLL_INTERVAL = 0.05
+# 只保留最近的输出用于提示符匹配
+TAIL_CHARS = 512
+
+# wait_for_output 的返回值
+REASON_PROMPT = 'prompt'
+REASON_BLOCKED = 'blocked'
+REASON_IDLE = 'idle'
+REASON_TIMEOUT = 'timeout'
+
+
+def compile_prompt_pattern(prompt_pattern: Optional[str] = None):
+    """
+    编译提示符正则，未提供时使用默认提示符；正则非法时抛出 re.error
+    正则用 search 匹配本次等待期间收到的最近输出，需要锚定末尾时请自行加上 `\Z`
+    （不要用 `$`：它也会匹配末尾换行之前的位置，"Results:\n" 这样的标题行会被误判为提示符）
+    """
+    return re.compile(prompt_pattern or DEFAULT_PROMPT_PATTERN)
+
+
+def _read_proc(path: str) -> Optional[str]:
+    try:
+        with open(path, 'r') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _child_pids(pid: int) -> list:
+    """获取直接子进程，优先使用 /proc/<pid>/task/<pid>/children，不可用时扫描 /proc"""
+    content = _read_proc(f'/proc/{pid}/task/{pid}/children')
+    if content is not None:
+        return [int(p) for p in content.split()]
+
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        stat = _read_proc(f'/proc/{entry}/stat')
+        if not stat:
+            continue
+        fields = stat.rsplit(')', 1)[-1].split()
+        if len(fields) > 1 and fields[1] == str(pid):
+            children.append(int(entry))
+    return children
+
+
+def process_tree(root_pid: int) -> list:
+    """返回以 root_pid 为根的进程树中所有进程的 pid"""
+    pids = []
+    stack = [root_pid]
+    while stack:
+        pid = stack.pop()
+        pids.append(pid)
+        stack.extend(_child_pids(pid))
+    return pids
+
+
+def _process_state(pid: int) -> Optional[str]:
+    stat = _read_proc(f'/proc/{pid}/stat')
+    if not stat:
+        return None
+    fields = stat.rsplit(')', 1)[-1].split()
+    return fields[0] if fields else None
+
+
+def _waiting_on_tty(pid: int) -> bool:
+    """进程当前系统调用的第一个参数是否为终端 fd（/proc/<pid>/syscall 格式：系统调用号 参数1 参数2 ...）"""
+    fields = (_read_proc(f'/proc/{pid}/syscall') or '').split()
+    if len(fields) < 2:
+        return False
+    try:
+        target = os.readlink(f'/proc/{pid}/fd/{int(fields[1], 16)}')
+    except (ValueError, OSError):
+        return False
+    return target.startswith(('/dev/pts/', '/dev/tty'))
+
+
+def _read_syscalls(pid: int) -> int:
+    """进程累计完成的读系统调用次数（/proc/<pid>/io 的 syscr），不可读时返回 0"""
+    content = _read_proc(f'/proc/{pid}/io') or ''
+    for line in content.splitlines():
+        if line.startswith('syscr:'):
+            return int(line.split()[1])
+    return 0
+
+
+class InteractionEngine:
+    """
+    包装 pexpect 子进程，判断程序何时在等待输入
+
+    Args:
+        child: pexpect.spawn 对象（输出通过其 logfile_read 记录）
+        prompt_pattern: 可选的提示符正则，默认匹配输出末尾的 `:` / `>` / `?` / `？` / `：`
+    """
+
+    def __init__(self, child, prompt_pattern: Optional[str] = None):
+        self.child = child
+        self.prompt_re = compile_prompt_pattern(prompt_pattern)
+        self.proc_available = os.path.isdir(f'/proc/{child.pid}')
+        self._read_counter_at_send = None
+
+    def _tree_read_counter(self, pids) -> int:
+        return sum(_read_syscalls(pid) for pid in pids)
+
+    def blocked_on_read(self) -> bool:
+        """
+        子进程树是否阻塞在终端读操作上
+
+        没有进程处于运行态且至少一个进程阻塞在 tty 读上才算；
+        发送输入后还要求进程树完成过新的读系统调用，避免把尚未取走输入的那次读误判为新的等待
+        """
+        if not self.proc_available:
+            return False
+        pids = process_tree(self.child.pid)
+        waiting = False
+        for pid in pids:
+            state = _process_state(pid)
+            if state is None:
+                continue
+            if state == 'R':
+                return False
+            wchan = (_read_proc(f'/proc/{pid}/wchan') or '').strip()
+            if wchan in TTY_READ_WCHANS or (wchan in GENERIC_WAIT_WCHANS and _waiting_on_tty(pid)):
+                waiting = True
+        if not waiting:
+            return False
+        if self._read_counter_at_send is not None:
+            if self._tree_read_counter(pids) == self._read_counter_at_send:
+                return False
+            self._read_counter_at_send = None
+        return True
+
+    def sendline(self, line: str):
+        """发送一行输入，并记录发送时进程树的读调用计数"""
+        if self.proc_available:
+            self._read_counter_at_send = self._tree_read_counter(process_tree(self.child.pid))
+        self.child.sendline(line)
+
+    def _waiting_reason(self, tail: str, last_output_time: float, idle_threshold: float) -> Optional[str]:
+        """输出暂时读空时判断程序是否在等待输入，返回原因；还没有在等待时返回 None"""
+        if tail and self.prompt_re.search(tail):
+            return REASON_PROMPT
+        if self.blocked_on_read():
+            return REASON_BLOCKED
+        if time.time() - last_output_time >= idle_threshold:
+            return REASON_IDLE
+        return None
+
+    def wait_for_output(self, timeout: float = 10, idle_threshold: float = 1.0) -> str:
+        """
+        读取程序输出，直到程序开始等待输入或暂时没有新输出
+
+        Args:
+            timeout: 最大等待时间（秒）
+            idle_threshold: 兜底的空闲阈值，无法检测提示符和阻塞状态时使用（秒）
+
+        Returns:
+            str: 返回原因，prompt / blocked / idle / timeout
+
+        Raises:
+            pexpect.EOF: 程序已结束
+        """
+        start_time = time.time()
+        last_output_time = start_time
+        tail = ''
+        while time.time() - start_time < timeout:
+            try:
+                data = self.child.read_nonblocking(size=4096, timeout=POLL_INTERVAL)
+            except pexpect.TIMEOUT:
+                data = ''
+            if data:
+                # 数据已经被logfile_read自动记录了，这里只保留末尾用于提示符匹配
+                tail = (tail + data)[-TAIL_CHARS:]
+                last_output_time = time.time()
+                continue
+
+            # 输出暂时读空，判断程序是否在等待输入
+            reason = self._waiting_reason(tail, last_output_time, idle_threshold)
+            if reason:
+                return reason
+        return REASON_TIMEOUT
+
+    async def wait_for_output_async(self, timeout: float = 10, idle_threshold: float = 1.0) -> str:
+        """与 wait_for_output 相同，但在事件循环上等待 pty 可读，不阻塞线程"""
+        start_time = time.time()
+        last_output_time = start_time
+        tail = ''
+        while time.time() - start_time < timeout:
+            data = ''
+            if await _wait_readable(self.child.child_fd, POLL_INTERVAL):
+                try:
+                    data = self.child.read_nonblocking(size=4096, timeout=0)
+                except pexpect.TIMEOUT:
+                    data = ''
+            if data:
+                tail = (tail + data)[-TAIL_CHARS:]
+                last_output_time = time.time()
+                continue
+
+            reason = self._waiting_reason(tail, last_output_time, idle_threshold)
+            if reason:
+                return reason
+        return REASON_TIMEOUT
+
+    def expect_eof(self, timeout: float):
+        """等待程序结束（读完剩余输出），超时抛出 pexpect.TIMEOUT"""
+        self.child.expect(pexpect.EOF, timeout=timeout)
+
+    async def expect_eof_async(self, timeout: float):
+        """与 expect_eof 相同，但在事件循环上等待；结束后 child.before 为期间读到的输出"""
+        deadline = time.monotonic() + timeout
+        chunks = []
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.child.before = ''.join(chunks)
+                raise pexpect.TIMEOUT(f"Timeout exceeded ({timeout}s) waiting for EOF")
+            if not await _wait_readable(self.child.child_fd, remaining):
+                continue
+            try:
+                chunks.append(self.child.read_nonblocking(size=4096, timeout=0))
+            except pexpect.TIMEOUT:
+                continue
+            except pexpect.EOF:
+                self.child.before = ''.join(chunks)
+                return
+
+    def perform(self, op):
+        """
+        执行交互流程 yield 的一个操作：
+          ('wait', timeout, idle_threshold) -> wait_for_output 的返回原因
+          ('eof', timeout)                  -> 等待程序结束
+          ('close', force)                  -> 关闭子进程（pexpect 关闭时会 sleep 等待进程退出）
+        """
+        name, *params = op
+        if name == 'wait':
+            return self.wait_for_output(*params)
+        if name == 'eof':
+            return self.expect_eof(*params)
+        if name == 'close':
+            return self.child.close(force=params[0])
+        raise ValueError(f"未知的交互操作: {name}")
+
+    async def perform_async(self, op):
+        """perform 的异步版本"""
+        name, *params = op
+        if name == 'wait':
+            return await self.wait_for_output_async(*params)
+        if name == 'eof':
+            return await self.expect_eof_async(*params)
+        if name == 'close':
+            return await asyncio.to_thread(self.child.close, force=params[0])
+        raise ValueError(f"未知的交互操作: {name}")
+
+
+def run_steps(steps, engine: InteractionEngine):
+    """
+    同步执行交互流程（生成器），返回生成器的返回值
+    操作抛出的异常（pexpect.EOF / pexpect.TIMEOUT 等）抛回生成器，由流程自己处理
+    """
+    value, error = None, None
+    while True:
+        try:
+            op = steps.throw(error) if error else steps.send(value)
+        except StopIteration as stop:
+            return stop.value
+        value, error = None, None
+        try:
+            value = engine.perform(op)
+        except Exception as e:
+            error = e
+
+
+async def run_steps_async(steps, engine: InteractionEngine):
+    """run_steps 的异步版本：等待都在事件循环上进行；工具调用被取消时结束程序，不留下孤儿进程"""
+    value, error = None, None
+    while True:
+        try:
+            op = steps.throw(error) if error else steps.send(value)
+        except StopIteration as stop:
+            return stop.value
+        value, error = None, None
+        try:
+            value = await engine.perform_async(op)
+        except asyncio.CancelledError:
+            steps.close()
+            engine.child.close(force=True)
+            raise
+        except Exception as e:
+            error = e
@@ -3,12 +3,15 @@
 提供 Python 解释器、文件操作和系统操作功能
 """
 
+import io
 import os
+import re
 import subprocess
+import uuid
 import tempfile
 import shutil
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 from google.adk.tools import ToolContext
 from google.adk.tools.mcp_tool.mcp_toolset import MCPToolset
 from google.adk.tools.mcp_tool.mcp_session_manager import SseServerParams
@@ -18,7 +21,13 @@ import pexpect
 import asyncio
 from aiohttp import web
 from typing import Dict, Any, Optional
-from code_eval_agent.interative_shell import step, terminate
+from code_eval_agent.interative_shell import step, terminate, configure_pool, serve_pool_metrics
+from code_eval_agent.conda_env import get_conda_env
+from code_eval_agent.output_budget import OutputBudget, walk_workspace
+from code_eval_agent.ranged_read import (DEFAULT_MAX_MATCHES, get_line_index, grep_file, read_byte_range,
+                                         read_line_range, tail_lines)
+from code_eval_agent.interaction_engine import InteractionEngine, compile_prompt_pattern, run_steps, REASON_BLOCKED
+from code_eval_agent.replay_cache import ReplayCache, snapshot
 from datetime import datetime
 import time
 import json
@@ -34,10 +43,23 @@ try:
         MCP_SSE_TIMEOUT,
         WORKSPACE_DIR,
         ALLOWED_EXTENSIONS,
-        MAX_FILE_SIZE,
         SANDBOX_MODE,
         CURRENT_EXECUTION_ID,
-        ENABLE_PATH_RESTRICTION
+        ENABLE_PATH_RESTRICTION,
+        JUDGE_LOG_DIR,
+        JUDGE_REPLAY_CACHE,
+        JUDGE_REPLAY_CACHE_DIR,
+        JUDGE_REPLAY_CACHE_MAX_MB,
+        TOOL_OUTPUT_MAX_BYTES,
+        TOOL_OUTPUT_SPILL_DIR,
+        LIST_WORKSPACE_IGNORE,
+        SHELL_POOL_MAX_SESSIONS,
+        SHELL_SESSION_IDLE_TTL,
+        SHELL_SESSION_CPU_SECONDS,
+        SHELL_SESSION_MEMORY_MB,
+        SHELL_POOL_PREWARM,
+        SHELL_POOL_METRICS_PORT,
+        CONDA_ACTIVATION_MODE
     )
 except ImportError:
     # 如果相对导入失败，使用绝对导入
@@ -48,13 +70,39 @@ except ImportError:
         MCP_SSE_TIMEOUT,
         WORKSPACE_DIR,
         ALLOWED_EXTENSIONS,
-        MAX_FILE_SIZE,
         SANDBOX_MODE,
         CURRENT_EXECUTION_ID,
-        ENABLE_PATH_RESTRICTION
+        ENABLE_PATH_RESTRICTION,
+        JUDGE_LOG_DIR,
+        JUDGE_REPLAY_CACHE,
+        JUDGE_REPLAY_CACHE_DIR,
+        JUDGE_REPLAY_CACHE_MAX_MB,
+        TOOL_OUTPUT_MAX_BYTES,
+        TOOL_OUTPUT_SPILL_DIR,
+        LIST_WORKSPACE_IGNORE,
+        SHELL_POOL_MAX_SESSIONS,
+        SHELL_SESSION_IDLE_TTL,
+        SHELL_SESSION_CPU_SECONDS,
+        SHELL_SESSION_MEMORY_MB,
+        SHELL_POOL_PREWARM,
+        SHELL_POOL_METRICS_PORT,
+        CONDA_ACTIVATION_MODE
     )
 SAFE_COMMANDS = ['ls', 'pwd', 'echo', 'cat', 'head', 'tail', 'grep', 'find', 'python', 'python3', 'chmod', 'cd', 'pytest']
         
+# 工具输出预算：超过 TOOL_OUTPUT_MAX_BYTES 的输出只保留首尾，完整内容写入 TOOL_OUTPUT_SPILL_DIR
+OUTPUT_BUDGET = OutputBudget(TOOL_OUTPUT_MAX_BYTES, TOOL_OUTPUT_SPILL_DIR)
+
+# 交互式 shell 会话池：限制存活会话数、回收空闲会话、限制每个会话的 CPU / 内存，并预热 bash 进程
+configure_pool(max_sessions=SHELL_POOL_MAX_SESSIONS, idle_ttl=SHELL_SESSION_IDLE_TTL,
+               cpu_seconds=SHELL_SESSION_CPU_SECONDS, memory_mb=SHELL_SESSION_MEMORY_MB, prewarm=SHELL_POOL_PREWARM)
+if SHELL_POOL_METRICS_PORT:
+    serve_pool_metrics(SHELL_POOL_METRICS_PORT)
+
+# conda 环境在服务启动时解析一次并缓存，judge / start_interative_shell 不再每次检测和激活
+if CONDA_ACTIVATION_MODE == 'cached':
+    get_conda_env()
+
 # 数据模型定义
 class PythonCode(BaseModel):
     """Python代码执行请求"""
@@ -220,16 +268,24 @@ data/*.json
     
     return result
 
-def list_workspace(tool_context: ToolContext, workspace_name: Optional[str] = None):
+def list_workspace(tool_context: ToolContext, workspace_name: Optional[str] = None, max_depth: int = 4,
+                   ignore: Optional[str] = None, max_entries: int = 500):
     """
     List the files and directories in the workspace.
+    Directories matching the ignore patterns (venv, __pycache__, .git, ... by default) are skipped without being traversed.
     
     Args:
         tool_context: Tool context
         workspace_name: The name of the workspace, if None, use the current execution ID.
+        max_depth: The maximum depth to list (1 = direct children only), default 4.
+        ignore: Optional extra comma-separated name patterns to skip (e.g. "*.log,data").
+        max_entries: The maximum number of entries to return, default 500.
     
     Returns:
         dict: A dictionary containing the list of files and directories in the workspace.
+            - files: list of entries (path, type, size)
+            - skipped: directories skipped by the ignore patterns
+            - truncated: bool, whether the listing was cut off by max_entries; narrow it with workspace_name or ignore
     """
     if workspace_name is None:
         workspace_name = CURRENT_EXECUTION_ID
@@ -239,24 +295,17 @@ def list_workspace(tool_context: ToolContext, workspace_name: Optional[str] = No
     if not workspace_path.exists():
         return {"error": "The workspace does not exist！"}
     
-    files = []
-    for item in workspace_path.rglob("*"):
-        if item.is_file():
-            files.append({
-                "path": str(item.relative_to(workspace_path)),
-                "size": item.stat().st_size,
-                "type": "file"
-            })
-        elif item.is_dir():
-            files.append({
-                "path": str(item.relative_to(workspace_path)),
-                "type": "directory"
-            })
+    ignore_patterns = list(LIST_WORKSPACE_IGNORE)
+    if ignore:
+        ignore_patterns += [pattern.strip() for pattern in ignore.split(',') if pattern.strip()]
+    files, skipped, truncated = walk_workspace(str(workspace_path), ignore_patterns, max_depth, max_entries)
     
     return {
         "workspace_path": str(workspace_path),
         "workspace_name": workspace_name,
-        "files": files
+        "files": files,
+        "skipped": skipped,
+        "truncated": truncated
     }
 
 def validate_write_path(file_path: str) -> bool:
@@ -308,16 +357,35 @@ def validate_read_file_path(file_path: str) -> bool:
     
     return True
 
-def read_file(tool_context: ToolContext, file_path: str):
+def read_file(tool_context: ToolContext, file_path: str, offset: int = 0, limit: Optional[int] = None,
+              tail: Optional[int] = None, grep: Optional[str] = None, context: int = 0,
+              ignore_case: bool = False, byte_offset: Optional[int] = None):
     """
     Read the content of the file.
+    Large files are returned page by page: if next_offset is not None, call again with offset=next_offset to read the rest.
+    Only the requested part of the file is read, so files of any size can be inspected:
+    use tail to read the end of a log, grep to search within a large file, byte_offset for files without line breaks.
     
     Args:
         tool_context: Tool context
         file_path: The path of the file.
+        offset: The line number (0-based) to start reading from, default 0.
+        limit: The maximum number of lines to read, default reads until the output size budget is reached.
+            With grep: the maximum number of matching lines; with byte_offset: the number of bytes.
+        tail: Optional, read the last N lines of the file instead.
+        grep: Optional, a regular expression (matched per line) to search for in the file instead of reading it.
+        context: With grep, the number of lines to show before and after each match, default 0.
+        ignore_case: With grep, match case-insensitively, default False.
+        byte_offset: Optional, read raw bytes starting at this byte offset instead of lines.
     
     Returns:
         dict: A dictionary containing the content of the file.
+            - content: str, lines [offset, next_offset) of the file
+            - total_lines: int, the number of lines in the file
+            - next_offset: int or None, the offset of the next page, None if the end of the file is reached
+            With tail: content and first_line (the line number of the first returned line).
+            With grep: matches (line, text, before, after) and truncated.
+            With byte_offset: content, size (bytes) and next_byte_offset.
     """
     if not validate_read_file_path(file_path):
         return {"error": "The file path is not allowed to be read! Please concentrate on the file path in the project directory!"}
@@ -327,17 +395,43 @@ def read_file(tool_context: ToolContext, file_path: str):
         if not file_path.exists():
             return {"error": "文件不存在"}
         
-        if file_path.stat().st_size > MAX_FILE_SIZE:
-            return {"error": "文件过大"}
-        
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        path = str(file_path)
+        max_bytes = OUTPUT_BUDGET.max_bytes
+        if grep:
+            found = grep_file(path, grep, ignore_case, max(context or 0, 0),
+                              limit or DEFAULT_MAX_MATCHES, max_bytes)
+            return {"file_path": path, "pattern": grep, **found}
         
-        return {
-            "file_path": str(file_path),
-            "content": content,
-            "size": len(content)
-        }
+        if tail is not None:
+            content, first_line = tail_lines(path, tail, max_bytes)
+            result = {
+                "file_path": path,
+                "content": content,
+                "size": len(content),
+                "first_line": first_line,
+                "total_lines": get_line_index(path).total_lines
+            }
+        elif byte_offset is not None:
+            content, size, next_byte_offset = read_byte_range(path, byte_offset, limit, max_bytes)
+            result = {
+                "file_path": path,
+                "content": content,
+                "byte_offset": max(byte_offset, 0),
+                "size": size,
+                "next_byte_offset": next_byte_offset
+            }
+        else:
+            content, total_lines, next_offset = read_line_range(path, offset, limit, max_bytes)
+            result = {
+                "file_path": path,
+                "content": content,
+                "size": len(content),
+                "offset": max(offset or 0, 0),
+                "total_lines": total_lines,
+                "next_offset": next_offset
+            }
+        # 单行超过预算（如压缩过的 js / json）时只保留首尾；原文件就在磁盘上，不需要另存
+        return OUTPUT_BUDGET.apply(result, ["content"], "read_file", spill=False)
     except Exception as e:
         return {"error": f"读取文件失败: {str(e)}"}
 
@@ -517,6 +611,39 @@ def execute_python_code(tool_context: ToolContext, code: str, timeout: int = 30,
     except Exception as e:
         return {"error": f"代码执行失败: {str(e)}"}
 
+def prepare_system_command(command: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    """
+    run_system_command（同步 / 异步版本）执行前的检查
+
+    Returns:
+        tuple: (不允许执行时的错误结果，否则为 None, 命令的工作目录)
+    """
+    if SANDBOX_MODE:
+        # 在沙盒模式下，只允许安全的命令
+        safe_commands = SAFE_COMMANDS
+        if not any(cmd in command for cmd in safe_commands):
+            return {"error": "你执行的命令在沙盒模式下不被允许; 安全命令列表: " + str(safe_commands)}, WORKSPACE_DIR
+    logger.info(f"执行系统命令: {command}")
+    return None, WORKSPACE_DIR
+
+
+def system_command_result(stdout: str, stderr: str, return_code: int, workdir: str) -> Dict[str, Any]:
+    """run_system_command 的返回结果"""
+    return {
+        "stdout": stdout,
+        "stderr": stderr,
+        "return_code": return_code
+    }
+
+
+def system_command_error(error: Exception) -> Dict[str, Any]:
+    """run_system_command 执行出错（含超时）时的返回结果"""
+    if isinstance(error, subprocess.TimeoutExpired):
+        return {"error": "命令执行超时"}
+    return {"error": f"命令执行失败: {str(error)}"}
+
+
+@OUTPUT_BUDGET.limit("stdout", "stderr")
 def run_system_command(tool_context: ToolContext, command: str, timeout: int = 30):
     """
     Run the system command.
@@ -529,31 +656,21 @@ def run_system_command(tool_context: ToolContext, command: str, timeout: int = 3
     Returns:
         dict: A dictionary containing the result of the execution.
     """
-    if SANDBOX_MODE:
-        # 在沙盒模式下，只允许安全的命令
-        safe_commands = SAFE_COMMANDS
-        if not any(cmd in command for cmd in safe_commands):
-            return {"error": "你执行的命令在沙盒模式下不被允许; 安全命令列表: " + str(safe_commands)}
+    error, workdir = prepare_system_command(command)
+    if error:
+        return error
     try:
-        logger.info(f"执行系统命令: {command}")
         result = subprocess.run(
             command,
             shell=True,
             capture_output=True,
             text=True,
             timeout=timeout,
-            cwd=WORKSPACE_DIR
+            cwd=workdir
         )
-        
-        return {
-            "stdout": result.stdout,
-            "stderr": result.stderr,
-            "return_code": result.returncode
-        }
-    except subprocess.TimeoutExpired:
-        return {"error": "命令执行超时"}
+        return system_command_result(result.stdout, result.stderr, result.returncode, workdir)
     except Exception as e:
-        return {"error": f"命令执行失败: {str(e)}"}
+        return system_command_error(e)
 
 def interactive_system_command(
     tool_context: ToolContext,
@@ -632,6 +749,19 @@ def run_interactive_python_code(tool_context: ToolContext, cmd: str, session_id:
             "finished": True
         }
 
+def prepare_shell_start(cmd: str) -> Dict[str, Any]:
+    """start_interative_shell（同步 / 异步版本）启动会话的参数：按 conda 激活方式改写命令或设置环境变量"""
+    # conda 环境在服务启动时已解析并缓存（conda_env.py）
+    conda_env = get_conda_env()
+    env = None
+    if conda_env and CONDA_ACTIVATION_MODE == 'shell':
+        cmd = f"source activate {conda_env.path} && {cmd}"
+    elif conda_env:
+        # 直接以激活后的环境变量启动，不再执行 conda 激活脚本
+        env = dict(conda_env.env)
+    return {"cmd": cmd, "env": env}
+
+
 def start_interative_shell(tool_context: ToolContext, cmd: str = "bash") -> Dict[str, Any]:
     """
     Start a interactive shell session.
@@ -642,112 +772,84 @@ def start_interative_shell(tool_context: ToolContext, cmd: str = "bash") -> Dict
     Returns:
         dict: A dictionary containing the result of the execution.
     """
-    # 检查并获取 conda 环境路径
-    conda_env_path = None
-    # 方法1: 优先使用启动脚本设置的 CONDA_ENV_PATH 环境变量
-    if 'CONDA_ENV_PATH' in os.environ and os.environ['CONDA_ENV_PATH'].strip():
-        conda_env_path = os.environ['CONDA_ENV_PATH'].strip()
-    # 方法2: 检查 CONDA_PREFIX 环境变量（当前激活的 conda 环境）
-    elif 'CONDA_PREFIX' in os.environ:
-        conda_env_path = os.environ['CONDA_PREFIX']
-    # 方法3: 检查 CONDA_DEFAULT_ENV 并尝试获取完整路径
-    elif 'CONDA_DEFAULT_ENV' in os.environ:
-        try:
-            # 尝试通过 conda info 获取环境路径
-            result = subprocess.run(
-                ['conda', 'info', '--envs'],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-            if result.returncode == 0:
-                # 解析输出，查找当前环境
-                env_name = os.environ['CONDA_DEFAULT_ENV']
-                for line in result.stdout.split('\n'):
-                    if line.strip().startswith(env_name) or f'/{env_name}' in line:
-                        # 提取路径（通常在环境名之后）
-                        parts = line.split()
-                        if len(parts) >= 2:
-                            conda_env_path = parts[-1]
-                            break
-        except Exception as e:
-            logger.warning(f"获取 conda 环境信息时出错: {e}")
-    
-    # 如果检测到 conda 环境，在命令前添加 source activate
-    if conda_env_path and conda_env_path.strip():
-        cmd = f"source activate {conda_env_path} && {cmd}"
-    
-    session_id = None
     try:
-        result = step(
-            cmd=cmd,
-        )
-        return result
+        return step(**prepare_shell_start(cmd))
     except Exception as e:
-        return {
-            "error": str(e),
-            "session_id": session_id,
-            "output": session_id,
-            "waiting": False,
-            "finished": True
-        }
+        return shell_step_error(None, e)
 
 IS_IN_PYTHON_ENV = False
 
-def run_interactive_shell(tool_context: ToolContext, session_id: Optional[str] = None, user_input: Optional[str] = None) -> Dict[str, Any]:
+def prepare_shell_input(tool_context: ToolContext, session_id: Optional[str], user_input: Optional[str]) -> Optional[Dict[str, Any]]:
     """
-    Run a interactive shell session.
-    
-    The first time to call, you need to provide the cmd parameter to start a new session, and then provide the session_id to continue the previous session.
-    If you need to input content to the shell, provide the user_input parameter.
-    
-    参数:
-        session_id (str, optional): The session ID, for continuing the previous session.
-        user_input (str, optional): The content to be input to the shell.
-        
+    run_interactive_shell（同步 / 异步版本）发送输入前的检查，并更新会话的 python_env_state
+
     Returns:
-        Dict[str, Any]: A dictionary containing the result of the execution.
-            - session_id: str, The session ID
-            - output: str, The output of the shell
-            - waiting: bool, Whether to wait for input
-            - finished: bool, Whether the session is finished
+        不允许发送时的错误结果，否则为 None
     """
     # 获取当前会话的状态
     session_state = getattr(tool_context, 'python_env_state', {})
     if session_id not in session_state:
         session_state[session_id] = False
     is_in_python = session_state[session_id]
-    
+
     # 检查命令安全性
     if is_in_python and user_input:
         safe_commands = SAFE_COMMANDS
         current_command = user_input.split()[0] if user_input else ''
         if not any(cmd in current_command for cmd in safe_commands):
             return {"error": "你执行的命令在沙盒模式下不被允许; 安全命令列表: " + str(safe_commands)}
-    
+
     # 更新Python环境状态
     if user_input and user_input.startswith("python"):
         session_state[session_id] = True
     elif user_input == "exit":
         session_state[session_id] = False
-    
+
     # 保存状态回上下文
     setattr(tool_context, 'python_env_state', session_state)
+    return None
+
+
+def shell_step_error(session_id: Optional[str], error: Exception) -> Dict[str, Any]:
+    """run_interactive_shell 执行出错时的返回结果"""
+    return {
+        "error": str(error),
+        "session_id": session_id,
+        "output": "",
+        "waiting": False,
+        "finished": True
+    }
+
+
+def run_interactive_shell(tool_context: ToolContext, session_id: Optional[str] = None, user_input: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Run a interactive shell session.
+    
+    The first time to call, you need to provide the cmd parameter to start a new session, and then provide the session_id to continue the previous session.
+    If you need to input content to the shell, provide the user_input parameter.
     
+    参数:
+        session_id (str, optional): The session ID, for continuing the previous session.
+        user_input (str, optional): The content to be input to the shell.
+        
+    Returns:
+        Dict[str, Any]: A dictionary containing the result of the execution.
+            - session_id: str, The session ID
+            - output: str, The output of the shell
+            - waiting: bool, Whether to wait for input
+            - finished: bool, Whether the session is finished
+    """
+    error = prepare_shell_input(tool_context, session_id, user_input)
+    if error:
+        return error
+
     try:
-        result = step(
+        return step(
             session_id=session_id,
             user_input=user_input
         )
-        return result
     except Exception as e:
-        return {
-            "error": str(e),
-            "session_id": session_id,
-            "output": "",
-            "waiting": False,
-            "finished": True
-        }
+        return shell_step_error(session_id, e)
 
 def kill_shell_session(tool_context: ToolContext, session_id: str) -> Dict[str, Any]:
     """
@@ -899,171 +1001,229 @@ def validate_workspace_dir(workspace_dir: str, base_dir: str = None) -> bool:
     except (OSError, ValueError):
         return False
 
-def judge(tool_context, context: str, entry_command: str, input_file: Optional[str] = None, workspace_dir: Optional[str] = None):
+class JudgeTranscript:
     """
-    Run the program and simulate the user interaction, record the interaction process and output result.
-    If the program does not exit automatically after the input ends, send Ctrl+C to force interrupt.
-    When KeyboardInterrupt is captured, it is also considered successful.
+    单次 judge 调用的交互记录
 
-    Args:
-        tool_context: Tool context
-        context: The expected output description and test requirements (only used for information transmission, not for judgment)
-        entry_command: The entry command of the program (e.g. "python main.py")
-        input_file: The path of the file containing the simulated user input (e.g. "a.in")
-        workspace_dir: Optional working directory (must be under WORKSPACE_DIR). If not provided, uses default WORKSPACE_DIR.
-
-    Returns:
-        dict: A dictionary containing the test result, interaction record, and user inputs
-            - success: bool, whether the program executed successfully
-            - log: str, raw terminal output (program output + user input echo)
-            - user_input: str, all user inputs separated by newlines
-            - error: str or None, error message if any
+    交互过程写入内存缓冲区，并发的 judge 调用互不干扰；
+    设置了 JUDGE_LOG_DIR 时同时写入该次调用独有的日志文件，便于事后排查
     """
-    import os
-    import time
-    import pexpect
-    from typing import Optional
-
-    class CustomLogger:
-        """自定义日志记录器，直接写入原始内容，不添加前缀"""
-        def __init__(self, file):
-            self.file = file
 
-        def write(self, data):
-            # 直接写入原始数据，不添加 "program:" 前缀
+    def __init__(self, log_file_path: Optional[str] = None):
+        self.buffer = io.StringIO()
+        self.log_file_path = log_file_path
+        self.file = None
+        if log_file_path:
+            try:
+                os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
+                self.file = open(log_file_path, 'w', encoding='utf-8')
+            except OSError as e:
+                logger.warning(f"无法创建 judge 日志文件 {log_file_path}: {e}")
+                self.log_file_path = None
+
+    def write(self, data):
+        self.buffer.write(data)
+        if self.file:
             self.file.write(data)
-            self.file.flush()
 
-        def flush(self):
+    def flush(self):
+        if self.file:
             self.file.flush()
 
+    def getvalue(self) -> str:
+        return self.buffer.getvalue()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def get_judge_invocation_ids(tool_context) -> tuple:
+    """从 tool_context 中取出 ADK 会话 ID 和本次调用的 ID，用于标识 judge 结果"""
+    session = getattr(tool_context, 'session', None)
+    if session is None:
+        invocation_context = getattr(tool_context, '_invocation_context', None)
+        session = getattr(invocation_context, 'session', None)
+    session_id = getattr(session, 'id', None)
+    invocation_id = getattr(tool_context, 'function_call_id', None) or getattr(tool_context, 'invocation_id', None)
+    return session_id, invocation_id or uuid.uuid4().hex
+
+
+def get_judge_log_path(session_id: Optional[str], invocation_id: str) -> Optional[str]:
+    """JUDGE_LOG_DIR 下该次调用独有的日志文件路径；未配置时返回 None（只保留在内存中）"""
+    if not JUDGE_LOG_DIR:
+        return None
+    safe_name = re.sub(r'[^\w.-]+', '_', f"{session_id or 'no_session'}_{invocation_id}")
+    return os.path.join(JUDGE_LOG_DIR, f"judge_{safe_name}.log")
+
+
+_replay_cache = None
+
+
+def get_replay_cache() -> Optional[ReplayCache]:
+    """按配置返回 judge 回放缓存，未启用时返回 None"""
+    global _replay_cache
+    if not JUDGE_REPLAY_CACHE:
+        return None
+    if _replay_cache is None:
+        _replay_cache = ReplayCache(JUDGE_REPLAY_CACHE_DIR, JUDGE_REPLAY_CACHE_MAX_MB * 1024 * 1024)
+    return _replay_cache
+
+
+class JudgeRun:
+    """一次 judge 调用的状态，由 prepare_judge 创建、judge_steps 使用"""
+
+    def __init__(self, result, child=None, engine=None, input_file=None, input_lines=(), log_file_path=None,
+                 save_to_replay_cache=None):
+        self.result = result
+        self.child = child
+        self.engine = engine
+        self.input_file = input_file
+        self.input_lines = input_lines
+        self.log_file_path = log_file_path
+        self.save_to_replay_cache = save_to_replay_cache
+
+
+def prepare_judge(tool_context, entry_command: str, input_file: Optional[str] = None, workspace_dir: Optional[str] = None, prompt_pattern: Optional[str] = None) -> 'JudgeRun':
+    """
+    judge 启动程序之前的部分：检查参数、查回放缓存，然后启动程序
+    返回的 JudgeRun.child 为 None 时，JudgeRun.result 已经是最终结果（参数错误或回放命中）
+    """
     # 确定工作目录
     if workspace_dir:
         # 验证路径安全性
         if not validate_workspace_dir(workspace_dir):
-            return {
+            return JudgeRun({
                 "success": False,
                 "log": '',
                 "user_input": '',
                 "error": f"工作目录 '{workspace_dir}' 不在允许的基础目录 '{WORKSPACE_DIR}' 下"
-            }
+            })
         work_dir = workspace_dir
     else:
         work_dir = WORKSPACE_DIR
     
-    log_file_path = os.path.join(WORKSPACE_DIR, 'pexpect_interact.log')
+    # 每次调用独立记录交互过程，结果中带上会话和调用 ID
+    session_id, invocation_id = get_judge_invocation_ids(tool_context)
+    log_file_path = get_judge_log_path(session_id, invocation_id)
     result = {
         "success": False,
         "log": '',
         "user_input": '',
-        "error": None
+        "error": None,
+        "session_id": session_id,
+        "invocation_id": invocation_id,
+        "replayed": False
     }
     
-    # 记录所有用户输入
-    user_inputs = []
-    
     # 确保 WORKSPACE_DIR 存在
     os.makedirs(WORKSPACE_DIR, exist_ok=True)
 
     if input_file and not os.path.exists(input_file):
         result["error"] = f"输入文件{input_file}不存在，请检查路径后重新调用。"
-        return result
+        return JudgeRun(result)
+
+    if prompt_pattern:
+        try:
+            compile_prompt_pattern(prompt_pattern)
+        except re.error as e:
+            result["error"] = f"提示符正则 {prompt_pattern} 无效: {e}"
+            return JudgeRun(result)
 
     input_lines = []
     if input_file and os.path.exists(input_file):
         with open(input_file, 'r', encoding='utf-8') as infile:
             input_lines = [line.rstrip('\n') for line in infile]
     
-    # 检查并获取 conda 环境路径
-    conda_env_path = None
-    # 方法1: 优先使用启动脚本设置的 CONDA_ENV_PATH 环境变量
-    if 'CONDA_ENV_PATH' in os.environ and os.environ['CONDA_ENV_PATH'].strip():
-        conda_env_path = os.environ['CONDA_ENV_PATH'].strip()
-    # 方法2: 检查 CONDA_PREFIX 环境变量（当前激活的 conda 环境）
-    elif 'CONDA_PREFIX' in os.environ:
-        conda_env_path = os.environ['CONDA_PREFIX']
-    # 方法3: 检查 CONDA_DEFAULT_ENV 并尝试获取完整路径
-    elif 'CONDA_DEFAULT_ENV' in os.environ:
-        try:
-            # 尝试通过 conda info 获取环境路径
-            result = subprocess.run(
-                ['conda', 'info', '--envs'],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-            if result.returncode == 0:
-                # 解析输出，查找当前环境
-                env_name = os.environ['CONDA_DEFAULT_ENV']
-                for line in result.stdout.split('\n'):
-                    if line.strip().startswith(env_name) or f'/{env_name}' in line:
-                        # 提取路径（通常在环境名之后）
-                        parts = line.split()
-                        if len(parts) >= 2:
-                            conda_env_path = parts[-1]
-                            break
-        except Exception as e:
-            logger.warning(f"获取 conda 环境信息时出错: {e}")
+    # conda 环境在服务启动时已解析并缓存（conda_env.py），这里不再执行 conda info
+    conda_env = get_conda_env()
     
     # 如果检测不到 conda 环境，返回错误
-    if not conda_env_path or conda_env_path.strip() == '':
+    if conda_env is None:
         result["error"] = "无法检测到 conda 环境。请确保已激活 conda 环境或设置了 CONDA_ENV_PATH 环境变量。"
-        return result
+        return JudgeRun(result)
+    conda_env_path = conda_env.path
     
-    entry_command = f"source activate {conda_env_path} && {entry_command}"
+    # 源码、命令、输入文件和环境都没有变化时，直接回放上一次的交互结果（包括产生的文件）
+    replay_cache = get_replay_cache()
+    cache_key, cache_roots, cache_before = None, [], None
+    if replay_cache:
+        try:
+            cache_key, cache_roots = replay_cache.make_key(
+                work_dir, entry_command, input_file,
+                {'conda_env_path': conda_env_path, 'prompt_pattern': prompt_pattern or ''}
+            )
+            if cache_key:
+                cached = replay_cache.lookup(cache_key)
+                if cached:
+                    for field in ("success", "log", "user_input", "error"):
+                        result[field] = cached.get(field)
+                    result["replayed"] = True
+                    return JudgeRun(result)
+                cache_before = snapshot(cache_roots)
+        except OSError as e:
+            print(f"计算 judge 回放缓存键失败，跳过缓存: {e}")
+            cache_key = None
+
+    def save_to_replay_cache():
+        if cache_key and result["error"] != "程序执行超时":
+            replay_cache.store(cache_key, result, cache_roots, cache_before, child.exitstatus)
+
+    if CONDA_ACTIVATION_MODE == 'shell':
+        entry_command = f"source activate {conda_env_path} && {entry_command}"
+        spawn_env = None
+    else:
+        # 直接以激活后的环境变量启动，不再为每个测试用例执行 conda 激活脚本
+        spawn_env = dict(conda_env.env)
 
-    child = pexpect.spawn('/bin/bash', ['-c', entry_command], cwd=work_dir, timeout=30, encoding='utf-8')
+    child = pexpect.spawn('/bin/bash', ['-c', entry_command], cwd=work_dir, timeout=30, encoding='utf-8', env=spawn_env)
+    return JudgeRun(result, child, InteractionEngine(child, prompt_pattern), input_file, input_lines,
+                    log_file_path, save_to_replay_cache)
 
-    with open(log_file_path, 'w', encoding='utf-8') as logfile:
+
+def judge_steps(run: JudgeRun):
+    """
+    judge 的交互流程（生成器）：等待输出、等待结束和关闭程序都 yield 出去，
+    同步的 judge 用 run_steps 执行，异步工具用 run_steps_async 在事件循环上执行
+    """
+    import pexpect
+
+    class CustomLogger:
+        """自定义日志记录器，直接写入原始内容，不添加前缀"""
+        def __init__(self, file):
+            self.file = file
+
+        def write(self, data):
+            # 直接写入原始数据，不添加 "program:" 前缀
+            self.file.write(data)
+            self.file.flush()
+
+        def flush(self):
+            self.file.flush()
+
+    child, engine, result = run.child, run.engine, run.result
+    save_to_replay_cache = run.save_to_replay_cache
+
+    # 记录所有用户输入
+    user_inputs = []
+
+    with JudgeTranscript(run.log_file_path) as logfile:
         # 使用 logfile_read 只记录程序输出，用户输入由bash回显自动记录
         logger = CustomLogger(logfile)
         child.logfile_read = logger
 
-        def wait_for_output(timeout=10, idle_threshold=1.0):
-            """等待程序输出，确保输出被记录到日志中
-            
-            使用短超时循环非阻塞读取，快速响应有输出的情况，
-            同时也能等待慢速输出（最多等待timeout秒）
-            
-            Args:
-                timeout: 最大等待时间（秒）
-                idle_threshold: 空闲多久后认为程序暂时停止输出（秒）
-            """
-            start_time = time.time()
-            idle_time = 0
-            
-            while time.time() - start_time < timeout:
-                try:
-                    # 尝试非阻塞读取
-                    data = child.read_nonblocking(size=1024, timeout=0.1)
-                    if data:
-                        # 有数据，重置空闲时间
-                        idle_time = 0
-                        # 数据已经被logfile_read自动记录了
-                    else:
-                        # 没有数据，增加空闲时间
-                        idle_time += 0.1
-                        
-                    # 如果空闲时间达到阈值，认为程序暂时不会再输出，提前返回
-                    if idle_time >= idle_threshold:
-                        break
-                        
-                except pexpect.TIMEOUT:
-                    # 没有数据可读，增加空闲时间
-                    idle_time += 0.1
-                    if idle_time >= idle_threshold:
-                        break
-                    time.sleep(0.1)
-                    
-                except pexpect.EOF:
-                    # 程序结束了
-                    raise
-
         def send_user_line(line):
             # 先等待并读取程序的输出（等待提示符显示）
-            # 使用较短的空闲超时（0.8秒），因为交互过程中响应较快
+            # 0.8秒空闲超时只在检测不到提示符和阻塞读时生效
             try:
-                wait_for_output(timeout=10, idle_threshold=0.8)
+                yield ('wait', 10, 0.8)
             except pexpect.EOF:
                 # 程序意外结束
                 raise
@@ -1072,13 +1232,11 @@ def judge(tool_context, context: str, entry_command: str, input_file: Optional[s
             user_inputs.append(line)
             
             # 发送用户输入
-            child.sendline(line)
+            engine.sendline(line)
             
-            # 立即短暂等待，读取输入的回显+程序的即时响应
-            # 回显通常很快，使用0.5秒空闲超时
-            time.sleep(0.05)  # 给一点时间让回显出现
+            # 读取输入的回显+程序的即时响应，程序再次等待输入时立即返回
             try:
-                wait_for_output(timeout=2, idle_threshold=0.5)
+                yield ('wait', 2, 0.5)
             except pexpect.EOF:
                 # 程序意外结束
                 raise
@@ -1087,38 +1245,38 @@ def judge(tool_context, context: str, entry_command: str, input_file: Optional[s
             logfile.flush()
             
             # 在开始输入之前，先等待程序的初始输出
-            # 程序启动时输出较慢，使用更长的空闲超时（2秒）
+            # 程序启动时输出较慢，兜底的空闲超时更长（2秒）
             try:
-                wait_for_output(timeout=10, idle_threshold=2.0)
+                yield ('wait', 10, 2.0)
             except pexpect.EOF:
                 # 程序在接收输入之前就结束了
                 last_output = child.before if hasattr(child, 'before') else ''
                 exit_status = child.exitstatus if hasattr(child, 'exitstatus') else None
-                child.close()
+                yield ('close', False)
                 result["success"] = False
                 result["error"] = f"程序在接收输入之前就已经结束，但提供了输入文件。程序可能不需要输入或运行失败。\n退出状态码: {exit_status}\n最后输出: {last_output}"
-                with open(log_file_path, 'r', encoding='utf-8') as logfile_read:
-                    result["log"] = logfile_read.read()
+                result["log"] = logfile.getvalue()
                 result["user_input"] = '\n'.join(user_inputs)
+                save_to_replay_cache()
                 return result
             
             # 依次发送每一行输入
-            for line in input_lines:
-                send_user_line(line.rstrip('\n'))
+            for line in run.input_lines:
+                yield from send_user_line(line.rstrip('\n'))
                 # send_user_line内部已经包含等待，不需要额外sleep
 
             # 所有输入发送完毕后，等待程序的最终输出和结束
             try:
                 # 先等待最后的输出（限时10秒，空闲超时1秒）
-                wait_for_output(timeout=10, idle_threshold=1.0)
-                # 然后等待程序结束
-                child.expect(pexpect.EOF, timeout=10)
+                reason = yield ('wait', 10, 1.0)
+                # 然后等待程序结束；程序已经阻塞在读终端上（还在等输入）时不必等满10秒
+                yield ('eof', 1 if reason == REASON_BLOCKED else 10)
             except pexpect.TIMEOUT:
                 # 程序在输入结束后仍然没有结束，发送Ctrl+C
                 # 先再等待一下输出
                 try:
-                    wait_for_output(timeout=0.5, idle_threshold=0.5)
-                except:
+                    yield ('wait', 0.5, 0.5)
+                except Exception:
                     pass
                 
                 # 记录Ctrl+C到user_inputs
@@ -1129,17 +1287,17 @@ def judge(tool_context, context: str, entry_command: str, input_file: Optional[s
                 
                 # 等待Ctrl+C后的输出
                 try:
-                    wait_for_output(timeout=1, idle_threshold=0.5)
-                except:
+                    yield ('wait', 1, 0.5)
+                except Exception:
                     pass
                 
                 try:
-                    child.expect(pexpect.EOF, timeout=3)
+                    yield ('eof', 3)
                 except pexpect.TIMEOUT:
-                    child.close(force=True)
+                    yield ('close', True)
                     result["error"] = "程序未正常结束，已发送 Ctrl+C 强制中断。这不代表程序运行成功/失败，请根据日志做额外的打分判断。"
 
-            child.close()
+            yield ('close', False)
 
             last_output = child.before if hasattr(child, 'before') else ''
             if child.exitstatus == 0 or child.exitstatus==130 or 'keyboardInterrupt' in last_output:
@@ -1158,15 +1316,47 @@ def judge(tool_context, context: str, entry_command: str, input_file: Optional[s
                 result["success"] = True
                 result["error"] = None
 
-    with open(log_file_path, 'r', encoding='utf-8') as logfile:
-        result["log"] = logfile.read()
+    result["log"] = logfile.getvalue()
     
     # 将用户输入列表转换为字符串，每行一个输入
     result["user_input"] = '\n'.join(user_inputs)
+    save_to_replay_cache()
     
     return result
 
 
+@OUTPUT_BUDGET.limit("log")
+def judge(tool_context, context: str, entry_command: str, input_file: Optional[str] = None, workspace_dir: Optional[str] = None, prompt_pattern: Optional[str] = None):
+    """
+    Run the program and simulate the user interaction, record the interaction process and output result.
+    The next input line is sent as soon as the program shows a prompt or blocks reading the terminal.
+    If the program does not exit automatically after the input ends, send Ctrl+C to force interrupt.
+    When KeyboardInterrupt is captured, it is also considered successful.
+
+    Args:
+        tool_context: Tool context
+        context: The expected output description and test requirements (only used for information transmission, not for judgment)
+        entry_command: The entry command of the program (e.g. "python main.py")
+        input_file: The path of the file containing the simulated user input (e.g. "a.in")
+        workspace_dir: Optional working directory (must be under WORKSPACE_DIR). If not provided, uses default WORKSPACE_DIR.
+        prompt_pattern: Optional regex that marks the program is waiting for input (e.g. "请输入.*[:：]"). Defaults to a trailing ':' / '>' / '?'.
+
+    Returns:
+        dict: A dictionary containing the test result, interaction record, and user inputs
+            - success: bool, whether the program executed successfully
+            - log: str, raw terminal output (program output + user input echo)
+            - user_input: str, all user inputs separated by newlines
+            - error: str or None, error message if any
+            - session_id: str or None, ADK session ID of this invocation
+            - invocation_id: str, unique ID of this judge invocation
+            - replayed: bool, whether the result was replayed from the cache (source, command and input unchanged)
+    """
+    run = prepare_judge(tool_context, entry_command, input_file, workspace_dir, prompt_pattern)
+    if run.child is None:
+        return run.result
+    return run_steps(judge_steps(run), run.engine)
+
+
 
 # 工具定义
 TOOL_DEFINITIONS = {
@@ -29,11 +29,14 @@ from .mcp_tools import (
     exit_loop, create_workspace, list_workspace,
     read_file, write_file, delete_file, 
     # execute_python_code, 
-    run_system_command, 
-    start_interative_shell, run_interactive_shell, kill_shell_session,
-    # judge,  # 添加Judge工具导入
+    kill_shell_session,
     deal_graph
 )
+from . import async_tools, mcp_tools
+from .config import ASYNC_TOOLS
+# run_system_command / start_interative_shell / run_interactive_shell 有同名的同步和异步实现，只在这里按 ASYNC_TOOLS 选择；
+# 异步工具的子进程和 pty 输出在事件循环上等待，不阻塞同一服务上的其他会话
+shell_tools = async_tools if ASYNC_TOOLS else mcp_tools
 
 ALL_TOOLS = [
     exit_loop,
@@ -43,10 +46,10 @@ ALL_TOOLS = [
     write_file,
     delete_file,
     # execute_python_code,
-    run_system_command,
+    shell_tools.run_system_command,
     # interactive_system_command,
-    start_interative_shell,
-    run_interactive_shell,
+    shell_tools.start_interative_shell,
+    shell_tools.run_interactive_shell,
     kill_shell_session,
     # meituan_search,
     # meituan_browse,
@@ -54,6 +57,10 @@ ALL_TOOLS = [
     deal_graph
 ]
 
+# 每次工具调用记录一个 span（设置 TRACE_DIR 时生效，见 tracing.py）
+from tracing import trace_tool
+ALL_TOOLS = [trace_tool(tool) for tool in ALL_TOOLS]
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -137,11 +144,19 @@ After all test cases are executed, output a summary JSON array containing the re
 [
     {
         'name': "read_file",
-        'description': "read a file",
+        'description': "read a file; large files are returned page by page, call again with offset=next_offset to read the rest",
         'parameters': {
             'file_path': {
                 "type": "STRING",
                 "description": "absolute path of the file to read"
+            },
+            'offset': {
+                "type": "INTEGER",
+                "description": "optional 0-based line number to start reading from"
+            },
+            'limit': {
+                "type": "INTEGER",
+                "description": "optional maximum number of lines to read"
             }
         }
     },
@@ -161,11 +176,19 @@ After all test cases are executed, output a summary JSON array containing the re
     },
     {
         'name': "list_workspace",
-        'description': "list file in the workspace",
+        'description': "list file in the workspace (venv, __pycache__, .git and similar directories are skipped)",
         'parameters': {
             'workspace_name': {
                 "type": "STRING",
                 "description": "The absolute path to the directory to list (must be absolute, not relative)"
+            },
+            'max_depth': {
+                "type": "INTEGER",
+                "description": "optional maximum depth to list (1 = direct children only), default 4"
+            },
+            'ignore': {
+                "type": "STRING",
+                "description": "optional extra comma-separated name patterns to skip, e.g. \"*.log,data\""
             }
         }
     },
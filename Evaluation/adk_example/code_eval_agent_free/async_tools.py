@@ -0,0 +1,120 @@
+"""
+工具的异步版本
+
+mcp_tools 中的 run_system_command / start_interative_shell / run_interactive_shell 是同步函数，
+在 ADK api_server 中执行时一次较慢的 pytest 就会阻塞事件循环（或在线程池中排队），同一服务上的其他会话都要等待。
+这里提供同名、同签名的异步工具（config.ASYNC_TOOLS 开启时由 agent.py 注册）：
+  - run_system_command：asyncio 子进程，超时后结束整个进程组
+  - run_interactive_shell：pty 输出通过事件循环等待（interative_shell.step_async）
+  - start_interative_shell：会话启动后的 pty 输出同样通过事件循环等待
+"""
+
+import asyncio
+import os
+import signal
+import subprocess
+from typing import Any, Dict, Optional, Tuple
+
+from google.adk.tools import ToolContext
+
+from code_agent_local.interative_shell import step_async
+from .mcp_tools import (
+    OUTPUT_BUDGET, prepare_shell_input, prepare_system_command,
+    shell_step_error, system_command_error, system_command_result
+)
+
+async def run_command_async(command: str, timeout: float, cwd: Optional[str] = None,
+                            env: Optional[Dict[str, str]] = None) -> Tuple[str, str, int]:
+    """
+    用 asyncio 子进程执行 shell 命令，返回 (stdout, stderr, 退出码)
+    超时后结束整个进程组并抛出 subprocess.TimeoutExpired（与 subprocess.run 一致）
+    """
+    process = await asyncio.create_subprocess_shell(
+        command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=cwd,
+        env=env,
+        start_new_session=True,
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        await process.wait()
+        raise subprocess.TimeoutExpired(command, timeout)
+    return (stdout.decode('utf-8', errors='replace'), stderr.decode('utf-8', errors='replace'),
+            process.returncode)
+
+
+@OUTPUT_BUDGET.limit("stdout", "stderr")
+async def run_system_command(tool_context: ToolContext, command: str, timeout: int = 30):
+    """
+    Run the system command.
+
+    Args:
+        tool_context: Tool context
+        command: The system command to be executed
+        timeout: The timeout for the execution (seconds), default 30 seconds
+
+    Returns:
+        dict: A dictionary containing the result of the execution.
+    """
+    error, workdir = prepare_system_command(command)
+    if error:
+        return error
+    try:
+        stdout, stderr, return_code = await run_command_async(command, timeout, cwd=workdir)
+        return system_command_result(stdout, stderr, return_code, workdir)
+    except Exception as e:
+        return system_command_error(e)
+
+
+async def run_interactive_shell(tool_context: ToolContext, session_id: Optional[str] = None, user_input: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Run a interactive shell session.
+
+    The first time to call, you need to provide the cmd parameter to start a new session, and then provide the session_id to continue the previous session.
+    If you need to input content to the shell, provide the user_input parameter.
+
+    参数:
+        session_id (str, optional): The session ID, for continuing the previous session.
+        user_input (str, optional): The content to be input to the shell.
+
+    Returns:
+        Dict[str, Any]: A dictionary containing the result of the execution.
+            - session_id: str, The session ID
+            - output: str, The output of the shell
+            - waiting: bool, Whether to wait for input
+            - finished: bool, Whether the session is finished
+    """
+    error = prepare_shell_input(tool_context, session_id, user_input)
+    if error:
+        return error
+
+    try:
+        return await step_async(
+            session_id=session_id,
+            user_input=user_input
+        )
+    except Exception as e:
+        return shell_step_error(session_id, e)
+
+
+async def start_interative_shell(tool_context: ToolContext, cmd: str = "bash") -> Dict[str, Any]:
+    """
+    Start a interactive shell session.
+    
+    Args:
+        tool_context: Tool context
+        cmd: The shell command to be executed
+    Returns:
+        dict: A dictionary containing the result of the execution.
+    """
+    try:
+        return await step_async(cmd=cmd)
+    except Exception as e:
+        return shell_step_error(None, e)
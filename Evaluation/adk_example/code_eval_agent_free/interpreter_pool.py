@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+预热的 Python 解释器池
+
+PythonInterpreterMCP.execute_code 原来每次请求都写临时文件并 subprocess.run 一个新的解释器：
+解释器启动加上 import pandas / numpy 每段代码要 0.5-2 秒，而且同步的 subprocess.run 会阻塞 aiohttp 的事件循环。
+这里预先启动若干个 worker 解释器（本文件以 --worker 运行），启动时导入配置的模块（PYTHON_POOL_PRELOAD）：
+  - 请求通过管道（每行一个 JSON）发给空闲的 worker
+  - worker 为每段代码 fork 一个子进程执行：子进程继承已导入的模块，但命名空间、工作目录、标准输入输出都是新的，
+    代码之间互不影响，行为与原来的"每次一个新解释器"一致（__name__ == '__main__'，sys.path[0] 为临时文件目录）
+  - 子进程超时由 worker 结束整个进程组；worker 本身无响应（超时后仍无回复）时由池结束并重新启动
+"""
+
+import asyncio
+import atexit
+import importlib
+import json
+import logging
+import os
+import signal
+import sys
+import tempfile
+import time
+import traceback
+import types
+
+logger = logging.getLogger(__name__)
+
+# worker 在子进程超时之后仍无回复的宽限时间（秒），超过则认为 worker 卡住
+WORKER_GRACE = 5
+# worker 启动（导入预加载模块）的超时（秒）
+WORKER_START_TIMEOUT = 120
+# 等待子进程结束的轮询间隔上限（秒）
+POLL_INTERVAL = 0.02
+
+
+# ---------------------------------------------------------------------------
+# worker 端（在独立的解释器中运行）
+# ---------------------------------------------------------------------------
+
+def _child_main(code_file, cwd, out_fd, err_fd):
+    """fork 出的子进程：重定向标准输入输出后以 __main__ 执行代码文件，不返回"""
+    exit_code = 0
+    try:
+        os.setsid()
+        os.chdir(cwd)
+        null_fd = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(null_fd, 0)
+        os.dup2(out_fd, 1)
+        os.dup2(err_fd, 2)
+        sys.argv = [code_file]
+        sys.path[0] = os.path.dirname(code_file)
+        with open(code_file, 'r', encoding='utf-8') as f:
+            source = f.read()
+        # 新的 __main__ 模块（而不是普通字典）：代码中定义的类和函数可以按 __main__.X 被 pickle / multiprocessing 找到
+        main_module = types.ModuleType('__main__')
+        main_module.__file__ = code_file
+        main_module.__builtins__ = __builtins__
+        sys.modules['__main__'] = main_module
+        exec(compile(source, code_file, 'exec'), main_module.__dict__)
+    except SystemExit as e:
+        if e.code is None:
+            exit_code = 0
+        elif isinstance(e.code, int):
+            exit_code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except BaseException as e:
+        # 去掉 _child_main 自身的栈帧，与直接运行脚本时的输出一致
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        exit_code = 1
+    try:
+        atexit._run_exitfuncs()
+        sys.stdout.flush()
+        sys.stderr.flush()
+    finally:
+        os._exit(exit_code & 0xFF)
+
+
+def _run_request(request):
+    """在 fork 出的子进程中执行一段代码，超时结束整个进程组"""
+    timeout = request.get('timeout')
+    cwd = request.get('cwd') or tempfile.gettempdir()
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8') as f:
+        f.write(request['code'])
+        code_file = f.name
+    out = tempfile.TemporaryFile()
+    err = tempfile.TemporaryFile()
+    try:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            _child_main(code_file, cwd, out.fileno(), err.fileno())
+
+        deadline = time.monotonic() + timeout if timeout else None
+        interval = 0.001
+        timed_out = False
+        while True:
+            finished, status = os.waitpid(pid, os.WNOHANG)
+            if finished:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                timed_out = True
+                try:
+                    os.killpg(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                os.waitpid(pid, 0)
+                break
+            time.sleep(interval)
+            interval = min(interval * 2, POLL_INTERVAL)
+
+        if timed_out:
+            return {'timeout': True}
+        out.seek(0)
+        err.seek(0)
+        return {
+            'stdout': out.read().decode('utf-8', errors='replace'),
+            'stderr': err.read().decode('utf-8', errors='replace'),
+            # 与 subprocess 一致：被信号结束时为负的信号值
+            'return_code': -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status),
+        }
+    finally:
+        out.close()
+        err.close()
+        os.unlink(code_file)
+
+
+def worker_main(preload):
+    """worker 主循环：导入预加载模块后逐行读取请求、写回结果；标准输入关闭（服务退出）时结束"""
+    protocol_out = os.fdopen(os.dup(1), 'w', encoding='utf-8')
+    # 预加载模块的输出不能混进协议管道
+    os.dup2(2, 1)
+    loaded = []
+    for name in preload:
+        try:
+            importlib.import_module(name)
+            loaded.append(name)
+        except Exception as e:
+            print(f"预加载模块 {name} 失败: {e}", file=sys.stderr)
+    protocol_out.write(json.dumps({'ready': True, 'preloaded': loaded}) + '\n')
+    protocol_out.flush()
+
+    for line in sys.stdin:
+        try:
+            response = _run_request(json.loads(line))
+        except Exception as e:
+            response = {'error': f"{type(e).__name__}: {e}"}
+        protocol_out.write(json.dumps(response, ensure_ascii=False) + '\n')
+        protocol_out.flush()
+
+
+# ---------------------------------------------------------------------------
+# 服务端（在 aiohttp 事件循环中使用）
+# ---------------------------------------------------------------------------
+
+class ExecutionTimeout(Exception):
+    """代码执行超时"""
+
+
+class InterpreterWorker:
+    """一个预热的 worker 解释器进程"""
+
+    def __init__(self, process, preloaded):
+        self.process = process
+        self.preloaded = preloaded
+        self.executions = 0
+
+    @property
+    def alive(self):
+        return self.process.returncode is None
+
+    async def kill(self):
+        if self.alive:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        await self.process.wait()
+
+
+class InterpreterPool:
+    """
+    固定数量的预热 worker，按请求分配；size 个请求之外的请求排队等待空闲 worker
+
+    Args:
+        size: worker 数量
+        preload: worker 启动时导入的模块名列表（导入失败只记录警告）
+        cwd: 代码执行的工作目录，默认与原实现一致为 /tmp
+    """
+
+    def __init__(self, size, preload=(), cwd='/tmp'):
+        self.size = size
+        self.preload = [name for name in preload if name]
+        self.cwd = cwd
+        self._idle = None
+        self._workers = set()
+        self.stats = {'executions': 0, 'timeouts': 0, 'respawns': 0}
+
+    async def _spawn(self):
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__), '--worker', ','.join(self.preload),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            start_new_session=True,
+            # 单条结果可能包含大量输出
+            limit=64 * 1024 * 1024,
+        )
+        try:
+            line = await asyncio.wait_for(process.stdout.readline(), WORKER_START_TIMEOUT)
+            ready = json.loads(line) if line else {}
+        except (asyncio.TimeoutError, ValueError):
+            ready = {}
+        worker = InterpreterWorker(process, ready.get('preloaded', []))
+        if not ready.get('ready'):
+            await worker.kill()
+            raise RuntimeError(f"Python worker 启动失败（退出码 {process.returncode}）")
+        self._workers.add(worker)
+        return worker
+
+    async def start(self):
+        """启动所有 worker（并行导入预加载模块）"""
+        self._idle = asyncio.Queue()
+        workers = await asyncio.gather(*(self._spawn() for _ in range(self.size)))
+        for worker in workers:
+            self._idle.put_nowait(worker)
+        preloaded = workers[0].preloaded if workers else []
+        logger.info(f"Python 解释器池已启动: {self.size} 个 worker，预加载 {preloaded}")
+
+    async def _replace(self, worker):
+        """结束卡住的 worker 并启动新的 worker 放回池中"""
+        self._workers.discard(worker)
+        await worker.kill()
+        self.stats['respawns'] += 1
+        try:
+            replacement = await self._spawn()
+        except Exception as e:
+            logger.error(f"重新启动 Python worker 失败: {e}")
+            # 保持池的容量：下次取到时再尝试启动
+            replacement = None
+        self._idle.put_nowait(replacement)
+
+    async def execute(self, code, timeout):
+        """
+        在空闲 worker 中执行代码
+
+        Returns:
+            dict: stdout / stderr / return_code
+
+        Raises:
+            ExecutionTimeout: 代码执行超时
+        """
+        worker = await self._idle.get()
+        try:
+            if worker is None or not worker.alive:
+                if worker is not None:
+                    self._workers.discard(worker)
+                worker = await self._spawn()
+        except Exception:
+            self._idle.put_nowait(None)
+            raise
+
+        request = {'code': code, 'timeout': timeout, 'cwd': self.cwd}
+        try:
+            worker.process.stdin.write((json.dumps(request) + '\n').encode('utf-8'))
+            await worker.process.stdin.drain()
+            wait = timeout + WORKER_GRACE if timeout else None
+            line = await asyncio.wait_for(worker.process.stdout.readline(), wait)
+            if not line:
+                raise ConnectionError("Python worker 意外退出")
+            response = json.loads(line)
+        except asyncio.TimeoutError:
+            logger.warning(f"Python worker {worker.process.pid} 无响应，重新启动")
+            self.stats['timeouts'] += 1
+            await self._replace(worker)
+            raise ExecutionTimeout()
+        except (ConnectionError, ValueError, OSError):
+            await self._replace(worker)
+            raise
+        except asyncio.CancelledError:
+            # 请求被取消时 worker 的回复无法再对应，直接替换
+            asyncio.ensure_future(self._replace(worker))
+            raise
+
+        worker.executions += 1
+        self.stats['executions'] += 1
+        self._idle.put_nowait(worker)
+        if response.get('timeout'):
+            self.stats['timeouts'] += 1
+            raise ExecutionTimeout()
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response
+
+    async def close(self):
+        for worker in list(self._workers):
+            await worker.kill()
+        self._workers.clear()
+
+
+async def execute_once(code, timeout, cwd='/tmp'):
+    """不使用池（PYTHON_POOL_SIZE=0）时的执行方式：每次一个新的解释器，与原实现相同但不阻塞事件循环"""
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as f:
+        f.write(code)
+        temp_file = f.name
+    try:
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, temp_file,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=cwd,
+            start_new_session=True,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            await process.wait()
+            raise ExecutionTimeout()
+        return {
+            'stdout': stdout.decode('utf-8', errors='replace'),
+            'stderr': stderr.decode('utf-8', errors='replace'),
+            'return_code': process.returncode,
+        }
+    finally:
+        os.unlink(temp_file)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2 and sys.argv[1] == '--worker':
+        worker_main(sys.argv[2].split(',') if len(sys.argv) > 2 and sys.argv[2] else [])
+    else:
+        print(f"用法: {sys.argv[0]} --worker [模块1,模块2,...]", file=sys.stderr)
+        sys.exit(2)
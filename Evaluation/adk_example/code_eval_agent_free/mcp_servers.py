@@ -5,10 +5,10 @@
 """
 
 import asyncio
+import fnmatch
+import functools
 import json
 import logging
-import subprocess
-import tempfile
 import os
 import sys
 from pathlib import Path
@@ -31,7 +31,13 @@ from mcp_config import (
     FILE_OPERATIONS_MCP_URL, 
     SYSTEM_OPERATIONS_MCP_URL,
     WORKSPACE_DIR,
+    PYTHON_POOL_SIZE,
+    PYTHON_POOL_PRELOAD,
+    FILE_READ_MAX_BYTES,
+    LIST_FILES_PAGE_SIZE,
 )
+from interpreter_pool import ExecutionTimeout, InterpreterPool, execute_once
+from ranged_read import DEFAULT_MAX_MATCHES, grep_file, read_byte_range, read_line_range, tail_lines
 
 class PythonInterpreterMCP:
     """Python 解释器 MCP 服务器"""
@@ -40,6 +46,8 @@ class PythonInterpreterMCP:
     def __init__(self, port: int = None):
         self.port = port or int(PYTHON_INTERPRETER_PORT)
         print(self.port)
+        # 预热的解释器池，PYTHON_POOL_SIZE=0 时每次请求启动新的解释器
+        self.pool = InterpreterPool(PYTHON_POOL_SIZE, PYTHON_POOL_PRELOAD) if PYTHON_POOL_SIZE > 0 else None
         self.app = web.Application()
         self.setup_routes()
     
@@ -57,37 +65,23 @@ class PythonInterpreterMCP:
             timeout = data.get('timeout', self.TIMEOUT)
             
             logger.info(f"执行 Python 代码: {code[:100]}...")
-            
-            # 创建临时文件
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as f:
-                f.write(code)
-                temp_file = f.name
-            
-            try:
-                # 执行代码
-                result = subprocess.run(
-                    [sys.executable, temp_file],
-                    capture_output=True,
-                    text=True,
-                    timeout=timeout,
-                    cwd='/tmp'
-                )
-                
-                response_data = {
-                    'status': 'success',
-                    'stdout': result.stdout,
-                    'stderr': result.stderr,
-                    'return_code': result.returncode,
-                    'execution_time': datetime.now().isoformat()
-                }
-                
-            finally:
-                # 清理临时文件
-                os.unlink(temp_file)
-            
+
+            if self.pool:
+                result = await self.pool.execute(code, timeout)
+            else:
+                result = await execute_once(code, timeout)
+
+            response_data = {
+                'status': 'success',
+                'stdout': result['stdout'],
+                'stderr': result['stderr'],
+                'return_code': result['return_code'],
+                'execution_time': datetime.now().isoformat()
+            }
+
             return web.json_response(response_data)
-            
-        except subprocess.TimeoutExpired:
+
+        except ExecutionTimeout:
             return web.json_response({
                 'status': 'error',
                 'error': '代码执行超时'
@@ -104,6 +98,7 @@ class PythonInterpreterMCP:
         return web.json_response({
             'status': 'healthy',
             'service': 'python-interpreter',
+            'pool': self.pool.stats if self.pool else None,
             'timestamp': datetime.now().isoformat()
         })
     
@@ -145,6 +140,9 @@ class PythonInterpreterMCP:
     
     async def start(self):
         """启动服务器"""
+        if self.pool:
+            await self.pool.start()
+            self.app.on_cleanup.append(lambda app: self.pool.close())
         runner = web.AppRunner(self.app)
         await runner.setup()
         site = web.TCPSite(runner, 'localhost', self.port)
@@ -152,6 +150,29 @@ class PythonInterpreterMCP:
         logger.info(f"Python 解释器 MCP 服务器启动在端口 {self.port}")
         return runner
 
+def list_directory_page(directory: Path, pattern: Optional[str], offset: int, limit: int):
+    """按名称排序列出目录（可按 glob 过滤），只对返回的一页调用 stat，返回 (条目列表, 匹配总数)"""
+    if pattern and ('/' in pattern or '**' in pattern):
+        paths = sorted(directory.glob(pattern))
+    else:
+        with os.scandir(directory) as entries:
+            names = sorted(entry.name for entry in entries)
+        if pattern:
+            names = fnmatch.filter(names, pattern)
+        paths = [directory / name for name in names]
+    files = []
+    for item in paths[offset:offset + limit]:
+        try:
+            is_file = item.is_file()
+            files.append({
+                'name': str(item.relative_to(directory)),
+                'type': 'directory' if item.is_dir() else 'file',
+                'size': item.stat().st_size if is_file else None
+            })
+        except OSError:
+            continue
+    return files, len(paths)
+
 class FileOperationsMCP:
     """文件操作 MCP 服务器"""
     
@@ -198,14 +219,35 @@ class FileOperationsMCP:
                     'error': '文件不存在'
                 }, status=404)
             
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
+            # 只读取请求的部分（grep / tail / 字节范围 / 行范围），在线程池中执行，不阻塞事件循环
+            path = str(file_path)
+            limit = data.get('limit')
+            max_bytes = data.get('max_bytes') or FILE_READ_MAX_BYTES
+            loop = asyncio.get_running_loop()
+            if data.get('grep'):
+                found = await loop.run_in_executor(None, functools.partial(
+                    grep_file, path, data['grep'], bool(data.get('ignore_case')), int(data.get('context') or 0),
+                    limit or DEFAULT_MAX_MATCHES, max_bytes))
+                return web.json_response({'status': 'success', 'path': path, **found})
+            if data.get('tail') is not None:
+                content, first_line = await loop.run_in_executor(
+                    None, tail_lines, path, int(data['tail']), max_bytes)
+                extra = {'first_line': first_line}
+            elif data.get('byte_offset') is not None:
+                content, file_size, next_byte_offset = await loop.run_in_executor(
+                    None, read_byte_range, path, int(data['byte_offset']), limit, max_bytes)
+                extra = {'file_size': file_size, 'next_byte_offset': next_byte_offset}
+            else:
+                content, total_lines, next_offset = await loop.run_in_executor(
+                    None, read_line_range, path, int(data.get('offset') or 0), limit, max_bytes)
+                extra = {'total_lines': total_lines, 'next_offset': next_offset}
+
             return web.json_response({
                 'status': 'success',
                 'content': content,
                 'size': len(content),
-                'path': str(file_path)
+                'path': path,
+                **extra
             })
             
         except Exception as e:
@@ -266,19 +308,21 @@ class FileOperationsMCP:
                     'error': '目录不存在'
                 }, status=404)
             
-            files = []
-            for item in directory.iterdir():
-                file_info = {
-                    'name': item.name,
-                    'type': 'directory' if item.is_dir() else 'file',
-                    'size': item.stat().st_size if item.is_file() else None
-                }
-                files.append(file_info)
+            # pattern 为 glob（如 *.csv、**/*.py），含 / 或 ** 时按路径匹配，否则只匹配文件名
+            pattern = data.get('pattern')
+            offset = max(int(data.get('offset') or 0), 0)
+            limit = int(data.get('limit') or LIST_FILES_PAGE_SIZE)
+            loop = asyncio.get_running_loop()
+            files, total = await loop.run_in_executor(None, list_directory_page, directory, pattern, offset, limit)
+            next_offset = offset + limit if offset + limit < total else None
             
             return web.json_response({
                 'status': 'success',
                 'files': files,
-                'directory': str(directory)
+                'directory': str(directory),
+                'total': total,
+                'offset': offset,
+                'next_offset': next_offset
             })
             
         except Exception as e:
@@ -3,12 +3,15 @@
 提供 Python 解释器、文件操作和系统操作功能
 """
 
+import io
 import os
+import re
 import subprocess
+import uuid
 import tempfile
 import shutil
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 from google.adk.tools import ToolContext
 from google.adk.tools.mcp_tool.mcp_toolset import MCPToolset
 from google.adk.tools.mcp_tool.mcp_session_manager import SseServerParams
@@ -18,7 +21,10 @@ import pexpect
 import asyncio
 from aiohttp import web
 from typing import Dict, Any, Optional
-from code_agent_local.interative_shell import step, terminate
+from code_agent_local.interative_shell import step, terminate, configure_pool, serve_pool_metrics
+from code_eval_agent_free.output_budget import OutputBudget, walk_workspace
+from code_eval_agent_free.ranged_read import (DEFAULT_MAX_MATCHES, get_line_index, grep_file, read_byte_range,
+                                              read_line_range, tail_lines)
 from datetime import datetime
 import time
 
@@ -33,10 +39,19 @@ try:
         MCP_SSE_TIMEOUT,
         WORKSPACE_DIR,
         ALLOWED_EXTENSIONS,
-        MAX_FILE_SIZE,
         SANDBOX_MODE,
         CURRENT_EXECUTION_ID,
-        ENABLE_PATH_RESTRICTION
+        ENABLE_PATH_RESTRICTION,
+        JUDGE_LOG_DIR,
+        TOOL_OUTPUT_MAX_BYTES,
+        TOOL_OUTPUT_SPILL_DIR,
+        LIST_WORKSPACE_IGNORE,
+        SHELL_POOL_MAX_SESSIONS,
+        SHELL_SESSION_IDLE_TTL,
+        SHELL_SESSION_CPU_SECONDS,
+        SHELL_SESSION_MEMORY_MB,
+        SHELL_POOL_PREWARM,
+        SHELL_POOL_METRICS_PORT
     )
 except ImportError:
     # 如果相对导入失败，使用绝对导入
@@ -47,13 +62,31 @@ except ImportError:
         MCP_SSE_TIMEOUT,
         WORKSPACE_DIR,
         ALLOWED_EXTENSIONS,
-        MAX_FILE_SIZE,
         SANDBOX_MODE,
         CURRENT_EXECUTION_ID,
-        ENABLE_PATH_RESTRICTION
+        ENABLE_PATH_RESTRICTION,
+        JUDGE_LOG_DIR,
+        TOOL_OUTPUT_MAX_BYTES,
+        TOOL_OUTPUT_SPILL_DIR,
+        LIST_WORKSPACE_IGNORE,
+        SHELL_POOL_MAX_SESSIONS,
+        SHELL_SESSION_IDLE_TTL,
+        SHELL_SESSION_CPU_SECONDS,
+        SHELL_SESSION_MEMORY_MB,
+        SHELL_POOL_PREWARM,
+        SHELL_POOL_METRICS_PORT
     )
 SAFE_COMMANDS = ['ls', 'pwd', 'echo', 'cat', 'head', 'tail', 'grep', 'find', 'python', 'python3', 'chmod', 'cd', 'pytest']
         
+# 工具输出预算：超过 TOOL_OUTPUT_MAX_BYTES 的输出只保留首尾，完整内容写入 TOOL_OUTPUT_SPILL_DIR
+OUTPUT_BUDGET = OutputBudget(TOOL_OUTPUT_MAX_BYTES, TOOL_OUTPUT_SPILL_DIR)
+
+# 交互式 shell 会话池：限制存活会话数、回收空闲会话、限制每个会话的 CPU / 内存，并预热 bash 进程
+configure_pool(max_sessions=SHELL_POOL_MAX_SESSIONS, idle_ttl=SHELL_SESSION_IDLE_TTL,
+               cpu_seconds=SHELL_SESSION_CPU_SECONDS, memory_mb=SHELL_SESSION_MEMORY_MB, prewarm=SHELL_POOL_PREWARM)
+if SHELL_POOL_METRICS_PORT:
+    serve_pool_metrics(SHELL_POOL_METRICS_PORT)
+
 # 数据模型定义
 class PythonCode(BaseModel):
     """Python代码执行请求"""
@@ -219,16 +252,24 @@ data/*.json
     
     return result
 
-def list_workspace(tool_context: ToolContext, workspace_name: Optional[str] = None):
+def list_workspace(tool_context: ToolContext, workspace_name: Optional[str] = None, max_depth: int = 4,
+                   ignore: Optional[str] = None, max_entries: int = 500):
     """
     List the files and directories in the workspace.
+    Directories matching the ignore patterns (venv, __pycache__, .git, ... by default) are skipped without being traversed.
     
     Args:
         tool_context: Tool context
         workspace_name: The name of the workspace, if None, use the current execution ID.
+        max_depth: The maximum depth to list (1 = direct children only), default 4.
+        ignore: Optional extra comma-separated name patterns to skip (e.g. "*.log,data").
+        max_entries: The maximum number of entries to return, default 500.
     
     Returns:
         dict: A dictionary containing the list of files and directories in the workspace.
+            - files: list of entries (path, type, size)
+            - skipped: directories skipped by the ignore patterns
+            - truncated: bool, whether the listing was cut off by max_entries; narrow it with workspace_name or ignore
     """
     if workspace_name is None:
         workspace_name = CURRENT_EXECUTION_ID
@@ -238,24 +279,17 @@ def list_workspace(tool_context: ToolContext, workspace_name: Optional[str] = No
     if not workspace_path.exists():
         return {"error": "The workspace does not exist！"}
     
-    files = []
-    for item in workspace_path.rglob("*"):
-        if item.is_file():
-            files.append({
-                "path": str(item.relative_to(workspace_path)),
-                "size": item.stat().st_size,
-                "type": "file"
-            })
-        elif item.is_dir():
-            files.append({
-                "path": str(item.relative_to(workspace_path)),
-                "type": "directory"
-            })
+    ignore_patterns = list(LIST_WORKSPACE_IGNORE)
+    if ignore:
+        ignore_patterns += [pattern.strip() for pattern in ignore.split(',') if pattern.strip()]
+    files, skipped, truncated = walk_workspace(str(workspace_path), ignore_patterns, max_depth, max_entries)
     
     return {
         "workspace_path": str(workspace_path),
         "workspace_name": workspace_name,
-        "files": files
+        "files": files,
+        "skipped": skipped,
+        "truncated": truncated
     }
 
 def validate_write_path(file_path: str) -> bool:
@@ -299,16 +333,35 @@ def validate_read_file_path(file_path: str) -> bool:
     
     return True
 
-def read_file(tool_context: ToolContext, file_path: str):
+def read_file(tool_context: ToolContext, file_path: str, offset: int = 0, limit: Optional[int] = None,
+              tail: Optional[int] = None, grep: Optional[str] = None, context: int = 0,
+              ignore_case: bool = False, byte_offset: Optional[int] = None):
     """
     Read the content of the file.
+    Large files are returned page by page: if next_offset is not None, call again with offset=next_offset to read the rest.
+    Only the requested part of the file is read, so files of any size can be inspected:
+    use tail to read the end of a log, grep to search within a large file, byte_offset for files without line breaks.
     
     Args:
         tool_context: Tool context
         file_path: The path of the file.
+        offset: The line number (0-based) to start reading from, default 0.
+        limit: The maximum number of lines to read, default reads until the output size budget is reached.
+            With grep: the maximum number of matching lines; with byte_offset: the number of bytes.
+        tail: Optional, read the last N lines of the file instead.
+        grep: Optional, a regular expression (matched per line) to search for in the file instead of reading it.
+        context: With grep, the number of lines to show before and after each match, default 0.
+        ignore_case: With grep, match case-insensitively, default False.
+        byte_offset: Optional, read raw bytes starting at this byte offset instead of lines.
     
     Returns:
         dict: A dictionary containing the content of the file.
+            - content: str, lines [offset, next_offset) of the file
+            - total_lines: int, the number of lines in the file
+            - next_offset: int or None, the offset of the next page, None if the end of the file is reached
+            With tail: content and first_line (the line number of the first returned line).
+            With grep: matches (line, text, before, after) and truncated.
+            With byte_offset: content, size (bytes) and next_byte_offset.
     """
     if not validate_read_file_path(file_path):
         return {"error": "The file path is not allowed to be read! Please concentrate on the file path in the project directory!"}
@@ -318,17 +371,43 @@ def read_file(tool_context: ToolContext, file_path: str):
         if not file_path.exists():
             return {"error": "文件不存在"}
         
-        if file_path.stat().st_size > MAX_FILE_SIZE:
-            return {"error": "文件过大"}
+        path = str(file_path)
+        max_bytes = OUTPUT_BUDGET.max_bytes
+        if grep:
+            found = grep_file(path, grep, ignore_case, max(context or 0, 0),
+                              limit or DEFAULT_MAX_MATCHES, max_bytes)
+            return {"file_path": path, "pattern": grep, **found}
         
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        return {
-            "file_path": str(file_path),
-            "content": content,
-            "size": len(content)
-        }
+        if tail is not None:
+            content, first_line = tail_lines(path, tail, max_bytes)
+            result = {
+                "file_path": path,
+                "content": content,
+                "size": len(content),
+                "first_line": first_line,
+                "total_lines": get_line_index(path).total_lines
+            }
+        elif byte_offset is not None:
+            content, size, next_byte_offset = read_byte_range(path, byte_offset, limit, max_bytes)
+            result = {
+                "file_path": path,
+                "content": content,
+                "byte_offset": max(byte_offset, 0),
+                "size": size,
+                "next_byte_offset": next_byte_offset
+            }
+        else:
+            content, total_lines, next_offset = read_line_range(path, offset, limit, max_bytes)
+            result = {
+                "file_path": path,
+                "content": content,
+                "size": len(content),
+                "offset": max(offset or 0, 0),
+                "total_lines": total_lines,
+                "next_offset": next_offset
+            }
+        # 单行超过预算（如压缩过的 js / json）时只保留首尾；原文件就在磁盘上，不需要另存
+        return OUTPUT_BUDGET.apply(result, ["content"], "read_file", spill=False)
     except Exception as e:
         return {"error": f"读取文件失败: {str(e)}"}
 
@@ -501,6 +580,39 @@ def execute_python_code(tool_context: ToolContext, code: str, timeout: int = 30,
     except Exception as e:
         return {"error": f"代码执行失败: {str(e)}"}
 
+def prepare_system_command(command: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    """
+    run_system_command（同步 / 异步版本）执行前的检查
+
+    Returns:
+        tuple: (不允许执行时的错误结果，否则为 None, 命令的工作目录)
+    """
+    if SANDBOX_MODE:
+        # 在沙盒模式下，只允许安全的命令
+        safe_commands = SAFE_COMMANDS
+        if not any(cmd in command for cmd in safe_commands):
+            return {"error": "你执行的命令在沙盒模式下不被允许; 安全命令列表: " + str(safe_commands)}, WORKSPACE_DIR
+    logger.info(f"执行系统命令: {command}")
+    return None, WORKSPACE_DIR
+
+
+def system_command_result(stdout: str, stderr: str, return_code: int, workdir: str) -> Dict[str, Any]:
+    """run_system_command 的返回结果"""
+    return {
+        "stdout": stdout,
+        "stderr": stderr,
+        "return_code": return_code
+    }
+
+
+def system_command_error(error: Exception) -> Dict[str, Any]:
+    """run_system_command 执行出错（含超时）时的返回结果"""
+    if isinstance(error, subprocess.TimeoutExpired):
+        return {"error": "命令执行超时"}
+    return {"error": f"命令执行失败: {str(error)}"}
+
+
+@OUTPUT_BUDGET.limit("stdout", "stderr")
 def run_system_command(tool_context: ToolContext, command: str, timeout: int = 30):
     """
     Run the system command.
@@ -513,31 +625,21 @@ def run_system_command(tool_context: ToolContext, command: str, timeout: int = 3
     Returns:
         dict: A dictionary containing the result of the execution.
     """
-    if SANDBOX_MODE:
-        # 在沙盒模式下，只允许安全的命令
-        safe_commands = SAFE_COMMANDS
-        if not any(cmd in command for cmd in safe_commands):
-            return {"error": "你执行的命令在沙盒模式下不被允许; 安全命令列表: " + str(safe_commands)}
+    error, workdir = prepare_system_command(command)
+    if error:
+        return error
     try:
-        logger.info(f"执行系统命令: {command}")
         result = subprocess.run(
             command,
             shell=True,
             capture_output=True,
             text=True,
             timeout=timeout,
-            cwd=WORKSPACE_DIR
+            cwd=workdir
         )
-        
-        return {
-            "stdout": result.stdout,
-            "stderr": result.stderr,
-            "return_code": result.returncode
-        }
-    except subprocess.TimeoutExpired:
-        return {"error": "命令执行超时"}
+        return system_command_result(result.stdout, result.stderr, result.returncode, workdir)
     except Exception as e:
-        return {"error": f"命令执行失败: {str(e)}"}
+        return system_command_error(e)
 
 def interactive_system_command(
     tool_context: ToolContext,
@@ -625,77 +727,84 @@ def start_interative_shell(tool_context: ToolContext, cmd: str = "bash") -> Dict
     Returns:
         dict: A dictionary containing the result of the execution.
     """
-    session_id = None
     try:
-        result = step(
-            cmd=cmd,
-        )
-        return result
+        return step(cmd=cmd)
     except Exception as e:
-        return {
-            "error": str(e),
-            "session_id": session_id,
-            "output": session_id,
-            "waiting": False,
-            "finished": True
-        }
+        return shell_step_error(None, e)
 
 IS_IN_PYTHON_ENV = False
 
-def run_interactive_shell(tool_context: ToolContext, session_id: Optional[str] = None, user_input: Optional[str] = None) -> Dict[str, Any]:
+def prepare_shell_input(tool_context: ToolContext, session_id: Optional[str], user_input: Optional[str]) -> Optional[Dict[str, Any]]:
     """
-    Run a interactive shell session.
-    
-    The first time to call, you need to provide the cmd parameter to start a new session, and then provide the session_id to continue the previous session.
-    If you need to input content to the shell, provide the user_input parameter.
-    
-    参数:
-        session_id (str, optional): The session ID, for continuing the previous session.
-        user_input (str, optional): The content to be input to the shell.
-        
+    run_interactive_shell（同步 / 异步版本）发送输入前的检查，并更新会话的 python_env_state
+
     Returns:
-        Dict[str, Any]: A dictionary containing the result of the execution.
-            - session_id: str, The session ID
-            - output: str, The output of the shell
-            - waiting: bool, Whether to wait for input
-            - finished: bool, Whether the session is finished
+        不允许发送时的错误结果，否则为 None
     """
     # 获取当前会话的状态
     session_state = getattr(tool_context, 'python_env_state', {})
     if session_id not in session_state:
         session_state[session_id] = False
     is_in_python = session_state[session_id]
-    
+
     # 检查命令安全性
     if is_in_python and user_input:
         safe_commands = SAFE_COMMANDS
         current_command = user_input.split()[0] if user_input else ''
         if not any(cmd in current_command for cmd in safe_commands):
             return {"error": "你执行的命令在沙盒模式下不被允许; 安全命令列表: " + str(safe_commands)}
-    
+
     # 更新Python环境状态
     if user_input and user_input.startswith("python"):
         session_state[session_id] = True
     elif user_input == "exit":
         session_state[session_id] = False
-    
+
     # 保存状态回上下文
     setattr(tool_context, 'python_env_state', session_state)
+    return None
+
+
+def shell_step_error(session_id: Optional[str], error: Exception) -> Dict[str, Any]:
+    """run_interactive_shell 执行出错时的返回结果"""
+    return {
+        "error": str(error),
+        "session_id": session_id,
+        "output": "",
+        "waiting": False,
+        "finished": True
+    }
+
+
+def run_interactive_shell(tool_context: ToolContext, session_id: Optional[str] = None, user_input: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Run a interactive shell session.
     
+    The first time to call, you need to provide the cmd parameter to start a new session, and then provide the session_id to continue the previous session.
+    If you need to input content to the shell, provide the user_input parameter.
+    
+    参数:
+        session_id (str, optional): The session ID, for continuing the previous session.
+        user_input (str, optional): The content to be input to the shell.
+        
+    Returns:
+        Dict[str, Any]: A dictionary containing the result of the execution.
+            - session_id: str, The session ID
+            - output: str, The output of the shell
+            - waiting: bool, Whether to wait for input
+            - finished: bool, Whether the session is finished
+    """
+    error = prepare_shell_input(tool_context, session_id, user_input)
+    if error:
+        return error
+
     try:
-        result = step(
+        return step(
             session_id=session_id,
             user_input=user_input
         )
-        return result
     except Exception as e:
-        return {
-            "error": str(e),
-            "session_id": session_id,
-            "output": "",
-            "waiting": False,
-            "finished": True
-        }
+        return shell_step_error(session_id, e)
 
 def kill_shell_session(tool_context: ToolContext, session_id: str) -> Dict[str, Any]:
     """
@@ -830,6 +939,70 @@ def deal_graph(tool_context: ToolContext, graph_path_list: list, prompt: str):
     except Exception as e:
         return {"error": "图片解析失败"}
    
+class JudgeTranscript:
+    """
+    单次 judge 调用的交互记录
+
+    交互过程写入内存缓冲区，并发的 judge 调用互不干扰；
+    设置了 JUDGE_LOG_DIR 时同时写入该次调用独有的日志文件，便于事后排查
+    """
+
+    def __init__(self, log_file_path: Optional[str] = None):
+        self.buffer = io.StringIO()
+        self.log_file_path = log_file_path
+        self.file = None
+        if log_file_path:
+            try:
+                os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
+                self.file = open(log_file_path, 'w', encoding='utf-8')
+            except OSError as e:
+                logger.warning(f"无法创建 judge 日志文件 {log_file_path}: {e}")
+                self.log_file_path = None
+
+    def write(self, data):
+        self.buffer.write(data)
+        if self.file:
+            self.file.write(data)
+
+    def flush(self):
+        if self.file:
+            self.file.flush()
+
+    def getvalue(self) -> str:
+        return self.buffer.getvalue()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def get_judge_invocation_ids(tool_context) -> tuple:
+    """从 tool_context 中取出 ADK 会话 ID 和本次调用的 ID，用于标识 judge 结果"""
+    session = getattr(tool_context, 'session', None)
+    if session is None:
+        invocation_context = getattr(tool_context, '_invocation_context', None)
+        session = getattr(invocation_context, 'session', None)
+    session_id = getattr(session, 'id', None)
+    invocation_id = getattr(tool_context, 'function_call_id', None) or getattr(tool_context, 'invocation_id', None)
+    return session_id, invocation_id or uuid.uuid4().hex
+
+
+def get_judge_log_path(session_id: Optional[str], invocation_id: str) -> Optional[str]:
+    """JUDGE_LOG_DIR 下该次调用独有的日志文件路径；未配置时返回 None（只保留在内存中）"""
+    if not JUDGE_LOG_DIR:
+        return None
+    safe_name = re.sub(r'[^\w.-]+', '_', f"{session_id or 'no_session'}_{invocation_id}")
+    return os.path.join(JUDGE_LOG_DIR, f"judge_{safe_name}.log")
+
+
+@OUTPUT_BUDGET.limit("log")
 def judge(tool_context, context: str, entry_command: str, input_file: Optional[str] = None):
     """
     Run the program and simulate the user interaction, record the interaction process and output result.
@@ -862,11 +1035,15 @@ def judge(tool_context, context: str, entry_command: str, input_file: Optional[s
         def flush(self):
             self.file.flush()
 
-    log_file_path = 'pexpect_interact.log'
+    # 每次调用独立记录交互过程，结果中带上会话和调用 ID
+    session_id, invocation_id = get_judge_invocation_ids(tool_context)
+    log_file_path = get_judge_log_path(session_id, invocation_id)
     result = {
         "success": False,
         "log": '',
-        "error": None
+        "error": None,
+        "session_id": session_id,
+        "invocation_id": invocation_id
     }
     work_dir = WORKSPACE_DIR
 
@@ -885,7 +1062,7 @@ def judge(tool_context, context: str, entry_command: str, input_file: Optional[s
         result["error"] = f"程序入口命令{entry_command}执行失败: {e}"
         return result
 
-    with open(log_file_path, 'w', encoding='utf-8') as logfile:
+    with JudgeTranscript(log_file_path) as logfile:
         logger = CustomLogger(logfile)
         child.logfile_read = logger
 
@@ -933,8 +1110,7 @@ def judge(tool_context, context: str, entry_command: str, input_file: Optional[s
                 result["error"] = None
             #result["error"] = tb_lines
 
-    with open(log_file_path, 'r', encoding='utf-8') as logfile:
-        result["log"] = logfile.read()
+    result["log"] = logfile.getvalue()
     return result
 
 
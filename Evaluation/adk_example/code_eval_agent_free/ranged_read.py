@@ -0,0 +1,264 @@
+"""
+大文件的分段读取
+
+read_file 原来每次翻页都从头逐行扫描到 offset，超过 MAX_FILE_SIZE（10MB）的文件直接拒绝，agent 无法查看大的 CSV / 日志（例如 10 万条记录以上的数据文件）。
+这里的读取都只触及需要的部分：
+  - 按行范围：首次读取时流式扫描一遍，记录每 INDEX_STRIDE 行的字节偏移（稀疏行索引，按文件大小和修改时间缓存），
+    之后翻页直接 seek 到最近的索引点，不再从头读
+  - 按字节范围：seek 后读取
+  - 末尾 N 行：从文件末尾向前按块读取
+  - 文件内搜索：mmap 后用正则直接在映射上匹配，不把文件读入内存
+所有函数返回的内容都不超过 max_bytes（至少一行），调用方据返回的 next_offset 继续翻页。
+"""
+
+import mmap
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# 稀疏行索引的间隔（行）
+INDEX_STRIDE = 1000
+# 扫描 / 反向读取的块大小
+CHUNK_SIZE = 1024 * 1024
+# 缓存行索引的文件数
+MAX_INDEXED_FILES = 32
+# grep 默认最多返回的匹配行数
+DEFAULT_MAX_MATCHES = 100
+
+
+class LineIndex:
+    """文件的总行数和每 INDEX_STRIDE 行的起始字节偏移"""
+
+    def __init__(self, total_lines: int, checkpoints: List[int]):
+        self.total_lines = total_lines
+        self.checkpoints = checkpoints
+
+
+_index_cache: "OrderedDict[Tuple[str, int, int], LineIndex]" = OrderedDict()
+_index_lock = threading.Lock()
+
+
+def build_line_index(path: str) -> LineIndex:
+    """流式扫描文件，统计行数并记录索引点（内存占用与文件大小无关）"""
+    checkpoints = [0]
+    total = 0
+    position = 0
+    last_byte = b''
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            start = 0
+            while True:
+                newline = chunk.find(b'\n', start)
+                if newline < 0:
+                    break
+                total += 1
+                if total % INDEX_STRIDE == 0:
+                    checkpoints.append(position + newline + 1)
+                start = newline + 1
+            position += len(chunk)
+            last_byte = chunk[-1:]
+    # 最后一行没有换行符时也算一行
+    if position and last_byte != b'\n':
+        total += 1
+    return LineIndex(total, checkpoints)
+
+
+def get_line_index(path: str) -> LineIndex:
+    """返回缓存的行索引，文件大小或修改时间变化后重建"""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _index_lock:
+        if key in _index_cache:
+            _index_cache.move_to_end(key)
+            return _index_cache[key]
+    index = build_line_index(path)
+    with _index_lock:
+        _index_cache[key] = index
+        while len(_index_cache) > MAX_INDEXED_FILES:
+            _index_cache.popitem(last=False)
+    return index
+
+
+def _decode(data: bytes) -> str:
+    return data.decode('utf-8', errors='replace')
+
+
+def read_line_range(path: str, offset: int = 0, limit: Optional[int] = None,
+                    max_bytes: int = 0) -> Tuple[str, int, Optional[int]]:
+    """
+    从第 offset 行（从 0 开始）起读取最多 limit 行，且总字节数不超过 max_bytes（至少返回一行）
+
+    Returns:
+        tuple: (内容, 文件总行数, 下一页的 offset；已读到文件末尾时为 None)
+    """
+    offset = max(offset or 0, 0)
+    index = get_line_index(path)
+    if offset >= index.total_lines:
+        return '', index.total_lines, None
+
+    checkpoint = min(offset // INDEX_STRIDE, len(index.checkpoints) - 1)
+    line_number = checkpoint * INDEX_STRIDE
+    lines = []
+    used = 0
+    next_offset = None
+    with open(path, 'rb') as f:
+        f.seek(index.checkpoints[checkpoint])
+        for line in f:
+            if line_number < offset:
+                line_number += 1
+                continue
+            if (limit is not None and len(lines) >= limit) or (max_bytes > 0 and lines and used + len(line) > max_bytes):
+                next_offset = line_number
+                break
+            lines.append(line)
+            used += len(line)
+            line_number += 1
+    return _decode(b''.join(lines)), index.total_lines, next_offset
+
+
+def read_byte_range(path: str, offset: int = 0, length: Optional[int] = None,
+                    max_bytes: int = 0) -> Tuple[str, int, Optional[int]]:
+    """
+    读取字节 [offset, offset + length)，长度不超过 max_bytes；用于单行很长或没有换行的文件
+
+    Returns:
+        tuple: (内容, 文件总字节数, 下一段的字节 offset；已读到文件末尾时为 None)
+    """
+    size = os.path.getsize(path)
+    offset = min(max(offset or 0, 0), size)
+    length = size - offset if length is None else max(length, 0)
+    if max_bytes > 0:
+        length = min(length, max_bytes)
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(length)
+    end = offset + len(data)
+    return _decode(data), size, end if end < size else None
+
+
+def tail_lines(path: str, count: int, max_bytes: int = 0) -> Tuple[str, int]:
+    """
+    读取文件最后 count 行（总字节数超过 max_bytes 时只保留最后的若干行），从末尾向前按块读取
+
+    Returns:
+        tuple: (内容, 内容第一行的行号（从 0 开始）)
+    """
+    index = get_line_index(path)
+    count = max(count, 0)
+    if count == 0 or index.total_lines == 0:
+        return '', index.total_lines
+    size = os.path.getsize(path)
+    data = b''
+    position = size
+    with open(path, 'rb') as f:
+        # 多读一个换行符以确定第一行的起点；末尾的换行符不算行分隔
+        needed = count + (1 if size and _last_byte(f, size) == b'\n' else 0)
+        while position > 0 and data.count(b'\n') < needed:
+            if max_bytes > 0 and len(data) > max_bytes:
+                break
+            step = min(CHUNK_SIZE, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    lines = _split_lines(data)
+    if position > 0:
+        # 第一块从行中间开始（或恰好是多读的那个换行符所在行），丢弃不完整的行
+        lines = lines[1:]
+    lines = lines[-count:]
+    if max_bytes > 0:
+        used = 0
+        kept = []
+        for line in reversed(lines):
+            if kept and used + len(line) > max_bytes:
+                break
+            kept.append(line)
+            used += len(line)
+        lines = kept[::-1]
+    return _decode(b''.join(lines)), index.total_lines - len(lines)
+
+
+def _split_lines(data: bytes) -> List[bytes]:
+    """只按 \n 分行（bytes.splitlines 还会在单独的 \r 处分行，与行号不一致）"""
+    parts = data.split(b'\n')
+    lines = [part + b'\n' for part in parts[:-1]]
+    if parts[-1]:
+        lines.append(parts[-1])
+    return lines
+
+
+def _last_byte(f, size: int) -> bytes:
+    f.seek(size - 1)
+    return f.read(1)
+
+
+def grep_file(path: str, pattern: str, ignore_case: bool = False, context: int = 0,
+              max_matches: int = DEFAULT_MAX_MATCHES, max_bytes: int = 0) -> Dict:
+    """
+    在文件中按正则搜索（按 UTF-8 字节匹配，\\w 等字符类只匹配 ASCII；^ / $ 匹配行首行尾），返回匹配行及前后 context 行
+
+    Returns:
+        dict:
+            - matches: [{"line": 行号（从 0 开始）, "text": 匹配行, "before": [...], "after": [...]}]
+            - truncated: 是否因 max_matches / max_bytes 没有返回全部匹配
+    """
+    regex = re.compile(pattern.encode('utf-8'), re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+    matches = []
+    truncated = False
+    if os.path.getsize(path) == 0:
+        return {"matches": matches, "truncated": truncated}
+
+    def strip(line: bytes) -> str:
+        return _decode(line.rstrip(b'\r\n'))
+
+    used = 0
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        line_number = 0
+        counted_to = 0
+        position = 0
+        while position < size:
+            match = regex.search(mm, position)
+            if match is None:
+                break
+            line_start = mm.rfind(b'\n', 0, match.start()) + 1
+            line_end = mm.find(b'\n', match.start())
+            line_end = size if line_end < 0 else line_end
+            line_number += mm[counted_to:line_start].count(b'\n')
+            counted_to = line_start
+
+            before = []
+            start = line_start
+            for _ in range(context):
+                if start == 0:
+                    break
+                previous = mm.rfind(b'\n', 0, start - 1) + 1
+                before.insert(0, strip(mm[previous:start]))
+                start = previous
+            after = []
+            end = line_end
+            for _ in range(context):
+                if end >= size - 1:
+                    break
+                following = mm.find(b'\n', end + 1)
+                following = size if following < 0 else following
+                after.append(strip(mm[end + 1:following]))
+                end = following
+
+            entry = {"line": line_number, "text": strip(mm[line_start:line_end])}
+            if context:
+                entry["before"] = before
+                entry["after"] = after
+            entry_size = sum(len(text) for text in [entry["text"]] + before + after)
+            if len(matches) >= max_matches or (max_bytes > 0 and matches and used + entry_size > max_bytes):
+                truncated = True
+                break
+            matches.append(entry)
+            used += entry_size
+            # 同一行只报告一次
+            position = line_end + 1
+    return {"matches": matches, "truncated": truncated}
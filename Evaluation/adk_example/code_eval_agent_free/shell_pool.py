@@ -0,0 +1,426 @@
+"""
+交互式 shell 会话池
+
+原来 interative_shell.step 每个会话直接 spawn 一个 `/bin/bash -c cmd` 子进程，放进一个不设上限的 dict：
+agent 没有调用 kill_shell_session 的会话会一直占着 pty 和进程，直到 ADK 服务退出。这里统一管理：
+  - 存活会话数上限：超过时关闭最久未使用的会话
+  - 空闲超时：后台线程定期关闭超过 idle_ttl 未使用的会话，以及已退出且长时间没有被读取的会话
+  - 资源限制：每个会话的进程设置 RLIMIT_CPU / RLIMIT_AS（子进程继承），
+    后台线程另外按整个进程树的累计 CPU 时间检查，超出的会话被关闭
+  - 预热：裸 bash 会话（start_interative_shell）在取走后后台补充同样参数（cmd / cwd / env）的备用进程，
+    下一个会话直接使用，省去 bash 启动和读取 .bashrc 的时间
+  - 指标：stats() 返回存活会话及其进程树的 CPU / 内存占用，start_metrics_server 以 HTTP 提供 /metrics
+进程树的资源统计读取 /proc，非 Linux 平台上只返回会话列表。
+"""
+
+import atexit
+import http.server
+import json
+import logging
+import os
+import resource
+import signal
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import pexpect
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SESSIONS = 64
+DEFAULT_IDLE_TTL = 1800
+DEFAULT_CPU_SECONDS = 3600
+DEFAULT_MEMORY_MB = 16384
+DEFAULT_PREWARM = 2
+# 后台回收的检查间隔（秒）
+REAP_INTERVAL = 15
+# 已退出的会话在多久没有被读取后回收（秒），留出时间让 agent 读取最后的输出
+FINISHED_GRACE = 120
+# 最多为几组不同的 (cmd, cwd, env) 保留预热进程
+MAX_WARM_KEYS = 4
+# 只有不执行具体命令的 shell 才能预热，其他命令提前启动会改变程序的行为
+WARMABLE_COMMANDS = {"bash", "/bin/bash"}
+# 记住最近关闭的会话及原因，便于在 agent 继续使用时给出明确的报错
+MAX_CLOSED_RECORDS = 256
+
+PROC_DIR = '/proc'
+try:
+    CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    CLOCK_TICKS, PAGE_SIZE = 100, 4096
+
+
+def _rlimit_preexec(cpu_seconds: int, memory_mb: int):
+    """返回在子进程 exec 之前设置资源限制的函数（<= 0 表示不限制）"""
+    def preexec():
+        if cpu_seconds > 0:
+            # 软限制到达时收到 SIGXCPU，硬限制留几秒给进程处理
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 5))
+        if memory_mb > 0:
+            limit = memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    return preexec
+
+
+def _process_table() -> Dict[int, Tuple[int, float, int]]:
+    """
+    读取 /proc 中所有进程的 (ppid, 累计 CPU 秒数, RSS 字节数)
+    CPU 包含 utime + stime 以及已被回收的子进程的 cutime + cstime
+    """
+    table = {}
+    try:
+        pids = [int(name) for name in os.listdir(PROC_DIR) if name.isdigit()]
+    except OSError:
+        return table
+    for pid in pids:
+        try:
+            with open(f'{PROC_DIR}/{pid}/stat', 'r') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # comm 字段可能包含空格和括号，从最后一个 ')' 之后开始解析
+        fields = stat[stat.rfind(')') + 2:].split()
+        try:
+            ticks = sum(int(value) for value in fields[11:15])
+            table[pid] = (int(fields[1]), ticks / CLOCK_TICKS, int(fields[21]) * PAGE_SIZE)
+        except (IndexError, ValueError):
+            continue
+    return table
+
+
+def _tree_usage(root_pid: int, table: Dict[int, Tuple[int, float, int]]) -> Optional[dict]:
+    """统计 root_pid 及其所有子孙进程的资源占用，root_pid 不存在时返回 None"""
+    if root_pid not in table:
+        return None
+    children: Dict[int, List[int]] = {}
+    for pid, (ppid, _, _) in table.items():
+        children.setdefault(ppid, []).append(pid)
+    pids = []
+    stack = [root_pid]
+    while stack:
+        pid = stack.pop()
+        pids.append(pid)
+        stack.extend(children.get(pid, []))
+    return {
+        "processes": len(pids),
+        "cpu_seconds": round(sum(table[pid][1] for pid in pids), 2),
+        "rss_mb": round(sum(table[pid][2] for pid in pids) / (1024 * 1024), 1),
+    }
+
+
+class ShellSession:
+    """池中的一个会话"""
+
+    def __init__(self, session_id: str, child: pexpect.spawn, cmd: str, cwd: Optional[str], warm: bool):
+        self.session_id = session_id
+        self.child = child
+        self.cmd = cmd
+        self.cwd = cwd
+        self.warm = warm
+        self.created = time.time()
+        self.last_used = self.created
+        # 同一会话的读写串行执行
+        self.lock = threading.Lock()
+
+    def touch(self):
+        self.last_used = time.time()
+
+
+class ShellSessionPool:
+    """
+    交互式 shell 会话池（线程安全）
+
+    Args:
+        max_sessions: 存活会话数上限，超过时关闭最久未使用的会话
+        idle_ttl: 会话空闲超过该秒数后被回收，<= 0 表示不回收
+        cpu_seconds: 每个会话的 CPU 时间上限（秒），<= 0 表示不限制
+        memory_mb: 每个会话中单个进程的虚拟内存上限（MB），<= 0 表示不限制
+        prewarm: 每组参数保留的预热 bash 进程数，0 表示不预热
+    """
+
+    def __init__(self, max_sessions: int = DEFAULT_MAX_SESSIONS, idle_ttl: int = DEFAULT_IDLE_TTL,
+                 cpu_seconds: int = DEFAULT_CPU_SECONDS, memory_mb: int = DEFAULT_MEMORY_MB,
+                 prewarm: int = DEFAULT_PREWARM):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.prewarm = prewarm
+        self._sessions: "OrderedDict[str, ShellSession]" = OrderedDict()
+        self._warm: "OrderedDict[tuple, List[pexpect.spawn]]" = OrderedDict()
+        self._refilling = set()
+        self._closed: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._reaper: Optional[threading.Thread] = None
+        self.counters = {"created": 0, "warm_hits": 0, "closed": 0, "evicted_lru": 0,
+                         "evicted_idle": 0, "killed_cpu": 0}
+        atexit.register(self.shutdown)
+
+    def configure(self, max_sessions: Optional[int] = None, idle_ttl: Optional[int] = None,
+                  cpu_seconds: Optional[int] = None, memory_mb: Optional[int] = None,
+                  prewarm: Optional[int] = None):
+        """更新限制（None 表示保持不变），只影响之后启动的进程"""
+        with self._lock:
+            for name, value in (("max_sessions", max_sessions), ("idle_ttl", idle_ttl),
+                                ("cpu_seconds", cpu_seconds), ("memory_mb", memory_mb), ("prewarm", prewarm)):
+                if value is not None:
+                    setattr(self, name, value)
+
+    # ------------------------------------------------------------------
+    # 会话的创建、获取和关闭
+    # ------------------------------------------------------------------
+    def _spawn(self, cmd: str, cwd: Optional[str], env: Optional[Dict[str, str]], read_timeout: float) -> pexpect.spawn:
+        # 用 /bin/bash -c "<cmd>" 启动，cmd 可以是完整的 shell 命令行
+        return pexpect.spawn(
+            "/bin/bash",
+            ["-c", cmd],
+            encoding="utf-8",
+            echo=False,
+            timeout=read_timeout,
+            cwd=cwd,
+            env=env,
+            preexec_fn=_rlimit_preexec(self.cpu_seconds, self.memory_mb),
+        )
+
+    @staticmethod
+    def _warm_key(cmd: str, cwd: Optional[str], env: Optional[Dict[str, str]]) -> Optional[tuple]:
+        if cmd.strip() not in WARMABLE_COMMANDS:
+            return None
+        return cmd.strip(), cwd, tuple(sorted(env.items())) if env is not None else None
+
+    def _take_warm(self, key: tuple) -> Optional[pexpect.spawn]:
+        with self._lock:
+            spares = self._warm.get(key)
+            while spares:
+                child = spares.pop(0)
+                if child.isalive():
+                    return child
+                child.close(force=True)
+        return None
+
+    def _refill(self, key: tuple, cmd: str, cwd: Optional[str], env: Optional[Dict[str, str]]):
+        """在后台线程中为 key 补充预热进程"""
+        with self._lock:
+            if self.prewarm <= 0 or key in self._refilling:
+                return
+            self._refilling.add(key)
+
+        def run():
+            try:
+                while True:
+                    with self._lock:
+                        spares = self._warm.setdefault(key, [])
+                        self._warm.move_to_end(key)
+                        if len(spares) >= self.prewarm:
+                            break
+                    child = self._spawn(cmd, cwd, env, read_timeout=0.3)
+                    with self._lock:
+                        self._warm.setdefault(key, []).append(child)
+                        # 参数组合过多时丢弃最久未使用的一组
+                        while len(self._warm) > MAX_WARM_KEYS:
+                            _, evicted = self._warm.popitem(last=False)
+                            for spare in evicted:
+                                spare.close(force=True)
+            except Exception as e:
+                logger.warning(f"[shell_pool] 预热 shell 失败: {e}")
+            finally:
+                with self._lock:
+                    self._refilling.discard(key)
+
+        threading.Thread(target=run, name="shell-pool-prewarm", daemon=True).start()
+
+    def open(self, cmd: str, cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None,
+             read_timeout: float = 0.3) -> ShellSession:
+        """启动一个新会话（有匹配的预热进程时直接使用）"""
+        self._ensure_reaper()
+        key = self._warm_key(cmd, cwd, env)
+        child = self._take_warm(key) if key else None
+        warm = child is not None
+        if child is None:
+            child = self._spawn(cmd, cwd, env, read_timeout)
+        child.timeout = read_timeout
+
+        session = ShellSession(uuid.uuid4().hex, child, cmd, cwd, warm)
+        with self._lock:
+            while len(self._sessions) >= self.max_sessions > 0:
+                oldest = next(iter(self._sessions))
+                self._close_locked(oldest, f"evicted: more than {self.max_sessions} live shell sessions", "evicted_lru")
+            self._sessions[session.session_id] = session
+            self.counters["created"] += 1
+            if warm:
+                self.counters["warm_hits"] += 1
+        if key:
+            self._refill(key, cmd, cwd, env)
+        return session
+
+    def get(self, session_id: str) -> ShellSession:
+        """获取会话并标记为最近使用，不存在时抛出 ValueError（说明会话被回收的原因）"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                reason = self._closed.get(session_id)
+                if reason:
+                    raise ValueError(f"Session {session_id!r} was closed ({reason}); start a new session")
+                raise ValueError(f"Session {session_id!r} not found or already closed")
+            self._sessions.move_to_end(session_id)
+            session.touch()
+            return session
+
+    def _close_locked(self, session_id: str, reason: str, counter: Optional[str] = None) -> bool:
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        self._closed[session_id] = reason
+        while len(self._closed) > MAX_CLOSED_RECORDS:
+            self._closed.popitem(last=False)
+        self.counters["closed"] += 1
+        if counter:
+            self.counters[counter] += 1
+        _kill(session.child)
+        if counter:
+            logger.info(f"[shell_pool] 关闭会话 {session_id}: {reason}")
+        return True
+
+    def close(self, session_id: str, reason: str = "terminated") -> bool:
+        """关闭会话及其进程组，返回会话是否存在"""
+        with self._lock:
+            return self._close_locked(session_id, reason)
+
+    # ------------------------------------------------------------------
+    # 后台回收
+    # ------------------------------------------------------------------
+    def _ensure_reaper(self):
+        with self._lock:
+            if self._reaper is None or not self._reaper.is_alive():
+                self._reaper = threading.Thread(target=self._reap_loop, name="shell-pool-reaper", daemon=True)
+                self._reaper.start()
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(REAP_INTERVAL)
+            try:
+                self.reap()
+            except Exception as e:
+                logger.warning(f"[shell_pool] 回收会话失败: {e}")
+
+    def reap(self) -> int:
+        """关闭空闲超时、已退出且长时间未读取、或超出 CPU 时间的会话，返回关闭的数量"""
+        now = time.time()
+        table = _process_table() if self.cpu_seconds > 0 else {}
+        closed = 0
+        with self._lock:
+            for session_id, session in list(self._sessions.items()):
+                idle = now - session.last_used
+                if self.idle_ttl > 0 and idle > self.idle_ttl:
+                    closed += self._close_locked(session_id, f"idle for more than {self.idle_ttl}s", "evicted_idle")
+                elif not session.child.isalive() and idle > FINISHED_GRACE:
+                    closed += self._close_locked(session_id, "process exited")
+                elif table:
+                    usage = _tree_usage(session.child.pid, table)
+                    if usage and usage["cpu_seconds"] > self.cpu_seconds:
+                        closed += self._close_locked(
+                            session_id, f"CPU time limit of {self.cpu_seconds}s exceeded", "killed_cpu")
+        return closed
+
+    def shutdown(self):
+        """关闭所有会话和预热进程（进程退出时调用）"""
+        with self._lock:
+            for session_id in list(self._sessions):
+                self._close_locked(session_id, "shell pool shut down")
+            for spares in self._warm.values():
+                for child in spares:
+                    _kill(child)
+            self._warm.clear()
+
+    # ------------------------------------------------------------------
+    # 指标
+    # ------------------------------------------------------------------
+    def stats(self) -> dict:
+        """存活会话及其进程树的资源占用"""
+        table = _process_table()
+        now = time.time()
+        with self._lock:
+            sessions = list(self._sessions.values())
+            warm = sum(len(spares) for spares in self._warm.values())
+            counters = dict(self.counters)
+        items = []
+        for session in sessions:
+            item = {
+                "session_id": session.session_id,
+                "cmd": session.cmd,
+                "cwd": session.cwd,
+                "pid": session.child.pid,
+                "alive": session.child.isalive(),
+                "warm_start": session.warm,
+                "age_seconds": round(now - session.created, 1),
+                "idle_seconds": round(now - session.last_used, 1),
+            }
+            usage = _tree_usage(session.child.pid, table) if table else None
+            if usage:
+                item.update(usage)
+            items.append(item)
+        return {
+            "limits": {"max_sessions": self.max_sessions, "idle_ttl": self.idle_ttl,
+                       "cpu_seconds": self.cpu_seconds, "memory_mb": self.memory_mb, "prewarm": self.prewarm},
+            "live_sessions": len(items),
+            "warm_processes": warm,
+            "counters": counters,
+            "totals": {
+                "processes": sum(item.get("processes", 0) for item in items),
+                "cpu_seconds": round(sum(item.get("cpu_seconds", 0) for item in items), 2),
+                "rss_mb": round(sum(item.get("rss_mb", 0) for item in items), 1),
+            },
+            "sessions": items,
+        }
+
+
+def _kill(child: pexpect.spawn):
+    """结束会话的整个进程组（pty 子进程是会话首进程，其进程组包含前台启动的命令）"""
+    try:
+        if child.isalive():
+            os.killpg(child.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError, OSError):
+        pass
+    try:
+        child.close(force=True)
+    except Exception:
+        pass
+
+
+def start_metrics_server(pool: ShellSessionPool, port: int, host: str = '127.0.0.1') -> Optional[http.server.ThreadingHTTPServer]:
+    """
+    在后台线程中启动指标服务：GET /metrics 返回 pool.stats()，GET /health 返回 ok
+    端口被占用时只记录警告（例如同一台机器上的多个 ADK 服务使用了相同的端口）
+    """
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip('/') in ('/metrics', ''):
+                body = pool.stats()
+            elif self.path.rstrip('/') == '/health':
+                body = {"status": "ok"}
+            else:
+                self.send_error(404)
+                return
+            data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = http.server.ThreadingHTTPServer((host, port), Handler)
+    except OSError as e:
+        logger.warning(f"[shell_pool] 指标服务启动失败（{host}:{port}）: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="shell-pool-metrics", daemon=True).start()
+    logger.info(f"[shell_pool] 指标服务: http://{host}:{port}/metrics")
+    return server
@@ -29,11 +29,14 @@ from .mcp_tools import (
     exit_loop, create_workspace, list_workspace,
     read_file, write_file, delete_file, 
     # execute_python_code, 
-    run_system_command, 
-    start_interative_shell, run_interactive_shell, kill_shell_session,
-    judge,  # 添加Judge工具导入
+    kill_shell_session,
     deal_graph
 )
+from . import async_tools, mcp_tools
+from .config import ASYNC_TOOLS
+# run_system_command / start_interative_shell / run_interactive_shell / judge 有同名的同步和异步实现，只在这里按 ASYNC_TOOLS 选择；
+# 异步工具的子进程和 pty 输出在事件循环上等待，不阻塞同一服务上的其他会话
+shell_tools = async_tools if ASYNC_TOOLS else mcp_tools
 
 ALL_TOOLS = [
     exit_loop,
@@ -43,17 +46,21 @@ ALL_TOOLS = [
     write_file,
     # delete_file,
     # execute_python_code,
-    run_system_command,
+    shell_tools.run_system_command,
     # interactive_system_command,
-    start_interative_shell,
-    run_interactive_shell,
+    shell_tools.start_interative_shell,
+    shell_tools.run_interactive_shell,
     kill_shell_session,
     # meituan_search,
     # meituan_browse,
-    judge,  # 添加Judge工具
+    shell_tools.judge,  # 添加Judge工具
     deal_graph
 ]
 
+# 每次工具调用记录一个 span（设置 TRACE_DIR 时生效，见 tracing.py）
+from tracing import trace_tool
+ALL_TOOLS = [trace_tool(tool) for tool in ALL_TOOLS]
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -109,11 +116,19 @@ You are an intelligent QA Automation Agent. Your primary goal is to rigorously,
 [
     {
         'name': "read_file",
-        'description': "read a file",
+        'description': "read a file; large files are returned page by page, call again with offset=next_offset to read the rest",
         'parameters': {
             'file_path': {
                 "type": "STRING",
                 "description": "absolute path of the file to read"
+            },
+            'offset': {
+                "type": "INTEGER",
+                "description": "optional 0-based line number to start reading from"
+            },
+            'limit': {
+                "type": "INTEGER",
+                "description": "optional maximum number of lines to read"
             }
         }
     },
@@ -133,11 +148,19 @@ You are an intelligent QA Automation Agent. Your primary goal is to rigorously,
     },
     {
         'name': "list_workspace",
-        'description': "list file in the workspace",
+        'description': "list file in the workspace (venv, __pycache__, .git and similar directories are skipped)",
         'parameters': {
             'workspace_name': {
                 "type": "STRING",
                 "description": "The absolute path to the directory to list (must be absolute, not relative)"
+            },
+            'max_depth': {
+                "type": "INTEGER",
+                "description": "optional maximum depth to list (1 = direct children only), default 4"
+            },
+            'ignore': {
+                "type": "STRING",
+                "description": "optional extra comma-separated name patterns to skip, e.g. \"*.log,data\""
             }
         }
     },
@@ -212,6 +235,10 @@ You are an intelligent QA Automation Agent. Your primary goal is to rigorously,
             'workspace_dir':{
                 "type": "STRING",
                 "description": "optional working directory (must be under WORKSPACE_DIR). If not specified, uses default WORKSPACE_DIR."
+            },
+            'prompt_pattern':{
+                "type": "STRING",
+                "description": "optional regex marking that the program is waiting for input (e.g. the prompt text in the metric). Defaults to a trailing ':', '>' or '?'."
             }
         }
     },
@@ -241,7 +268,7 @@ You are an intelligent QA Automation Agent. Your primary goal is to rigorously,
 ## Tool Usage
 - **Command Execution:** Use `judge`, `run_system_command`, `start_interative_shell`, and `run_interactive_shell` for running shell commands or interacting with processes. For standard, non-interactive commands, prefer `run_system_command` or `judge`. For interactive sessions, use `start_interative_shell` and continue with `run_interactive_shell` as needed.
 - **Background Processes:** If a command is expected to run indefinitely (e.g., starting a server), append `&` to run it in the background. 
-- **Judge Tool:** For simulating user interaction and recording the process and output, prefer using the judge tool when appropriate, providing all required parameters (context, entry_command, input_file, workspace_dir).
+- **Judge Tool:** For simulating user interaction and recording the process and output, prefer using the judge tool when appropriate, providing all required parameters (context, entry_command, input_file, workspace_dir). If the program's input prompts do not end with ':', '>' or '?', pass `prompt_pattern` with a regex matching the prompt text so inputs are sent as soon as the prompt appears.
 - **Session Management:** Use `kill_shell_session` to terminate shell sessions when they are no longer needed to free resources.
 - **STRING Parameters:** All string parameters must be enclosed in quotation marks.
 - **Exit Loop:** Call `exit_loop` when you finish the evaluation.
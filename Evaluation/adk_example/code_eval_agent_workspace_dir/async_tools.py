@@ -0,0 +1,163 @@
+"""
+工具的异步版本
+
+mcp_tools 中的 run_system_command / judge / start_interative_shell / run_interactive_shell 是同步函数，
+在 ADK api_server 中执行时一次较慢的 pytest 就会阻塞事件循环（或在线程池中排队），同一服务上的其他会话都要等待。
+这里提供同名、同签名的异步工具（config.ASYNC_TOOLS 开启时由 agent.py 注册）：
+  - run_system_command：asyncio 子进程，超时后结束整个进程组
+  - run_interactive_shell：pty 输出通过事件循环等待（interative_shell.step_async）
+  - start_interative_shell：会话启动后的 pty 输出同样通过事件循环等待
+  - judge：与同步版本共用 mcp_tools.judge_steps 交互流程，由 interaction_engine.run_steps_async 在事件循环上执行
+"""
+
+import asyncio
+import os
+import signal
+import subprocess
+from typing import Any, Dict, Optional, Tuple
+
+from google.adk.tools import ToolContext
+
+from .interaction_engine import run_steps_async
+from .interative_shell import step_async
+from .mcp_tools import (
+    OUTPUT_BUDGET, judge_steps, prepare_judge, prepare_shell_input, prepare_shell_start,
+    prepare_system_command, shell_start_result, shell_step_error, system_command_error, system_command_result
+)
+
+async def run_command_async(command: str, timeout: float, cwd: Optional[str] = None,
+                            env: Optional[Dict[str, str]] = None) -> Tuple[str, str, int]:
+    """
+    用 asyncio 子进程执行 shell 命令，返回 (stdout, stderr, 退出码)
+    超时后结束整个进程组并抛出 subprocess.TimeoutExpired（与 subprocess.run 一致）
+    """
+    process = await asyncio.create_subprocess_shell(
+        command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=cwd,
+        env=env,
+        start_new_session=True,
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        await process.wait()
+        raise subprocess.TimeoutExpired(command, timeout)
+    return (stdout.decode('utf-8', errors='replace'), stderr.decode('utf-8', errors='replace'),
+            process.returncode)
+
+
+@OUTPUT_BUDGET.limit("stdout", "stderr")
+async def run_system_command(tool_context: ToolContext, command: str, timeout: int = 30, workspace_dir: Optional[str] = None):
+    """
+    Run the system command.
+
+    Args:
+        tool_context: Tool context
+        command: The system command to be executed
+        timeout: The timeout for the execution (seconds), default 30 seconds
+        workspace_dir: Optional working directory (must be under WORKSPACE_DIR). If not provided, uses default WORKSPACE_DIR.
+
+    Returns:
+        dict: A dictionary containing the result of the execution.
+    """
+    error, workdir = prepare_system_command(command, workspace_dir)
+    if error:
+        return error
+    try:
+        stdout, stderr, return_code = await run_command_async(command, timeout, cwd=workdir, env=os.environ.copy())
+        return system_command_result(stdout, stderr, return_code, workdir)
+    except Exception as e:
+        return system_command_error(e)
+
+
+async def run_interactive_shell(tool_context: ToolContext, session_id: Optional[str] = None, user_input: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Run a interactive shell session.
+
+    The first time to call, you need to provide the cmd parameter to start a new session, and then provide the session_id to continue the previous session.
+    If you need to input content to the shell, provide the user_input parameter.
+
+    参数:
+        session_id (str, optional): The session ID, for continuing the previous session.
+        user_input (str, optional): The content to be input to the shell.
+
+    Returns:
+        Dict[str, Any]: A dictionary containing the result of the execution.
+            - session_id: str, The session ID
+            - output: str, The output of the shell
+            - waiting: bool, Whether to wait for input
+            - finished: bool, Whether the session is finished
+    """
+    error = prepare_shell_input(tool_context, session_id, user_input)
+    if error:
+        return error
+
+    try:
+        return await step_async(
+            session_id=session_id,
+            user_input=user_input
+        )
+    except Exception as e:
+        return shell_step_error(session_id, e)
+
+
+async def start_interative_shell(tool_context: ToolContext, cmd: Optional[str] = None, workspace_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Start a interactive shell session.
+    
+    此工具仅用于启动新的交互式shell会话，不能执行命令。
+    如果需要执行命令，请使用 run_interactive_shell 工具。
+    
+    Args:
+        tool_context: Tool context
+        cmd: 此参数不应提供。如果提供了cmd参数，将返回错误。
+        workspace_dir: Optional working directory (must be under WORKSPACE_DIR). If not provided, uses default WORKSPACE_DIR.
+    Returns:
+        dict: A dictionary containing the result of the execution.
+    """
+    error, step_kwargs = prepare_shell_start(cmd, workspace_dir)
+    if error:
+        return error
+    try:
+        return shell_start_result(await step_async(**step_kwargs))
+    except Exception as e:
+        return shell_step_error(None, e)
+
+
+@OUTPUT_BUDGET.limit("log")
+async def judge(tool_context, context: str, entry_command: str, input_file: Optional[str] = None, workspace_dir: Optional[str] = None, prompt_pattern: Optional[str] = None):
+    """
+    Run the program and simulate the user interaction, record the interaction process and output result.
+    The next input line is sent as soon as the program shows a prompt or blocks reading the terminal.
+    If the program does not exit automatically after the input ends, send Ctrl+C to force interrupt.
+    When KeyboardInterrupt is captured, it is also considered successful.
+
+    Args:
+        tool_context: Tool context
+        context: The expected output description and test requirements (only used for information transmission, not for judgment)
+        entry_command: The entry command of the program (e.g. "python main.py")
+        input_file: The path of the file containing the simulated user input (e.g. "a.in")
+        workspace_dir: Optional working directory (must be under WORKSPACE_DIR). If not provided, uses default WORKSPACE_DIR.
+        prompt_pattern: Optional regex that marks the program is waiting for input (e.g. "请输入.*[:：]"). Defaults to a trailing ':' / '>' / '?'.
+
+    Returns:
+        dict: A dictionary containing the test result, interaction record, and user inputs
+            - success: bool, whether the program executed successfully
+            - log: str, raw terminal output (program output + user input echo)
+            - user_input: str, all user inputs separated by newlines
+            - error: str or None, error message if any
+            - session_id: str or None, ADK session ID of this invocation
+            - invocation_id: str, unique ID of this judge invocation
+            - replayed: bool, whether the result was replayed from the cache (source, command and input unchanged)
+    """
+    # 参数检查、回放缓存查找和启动程序要读写文件，放到线程中执行；交互过程在事件循环上等待 pty 输出
+    run = await asyncio.to_thread(prepare_judge, tool_context, entry_command, input_file, workspace_dir, prompt_pattern)
+    if run.child is None:
+        return run.result
+    return await run_steps_async(judge_steps(run), run.engine)
@@ -0,0 +1,330 @@
+"""
+judge 工具的交互回放缓存
+
+补漏重试和多轮评测会对没有任何改动的项目重复执行同样的 `python src/main.py < inputs_for_test_X.in`。
+这里按内容寻址缓存一次 judge 的执行结果：
+  key = sha256(项目 src 目录树, 项目其余文件（reports 等除外）, 工作目录, 测试命令, 命令中引用的文件, 输入文件, 环境)
+项目其余文件包括之前的测试写入的 data/*.json、sqlite 等状态，状态不同的运行不会命中同一条记录。
+缓存内容包括交互记录、退出状态以及本次运行新产生/修改的文件，命中时恢复这些文件并直接返回记录。
+
+缓存目录按最近使用时间做 LRU 淘汰，总大小不超过 JUDGE_REPLAY_CACHE_MAX_MB；各条目的大小记录在索引文件中，
+淘汰时不需要读取每个条目。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shlex
+import shutil
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 快照和源码哈希时跳过的目录
+IGNORED_DIRS = {'reports', '__pycache__', '.git', '.pytest_cache', '.metric_slots', 'venv', '.venv', 'node_modules'}
+# 参与缓存键的环境变量
+KEY_ENV_VARS = ('PYTHONPATH', 'PYTHONHASHSEED', 'LANG', 'LC_ALL')
+ENTRY_FILE = 'entry.json'
+INDEX_FILE = 'index.json'
+FILES_DIR = 'files'
+
+# 文件内容哈希缓存：{path: (mtime_ns, size, digest)}，避免每次调用都重新读取未改动的源码
+_file_digests: Dict[str, Tuple[int, int, str]] = {}
+_file_digests_lock = threading.Lock()
+
+
+def file_digest(path: str) -> str:
+    """文件内容的 sha256，按 (mtime, size) 缓存"""
+    stat = os.stat(path)
+    with _file_digests_lock:
+        cached = _file_digests.get(path)
+    if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    value = digest.hexdigest()
+    with _file_digests_lock:
+        _file_digests[path] = (stat.st_mtime_ns, stat.st_size, value)
+    return value
+
+
+def _walk_files(root: str):
+    """遍历目录下的文件（跳过 IGNORED_DIRS 和符号链接目录），返回排序后的相对路径"""
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in IGNORED_DIRS)
+        for filename in filenames:
+            if filename.endswith('.pyc'):
+                continue
+            files.append(os.path.relpath(os.path.join(dirpath, filename), root))
+    return sorted(files)
+
+
+def tree_digest(root: str) -> str:
+    """目录树的 sha256（相对路径 + 文件内容）"""
+    digest = hashlib.sha256()
+    for rel_path in _walk_files(root):
+        path = os.path.join(root, rel_path)
+        try:
+            digest.update(rel_path.encode('utf-8'))
+            digest.update(file_digest(path).encode('ascii'))
+        except OSError:
+            continue
+    return digest.hexdigest()
+
+
+def project_state_digest(project_root: str) -> str:
+    """项目目录中 src 之外的文件（测试数据、之前运行写入的状态等）的 sha256，跳过 IGNORED_DIRS（含 reports）"""
+    digest = hashlib.sha256()
+    for rel_path in _walk_files(project_root):
+        if rel_path.split(os.sep, 1)[0] == 'src':
+            continue
+        try:
+            digest.update(rel_path.encode('utf-8'))
+            digest.update(file_digest(os.path.join(project_root, rel_path)).encode('ascii'))
+        except OSError:
+            continue
+    return digest.hexdigest()
+
+
+def snapshot(roots: List[str]) -> Dict[str, Tuple[int, int]]:
+    """记录项目目录下所有文件的 (mtime, size)，用于找出本次运行产生的文件"""
+    state = {}
+    for root in roots:
+        for rel_path in _walk_files(root):
+            path = os.path.join(root, rel_path)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            state[path] = (stat.st_mtime_ns, stat.st_size)
+    return state
+
+
+def _find_src_dir(path: str) -> Optional[str]:
+    """返回 path 所在的最近一个名为 src 的祖先目录"""
+    current = path if os.path.isdir(path) else os.path.dirname(path)
+    while current and current != os.path.dirname(current):
+        if os.path.basename(current) == 'src':
+            return current
+        current = os.path.dirname(current)
+    return None
+
+
+def _referenced_paths(work_dir: str, entry_command: str) -> List[str]:
+    """命令中引用到的已存在的文件/目录（相对路径按工作目录解析，处理 `cd xxx &&` 前缀）"""
+    try:
+        tokens = shlex.split(entry_command)
+    except ValueError:
+        tokens = entry_command.split()
+
+    paths = []
+    cwd = work_dir
+    for index, token in enumerate(tokens):
+        if token in ('&&', ';', '|', '<', '>', '2>'):
+            continue
+        if '=' in token and token.startswith('-'):
+            token = token.split('=', 1)[1]
+        path = os.path.normpath(os.path.join(cwd, token))
+        if not os.path.exists(path):
+            continue
+        if index > 0 and tokens[index - 1] == 'cd' and os.path.isdir(path):
+            cwd = path
+        paths.append(path)
+    return paths
+
+
+class ReplayCache:
+    """
+    judge 结果的内容寻址缓存
+
+    Args:
+        cache_dir: 缓存目录，每个条目是一个以 key 命名的子目录
+        max_bytes: 缓存总大小上限，超出后按最近使用时间淘汰
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, work_dir: str, entry_command: str, input_file: Optional[str] = None,
+                 extra: Optional[dict] = None) -> Tuple[Optional[str], List[str]]:
+        """
+        计算缓存键
+
+        Returns:
+            (key, project_roots)：project_roots 是 src 目录所在的项目目录，用于记录/恢复产生的文件；
+            找不到项目 src 目录时返回 (None, [])，不做缓存
+        """
+        referenced = _referenced_paths(work_dir, entry_command)
+        src_dirs = {_find_src_dir(path) for path in referenced}
+        if os.path.isdir(os.path.join(work_dir, 'src')):
+            src_dirs.add(os.path.join(work_dir, 'src'))
+        src_dirs.discard(None)
+        if not src_dirs:
+            return None, []
+
+        digest = hashlib.sha256()
+        for part in (os.path.abspath(work_dir), entry_command):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        for src_dir in sorted(src_dirs):
+            digest.update(src_dir.encode('utf-8'))
+            digest.update(tree_digest(src_dir).encode('ascii'))
+        project_roots = sorted({os.path.dirname(src_dir) for src_dir in src_dirs})
+        # 回放会恢复整个项目目录中产生的文件，src 之外的状态也必须相同
+        for project_root in project_roots:
+            digest.update(b'state')
+            digest.update(project_state_digest(project_root).encode('ascii'))
+        # 命令中直接引用的数据文件（src 之外的也要算进去）
+        for path in sorted(set(referenced)):
+            if os.path.isfile(path):
+                digest.update(path.encode('utf-8'))
+                digest.update(file_digest(path).encode('ascii'))
+        if input_file:
+            digest.update(b'input')
+            digest.update(file_digest(input_file).encode('ascii'))
+        env_part = {name: os.environ.get(name, '') for name in KEY_ENV_VARS}
+        env_part.update(extra or {})
+        digest.update(json.dumps(env_part, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest(), project_roots
+
+    def lookup(self, key: str) -> Optional[dict]:
+        """命中时恢复产生的文件并返回缓存的结果，未命中返回 None"""
+        entry_dir = os.path.join(self.cache_dir, key)
+        entry_path = os.path.join(entry_dir, ENTRY_FILE)
+        try:
+            with open(entry_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        try:
+            for index, (target, _) in enumerate(entry.get('files', [])):
+                source = os.path.join(entry_dir, FILES_DIR, str(index))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copyfile(source, target)
+        except OSError as e:
+            logger.warning(f"恢复回放缓存文件失败，按未命中处理: {e}")
+            return None
+
+        # 更新访问时间，用于 LRU 淘汰
+        os.utime(entry_path)
+        return entry
+
+    def store(self, key: str, result: dict, project_roots: List[str],
+              before: Dict[str, Tuple[int, int]], exit_status: Optional[int] = None):
+        """保存一次 judge 的结果以及相对 before 快照新产生/修改的文件"""
+        after = snapshot(project_roots)
+        produced = [path for path, state in after.items() if before.get(path) != state]
+
+        tmp_dir = tempfile.mkdtemp(prefix=f'.{key}.', dir=self.cache_dir)
+        try:
+            files = []
+            size = 0
+            os.makedirs(os.path.join(tmp_dir, FILES_DIR))
+            for path in sorted(produced):
+                target = os.path.join(tmp_dir, FILES_DIR, str(len(files)))
+                shutil.copyfile(path, target)
+                file_size = os.path.getsize(target)
+                files.append((path, file_size))
+                size += file_size
+            entry = {
+                'key': key,
+                'created_at': time.time(),
+                'success': result.get('success'),
+                'log': result.get('log', ''),
+                'user_input': result.get('user_input', ''),
+                'error': result.get('error'),
+                'exit_status': exit_status,
+                'files': files,
+            }
+            entry_bytes = json.dumps(entry, ensure_ascii=False).encode('utf-8')
+            entry['size_bytes'] = size + len(entry_bytes)
+            if entry['size_bytes'] > self.max_bytes:
+                logger.info(f"judge 结果过大（{entry['size_bytes']} 字节），不写入回放缓存")
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                return
+            with open(os.path.join(tmp_dir, ENTRY_FILE), 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+
+            entry_dir = os.path.join(self.cache_dir, key)
+            with self._lock:
+                if os.path.exists(entry_dir):
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+                os.rename(tmp_dir, entry_dir)
+                index = self._load_index()
+                index[key] = entry['size_bytes']
+                self._save_index(index)
+        except OSError as e:
+            logger.warning(f"写入回放缓存失败: {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+
+        self.evict()
+
+    def _load_index(self) -> Dict[str, int]:
+        """索引文件：{key: 条目大小}；调用方持有 self._lock"""
+        try:
+            with open(os.path.join(self.cache_dir, INDEX_FILE), 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return index if isinstance(index, dict) else {}
+
+    def _save_index(self, index: Dict[str, int]):
+        path = os.path.join(self.cache_dir, INDEX_FILE)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        """总大小超过上限时，按最近使用时间从旧到新删除条目，直到低于上限的 90%"""
+        with self._lock:
+            index = self._load_index()
+            changed = False
+            entries = []
+            total = 0
+            for name in os.listdir(self.cache_dir):
+                if name.startswith('.') or name == INDEX_FILE:
+                    continue
+                entry_path = os.path.join(self.cache_dir, name, ENTRY_FILE)
+                try:
+                    mtime = os.stat(entry_path).st_mtime
+                    size = index.get(name)
+                    if size is None:
+                        # 索引中没有的条目（例如索引文件出现之前写入的）读取一次后补进索引
+                        with open(entry_path, 'r', encoding='utf-8') as f:
+                            size = json.load(f).get('size_bytes', 0)
+                        index[name] = size
+                        changed = True
+                except (OSError, ValueError):
+                    continue
+                entries.append((mtime, size, name))
+                total += size
+
+            present = {name for _, _, name in entries}
+            for name in [name for name in index if name not in present]:
+                del index[name]
+                changed = True
+
+            if total > self.max_bytes:
+                target = self.max_bytes * 0.9
+                for _, size, name in sorted(entries):
+                    shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+                    index.pop(name, None)
+                    changed = True
+                    total -= size
+                    if total <= target:
+                        break
+            if changed:
+                self._save_index(index)
@@ -0,0 +1,216 @@
+"""
+长会话的分层上下文压缩
+
+原来的做法是在超过阈值时用一次全量 LLM 调用把整个历史替换成一条摘要：调用期间会话停顿，
+最近的工具输出也一并丢失，agent 随后只能重新读取文件。这里改为分层、滚动的压缩：
+
+  1. 省略：最近 K 轮之前、超过 N tokens 的工具输出（function_response）替换为占位说明，
+     保留 function call id / name，调用与结果的配对关系不变
+  2. 保留：最近 K 轮（从第 K 个模型回复开始）原样保留
+  3. 摘要：上下文达到软阈值（硬阈值 * soft_ratio）时，在后台对最早的窗口（上一次摘要 + 之后到最近 K 轮之前的内容）
+     做摘要；摘要完成后，后续请求中被覆盖的前缀替换为一条 role="summary" 的内容
+
+摘要在后台任务中运行，当前请求不会等待；摘要完成前只使用省略后的上下文。
+ADK 每轮都会从会话事件重建 contents，所以压缩在每次请求时重新应用：
+已完成的摘要按内容哈希匹配被覆盖的前缀，历史与生成摘要时不一致（例如会话被重建）时丢弃旧摘要。
+"""
+
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Optional
+
+from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+ELIDED_TEMPLATE = "[Earlier tool output elided to save context: {name}, ~{tokens} tokens. Call the tool again if you still need it.]"
+SUMMARY_PREFIX = "Summary of the earlier conversation history (older turns were compacted):\n"
+# 待摘要窗口至少占硬阈值的比例，避免每轮都为一两条新内容重新摘要
+MIN_SUMMARY_WINDOW_RATIO = 0.1
+# 摘要失败后至少间隔多久再重试（秒）
+SUMMARY_RETRY_INTERVAL = 60
+# 保留压缩状态的 session 数上限
+MAX_COMPACTION_SESSIONS = 512
+
+
+class SessionCompaction:
+    """单个 session 的压缩状态"""
+
+    def __init__(self):
+        self.summary: Optional[str] = None
+        # 摘要覆盖的 contents[1:] 前缀的内容哈希
+        self.covered: List[str] = []
+        self.task: Optional[asyncio.Task] = None
+        self.last_failure = 0.0
+
+
+class ContextCompactor:
+    """
+    分层上下文压缩
+
+    Args:
+        render_part: (role, part) -> str，与 token 统计使用相同的渲染格式
+        count_text: str -> int，带缓存的 token 计数
+        summarize: async (previous_summary, history_text) -> str，调用 LLM 生成摘要
+        threshold: 硬阈值（max_tokens_threshold）
+        soft_ratio: 达到 threshold * soft_ratio 时开始省略工具输出并在后台生成摘要
+        keep_recent_turns: 原样保留的最近模型回复轮数
+        elide_tokens: 超过该 token 数的旧工具输出会被省略
+    """
+
+    def __init__(self, render_part: Callable, count_text: Callable[[str], int],
+                 summarize: Callable[[Optional[str], str], Awaitable[str]], threshold: int,
+                 soft_ratio: float = 0.75, keep_recent_turns: int = 6, elide_tokens: int = 2000):
+        self.render_part = render_part
+        self.count_text = count_text
+        self.summarize = summarize
+        self.threshold = threshold
+        self.soft_limit = int(threshold * soft_ratio)
+        self.keep_recent_turns = keep_recent_turns
+        self.elide_tokens = elide_tokens
+        self._sessions: "OrderedDict[str, SessionCompaction]" = OrderedDict()
+
+    def _state(self, session_id: str) -> SessionCompaction:
+        state = self._sessions.get(session_id)
+        if state is None:
+            state = SessionCompaction()
+            self._sessions[session_id] = state
+            while len(self._sessions) > MAX_COMPACTION_SESSIONS:
+                _, evicted = self._sessions.popitem(last=False)
+                if evicted.task and not evicted.task.done():
+                    evicted.task.cancel()
+        else:
+            self._sessions.move_to_end(session_id)
+        return state
+
+    def _content_key(self, content: types.Content) -> str:
+        digest = hashlib.sha1((content.role or '').encode('utf-8'))
+        for part in content.parts or []:
+            digest.update(self.render_part(content.role, part).encode('utf-8', 'surrogatepass'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def _content_tokens(self, content: types.Content) -> int:
+        return sum(self.count_text(self.render_part(content.role, part)) for part in content.parts or [])
+
+    def _recent_start(self, contents: List[types.Content]) -> int:
+        """
+        最近 K 轮的起始下标：从末尾数第 K 个模型回复
+        起点不能落在 function_response 上，否则会把结果和它的调用拆开
+        """
+        start = len(contents)
+        turns = 0
+        for index in range(len(contents) - 1, -1, -1):
+            if contents[index].role == 'model':
+                turns += 1
+                start = index
+                if turns >= self.keep_recent_turns:
+                    break
+        while start > 0 and any(part.function_response for part in contents[start].parts or []):
+            start -= 1
+        return start
+
+    def _elide(self, content: types.Content, limit: int) -> types.Content:
+        """把超过 limit tokens 的工具输出替换为占位说明（保留 id / name）"""
+        parts = []
+        changed = False
+        for part in content.parts or []:
+            response = part.function_response
+            if response is not None:
+                tokens = self.count_text(self.render_part(content.role, part))
+                if tokens > limit:
+                    parts.append(types.Part(function_response=types.FunctionResponse(
+                        id=response.id, name=response.name,
+                        response={"result": ELIDED_TEMPLATE.format(name=response.name, tokens=tokens)})))
+                    changed = True
+                    continue
+            parts.append(part)
+        return types.Content(role=content.role, parts=parts) if changed else content
+
+    def _schedule_summary(self, session_id: str, state: SessionCompaction, window: List[types.Content],
+                          covered: List[str]):
+        """在后台为 window 生成摘要，完成后覆盖 covered 前缀"""
+        # 摘要输入也先省略大段工具输出，控制摘要调用本身的大小
+        history_text = "\n\n".join(
+            "\n".join(text for text in (self.render_part(content.role, part)
+                                        for part in self._elide(content, self.elide_tokens).parts or []) if text)
+            for content in window)
+        previous_summary = state.summary
+
+        async def run():
+            start_time = time.time()
+            try:
+                summary = await self.summarize(previous_summary, history_text)
+            except Exception as e:
+                state.last_failure = time.time()
+                logger.warning(f"Session {session_id}: 后台摘要失败: {e}")
+                return
+            if not summary.strip():
+                state.last_failure = time.time()
+                logger.warning(f"Session {session_id}: 后台摘要为空，忽略")
+                return
+            state.summary = summary
+            state.covered = covered
+            logger.info(f"Session {session_id}: 后台摘要完成，覆盖 {len(covered)} 条历史，"
+                        f"耗时 {time.time() - start_time:.1f}s，摘要长度 {len(summary)}")
+
+        state.task = asyncio.get_running_loop().create_task(run())
+        logger.info(f"Session {session_id}: 上下文达到软阈值 {self.soft_limit}，后台摘要 {len(window)} 条历史")
+
+    def compact(self, session_id: str, contents: List[types.Content], total_tokens: int) -> List[types.Content]:
+        """
+        返回压缩后的 contents（不修改传入的列表），不会等待摘要
+
+        Args:
+            session_id: 会话ID
+            contents: llm_request.contents（第一条是任务提示，始终原样保留）
+            total_tokens: 压缩前的上下文 token 数
+        """
+        if len(contents) < 2:
+            return contents
+        state = self._state(session_id)
+        first, rest = contents[0], contents[1:]
+
+        # 已完成的摘要：被覆盖的前缀与当前历史一致时替换，否则丢弃
+        prefix = 0
+        if state.summary:
+            keys = [self._content_key(content) for content in rest[:len(state.covered)]]
+            if keys == state.covered:
+                prefix = len(state.covered)
+            else:
+                logger.info(f"Session {session_id}: 历史与摘要不一致，丢弃旧摘要")
+                state.summary, state.covered = None, []
+
+        if prefix == 0 and total_tokens < self.soft_limit:
+            return contents
+
+        cut = max(self._recent_start(rest), prefix)
+        output = [first]
+        if prefix:
+            summary = types.Content(role="summary", parts=[types.Part.from_text(text=SUMMARY_PREFIX + state.summary)])
+            output.append(summary)
+            # 之后的阈值判断按替换摘要后的上下文大小计算
+            total_tokens = sum(self._content_tokens(content) for content in [first, summary] + rest[prefix:])
+        if total_tokens >= self.soft_limit:
+            old = [self._elide(content, self.elide_tokens) for content in rest[prefix:cut]]
+            # 仍超过硬阈值时，省略最近 K 轮之前的全部工具输出
+            estimated = sum(self._content_tokens(content) for content in output + old + rest[cut:])
+            if estimated >= self.threshold:
+                old = [self._elide(content, 0) for content in rest[prefix:cut]]
+            output.extend(old)
+
+            # 最早的窗口（上一次摘要之后到最近 K 轮之前）交给后台摘要
+            running = state.task is not None and not state.task.done()
+            window = rest[prefix:cut]
+            if (window and not running
+                    and time.time() - state.last_failure >= SUMMARY_RETRY_INTERVAL
+                    and sum(self._content_tokens(content) for content in window) >= self.threshold * MIN_SUMMARY_WINDOW_RATIO):
+                covered = state.covered + [self._content_key(content) for content in window]
+                self._schedule_summary(session_id, state, window, covered)
+        else:
+            output.extend(rest[prefix:cut])
+        output.extend(rest[cut:])
+        return output
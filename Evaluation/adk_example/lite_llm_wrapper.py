@@ -10,6 +10,10 @@ from datetime import datetime
 import threading
 import hashlib
 import time
+from collections import OrderedDict
+from rate_limiter import get_rate_limiter, rate_limit_info
+from context_compaction import ContextCompactor
+import tracing
 
 current_time = lambda: int(time.time())
 
@@ -20,18 +24,129 @@ class EarlyStopException(Exception):
         self.reason = reason
         super().__init__(reason)
 
+# 内容哈希 -> token 数的缓存条目上限（所有 session 共用）
+PART_TOKEN_CACHE_SIZE = 200_000
+# 保留 token 账本的 session 数上限，超出后淘汰最久未使用的 session
+MAX_LEDGER_SESSIONS = 512
+# 开启 enable_prompt_cache 时默认的缓存断点（litellm cache_control_injection_points）：
+# system 消息之前的部分（工具声明 + system instruction）在所有 session 之间共用，最后一条消息之前的部分在同一 session 的后续轮次中复用。
+# ADK 对部分模型用 developer 角色发送 system instruction，两种角色都标记，实际只会命中一个
+DEFAULT_CACHE_CONTROL_POINTS = [
+    {"location": "message", "role": "system"},
+    {"location": "message", "role": "developer"},
+    {"location": "message", "index": -1},
+]
+# 上下文摘要（后台滚动摘要 / compress_with_llm_async）使用的 system prompt
+COMPRESSION_PROMPT = """You are the component that summarizes internal chat history into a given structure.
+When the conversation history grows too large, you will be invoked to distill the entire history into a concise, structured XML snapshot. This snapshot is CRITICAL, as it will become the agent's *only* memory of the past. The agent will resume its work based solely on this snapshot. All crucial details, plans, errors, and user directives MUST be preserved.
+
+First, you will think through the entire history in a private <scratchpad>. Review the user's overall goal, the agent's actions, tool outputs, file modifications, and any unresolved questions. Identify every piece of information that is essential for future actions.
+
+After your reasoning is complete, generate the final <state_snapshot> XML object. Be incredibly dense with information. Omit any irrelevant conversational filler.
+
+The structure MUST be as follows:
+<state_snapshot>
+    <overall_goal>
+        <!-- A single, concise sentence describing the user's high-level objective. -->
+    </overall_goal>
+    <key_knowledge>
+        <!-- Crucial facts, conventions, and constraints the agent must remember based on the conversation history and interaction with the user. Use bullet points. -->
+    </key_knowledge>
+    <file_system_state>
+        <!-- List files that have been created, read, modified, or deleted. Note their status and critical learnings. -->
+    </file_system_state>
+    <recent_actions>
+        <!-- A summary of the last few significant agent actions and their outcomes. Focus on facts. -->
+    </recent_actions>
+    <current_plan>
+        <!-- The agent's step-by-step plan. Mark completed steps. -->
+    </current_plan>
+</state_snapshot>
+"""
+
+
+class SessionTokenLedger:
+    """
+    单个 session 的上下文 token 账本
+
+    每轮调用的 contents 绝大部分与上一轮相同，只在末尾追加了新的 part。
+    账本按 part 对象身份记住上一轮每个 part 的 token 数；对象是新建的（ADK 每轮会重建 contents）时，
+    再按内容哈希查共享缓存，只有从未见过的内容才会调用 tokenizer。
+    """
+
+    def __init__(self):
+        # id(part) -> (part, tokens)：持有 part 的引用，保证 id 在下一轮之前不会被复用
+        self.part_tokens: Dict[int, tuple] = {}
+        self.context_tokens = 0
+        self.total_parts = 0
+        self.tokenized_parts = 0
+        self.updated_at = current_time()
+
+    def count(self, contents: list, render_part, count_text, hash_cache: "OrderedDict[str, int]",
+              cache_lock: threading.Lock) -> int:
+        """
+        统计 contents 的 token 数并更新账本
+
+        Args:
+            contents: llm_request.contents
+            render_part: (role, part) -> str，与 content_to_string 的单行格式一致
+            count_text: str -> int，实际的 tokenizer
+            hash_cache: 共享的 内容哈希 -> token 数 缓存
+            cache_lock: 保护 hash_cache 的锁
+        """
+        part_tokens = {}
+        total = 0
+        tokenized = 0
+        for content in contents:
+            for part in content.parts or []:
+                cached = self.part_tokens.get(id(part))
+                if cached is not None and cached[0] is part:
+                    tokens = cached[1]
+                else:
+                    text = render_part(content.role, part)
+                    key = hashlib.sha1(text.encode('utf-8', 'surrogatepass')).hexdigest()
+                    with cache_lock:
+                        tokens = hash_cache.get(key)
+                        if tokens is not None:
+                            hash_cache.move_to_end(key)
+                    if tokens is None:
+                        # 每个 part 之间的换行分隔符按 1 个 token 计
+                        tokens = count_text(text) + 1 if text else 0
+                        tokenized += 1
+                        with cache_lock:
+                            hash_cache[key] = tokens
+                            if len(hash_cache) > PART_TOKEN_CACHE_SIZE:
+                                hash_cache.popitem(last=False)
+                part_tokens[id(part)] = (part, tokens)
+                total += tokens
+        self.part_tokens = part_tokens
+        self.context_tokens = total
+        self.total_parts = len(part_tokens)
+        self.tokenized_parts = tokenized
+        self.updated_at = current_time()
+        return total
+
+
 class LiteLlmWithSleep(LiteLlm):
     """
-    Wrapper around LiteLlm that adds configurable sleep between responses.
+    Wrapper around LiteLlm that adds rate limiting between requests.
     
-    This allows you to control the rate of LLM responses without modifying
-    the original library code.
+    Requests go through a process-wide token-bucket limiter per model (rpm / tpm),
+    and a 429 pauses every session of the model for its Retry-After. The fixed
+    sleep between responses is kept for compatibility but defaults to 0.
     """
     
-    sleep_duration: float = Field(default=2.0, description="Time to sleep between responses in seconds")
+    sleep_duration: float = Field(default=0.0, description="Time to sleep between responses in seconds (legacy, prefer rpm/tpm)")
+    rpm: Optional[int] = Field(default=None, description="Max requests per minute for this model, shared by the whole process")
+    tpm: Optional[int] = Field(default=None, description="Max tokens per minute for this model, shared by the whole process")
     enable_compression: bool = Field(default=False, description="是否启用压缩")
     max_tokens_threshold: int = Field(default=None, description="Token threshold to trigger compression")
+    compaction_soft_ratio: float = Field(default=0.75, description="达到 max_tokens_threshold * 该比例时开始省略旧工具输出并在后台摘要")
+    keep_recent_turns: int = Field(default=6, description="压缩时原样保留的最近模型回复轮数")
+    elide_tool_output_tokens: int = Field(default=2000, description="最近几轮之前超过该 token 数的工具输出会被省略")
     tokenizer: object = Field(default=None, description="Tokenizer for token counting")
+    enable_prompt_cache: bool = Field(default=False, description="为支持 cache_control 的后端（Anthropic / Bedrock / Gemini 等）标记缓存断点；OpenAI 兼容接口按前缀自动缓存，不需要开启")
+    prompt_cache_points: Optional[list] = Field(default=None, description="自定义 cache_control_injection_points，默认 DEFAULT_CACHE_CONTROL_POINTS")
     max_total_tokens: int = Field(default=2_560_000, description="Max total tokens for truncate")
     warning_threshold: float = Field(default=0.8, description="Warning threshold for total tokens")
     max_session_time: int = Field(default=1200, description="Max session time in seconds")
@@ -44,6 +159,20 @@ class LiteLlmWithSleep(LiteLlm):
         self._session_early_stop: Dict[str, bool] = {}
         self._session_early_stop_reason: Dict[str, str] = {}
         self._lock = threading.Lock()
+        # 提示词缓存命中统计：session_id -> [prompt tokens, 命中缓存的 prompt tokens, 调用次数]
+        self._session_cache_stats: Dict[str, list] = {}
+        # 上下文 token 账本：session_id -> SessionTokenLedger（LRU），以及所有 session 共用的内容哈希缓存
+        self._session_ledgers: "OrderedDict[str, SessionTokenLedger]" = OrderedDict()
+        self._part_token_cache: "OrderedDict[str, int]" = OrderedDict()
+        self._part_token_cache_lock = threading.Lock()
+        # LiteLlm 会把构造参数原样传给 litellm.acompletion，这两个参数只在这里使用
+        self._additional_args.pop('enable_prompt_cache', None)
+        self._additional_args.pop('prompt_cache_points', None)
+        if self.enable_prompt_cache:
+            self._additional_args.setdefault(
+                'cache_control_injection_points', self.prompt_cache_points or DEFAULT_CACHE_CONTROL_POINTS)
+        # 进程内同一模型共用的限流器（未配置 rpm/tpm 时只响应 429）
+        self._rate_limiter = get_rate_limiter(self.model, self.rpm, self.tpm)
         
         # 初始化tokenizer
         if self.tokenizer is None:
@@ -51,6 +180,14 @@ class LiteLlmWithSleep(LiteLlm):
                 self.tokenizer = tiktoken.get_encoding("cl100k_base")
             except:
                 self.tokenizer = None
+
+        # 分层上下文压缩：省略旧工具输出 + 保留最近几轮 + 后台滚动摘要
+        self._compactor = None
+        if self.enable_compression and self.max_tokens_threshold:
+            self._compactor = ContextCompactor(
+                self._part_to_string, self._count_text_cached, self._summarize_history,
+                self.max_tokens_threshold, soft_ratio=self.compaction_soft_ratio,
+                keep_recent_turns=self.keep_recent_turns, elide_tokens=self.elide_tool_output_tokens)
     
     def _get_session_id(self, llm_request: LlmRequest) -> str:
         """获取或生成session ID"""
@@ -108,11 +245,22 @@ class LiteLlmWithSleep(LiteLlm):
         with self._lock:
             self._session_tokens[session_id] = 0
             self._session_early_stop[session_id] = False
+            self._session_ledgers.pop(session_id, None)
+            self._session_cache_stats.pop(session_id, None)
 
     def get_session_token_info(self, session_id: str) -> dict:
-        """获取指定session的token使用信息"""
+        """
+        获取指定session的token使用信息
+        current_tokens 是累计的 API 用量；context_tokens 是最近一次请求上下文的估算 token 数（来自 token 账本）
+        """
         current_tokens = self._get_session_tokens(session_id)
         start_time = self._get_session_times(session_id)
+        with self._lock:
+            ledger = self._session_ledgers.get(session_id)
+            context_tokens = ledger.context_tokens if ledger else 0
+            context_parts = ledger.total_parts if ledger else 0
+            tokenized_parts = ledger.tokenized_parts if ledger else 0
+            prompt_tokens, cached_tokens, calls = self._session_cache_stats.get(session_id, (0, 0, 0))
         return {
             "session_id": session_id,
             "current_tokens": current_tokens,
@@ -120,8 +268,80 @@ class LiteLlmWithSleep(LiteLlm):
             "max_tokens": self.max_total_tokens,
             "usage_ratio": current_tokens / self.max_total_tokens if self.max_total_tokens else 0,
             "early_stop_triggered": self._get_session_early_stop(session_id),
+            "context_tokens": context_tokens,
+            "context_parts": context_parts,
+            "last_tokenized_parts": tokenized_parts,
+            "compression_threshold": self.max_tokens_threshold,
+            "prompt_tokens": prompt_tokens,
+            "cached_prompt_tokens": cached_tokens,
+            "cache_hit_rate": cached_tokens / prompt_tokens if prompt_tokens else 0,
+            "llm_calls": calls,
         }
 
+    def _get_ledger(self, session_id: str) -> SessionTokenLedger:
+        """获取（必要时创建）session 的 token 账本，超过 MAX_LEDGER_SESSIONS 时淘汰最久未使用的"""
+        with self._lock:
+            ledger = self._session_ledgers.get(session_id)
+            if ledger is None:
+                ledger = SessionTokenLedger()
+                self._session_ledgers[session_id] = ledger
+                while len(self._session_ledgers) > MAX_LEDGER_SESSIONS:
+                    self._session_ledgers.popitem(last=False)
+            else:
+                self._session_ledgers.move_to_end(session_id)
+            return ledger
+
+    def count_context_tokens(self, llm_request: LlmRequest, session_id: Optional[str] = None) -> int:
+        """增量统计请求上下文的 token 数：只对新出现的 part 调用 tokenizer"""
+        session_id = session_id or self._get_session_id(llm_request)
+        return self._get_ledger(session_id).count(
+            llm_request.contents, self._part_to_string, self.count_tokens_with_tiktoken,
+            self._part_token_cache, self._part_token_cache_lock)
+
+    def _count_text_cached(self, text: str) -> int:
+        """按内容哈希缓存的 token 计数（与账本共用缓存，计数方式相同）"""
+        if not text:
+            return 0
+        key = hashlib.sha1(text.encode('utf-8', 'surrogatepass')).hexdigest()
+        with self._part_token_cache_lock:
+            tokens = self._part_token_cache.get(key)
+            if tokens is not None:
+                self._part_token_cache.move_to_end(key)
+                return tokens
+        tokens = self.count_tokens_with_tiktoken(text) + 1
+        with self._part_token_cache_lock:
+            self._part_token_cache[key] = tokens
+            if len(self._part_token_cache) > PART_TOKEN_CACHE_SIZE:
+                self._part_token_cache.popitem(last=False)
+        return tokens
+
+    async def _summarize_history(self, previous_summary: Optional[str], history_text: str) -> str:
+        """后台滚动摘要：把上一次的摘要和之后的历史合并成新的 state_snapshot"""
+        if previous_summary:
+            history_text = f"Previous state snapshot:\n{previous_summary}\n\nConversation since that snapshot:\n{history_text}"
+        request = LlmRequest(
+            model=self.model,
+            contents=[types.Content(role="user", parts=[types.Part.from_text(text=history_text)])],
+            config=types.GenerateContentConfig(
+                system_instruction=COMPRESSION_PROMPT,
+                temperature=0.1,
+                max_output_tokens=2000
+            )
+        )
+        await self._rate_limiter.acquire()
+        summary = ""
+        with tracing.span("llm.summarize", "compression", model=self.model,
+                          bytes_in=tracing.payload_size(history_text)) as llm_span:
+            # 直接调用 LiteLlm，不经过本类的 session 计数、限时和压缩逻辑
+            async for response in super(LiteLlmWithSleep, self).generate_content_async(request, stream=False):
+                tracing.record_llm_usage(llm_span, response)
+                if response.content and response.content.parts:
+                    for part in response.content.parts:
+                        if part.text:
+                            summary += part.text
+            llm_span.set(bytes_out=tracing.payload_size(summary))
+        return summary
+
     def set_new_response_info(self, old_request, new_request):
         # 把老的会话的token计数和起始时间设置到新的会话中
         old_session_id = self._get_session_id(old_request)
@@ -146,6 +366,7 @@ class LiteLlmWithSleep(LiteLlm):
         response_tokens = response.usage_metadata.candidates_token_count
         total_tokens = request_tokens + response_tokens
         logger.info(f"Session {session_id}: 请求token数: {request_tokens}, 响应token数: {response_tokens}, 总token数: {total_tokens}")
+        self._record_cache_usage(session_id, request_tokens, response.usage_metadata)
 
 
         self._add_session_tokens(session_id, total_tokens)
@@ -165,6 +386,20 @@ class LiteLlmWithSleep(LiteLlm):
         else:
             logger.info(f"Session {session_id}: 会话时间: {current_time() - self._get_session_times(session_id)}s, 最大会话时间: {self.max_session_time}s")
     
+    def _record_cache_usage(self, session_id: str, request_tokens: int, usage_metadata):
+        """累计 session 的提示词缓存命中（后端返回的 cached tokens，未返回时按 0 计）"""
+        cached_tokens = getattr(usage_metadata, 'cached_content_token_count', None) or 0
+        with self._lock:
+            stats = self._session_cache_stats.setdefault(session_id, [0, 0, 0])
+            stats[0] += request_tokens or 0
+            stats[1] += cached_tokens
+            stats[2] += 1
+            hit_rate = stats[1] / stats[0] if stats[0] else 0
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.info(f"Session {session_id}: 本次缓存命中 {cached_tokens}/{request_tokens} tokens，"
+                    f"累计命中率 {hit_rate:.1%}（{stats[2]} 次调用）")
+
     def _create_exit_loop_response(self, session_id: str = None, reason=None) -> LlmResponse:
         """创建包含exit_loop工具调用的响应"""
         # 标记已触发early stop
@@ -212,6 +447,8 @@ class LiteLlmWithSleep(LiteLlm):
         with self._lock:
             self._session_tokens.clear()
             self._session_early_stop.clear()
+            self._session_ledgers.clear()
+            self._session_cache_stats.clear()
     
     def force_reset_early_stop(self):
         """强制重置early stop状态（保持向后兼容）"""
@@ -291,21 +528,24 @@ class LiteLlmWithSleep(LiteLlm):
             parts=[types.Part.from_text(text=compressed_string)]
         )]
         
+    @staticmethod
+    def _part_to_string(role: str, part: types.Part) -> str:
+        """将单个 Part 转换为字符串，没有文本/函数调用/函数结果时返回空串"""
+        if part.text:
+            return f"[{role}]: {part.text}"
+        elif part.function_call:
+            return f"[{role} function_call]: {part.function_call}"
+        elif part.function_response:
+            return f"[{role} function_response]: {part.function_response}"
+        return ""
+
     def content_to_string(self, content: types.Content) -> str:
         """将单个 Content 转换为字符串"""
         if not content.parts:
             return ""
         
-        parts_text = []
-        for part in content.parts:
-            if part.text:
-                parts_text.append(f"[{content.role}]: {part.text}")
-            elif part.function_call:
-                parts_text.append(f"[{content.role} function_call]: {part.function_call}")
-            elif part.function_response:
-                parts_text.append(f"[{content.role} function_response]: {part.function_response}")
-        
-        return "\n".join(parts_text)
+        parts_text = [self._part_to_string(content.role, part) for part in content.parts]
+        return "\n".join(text for text in parts_text if text)
 
     def contents_to_string(self, contents: list[types.Content]) -> str:
         """将 contents 列表转换为字符串"""
@@ -316,9 +556,8 @@ class LiteLlmWithSleep(LiteLlm):
         if not self.enable_compression:
             return False
         
-        # 计算 contents 的 token 数量
-        content_string = self.contents_to_string(llm_request.contents)
-        content_tokens = self.count_tokens_with_tiktoken(content_string)
+        # 计算 contents 的 token 数量（账本只对新增的 part 做 tokenize）
+        content_tokens = self.count_context_tokens(llm_request)
         import logging
         logger = logging.getLogger(__name__)
         if content_tokens > self.max_tokens_threshold:
@@ -340,32 +579,6 @@ class LiteLlmWithSleep(LiteLlm):
     
         # 1. 将 contents 转换为字符串
         content_string = self.contents_to_string(historical_contents)
-        compression_prompt = f"""You are the component that summarizes internal chat history into a given structure.
-When the conversation history grows too large, you will be invoked to distill the entire history into a concise, structured XML snapshot. This snapshot is CRITICAL, as it will become the agent's *only* memory of the past. The agent will resume its work based solely on this snapshot. All crucial details, plans, errors, and user directives MUST be preserved.
-
-First, you will think through the entire history in a private <scratchpad>. Review the user's overall goal, the agent's actions, tool outputs, file modifications, and any unresolved questions. Identify every piece of information that is essential for future actions.
-
-After your reasoning is complete, generate the final <state_snapshot> XML object. Be incredibly dense with information. Omit any irrelevant conversational filler.
-
-The structure MUST be as follows:
-<state_snapshot>
-    <overall_goal>
-        <!-- A single, concise sentence describing the user's high-level objective. -->
-    </overall_goal>
-    <key_knowledge>
-        <!-- Crucial facts, conventions, and constraints the agent must remember based on the conversation history and interaction with the user. Use bullet points. -->
-    </key_knowledge>
-    <file_system_state>
-        <!-- List files that have been created, read, modified, or deleted. Note their status and critical learnings. -->
-    </file_system_state>
-    <recent_actions>
-        <!-- A summary of the last few significant agent actions and their outcomes. Focus on facts. -->
-    </recent_actions>
-    <current_plan>
-        <!-- The agent's step-by-step plan. Mark completed steps. -->
-    </current_plan>
-</state_snapshot>
-"""
         
         # 2. 创建压缩请求，将压缩指令作为 system prompt
         compression_request = LlmRequest(
@@ -376,7 +589,7 @@ The structure MUST be as follows:
                 )
             ],
             config=types.GenerateContentConfig(
-                system_instruction=compression_prompt,
+                system_instruction=COMPRESSION_PROMPT,
                 temperature=0.1,
                 max_output_tokens=2000
             )
@@ -398,11 +611,15 @@ The structure MUST be as follows:
             
             # 4. 调用 LLM 进行压缩
             compressed_content = ""
-            async for response in super().generate_content_async(compression_request, stream=False):
-                if response.content and response.content.parts:
-                    for part in response.content.parts:
-                        if part.text:
-                            compressed_content += part.text
+            with tracing.span("llm.compress", "compression", session_id=self._get_session_id(llm_request),
+                              model=self.model, bytes_in=tracing.payload_size(content_string)) as llm_span:
+                async for response in super().generate_content_async(compression_request, stream=False):
+                    tracing.record_llm_usage(llm_span, response)
+                    if response.content and response.content.parts:
+                        for part in response.content.parts:
+                            if part.text:
+                                compressed_content += part.text
+                llm_span.set(bytes_out=tracing.payload_size(compressed_content))
             
 
             llm_request.contents = [
@@ -453,6 +670,11 @@ The structure MUST be as follows:
 
             
         
+        # 分层压缩：省略旧工具输出、替换已摘要的前缀，必要时在后台开始新的摘要（不等待）
+        if self._compactor is not None and retry_count == 0:
+            llm_request.contents = self._compactor.compact(
+                session_id, llm_request.contents, self.count_context_tokens(llm_request, session_id))
+
         # 在请求中添加token警告信息（如果超过警告阈值）
         llm_request = self._add_token_warning_to_request(llm_request, session_id)
         if self.should_compress(llm_request):
@@ -462,21 +684,35 @@ The structure MUST be as follows:
                 parts=[types.Part.from_text(text="Your conversation history token usage has reached limit. In subsequent interactions, earlier parts of the conversation may be truncated. It is recommended that you summarize your conversation history and save it to a file for future reference.")]
             ))
             # assert len(llm_request.contents) == 3
+        # 限流：只有即将超过 rpm/tpm 或处于 429 暂停期时才会等待
+        estimated_tokens = self.count_context_tokens(llm_request, session_id) if self.tpm else 0
+        with tracing.span("llm.rate_limit_wait", "llm", session_id=session_id, model=self.model):
+            await self._rate_limiter.acquire(estimated_tokens)
         # Get the original generator from the parent class
         try:
             import logging
             logger = logging.getLogger(__name__)
             # logger.info('--------------------------------')
             # logger.info(f"prompt now:{llm_request}")
-            async for response in super().generate_content_async(llm_request, stream):
-                # 更新token计数
-                self._update_token_count(llm_request, response, session_id)
-                # Yield the response
-                yield response
-                
-                # Add sleep after each response (except the last one if needed)
-                if self.sleep_duration > 0:
-                    await asyncio.sleep(self.sleep_duration)
+            # span 只统计等待模型的时间，不含 yield 之后 ADK 执行工具的时间
+            with tracing.span("llm.generate", "llm", session_id=session_id, model=self.model,
+                              retry=retry_count or None) as llm_span:
+                async for response in llm_span.iterate(super().generate_content_async(llm_request, stream)):
+                    # 更新token计数
+                    self._update_token_count(llm_request, response, session_id)
+                    tracing.record_llm_usage(llm_span, response)
+                    if response.usage_metadata and self.tpm:
+                        self._rate_limiter.record_usage(
+                            (response.usage_metadata.prompt_token_count or 0)
+                            + (response.usage_metadata.candidates_token_count or 0),
+                            estimated_tokens)
+                        estimated_tokens = 0
+                    # Yield the response
+                    yield response
+                    
+                    # Add sleep after each response (except the last one if needed)
+                    if self.sleep_duration > 0:
+                        await asyncio.sleep(self.sleep_duration)
                     
         except Exception as e:
             # 如果发生异常，检查是否可以重试
@@ -487,9 +723,14 @@ The structure MUST be as follows:
                 # 可以重试，增加重试计数
                 retry_count += 1
                 logger.warning(f"生成内容时发生异常: {e}，正在进行第 {retry_count} 次重试...")
-        
-                # 短暂等待后重试
-                await asyncio.sleep(1)
+
+                is_rate_limited, retry_after = rate_limit_info(e)
+                if is_rate_limited:
+                    # 429：暂停该模型的所有 session，重试时在 acquire 中等待
+                    self._rate_limiter.penalize(retry_after)
+                else:
+                    # 短暂等待后重试
+                    await asyncio.sleep(1)
 
                 # 递归调用自身进行重试
                 async for response in self.generate_content_async(llm_request, stream, retry_count, max_retries):
@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+"""
+本地 OpenAI 兼容的模拟 LLM 后端，用于在不调用真实模型的情况下测试 agent 流程、提示词缓存和编排开销
+
+  - POST /v1/chat/completions：按固定脚本回复（先调用若干次 list_workspace，最后调用 exit_loop；没有工具时回复文本）
+  - 录制（--record）：把请求转发给真实的上游模型（--upstream），原样返回，并把每轮回复和耗时追加到 JSONL 文件
+  - 回放（--replay）：按会话（第一条 user 消息）和轮次（已有的 assistant 消息数）返回录制的回复（包括工具调用）
+      新会话与录制的会话不一致（例如项目路径不同）时按顺序分配一个录制的会话；--path_map 替换回复中的路径；
+      录制的轮次用完、或回复调用了当前 agent 没有的工具时退回到上面的脚本回复
+  - 延迟分布（--latency）：固定值、uniform / normal / lognormal 分布，或回放录制的耗时（replay，可缩放），
+      另可按回复的 completion tokens 增加延迟（--token_latency）
+  - 模拟后端的前缀缓存：按 1024 tokens 的块计算与之前请求相同的前缀，在 usage.prompt_tokens_details.cached_tokens 中返回
+      auto: 与 OpenAI 一致，自动缓存任意请求的前缀
+      explicit: 与 Anthropic 一致，只缓存到带 cache_control 标记的位置为止（用于验证 cache_control_injection_points 是否生效）
+      off: 不缓存
+  - GET /stats：总体和按会话（第一条 user 消息）的缓存命中率
+
+用法：
+  python Evaluation/adk_example/mock_llm_backend.py --port 18000 --turns 3
+  # config.py 中的 mock_local 模型指向该服务：ADK_MODEL=mock_local
+  # 录制一次真实运行（上游密钥从环境变量读取），再以录制的耗时的一半回放
+  UPSTREAM_API_KEY=... python Evaluation/adk_example/mock_llm_backend.py --record sessions.jsonl \
+      --upstream https://api.example.com/v1 --upstream_model deepseek-chat
+  python Evaluation/adk_example/mock_llm_backend.py --replay sessions.jsonl --latency replay:0.5 \
+      --path_map /work/workspace/gpt_5_Dev_inference_eval=/tmp/adk_bench/eval
+  # 端到端基准测试见 benchmark_harness.py
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+# 粗略估算：每 4 个字符约 1 个 token
+CHARS_PER_TOKEN = 4
+# 缓存块大小（tokens），与 OpenAI 的前缀缓存粒度一致
+CACHE_BLOCK_TOKENS = 1024
+# 保留的缓存块数上限
+MAX_CACHE_BLOCKS = 100_000
+# 脚本回复的 completion tokens
+SCRIPTED_COMPLETION_TOKENS = 20
+# 转发到上游的超时（秒）
+UPSTREAM_TIMEOUT = 600
+
+
+class PrefixCache:
+    """按块的前缀缓存：每个块的键是从开头到该块结尾的链式哈希，相同前缀得到相同的键"""
+
+    def __init__(self, block_chars: int):
+        self.block_chars = block_chars
+        self.blocks: "OrderedDict[str, bool]" = OrderedDict()
+
+    def _chain(self, text: str, limit: int):
+        digest = hashlib.sha256()
+        keys = []
+        for start in range(0, limit - self.block_chars + 1, self.block_chars):
+            digest.update(text[start:start + self.block_chars].encode('utf-8', 'surrogatepass'))
+            keys.append(digest.hexdigest())
+        return keys
+
+    def lookup_and_store(self, text: str, cacheable_chars: int) -> int:
+        """返回命中的前缀字符数，并把 text[:cacheable_chars] 的各个块写入缓存"""
+        hit_blocks = 0
+        for key in self._chain(text, cacheable_chars):
+            if key in self.blocks:
+                self.blocks.move_to_end(key)
+                hit_blocks += 1
+            else:
+                break
+        for key in self._chain(text, cacheable_chars)[hit_blocks:]:
+            self.blocks[key] = True
+            if len(self.blocks) > MAX_CACHE_BLOCKS:
+                self.blocks.popitem(last=False)
+        return hit_blocks * self.block_chars
+
+
+def serialize_prompt(body: dict):
+    """
+    按发送顺序把工具声明和消息序列化成文本，返回 (文本, 最后一个 cache_control 标记结束处的偏移)
+    """
+    pieces = [json.dumps(body.get('tools') or [], ensure_ascii=False, sort_keys=True)]
+    offset = len(pieces[0])
+    marker_end = 0
+    for message in body.get('messages') or []:
+        piece = json.dumps(message, ensure_ascii=False, sort_keys=True)
+        pieces.append(piece)
+        offset += len(piece)
+        content = message.get('content')
+        marked = 'cache_control' in message or (
+            isinstance(content, list) and any(isinstance(block, dict) and 'cache_control' in block for block in content))
+        if marked:
+            marker_end = offset
+    return ''.join(pieces), marker_end
+
+
+def first_user_text(messages) -> str:
+    for message in messages:
+        if message.get('role') == 'user':
+            content = message.get('content')
+            if isinstance(content, list):
+                return ''.join(block.get('text', '') for block in content if isinstance(block, dict))
+            return str(content or '')
+    return ''
+
+
+def session_key(messages) -> str:
+    """会话标识：第一条 user 消息的哈希（录制和回放使用同一算法）"""
+    return hashlib.md5(first_user_text(messages).encode('utf-8')).hexdigest()
+
+
+def parse_path_map(items) -> List[tuple]:
+    """把 ["旧路径=新路径", ...] 解析为 [(旧, 新)]"""
+    pairs = []
+    for item in items or []:
+        old, sep, new = item.partition('=')
+        if not sep or not old:
+            raise ValueError(f"--path_map 需要 旧路径=新路径 的形式: {item}")
+        pairs.append((old, new))
+    return pairs
+
+
+class LatencyModel:
+    """
+    每次回复注入的延迟（秒），spec 的形式：
+      0.5 / fixed:0.5        固定值
+      uniform:0.2,2          均匀分布
+      normal:1.0,0.3         正态分布（小于 0 时取 0）
+      lognormal:1.5,0.6      对数正态分布（中位数, sigma），接近真实模型的长尾延迟
+      replay / replay:0.5    录制的耗时乘以系数（没有录制值时为 0）
+    """
+
+    KINDS = {'fixed': 1, 'uniform': 2, 'normal': 2, 'lognormal': 2, 'replay': 1}
+
+    def __init__(self, spec: str, seed: Optional[int] = None):
+        self.spec = spec
+        kind, sep, params = spec.partition(':')
+        if not sep and kind not in self.KINDS:
+            kind, params = 'fixed', spec
+        if kind not in self.KINDS:
+            raise ValueError(f"未知的延迟分布: {spec}（可选 {', '.join(self.KINDS)}）")
+        values = [float(value) for value in params.split(',') if value.strip()] if params else []
+        if kind == 'replay' and not values:
+            values = [1.0]
+        if len(values) != self.KINDS[kind]:
+            raise ValueError(f"延迟分布 {kind} 需要 {self.KINDS[kind]} 个参数: {spec}")
+        self.kind = kind
+        self.params = values
+        self.random = random.Random(seed)
+
+    def sample(self, recorded: Optional[float] = None) -> float:
+        if self.kind == 'fixed':
+            value = self.params[0]
+        elif self.kind == 'uniform':
+            value = self.random.uniform(*self.params)
+        elif self.kind == 'normal':
+            value = self.random.gauss(*self.params)
+        elif self.kind == 'lognormal':
+            median, sigma = self.params
+            value = self.random.lognormvariate(math.log(median), sigma) if median > 0 else 0
+        else:
+            value = (recorded or 0) * self.params[0]
+        return max(value, 0.0)
+
+
+class ReplayLog:
+    """
+    录制的会话：{会话标识: {轮次: 录制条目}}
+
+    Args:
+        path: --record 写出的 JSONL 文件
+        path_map: [(录制时的路径, 回放时的路径)]，替换回复中的路径；反向替换后再匹配会话
+    """
+
+    def __init__(self, path: str, path_map=()):
+        self.path_map = list(path_map)
+        self.sessions: Dict[str, Dict[int, dict]] = OrderedDict()
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get('status', 200) != 200 or not entry.get('response', {}).get('choices'):
+                    continue
+                self.sessions.setdefault(entry['session'], {})[entry['turn']] = entry
+        self.order = list(self.sessions)
+        # 新会话 -> 分配的录制会话
+        self.assigned: Dict[str, str] = {}
+        self.stats = {"recorded_sessions": len(self.order), "matched_sessions": 0, "assigned_sessions": 0,
+                      "replayed_turns": 0, "scripted_turns": 0}
+
+    def _recorded_session(self, messages) -> Optional[str]:
+        text = first_user_text(messages)
+        for old, new in self.path_map:
+            if new:
+                text = text.replace(new, old)
+        live_key = hashlib.md5(text.encode('utf-8')).hexdigest()
+        if live_key not in self.assigned:
+            if live_key in self.sessions:
+                self.assigned[live_key] = live_key
+                self.stats["matched_sessions"] += 1
+            elif self.order:
+                self.assigned[live_key] = self.order[self.stats["assigned_sessions"] % len(self.order)]
+                self.stats["assigned_sessions"] += 1
+            else:
+                return None
+        return self.assigned[live_key]
+
+    def _map_paths(self, message: dict) -> dict:
+        text = json.dumps(message, ensure_ascii=False)
+        for old, new in self.path_map:
+            text = text.replace(json.dumps(old)[1:-1], json.dumps(new)[1:-1])
+        return json.loads(text)
+
+    def lookup(self, body: dict, tools) -> Optional[dict]:
+        """返回录制的 {"message", "latency", "completion_tokens"}；没有可用的录制回复时返回 None"""
+        messages = body.get('messages') or []
+        recorded_key = self._recorded_session(messages)
+        turn = sum(1 for message in messages if message.get('role') == 'assistant')
+        entry = self.sessions.get(recorded_key, {}).get(turn) if recorded_key else None
+        if entry is not None:
+            message = self._map_paths(entry['response']['choices'][0]['message'])
+            called = {call.get('function', {}).get('name') for call in message.get('tool_calls') or []}
+            if called <= tools:
+                self.stats["replayed_turns"] += 1
+                usage = entry['response'].get('usage') or {}
+                return {
+                    "message": message,
+                    "latency": entry.get('latency'),
+                    "completion_tokens": usage.get('completion_tokens', SCRIPTED_COMPLETION_TOKENS),
+                }
+        self.stats["scripted_turns"] += 1
+        return None
+
+
+class MockBackend:
+    def __init__(self, args):
+        self.args = args
+        self.cache = PrefixCache(CACHE_BLOCK_TOKENS * CHARS_PER_TOKEN)
+        self.sessions = OrderedDict()
+        self.totals = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "cache_control_requests": 0}
+        self.latency = LatencyModel(args.latency, args.seed)
+        self.latency_totals = {"injected_seconds": 0.0, "max_seconds": 0.0}
+        self.replay = ReplayLog(args.replay, parse_path_map(args.path_map)) if args.replay else None
+        self.record_totals = {"forwarded": 0, "errors": 0}
+        self._upstream: Optional[aiohttp.ClientSession] = None
+
+    def choose_reply(self, body: dict) -> dict:
+        """脚本化回复：前 turns-1 轮调用 list_workspace，之后调用 exit_loop"""
+        tools = {tool.get('function', {}).get('name') for tool in body.get('tools') or []}
+        assistant_turns = sum(1 for message in body.get('messages') or [] if message.get('role') == 'assistant')
+        if assistant_turns + 1 < self.args.turns and 'list_workspace' in tools:
+            name = 'list_workspace'
+        elif 'exit_loop' in tools:
+            name = 'exit_loop'
+        else:
+            return {"role": "assistant", "content": self.args.reply_text}
+        return {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {"name": name, "arguments": "{}"},
+            }],
+        }
+
+    def account(self, body: dict) -> dict:
+        text, marker_end = serialize_prompt(body)
+        prompt_tokens = max(1, len(text) // CHARS_PER_TOKEN)
+        if self.args.cache_mode == 'off':
+            cacheable = 0
+        elif self.args.cache_mode == 'explicit':
+            cacheable = marker_end
+        else:
+            cacheable = len(text)
+        cached_tokens = min(self.cache.lookup_and_store(text, cacheable) // CHARS_PER_TOKEN, prompt_tokens)
+
+        stats = self.sessions.setdefault(session_key(body.get('messages') or [])[:8], {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0})
+        for target in (stats, self.totals):
+            target["requests"] += 1
+            target["prompt_tokens"] += prompt_tokens
+            target["cached_tokens"] += cached_tokens
+        if marker_end:
+            self.totals["cache_control_requests"] += 1
+        return {"prompt_tokens": prompt_tokens, "cached_tokens": cached_tokens}
+
+    async def chat_completions(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        if self.args.record:
+            return await self.forward(request, body)
+        usage = self.account(body)
+        tools = {tool.get('function', {}).get('name') for tool in body.get('tools') or []}
+        recorded = self.replay.lookup(body, tools) if self.replay else None
+        if recorded:
+            message = recorded["message"]
+            completion_tokens = recorded["completion_tokens"]
+        else:
+            message = self.choose_reply(body)
+            completion_tokens = SCRIPTED_COMPLETION_TOKENS
+        delay = self.latency.sample(recorded["latency"] if recorded else None)
+        delay += completion_tokens * self.args.token_latency
+        if delay > 0:
+            self.latency_totals["injected_seconds"] += delay
+            self.latency_totals["max_seconds"] = max(self.latency_totals["max_seconds"], delay)
+            await asyncio.sleep(delay)
+        return web.json_response({
+            "id": f"chatcmpl-{uuid.uuid4().hex[:16]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get('model', 'mock'),
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if message.get("tool_calls") else "stop",
+            }],
+            "usage": {
+                "prompt_tokens": usage["prompt_tokens"],
+                "completion_tokens": completion_tokens,
+                "total_tokens": usage["prompt_tokens"] + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": usage["cached_tokens"]},
+            },
+        })
+
+    async def forward(self, request: web.Request, body: dict) -> web.Response:
+        """录制模式：转发给上游模型，原样返回，并追加一条录制记录"""
+        messages = body.get('messages') or []
+        upstream_body = dict(body, stream=False)
+        if self.args.upstream_model:
+            upstream_body['model'] = self.args.upstream_model
+        api_key = os.getenv(self.args.upstream_api_key_env)
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {
+            key: value for key, value in request.headers.items() if key.lower() == 'authorization'}
+        if self._upstream is None:
+            self._upstream = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=UPSTREAM_TIMEOUT))
+        start_time = time.monotonic()
+        try:
+            async with self._upstream.post(self.args.upstream.rstrip('/') + '/chat/completions',
+                                           json=upstream_body, headers=headers) as response:
+                status = response.status
+                text = await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.record_totals["errors"] += 1
+            return web.json_response({"error": {"message": f"上游请求失败: {type(e).__name__}: {e}"}}, status=502)
+        latency = time.monotonic() - start_time
+        self.record_totals["forwarded"] += 1
+        try:
+            payload = json.loads(text)
+        except ValueError:
+            payload = None
+        entry = {
+            "session": session_key(messages),
+            "turn": sum(1 for message in messages if message.get('role') == 'assistant'),
+            "latency": round(latency, 4),
+            "status": status,
+            "messages": len(messages),
+            "tools": sorted(tool.get('function', {}).get('name', '') for tool in body.get('tools') or []),
+            "response": payload if payload is not None else text,
+        }
+        with open(self.args.record, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        return web.Response(text=text, status=status, content_type='application/json')
+
+    async def close(self, app: web.Application):
+        if self._upstream is not None:
+            await self._upstream.close()
+
+    async def stats(self, request: web.Request) -> web.Response:
+        def with_rate(stats):
+            rate = stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0
+            return dict(stats, cache_hit_rate=round(rate, 4))
+        result = {
+            "cache_mode": self.args.cache_mode,
+            "total": with_rate(self.totals),
+            "latency": dict(self.latency_totals, spec=self.latency.spec, token_latency=self.args.token_latency),
+            "sessions": {key: with_rate(stats) for key, stats in self.sessions.items()},
+        }
+        if self.replay:
+            result["replay"] = self.replay.stats
+        if self.args.record:
+            result["record"] = dict(self.record_totals, file=self.args.record)
+        return web.json_response(result)
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok"})
+
+
+def create_app(args) -> web.Application:
+    backend = MockBackend(args)
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    for prefix in ('', '/v1'):
+        app.router.add_post(f'{prefix}/chat/completions', backend.chat_completions)
+    app.router.add_get('/stats', backend.stats)
+    app.router.add_get('/health', backend.health)
+    app.on_cleanup.append(backend.close)
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="OpenAI 兼容的模拟 LLM 后端（脚本化回复 + 前缀缓存模拟）")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18000)
+    parser.add_argument("--turns", type=int, default=1, help="每个会话的模型回复轮数（最后一轮调用 exit_loop）")
+    parser.add_argument("--cache_mode", type=str, default="auto", choices=["auto", "explicit", "off"],
+                        help="auto: 自动前缀缓存（OpenAI）；explicit: 只缓存到 cache_control 标记处（Anthropic）；off: 不缓存")
+    parser.add_argument("--latency", type=str, default="0",
+                        help="每次回复的延迟（秒）或分布：0.5、uniform:a,b、normal:均值,标准差、lognormal:中位数,sigma、replay[:系数]")
+    parser.add_argument("--token_latency", type=float, default=0.0, help="每个 completion token 额外的延迟（秒）")
+    parser.add_argument("--seed", type=int, default=None, help="延迟分布的随机种子")
+    parser.add_argument("--reply_text", type=str, default="OK", help="没有工具时的文本回复")
+    parser.add_argument("--replay", type=str, default=None, help="回放 --record 录制的 JSONL 文件")
+    parser.add_argument("--path_map", type=str, action="append", default=[],
+                        help="回放时替换回复中的路径：录制时的路径=回放时的路径（可重复）")
+    parser.add_argument("--record", type=str, default=None, help="录制模式：转发给 --upstream 并把回复追加到该 JSONL 文件")
+    parser.add_argument("--upstream", type=str, default=None, help="录制模式的上游 OpenAI 兼容地址（到 /v1 为止）")
+    parser.add_argument("--upstream_model", type=str, default=None, help="转发时替换请求中的模型名")
+    parser.add_argument("--upstream_api_key_env", type=str, default="UPSTREAM_API_KEY",
+                        help="上游密钥所在的环境变量，未设置时转发请求自带的 Authorization")
+    args = parser.parse_args()
+    if args.record and not args.upstream:
+        parser.error("--record 需要 --upstream")
+    if args.record and args.replay:
+        parser.error("--record 和 --replay 不能同时使用")
+    try:
+        LatencyModel(args.latency)
+        parse_path_map(args.path_map)
+    except ValueError as e:
+        parser.error(str(e))
+    mode = f"录制到 {args.record}（上游 {args.upstream}）" if args.record else (
+        f"回放 {args.replay}" if args.replay else f"脚本回复 turns={args.turns}")
+    print(f"[mock_llm] 监听 http://{args.host}:{args.port}/v1，{mode}，cache_mode={args.cache_mode}，latency={args.latency}")
+    web.run_app(create_app(args), host=args.host, port=args.port, print=None)
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+MCP 服务和 ADK api_server 的启动与守护
+
+替代 start_adk_server.sh + 固定 sleep 的启动方式：
+  - 以子进程启动 mcp_servers.py 和一个或多个 `adk api_server`
+  - 轮询 /python-interpreter/health、/file-operations/health 和 ADK 会话接口，全部就绪后立即开始工作
+  - 运行期间服务进程退出时自动重启并重新等待就绪
+  - `--` 之后的命令作为工作命令运行，结束后停止所有服务并返回其退出码
+
+用法：
+  # 启动服务，就绪后运行生成脚本，期间守护服务
+  python Generation/adk_launcher.py --model_name gpt_5 --root_path /work/workspace/gpt_5_Dev_inference \\
+      --ports 8010,8011 --python_port 9001 --file_port 8002 --system_port 8003 \\
+      -- bash Generation/experiment_dev.sh gpt_5 8010,8011
+
+  # 只等待已经在运行的服务就绪（例如 tmux 中手动启动的服务）
+  python Evaluation/adk_launcher.py --wait_only --ports 8010 --python_port 9001 --file_port 8002
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+# 按脚本所在目录（Evaluation / Generation）区分默认值：
+# (adk api_server 的工作目录, mcp_servers.py 所在目录, 用于就绪探测的 app 名, ADK_MODEL)
+SIDE_DEFAULTS = {
+    'Evaluation': ('Evaluation/adk_example', 'Evaluation/adk_example/code_eval_agent_workspace_dir',
+                   'code_eval_agent_workspace_dir', 'qwen3_coder_480b_a35b_local'),
+    'Generation': ('Generation/adk_example', 'Generation/adk_example/code_agent_local',
+                   'code_agent_local', None),
+}
+SIDE = os.path.basename(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE_TIMEOUT = 3
+PROBE_USER = 'adk_launcher'
+
+
+def probe(url):
+    """GET url，返回 2xx 即视为就绪"""
+    try:
+        with urllib.request.urlopen(url, timeout=PROBE_TIMEOUT) as response:
+            return 200 <= response.status < 300
+    except (urllib.error.URLError, OSError, ValueError):
+        return False
+
+
+class Service:
+    """
+    一个受守护的服务进程
+
+    Args:
+        name: 服务名（用于日志）
+        command: 启动命令（列表）
+        cwd: 工作目录
+        env: 环境变量
+        health_urls: 全部返回 2xx 才算就绪
+        log_path: stdout/stderr 输出文件
+    """
+
+    def __init__(self, name, command, cwd, env, health_urls, log_path):
+        self.name = name
+        self.command = command
+        self.cwd = cwd
+        self.env = env
+        self.health_urls = health_urls
+        self.log_path = log_path
+        self.process = None
+        self.restarts = 0
+
+    def start(self):
+        os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+        log_file = open(self.log_path, 'a', encoding='utf-8')
+        log_file.write(f"\n===== {time.strftime('%Y-%m-%d %H:%M:%S')} 启动: {' '.join(self.command)} =====\n")
+        log_file.flush()
+        # 独立进程组，停止时连同 adk 派生的子进程一起结束
+        self.process = subprocess.Popen(self.command, cwd=self.cwd, env=self.env, stdout=log_file,
+                                        stderr=subprocess.STDOUT, start_new_session=True)
+        log_file.close()
+        print(f"[launcher] 启动 {self.name}（pid {self.process.pid}，日志 {self.log_path}）")
+
+    def exited(self):
+        """进程已退出时返回退出码，否则返回 None"""
+        return self.process.poll() if self.process else None
+
+    def ready(self):
+        return all(probe(url) for url in self.health_urls)
+
+    def stop(self, timeout=10):
+        if not self.process or self.process.poll() is not None:
+            return
+        try:
+            os.killpg(self.process.pid, signal.SIGTERM)
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            os.killpg(self.process.pid, signal.SIGKILL)
+            self.process.wait()
+        except ProcessLookupError:
+            pass
+
+
+class Launcher:
+    """
+    启动并守护一组服务
+
+    Args:
+        services: Service 列表（按顺序启动，MCP 服务在前）
+        startup_timeout: 单个服务等待就绪的最长时间（秒）
+        poll_interval: 就绪探测和进程检查的间隔（秒）
+        max_restarts: 单个服务最多重启次数，超过后放弃并报错
+    """
+
+    def __init__(self, services, startup_timeout=300, poll_interval=0.5, max_restarts=5):
+        self.services = services
+        self.startup_timeout = startup_timeout
+        self.poll_interval = poll_interval
+        self.max_restarts = max_restarts
+
+    def restart(self, service, reason):
+        if service.restarts >= self.max_restarts:
+            raise RuntimeError(f"{service.name} 已重启 {service.restarts} 次仍然失败（{reason}），放弃")
+        service.restarts += 1
+        print(f"[launcher] {service.name} {reason}，第 {service.restarts} 次重启")
+        service.stop()
+        service.start()
+
+    def wait_ready(self, services):
+        """等待服务全部就绪；等待期间进程退出则重启"""
+        start_time = time.time()
+        pending = list(services)
+        deadlines = {service.name: start_time + self.startup_timeout for service in pending}
+        while pending:
+            for service in list(pending):
+                code = service.exited()
+                if code is not None:
+                    self.restart(service, f"启动过程中退出（退出码 {code}）")
+                    deadlines[service.name] = time.time() + self.startup_timeout
+                elif service.ready():
+                    print(f"[launcher] {service.name} 已就绪（{time.time() - start_time:.1f}s）")
+                    pending.remove(service)
+                elif time.time() > deadlines[service.name]:
+                    self.restart(service, f"{self.startup_timeout}s 内未就绪")
+                    deadlines[service.name] = time.time() + self.startup_timeout
+            if pending:
+                time.sleep(self.poll_interval)
+
+    def start_all(self):
+        for service in self.services:
+            if any(probe(url) for url in service.health_urls):
+                print(f"[launcher] 警告: {service.name} 的端口已有服务在响应，可能是上次运行残留的进程")
+            service.start()
+        self.wait_ready(self.services)
+
+    def supervise(self, work_process=None):
+        """
+        守护服务：进程退出时重启并等待就绪
+        有工作进程时在其结束后返回其退出码，否则一直运行到收到信号
+        """
+        while True:
+            if work_process is not None and work_process.poll() is not None:
+                return work_process.returncode
+            for service in self.services:
+                code = service.exited()
+                if code is not None:
+                    self.restart(service, f"运行中退出（退出码 {code}）")
+                    self.wait_ready([service])
+            time.sleep(self.poll_interval)
+
+    def stop_all(self):
+        # 逆序停止：先停 ADK 服务，再停 MCP 服务
+        for service in reversed(self.services):
+            service.stop()
+
+
+def build_services(args):
+    env = dict(os.environ)
+    env.update({
+        'PYTHON_INTERPRETER_PORT': str(args.python_port),
+        'FILE_OPERATIONS_PORT': str(args.file_port),
+        'SYSTEM_OPERATIONS_PORT': str(args.system_port),
+    })
+    if args.root_path:
+        env['CODE_AGENT_WORKSPACE_DIR'] = args.root_path
+    adk_model = args.adk_model or args.model_name
+    if adk_model:
+        env['ADK_MODEL'] = adk_model
+
+    log_dir = args.log_dir or os.path.join('logs', f"{SIDE.lower()}_{args.model_name or 'adk'}")
+    services = [Service(
+        name=f"MCP 服务（{args.python_port}/{args.file_port}）",
+        command=[sys.executable, 'mcp_servers.py'],
+        cwd=args.mcp_dir,
+        env=env,
+        health_urls=[f"http://localhost:{args.python_port}/python-interpreter/health",
+                     f"http://localhost:{args.file_port}/file-operations/health"],
+        log_path=os.path.join(log_dir, 'mcp_servers.log'),
+    )]
+    for port in args.ports:
+        services.append(Service(
+            name=f"ADK 服务（{port}）",
+            command=['adk', 'api_server', '--port', str(port)],
+            cwd=args.agent_root,
+            env=env,
+            health_urls=[f"http://localhost:{port}/apps/{args.app_name}/users/{PROBE_USER}/sessions"],
+            log_path=os.path.join(log_dir, f'adk_server_{port}.log'),
+        ))
+    return services
+
+
+def handle_signal(signum, frame):
+    # 转成 SystemExit，走 finally 中的清理逻辑
+    raise SystemExit(128 + signum)
+
+
+if __name__ == '__main__':
+    agent_root, mcp_dir, app_name, adk_model = SIDE_DEFAULTS.get(SIDE, SIDE_DEFAULTS['Evaluation'])
+    parser = argparse.ArgumentParser(description="启动并守护 MCP 服务和 ADK api_server，全部就绪后运行工作命令")
+    parser.add_argument("--model_name", type=str, default=None, help="Model name（用于日志目录，Generation 侧同时作为 ADK_MODEL）")
+    parser.add_argument("--adk_model", type=str, default=adk_model, help="ADK 服务使用的模型（ADK_MODEL），默认与 model_name 相同")
+    parser.add_argument("--root_path", type=str, default=None, help="工作目录（CODE_AGENT_WORKSPACE_DIR）")
+    parser.add_argument("--ports", type=str, required=True, help="ADK api_server 端口，多个用逗号分隔")
+    parser.add_argument("--python_port", type=int, default=9001, help="Python 解释器 MCP 服务端口")
+    parser.add_argument("--file_port", type=int, default=8002, help="文件操作 MCP 服务端口")
+    parser.add_argument("--system_port", type=int, default=8003, help="系统操作 MCP 服务端口")
+    parser.add_argument("--agent_root", type=str, default=agent_root, help="adk api_server 的工作目录")
+    parser.add_argument("--mcp_dir", type=str, default=mcp_dir, help="mcp_servers.py 所在目录")
+    parser.add_argument("--app_name", type=str, default=app_name, help="就绪探测使用的 ADK app 名")
+    parser.add_argument("--log_dir", type=str, default=None, help="服务日志目录，默认 logs/<side>_<model_name>")
+    parser.add_argument("--startup_timeout", type=int, default=300, help="单个服务等待就绪的最长时间（秒）")
+    parser.add_argument("--max_restarts", type=int, default=5, help="单个服务最多重启次数")
+    parser.add_argument("--wait_only", action="store_true", help="不启动服务，只等待已有服务就绪（超时返回1）")
+    parser.add_argument("command", nargs=argparse.REMAINDER, help="服务就绪后运行的工作命令（写在 -- 之后）")
+    args = parser.parse_args()
+    args.ports = [port.strip() for port in args.ports.split(',') if port.strip()]
+    if args.command and args.command[0] == '--':
+        args.command = args.command[1:]
+
+    services = build_services(args)
+
+    if args.wait_only:
+        deadline = time.time() + args.startup_timeout
+        pending = list(services)
+        while pending and time.time() < deadline:
+            pending = [service for service in pending if not service.ready()]
+            if pending:
+                time.sleep(0.5)
+        for service in pending:
+            print(f"[launcher] {service.name} {args.startup_timeout}s 内未就绪: {service.health_urls}")
+        sys.exit(1 if pending else 0)
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    launcher = Launcher(services, startup_timeout=args.startup_timeout, max_restarts=args.max_restarts)
+    exit_code = 0
+    work_process = None
+    try:
+        start_time = time.time()
+        launcher.start_all()
+        print(f"[launcher] 所有服务已就绪，用时 {time.time() - start_time:.1f}s")
+        if args.command:
+            print(f"[launcher] 运行: {' '.join(args.command)}")
+            work_process = subprocess.Popen(args.command)
+        exit_code = launcher.supervise(work_process)
+    except KeyboardInterrupt:
+        exit_code = 130
+    except SystemExit as e:
+        exit_code = e.code
+    except RuntimeError as e:
+        print(f"[launcher] {e}")
+        exit_code = 1
+    finally:
+        if work_process is not None and work_process.poll() is None:
+            work_process.terminate()
+            work_process.wait()
+        launcher.stop_all()
+        print("[launcher] 所有服务已停止")
+    sys.exit(exit_code)
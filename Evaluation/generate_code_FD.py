@@ -1,18 +1,19 @@
-import requests
 import json
 import os
 import shutil
 import argparse
 import time
+from adk_client import base_urls_from_ports, get_sync_client
 
 parser = argparse.ArgumentParser()
-parser.add_argument("--local_port", type=str, default="5678")
+parser.add_argument("--local_port", type=str, default="5678", help="ADK api_server 端口，多个用逗号分隔（组成服务池）")
 parser.add_argument("--model_name", type=str, default="claude_3_7_sonnet")
 parser.add_argument("--root_path", type=str, default='work/codex_dev_test')
 parser.add_argument("--round", type=int, default=1)
 parser.add_argument("--type", type=str, default="free")
 parser.add_argument("--source_dir", type=str, default="PRD_bench/")
 parser.add_argument("--i", type=int, default=1)
+parser.add_argument("--run_timeout", type=int, default=3600, help="单次/run请求的截止时间（秒）")
 args = parser.parse_args()
 
 code_path = args.root_path
@@ -20,81 +21,28 @@ source_dir = args.source_dir
 local_port = args.local_port
 model_name = args.model_name
 
+def get_adk_client():
+    return get_sync_client(base_urls_from_ports(local_port), "code_eval_agent", model_name,
+                           run_timeout=args.run_timeout)
+
 def construct_session(session_id):
-    session_query = {
-        "url": f"http://localhost:{local_port}/apps/code_eval_agent/users/{model_name}/sessions/s_{session_id}",
-        "method": "POST",
-        "headers": {
-            "Content-Type": "application/json"
-        }
-    }
-    delete_query = {
-        "url": f"http://localhost:{local_port}/apps/code_eval_agent/users/{model_name}/sessions/s_{session_id}",
-        "method": "DELETE",
-        "headers": {
-            "Content-Type": "application/json"
-        }
-    }
-    try:
-        delete_response = requests.delete(delete_query["url"], headers=delete_query["headers"])
-        print(f"删除会话响应状态码: {delete_response.status_code}")
-        response = requests.post(session_query["url"], headers=session_query["headers"])
-        print(f"创建会话响应状态码: {response.status_code}")
-        print(f"创建会话响应内容: {response.text}")
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"创建会话失败，状态码: {response.status_code}")
-            return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"网络请求错误: {e}")
-        return {"error": "network_error", "message": str(e)}
-    except json.JSONDecodeError as e:
-        print(f"JSON解析错误: {e}")
-        print(f"响应内容: {response.text}")
-        return {"error": "json_decode_error", "text": response.text}
+    # 先删除同名会话再创建
+    response = get_adk_client().create_session(f"s_{session_id}")
+    print(f"创建会话响应内容: {response}")
+    return response
 
 def make_query(prompt_data, session_id, max_retry=5):
-    query_query = {
-        "url": f"http://localhost:{local_port}/run",
-        "method": "POST",
-        "headers": {
-            "Content-Type": "application/json"
-        },
-        "data": {
-            "appName": f"code_eval_agent",
-            "userId": model_name,
-            "sessionId": f"s_{session_id}",
-            "newMessage": {
-                "role": "user",
-                "parts": [{
-                    "text": prompt_data
-                }]
-            }
-        }
-    }
     for attempt in range(max_retry):
-        try:
-            response = requests.post(query_query["url"], headers=query_query["headers"], json=query_query["data"])
-            print(f"查询响应状态码: {response.status_code}")
-            print(f"查询响应内容: {response.text}")
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"查询失败，状态码: {response.status_code}")
-                # 检查 token 上限相关错误并重试
-                if "token" in response.text or "limit" in response.text:
-                    print(f"检测到token相关错误，第{attempt+1}次重试")
-                    time.sleep(3)
-                    continue
-                return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"网络请求错误: {e}")
-            time.sleep(2)
-        except json.JSONDecodeError as e:
-            print(f"JSON解析错误: {e}")
-            print(f"响应内容: {str(response)}")
-            time.sleep(2)
+        response = get_adk_client().run(f"s_{session_id}", prompt_data)
+        print(f"查询响应内容: {response}")
+        # 检查 token 上限相关错误并重试（网络错误已在客户端内部重试过）
+        if isinstance(response, dict) and ("error" in response or "detail" in response):
+            text = json.dumps(response, ensure_ascii=False)
+            if "token" in text or "limit" in text:
+                print(f"检测到token相关错误，第{attempt+1}次重试")
+                time.sleep(3)
+                continue
+        return response
     return {"error": "max_retry_exceeded"}
 
 def check_report_format(report_file):
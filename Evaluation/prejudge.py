@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+确定性预评分执行器（pre-judge）
+
+在为某个 metric 打开 ADK 会话之前，先尝试在本地直接执行可以机械判定的测试项：
+  - unit_test：测试命令是 pytest，结果只取决于退出码和 pytest 汇总行
+  - file_comparison：单条测试命令、单个期望文件，只需做字节 / CSV / JSON 比对
+
+能够给出确定结论时直接写入 reports/<metric>.json（格式与 agent 写入的报告一致），
+否则返回 None，由 agent 继续评估。
+"""
+
+import csv
+import json
+import os
+import re
+import shlex
+import signal
+import subprocess
+import time
+
+DEFAULT_TIMEOUT = 300
+OUTPUT_TAIL_CHARS = 4000
+
+# 匹配 "pytest ..." / "python -m pytest ..." / "cd xxx && python -m pytest ..."
+PYTEST_COMMAND_RE = re.compile(r'(^|&&|;)\s*(python3?\s+-m\s+)?pytest(\s|$)')
+# pytest 最后一行汇总，例如 "===== 3 passed, 1 failed in 0.12s ====="
+PYTEST_SUMMARY_RE = re.compile(r'=+\s*([^=\n]*?)\s+in\s+[\d.]+s')
+# 收集阶段出错（退出码 2）：pytest 输出 "ERROR collecting <file>" 标题和 "Interrupted: N error(s) during collection"
+COLLECTION_ERROR_RE = re.compile(r'^_+ ERROR collecting .+ _+$|^!+ Interrupted: \d+ errors? during collection !+$', re.M)
+# 导入失败只认 pytest 自己输出的行：收集阶段的 "ImportError while importing test module" 和 traceback 中的 "E   ModuleNotFoundError"，
+# 不在整个输出里做子串匹配（测试的输出或断言信息里出现这些单词不算）
+IMPORT_ERROR_LINE_RE = re.compile(r'^(ImportError while importing test module|E\s+(ModuleNotFoundError|ImportError)\b)', re.M)
+# 只对这些文本类型做本地比对，其余交给 agent
+COMPARABLE_EXTENSIONS = ('.csv', '.txt', '.json')
+
+
+def build_exec_env():
+    """构造执行测试命令的环境变量（与 judge 工具保持一致，优先使用 CONDA_ENV_PATH）"""
+    env = os.environ.copy()
+    conda_env_path = env.get('CONDA_ENV_PATH', '').strip()
+    if conda_env_path:
+        env['PATH'] = f"{os.path.join(conda_env_path, 'bin')}:{env.get('PATH', '')}"
+        env['CONDA_PREFIX'] = conda_env_path
+        env.pop('PYTHONHOME', None)
+    return env
+
+
+def _run_command(command, cwd, stdin_path=None, timeout=DEFAULT_TIMEOUT):
+    """
+    在项目目录下执行一条测试命令，超时后杀掉整个进程组
+
+    Returns:
+        dict: command / return_code / output / timed_out / elapsed
+    """
+    start_time = time.time()
+    stdin_file = open(stdin_path, 'rb') if stdin_path else subprocess.DEVNULL
+    try:
+        proc = subprocess.Popen(
+            command,
+            shell=True,
+            cwd=cwd,
+            stdin=stdin_file,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            env=build_exec_env(),
+            start_new_session=True,
+        )
+        timed_out = False
+        try:
+            output, _ = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            timed_out = True
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            output, _ = proc.communicate()
+    finally:
+        if stdin_path:
+            stdin_file.close()
+
+    return {
+        'command': command,
+        'return_code': proc.returncode,
+        'output': output.decode('utf-8', errors='replace'),
+        'timed_out': timed_out,
+        'elapsed': round(time.time() - start_time, 3),
+    }
+
+
+def _output_tail(output):
+    if len(output) <= OUTPUT_TAIL_CHARS:
+        return output
+    return '...\n' + output[-OUTPUT_TAIL_CHARS:]
+
+
+def judge_pytest_run(run):
+    """
+    根据 pytest 的退出码和汇总行给出分数
+
+    Returns:
+        (score, reason)；无法确定时 score 为 None
+    """
+    if run['timed_out']:
+        return None, 'pytest timed out'
+
+    output = run['output']
+    summaries = PYTEST_SUMMARY_RE.findall(output)
+    summary = summaries[-1] if summaries else ''
+
+    if run['return_code'] == 0 and 'passed' in summary and 'failed' not in summary and 'error' not in summary:
+        return 2, f'All tests passed ({summary}).'
+    if run['return_code'] == 2 and COLLECTION_ERROR_RE.search(output):
+        return 0, f'pytest was interrupted by errors during collection ({summary or "no summary"}).'
+    if run['return_code'] in (1, 2) and IMPORT_ERROR_LINE_RE.search(output):
+        return 0, f'pytest reported module import errors ({summary or "no summary"}).'
+    if run['return_code'] == 1 and ('passed' in summary or 'failed' in summary):
+        return 1, f'pytest ran without import errors but some tests failed ({summary}).'
+    return None, f'undetermined pytest result (exit code {run["return_code"]}, summary: {summary or "none"})'
+
+
+def prejudge_unit_test(metric_data, project_dir, timeout=DEFAULT_TIMEOUT):
+    """对 pytest 类型的 unit_test 逐条执行测试命令，取所有 testcase 的最低分"""
+    testcases = metric_data.get('testcases') or []
+    if not testcases:
+        return None, None, []
+
+    runs = []
+    scores = []
+    reasons = []
+    for testcase in testcases:
+        command = (testcase.get('test_command') or '').strip()
+        if not command or testcase.get('test_input'):
+            return None, None, runs
+        if not PYTEST_COMMAND_RE.search(command):
+            return None, None, runs
+
+        run = _run_command(command, project_dir, timeout=timeout)
+        runs.append(run)
+        score, reason = judge_pytest_run(run)
+        if score is None:
+            return None, reason, runs
+        scores.append(score)
+        reasons.append(f'`{command}`: {reason}')
+
+    return min(scores), ' '.join(reasons), runs
+
+
+def _as_list(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return list(value)
+
+
+def _find_output_path(command, expected_file, input_files):
+    """
+    从测试命令中找出唯一一个与期望文件同扩展名、且不是输入/期望文件本身的路径参数
+    找不到或不唯一时返回 None
+    """
+    try:
+        tokens = shlex.split(command)
+    except ValueError:
+        return None
+
+    extension = os.path.splitext(expected_file)[1].lower()
+    excluded = {os.path.normpath(p) for p in input_files + [expected_file]}
+    candidates = []
+    skip_next = False
+    for token in tokens:
+        if skip_next:
+            skip_next = False
+            continue
+        if token == '<':
+            skip_next = True
+            continue
+        if '=' in token and token.startswith('--'):
+            token = token.split('=', 1)[1]
+        if os.path.splitext(token)[1].lower() != extension:
+            continue
+        if os.path.normpath(token) in excluded:
+            continue
+        candidates.append(token)
+
+    return candidates[0] if len(set(candidates)) == 1 else None
+
+
+def _normalize_csv(path):
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        return [[cell.strip() for cell in row] for row in csv.reader(f) if any(cell.strip() for cell in row)]
+
+
+def files_match(produced_path, expected_path):
+    """字节比对；对 CSV / JSON 额外做格式无关的比对"""
+    with open(produced_path, 'rb') as f1, open(expected_path, 'rb') as f2:
+        if f1.read() == f2.read():
+            return True
+
+    extension = os.path.splitext(expected_path)[1].lower()
+    try:
+        if extension == '.csv':
+            return _normalize_csv(produced_path) == _normalize_csv(expected_path)
+        if extension == '.json':
+            with open(produced_path, 'r', encoding='utf-8') as f1, open(expected_path, 'r', encoding='utf-8') as f2:
+                return json.load(f1) == json.load(f2)
+    except (UnicodeDecodeError, ValueError, csv.Error):
+        return False
+    return False
+
+
+def prejudge_file_comparison(metric_data, project_dir, timeout=DEFAULT_TIMEOUT):
+    """
+    对只需要字节 / CSV 比对的 file_comparison 执行测试命令并比对输出文件
+    只在完全一致（2分）或程序失败且没有产生输出（0分）时给出结论，其余交给 agent
+    """
+    testcases = metric_data.get('testcases') or []
+    expected_files = _as_list(metric_data.get('expected_output_files'))
+    input_files = _as_list(metric_data.get('input_files'))
+    if len(testcases) != 1 or len(expected_files) != 1:
+        return None, None, []
+
+    command = (testcases[0].get('test_command') or '').strip()
+    test_input = testcases[0].get('test_input')
+    expected_file = expected_files[0]
+    if not command or 'cd ' in command or any(ch in expected_file for ch in '*?['):
+        return None, None, []
+    if os.path.splitext(expected_file)[1].lower() not in COMPARABLE_EXTENSIONS:
+        return None, None, []
+
+    expected_path = os.path.join(project_dir, expected_file)
+    stdin_path = os.path.join(project_dir, test_input) if test_input else None
+    if not os.path.isfile(expected_path) or (stdin_path and not os.path.isfile(stdin_path)):
+        return None, None, []
+
+    output_file = _find_output_path(command, expected_file, input_files)
+    if not output_file:
+        return None, None, []
+    produced_path = os.path.join(project_dir, output_file)
+
+    # 记录执行前的状态，避免把上一次运行残留的文件当作本次输出
+    before = os.stat(produced_path) if os.path.exists(produced_path) else None
+    run = _run_command(command, project_dir, stdin_path=stdin_path, timeout=timeout)
+    if run['timed_out']:
+        return None, 'command timed out', [run]
+
+    after = os.stat(produced_path) if os.path.exists(produced_path) else None
+    produced = after is not None and (
+        before is None or (after.st_mtime_ns, after.st_size) != (before.st_mtime_ns, before.st_size)
+    )
+
+    if not produced:
+        if run['return_code'] != 0:
+            return 0, (f'`{command}` exited with code {run["return_code"]} '
+                       f'and did not produce {output_file}.'), [run]
+        return None, f'{output_file} was not produced', [run]
+
+    if files_match(produced_path, expected_path):
+        return 2, f'`{command}` produced {output_file}, which matches {expected_file}.', [run]
+    return None, f'{output_file} differs from {expected_file}', [run]
+
+
+def prejudge_metric(metric_data, project_dir, report_dir, timeout=DEFAULT_TIMEOUT):
+    """
+    尝试确定性地评估单个 metric
+
+    Args:
+        metric_data: detailed_test_plan.json 中的单个测试项（不会被修改）
+        project_dir: 项目目录（测试命令的工作目录）
+        report_dir: reports 目录
+        timeout: 每条测试命令的超时时间（秒）
+
+    Returns:
+        dict: 已写入的报告内容；无法确定时返回 None（交给 agent 评估）
+    """
+    metric_name = metric_data.get('metric', 'Unknown Metric')
+    metric_type = metric_data.get('type')
+
+    if metric_type == 'unit_test':
+        score, explanation, runs = prejudge_unit_test(metric_data, project_dir, timeout)
+    elif metric_type == 'file_comparison':
+        score, explanation, runs = prejudge_file_comparison(metric_data, project_dir, timeout)
+    else:
+        return None
+
+    if not runs:
+        return None
+
+    # 保存执行日志，便于排查
+    log_file = os.path.join(report_dir, f"{metric_name}.log")
+    try:
+        with open(log_file, 'w', encoding='utf-8') as f:
+            json.dump({
+                'judged_by': 'prejudge',
+                'score': score,
+                'explanation': explanation,
+                'runs': [dict(run, output=_output_tail(run['output'])) for run in runs],
+            }, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        print(f"Warning: Failed to save prejudge log for metric {metric_name}: {e}")
+
+    if score is None:
+        print(f"[prejudge] {metric_name}: {explanation}, falling back to agent")
+        return None
+
+    report = {
+        'metric': metric_name,
+        'description': metric_data.get('description', ''),
+        'score': score,
+        'explanation': f"[Deterministic pre-judge] {explanation}\n\nOutput:\n{_output_tail(runs[-1]['output'])}",
+        'judged_by': 'prejudge',
+    }
+    metric_report_file = os.path.join(report_dir, f"{metric_name}.json")
+    with open(metric_report_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[prejudge] {metric_name}: score {score}, report written to {metric_report_file}")
+    return report
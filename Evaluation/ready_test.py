@@ -1,23 +1,51 @@
-import requests
+import copy
+import hashlib
 import json
 import os
 import shutil
 import time
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from collections import deque
 import multiprocessing
+import threading
 # for each prompt, I should first create a session, then send the query
 import argparse
+from prejudge import prejudge_metric
+from adk_client import base_urls_from_ports, get_sync_client
+import tracing
 
 parser = argparse.ArgumentParser()
-parser.add_argument("--local_port", type=str, default="8010")
+parser.add_argument("--local_port", type=str, default="8010",
+                    help="ADK api_server 端口，多个用逗号分隔：新会话分配给在途请求最少的健康服务，服务失效时自动切换")
 parser.add_argument("--model_name", type=str, default="claude_3_7_sonnet")
 parser.add_argument("--root_path", type=str, default='workspace/gemini_test')
 parser.add_argument("--round", type=int, default=1)
 parser.add_argument("--retry_count", type=int, default=2)
 parser.add_argument("--max_workers", type=int, default=8, help="并行worker数量，建议4-8")
+parser.add_argument("--parallel_mode", type=str, default="repo", choices=["repo", "metric"],
+                    help="repo: 按项目并行（每个worker串行评估一个项目）；metric: 所有项目的metric进入全局队列，由worker共享")
+parser.add_argument("--max_metrics_per_project", type=int, default=1,
+                    help="metric模式下同一项目同时评估的metric数量上限")
+parser.add_argument("--isolate_projects", action="store_true",
+                    help="metric模式下同一项目的并发metric各自在独立的项目副本中执行（报告仍写回原项目的reports目录）")
+parser.add_argument("--run_timeout", type=int, default=3600, help="单次/run请求的截止时间（秒），超时视为network_error")
+parser.add_argument("--prejudge", action="store_true", help="在打开agent会话前，先本地确定性执行pytest类unit_test和可直接比对的file_comparison")
+parser.add_argument("--prejudge_timeout", type=int, default=300, help="预评分时每条测试命令的超时时间（秒）")
+parser.add_argument("--prompt_layout", type=str, default="legacy", choices=["cached", "legacy"],
+                    help="legacy: 原来的提示词（默认，与已发布的评测设置一致）；cached: 通用说明在前、metric 内容在后，便于命中后端提示词缓存。"
+                         "cached 会改变评分提示词，分数不能与 legacy 的结果直接比较")
+parser.add_argument("--project_context_chars", type=int, default=0,
+                    help="cached 布局下附带项目快照（src/ 目录树和 PRD.md 的前若干字符），值为 PRD.md 的最大字符数（如 12000）；默认 0 不附带")
+parser.add_argument("--batch_mode", type=str, default="none", choices=["none", "section", "type"],
+                    help="none: 每个metric一个会话；section: 同一项目中一级编号相同的metric（如 1.x）合并到一个会话；type: 同一类型的metric（如 unit_test）合并到一个会话。"
+                         "合并会话结束后缺失的报告回退到单metric会话补齐。合并会话使用 cached 布局的通用说明，需同时指定 --prompt_layout cached")
+parser.add_argument("--batch_size", type=int, default=8, help="合并会话中最多包含的metric数量")
 
 
 args = parser.parse_args()
+if args.batch_mode != 'none' and args.prompt_layout != 'cached':
+    # legacy 提示词只描述单个metric；合并会话必然改变评分提示词，必须显式选择 cached 布局
+    parser.error('--batch_mode 需要同时指定 --prompt_layout cached')
 code_path = args.root_path
 
 local_port = args.local_port
@@ -32,85 +60,23 @@ def move_to_backup(file_path, backup_dir):
         shutil.move(file_path, backup_file)
         print(f"Moved {file_path} to {backup_file}")
 
+APP_NAME = "code_eval_agent_workspace_dir"
+
+def get_adk_client(local_port, model_name, run_timeout=None):
+    """当前进程共用的 ADK 客户端（连接池 + 截止时间 + 重试；多个端口时为服务池）"""
+    return get_sync_client(base_urls_from_ports(local_port), APP_NAME, model_name,
+                           run_timeout=run_timeout or args.run_timeout)
+
 def construct_session(session_id):
-    session_query = {
-        "url": f"http://localhost:{local_port}/apps/code_eval_agent_workspace_dir/users/{model_name}/sessions/s_{session_id}",
-        "method": "POST",
-        "headers": {
-            "Content-Type": "application/json"
-        }
-    }
-    # delete session if it exists via curl -X DELETE
-    delete_query = {
-        "url": f"http://localhost:{local_port}/apps/code_eval_agent_workspace_dir/users/{model_name}/sessions/s_{session_id}",
-        "method": "DELETE",
-        "headers": {
-            "Content-Type": "application/json"
-        }
-    }
-    
-    try:
-        # Delete existing session
-        delete_response = requests.delete(delete_query["url"], headers=delete_query["headers"])
-        print(f"Delete session response status code: {delete_response.status_code}")
-        
-        # Create new session
-        response = requests.post(session_query["url"], headers=session_query["headers"])
-        print(f"Create session response status code: {response.status_code}")
-        print(f"Create session response content: {response.text}")
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Create session failed, status code: {response.status_code}")
-            return response.json()
-            
-    except requests.exceptions.RequestException as e:
-        print(f"Network request error: {e}")
-        return {"error": "network_error", "message": str(e)}
-    except json.JSONDecodeError as e:
-        print(f"JSON parsing error: {e}")
-        print(f"Response content: {response.text}")
-        return {"error": "json_decode_error", "text": response.text}
+    # 先删除同名会话再创建
+    response = get_adk_client(local_port, model_name).create_session(f"s_{session_id}")
+    print(f"Create session response content: {response}")
+    return response
 
 def make_query(prompt_data, session_id):
-    query_query = {
-        "url": f"http://localhost:{local_port}/run",
-        "method": "POST",
-        "headers": {
-            "Content-Type": "application/json"
-        },
-        "data": {
-            "appName": f"code_eval_agent_workspace_dir",
-            "userId": model_name,
-            "sessionId": f"s_{session_id}",
-            "newMessage": {
-                "role": "user",
-                "parts": [{
-                    "text": prompt_data
-                }]
-            }
-        }
-    }
-    
-    try:
-        response = requests.post(query_query["url"], headers=query_query["headers"], json=query_query["data"])
-        print(f"Query response status code: {response.status_code}")
-        print(f"Query response content: {response.text}")
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Query failed, status code: {response.status_code}")
-            return response.json()
-            
-    except requests.exceptions.RequestException as e:
-        print(f"Network request error: {e}")
-        return {"error": "network_error", "message": str(e)}
-    except json.JSONDecodeError as e:
-        print(f"JSON parsing error: {e}")
-        print(f"Response content: {str(response)}")
-        return {"error": "json_decode_error", "text": str(response)}
+    response = get_adk_client(local_port, model_name).run(f"s_{session_id}", prompt_data)
+    print(f"Query response content: {response}")
+    return response
     # todo if token limit occurs retry up to 5 times
 
 def check_report_format(report_file):
@@ -169,6 +135,8 @@ def check_report_format(report_file):
         return False
 
 def transfer_metric_abs_path(metric_data, project_dir):
+    """返回把测试输入、命令和输入文件转换为项目内绝对路径的副本（不修改 metric_data，同一metric可能被多次发送）"""
+    metric_data = copy.deepcopy(metric_data)
     testcases = metric_data.get('testcases', [])
     for testcase in testcases:
         print(testcase)
@@ -292,7 +260,158 @@ def get_completed_metrics(report_dir):
 
     return completed_metrics
 
-def evaluate_single_metric(metric_data, project_dir, session_id, retry_round, make_query, report_dir):
+# 缓存友好的提示词布局：所有 metric 共用的说明在最前，其次是同一项目共用的项目快照，metric 相关内容放在最后，
+# 这样同一项目的各个 metric 会话（以及不同项目之间）的请求共享尽可能长的相同前缀，可以命中后端的提示词缓存
+PROMPT_INSTRUCTIONS = """### Evaluation Instructions
+You are evaluating test metrics of a Python project. The metrics to evaluate, together with the report path of each metric, are given in the "Task" section at the end. If a "Project Context" section is present, it describes the project.
+The code should be completed strictly in accordance with the evaluation criteria to be considered qualified. If the code fails to run or adapt to the interface, please directly give the current test point a score of 0.
+
+### Evaluation Metric Fields
+- 'metric': the metric name
+- 'description'(Important): Arrange-Act-Assert description of the test metric
+- 'type': the type of the test metric, can be 'unit_test', 'shell_interaction' and 'file_comparison'
+- 'testcases': reference execution commands and input files
+- 'expected_output' / 'expected_output_files': expected output after executing the testcases
+- 'input_files': input files for the testcases
+
+### Path Instructions
+The project code is located in the src/ directory of the project directory. DO NOT MODIFY THE PROJECT CODE.
+DO NOT MODIFY THE EVALUATION CRITERIA. DO NOT MODIFY ANY FILES UNDER THE evaluation/ DIRECTORY OF THE PROJECT.
+If you encounter a "No such file or directory" error, please check whether you are in the correct problem path and whether the path has omitted the problem number.
+
+### Tips
+If the code is unable to run, please give the score of 0 and report it in the report.
+If the detailed_test_plan mentions that image analysis is required, use the "deal_graph" tool to analyze the images.
+Use the write_file tool to write the report content into a file, passing it to the content variable as a string type when writing.
+If the metric has more than one testcase, you should use "start_interative_shell" tool to start a new shell session for each testcase. And if you need to input content to the shell, use the "run_interactive_shell" tool.
+
+### *Important* File Output Requirement
+After completing the evaluation of a metric, you MUST write its evaluation result to the JSON report file given for that metric in the Task section.
+
+Each JSON file should contain the evaluation result of one metric in the following format:
+{"metric": "<the metric name>",
+"description": "<the metric description>",
+"score": <0-2>,
+"explanation": "Detailed explanation of the evaluation result"
+}
+
+The score should be 0, 1, or 2.
+0 means the test metric is completely not passed.
+1 means the test metric is partially passed. For shell_interaction and file_comparison types, this indicates that all steps except the final verification step are correct; for unit_test type, this means that pytest runs without any module import errors.
+2 means the test metric is completely passed.
+
+#### Detailed Example
+{
+"metric": "1.3 Menu Navigation - Export Results Submenu",
+"description": "1. **Arrange:** Read the main menu and understand the options. \\n2. **Act:** Start the program and select main menu '3' to enter the export results submenu.\\n3. **Assert:** Check whether the submenu displays 'Export Huffman codes to CSV', 'Export Huffman tree to JSON', and 'Return to main menu'.",
+"score": 0,
+"explanation": "When attempting to export results without having generated Huffman codes, the program does not enter the export submenu but instead prompts 'No available Huffman codes, please generate them first.' and returns to the main menu, which does not meet the expected behavior."
+}
+
+### Final Reminder
+The interface of the code must be completed strictly in accordance with the evaluation criteria to be considered qualified. 
+If the code fails to run or fails to adapt to the interface, please directly give the current test point a score of 0. There is no need to examine the code correctness, just use evaluation metric to give the score.
+DO NOT modify the project code. DO NOT MODIFY the evaluation criteria. 
+"""
+
+# 项目快照中跳过的目录和文件
+SNAPSHOT_IGNORE_DIRS = {'reports', '__pycache__', '.git', '.pytest_cache', '.metric_slots', 'venv', '.venv', 'node_modules'}
+SNAPSHOT_MAX_ENTRIES = 300
+_project_context_cache = {}
+_project_context_lock = threading.Lock()
+
+
+def build_project_context(project_dir, max_chars):
+    """
+    项目快照：src/ 目录树 + PRD.md（截断到 max_chars 个字符）
+    同一进程内每个项目只生成一次，保证该项目所有 metric 的提示词前缀完全相同（评测过程中产生的文件不会改变快照）
+    """
+    key = (os.path.abspath(project_dir), max_chars)
+    with _project_context_lock:
+        if key in _project_context_cache:
+            return _project_context_cache[key]
+
+    src_dir = os.path.join(project_dir, 'src')
+    tree = []
+    for dirpath, dirnames, filenames in os.walk(src_dir):
+        dirnames[:] = sorted(d for d in dirnames if d not in SNAPSHOT_IGNORE_DIRS and not d.endswith('.egg-info'))
+        rel_dir = os.path.relpath(dirpath, src_dir)
+        for name in sorted(filenames):
+            if name.endswith('.pyc'):
+                continue
+            rel_path = name if rel_dir == '.' else os.path.join(rel_dir, name)
+            try:
+                tree.append(f"src/{rel_path} ({os.path.getsize(os.path.join(dirpath, name))} bytes)")
+            except OSError:
+                continue
+    if len(tree) > SNAPSHOT_MAX_ENTRIES:
+        tree = tree[:SNAPSHOT_MAX_ENTRIES] + [f"... ({len(tree) - SNAPSHOT_MAX_ENTRIES} more files)"]
+
+    sections = [f"### Project Context\nProject directory: {project_dir}\n",
+                "Files under src/ (snapshot taken when the evaluation started):",
+                "\n".join(tree) if tree else "(src/ is empty or missing)"]
+    for prd_name in ('PRD.md', 'prd.md'):
+        prd_path = os.path.join(src_dir, prd_name)
+        if os.path.isfile(prd_path):
+            try:
+                with open(prd_path, 'r', encoding='utf-8', errors='replace') as f:
+                    prd = f.read(max_chars + 1)
+            except OSError:
+                break
+            if len(prd) > max_chars:
+                prd = prd[:max_chars] + f"\n... (truncated, read {prd_path} for the rest)"
+            sections.append(f"\nRequirements document ({prd_path}):\n{prd}")
+            break
+    context = "\n".join(sections)
+
+    with _project_context_lock:
+        _project_context_cache[key] = context
+    return context
+
+
+def build_metric_prompt(abs_metric_data, project_dir, metric_name, metric_report_file, retry_round, project_context_chars=0):
+    """缓存友好布局：通用说明 -> 项目快照（project_context_chars > 0 时）-> 当前 metric（轮次、metric 详情、报告路径）"""
+    parts = [PROMPT_INSTRUCTIONS]
+    if project_context_chars > 0:
+        parts.append(build_project_context(project_dir, project_context_chars))
+    parts.append(f"""### Task
+[Round {retry_round}] Please evaluate the implementation of {project_dir} based on the evaluation metric: {metric_name}. The project code is located in the {project_dir}/src/ directory and the evaluation auxiliary files are located in the {project_dir}/evaluation/ directory.
+
+### Evaluation Metric Details
+{json.dumps(abs_metric_data, ensure_ascii=False, indent=2)}
+
+The evaluation report must be saved to {metric_report_file} in JSON format.""")
+    return "\n\n".join(parts).strip()
+
+
+def build_batch_prompt(batch, project_dir, report_dir, retry_round, project_context_chars=0):
+    """
+    合并会话的提示词：前缀与单metric提示词相同（通用说明 + 项目快照），Task 中依次列出每个metric及其报告路径
+
+    Args:
+        batch: [(metric_name, abs_metric_data), ...]
+    """
+    parts = [PROMPT_INSTRUCTIONS]
+    if project_context_chars > 0:
+        parts.append(build_project_context(project_dir, project_context_chars))
+    metric_sections = []
+    for index, (metric_name, abs_metric_data) in enumerate(batch, 1):
+        metric_report_file = os.path.join(report_dir, f"{metric_name}.json")
+        metric_sections.append(f"""#### Metric {index}/{len(batch)}: {metric_name}
+{json.dumps(abs_metric_data, ensure_ascii=False, indent=2)}
+
+The evaluation report of this metric must be saved to {metric_report_file} in JSON format.""")
+    parts.append(f"""### Task
+[Round {retry_round}] Please evaluate the implementation of {project_dir} based on the {len(batch)} evaluation metrics below. The project code is located in the {project_dir}/src/ directory and the evaluation auxiliary files are located in the {project_dir}/evaluation/ directory.
+Evaluate the metrics one by one and independently: a failure in one metric must not affect the score of another. Write a separate JSON report for each metric as soon as it is evaluated, and call exit_loop only after all {len(batch)} reports are written.
+
+### Evaluation Metric Details
+""" + "\n\n".join(metric_sections))
+    return "\n\n".join(parts).strip()
+
+
+def evaluate_single_metric(metric_data, project_dir, session_id, retry_round, make_query, report_dir,
+                           prompt_layout='legacy', project_context_chars=0):
     """对单个测试项进行评分"""
     metric_name = metric_data.get('metric', 'Unknown Metric')
     description = metric_data.get('description', '')
@@ -301,7 +420,11 @@ def evaluate_single_metric(metric_data, project_dir, session_id, retry_round, ma
     
     abs_metric_data = transfer_metric_abs_path(metric_data, project_dir)
     
-    prompt_data = f"""[Round {retry_round}] ### Task
+    if prompt_layout == 'cached':
+        prompt_data = build_metric_prompt(abs_metric_data, project_dir, metric_name, metric_report_file, retry_round,
+                                          project_context_chars)
+    else:
+        prompt_data = f"""[Round {retry_round}] ### Task
 Please evaluate the implementation of {project_dir} based on the evaluation metric: {metric_name}. The project code is located in the src/ directory and the evaluation auxiliary files are located in the evaluation/ directory.
 The code should be completed strictly in accordance with the evaluation criteria to be considered qualified. If the code fails to run or adapt to the interface, please directly give the current test point a score of 0.
 
@@ -371,6 +494,156 @@ DO NOT modify the project code. DO NOT MODIFY the evaluation criteria.
     
     return query_response
 
+def check_metric_report(metric_report_file, metric_name):
+    """检查agent是否成功生成了JSON文件并验证内容"""
+    if not os.path.exists(metric_report_file):
+        print(f"Warning: Metric {metric_name} evaluation completed but no JSON file was generated")
+        return False
+
+    # 验证JSON文件内容
+    try:
+        with open(metric_report_file, 'r', encoding='utf-8') as f:
+            json_data = json.load(f)
+
+        # 检查是否包含必需的字段
+        required_fields = ['metric', 'description', 'score', 'explanation']
+        if all(field in json_data for field in required_fields):
+            # 检查score是否为有效数字
+            if isinstance(json_data['score'], (int, float)) and 0 <= json_data['score'] <= 2:
+                print(f"Successfully evaluated metric {metric_name} - valid JSON file generated")
+                return True
+            else:
+                print(f"Warning: Metric {metric_name} JSON file exists but score is invalid: {json_data.get('score')}")
+        else:
+            missing_fields = [field for field in required_fields if field not in json_data]
+            print(f"Warning: Metric {metric_name} JSON file exists but missing required fields: {missing_fields}")
+    except json.JSONDecodeError as e:
+        print(f"Warning: Metric {metric_name} JSON file exists but is not valid JSON: {e}")
+    except Exception as e:
+        print(f"Warning: Error reading metric {metric_name} JSON file: {e}")
+    return False
+
+def run_prejudge(test_dir, metric_data, project_dir, report_dir, args):
+    """本地预评分，返回是否已确定性判定并写入报告"""
+    with tracing.span("prejudge", "driver", project_id=test_dir, metric=metric_data.get('metric')) as prejudge_span:
+        judged = prejudge_metric(metric_data, project_dir, report_dir, timeout=args.prejudge_timeout)
+        prejudge_span.set(judged=judged)
+    return judged
+
+def process_metric(test_dir, metric_data, project_dir, report_dir, args, construct_session, make_query, retry_round=0,
+                   skip_prejudge=False):
+    """
+    评估单个metric：预评分 -> 创建会话 -> agent评分 -> 校验报告
+
+    Args:
+        test_dir: 项目目录名（用于构造session_id）
+        metric_data: 测试项
+        project_dir: agent执行测试的项目目录（metric并行模式下可能是项目副本）
+        report_dir: reports目录（始终是原项目的reports目录）
+        skip_prejudge: 调用方已经预评分过（合并会话），不再重复执行
+    """
+    metric_name = metric_data.get('metric', 'Unknown Metric')
+    # Add retry round to session_id to ensure uniqueness
+    if retry_round == 0:
+        session_id = f"{test_dir}_{metric_name}"
+    else:
+        session_id = f"{test_dir}_{metric_name}_{retry_round}"
+
+    # 能确定性判定的metric直接本地执行并写入报告，不再打开agent会话
+    if getattr(args, 'prejudge', False) and not skip_prejudge:
+        if run_prejudge(test_dir, metric_data, project_dir, report_dir, args):
+            return True
+
+    print(f"Start time: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())}")
+    print(f"Starting to create session, session_id: {session_id} ...")
+
+    # 服务端的会话ID带 s_ 前缀，span 用同一个ID与服务端的 llm / tool span 关联
+    with tracing.span("metric", "driver", session_id=f"s_{session_id}", project_id=test_dir, metric=metric_name,
+                      retry_round=retry_round or None) as metric_span:
+        session_response = construct_session(session_id)
+        # 调用evaluate_single_metric，agent会自己写入JSON文件
+        result = evaluate_single_metric(metric_data, project_dir, session_id, retry_round, make_query, report_dir,
+                                        getattr(args, 'prompt_layout', 'legacy'), getattr(args, 'project_context_chars', 0))
+
+        metric_report_file = os.path.join(report_dir, f"{metric_name}.json")
+        report_ok = check_metric_report(metric_report_file, metric_name)
+        metric_span.set(report_ok=report_ok)
+    return report_ok
+
+def metric_batch_key(metric_data, batch_mode):
+    """合并会话的分组键：section 按 metric 名的一级编号（"1.3 xxx" -> "1"），type 按测试类型"""
+    metric_name = metric_data.get('metric', 'Unknown Metric')
+    if batch_mode == 'section':
+        number = metric_name.split(maxsplit=1)[0] if metric_name.strip() else ''
+        return number.split('.', 1)[0] if number[:1].isdigit() else 'other'
+    return metric_data.get('type') or 'other'
+
+def group_metrics(metrics, batch_mode, batch_size):
+    """
+    按 batch_mode 把 metric 分组，每组最多 batch_size 个（保持 test plan 中的顺序）
+
+    Returns:
+        list: [(分组键, [metric_data, ...]), ...]；batch_mode 为 none 时每个 metric 单独一组
+    """
+    if batch_mode == 'none' or batch_size <= 1:
+        return [(None, [metric_data]) for metric_data in metrics]
+    groups = {}
+    for metric_data in metrics:
+        groups.setdefault(metric_batch_key(metric_data, batch_mode), []).append(metric_data)
+    batches = []
+    for key, group in groups.items():
+        for start in range(0, len(group), batch_size):
+            batches.append((key, group[start:start + batch_size]))
+    return batches
+
+def process_metric_batch(test_dir, batch_key, metrics, project_dir, report_dir, args, construct_session, make_query, retry_round=0):
+    """
+    在一个会话中评估同一项目的多个metric：预评分 -> 合并会话 -> 校验每个报告 -> 缺失的回退到单metric会话
+
+    Returns:
+        bool: 所有metric的报告是否都已有效生成
+    """
+    if getattr(args, 'prejudge', False):
+        metrics = [metric_data for metric_data in metrics
+                   if not run_prejudge(test_dir, metric_data, project_dir, report_dir, args)]
+    if len(metrics) <= 1:
+        return all([process_metric(test_dir, metric_data, project_dir, report_dir, args, construct_session, make_query, retry_round,
+                                   skip_prejudge=True)
+                    for metric_data in metrics])
+
+    metric_names = [metric_data.get('metric', 'Unknown Metric') for metric_data in metrics]
+    names_digest = hashlib.md5('\n'.join(metric_names).encode('utf-8')).hexdigest()[:8]
+    batch_tag = f"batch_{batch_key}_{names_digest}"
+    session_id = f"{test_dir}_{batch_tag}" if retry_round == 0 else f"{test_dir}_{batch_tag}_{retry_round}"
+
+    print(f"Start time: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())}")
+    print(f"Starting to create batch session, session_id: {session_id}, metrics: {metric_names}")
+    with tracing.span("metric_batch", "driver", session_id=f"s_{session_id}", project_id=test_dir, metric=batch_tag,
+                      metrics=len(metrics), retry_round=retry_round or None):
+        construct_session(session_id)
+        batch = [(metric_name, transfer_metric_abs_path(metric_data, project_dir))
+                 for metric_name, metric_data in zip(metric_names, metrics)]
+        prompt_data = build_batch_prompt(batch, project_dir, report_dir, retry_round, getattr(args, 'project_context_chars', 0))
+        query_response = make_query(prompt_data, session_id)
+
+    log_file = os.path.join(report_dir, f"{batch_tag}.log")
+    try:
+        with open(log_file, 'w', encoding='utf-8') as f:
+            json.dump({"metrics": metric_names, "response": query_response}, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        print(f"Warning: Failed to save log file for batch {batch_tag}: {e}")
+
+    # 合并会话没有写出（或写出无效）报告的metric，回退到单metric会话
+    missing = [metric_data for metric_name, metric_data in zip(metric_names, metrics)
+               if not check_metric_report(os.path.join(report_dir, f"{metric_name}.json"), metric_name)]
+    print(f"[{test_dir}] 合并会话 {batch_tag}: {len(metrics) - len(missing)}/{len(metrics)} 个报告有效"
+          f"{f'，{len(missing)} 个回退到单metric会话' if missing else ''}")
+    ok = True
+    for metric_data in missing:
+        ok = process_metric(test_dir, metric_data, project_dir, report_dir, args, construct_session, make_query, retry_round,
+                            skip_prejudge=True) and ok
+    return ok
+
 def run_evaluation(test_dir, args, code_path, construct_session, make_query, retry_round=0):
     print(f"\n=== Starting evaluation of project {test_dir} ===")
     dir_path = os.path.join(code_path, test_dir)
@@ -407,52 +680,22 @@ def run_evaluation(test_dir, args, code_path, construct_session, make_query, ret
     print(f"Already completed metrics: {len(completed_metrics)}")
    
     # Evaluate each metric
+    pending_metrics = []
     for metric_data in test_plan:
         metric_name = metric_data.get('metric', 'Unknown Metric')
-         # Add retry round to session_id to ensure uniqueness
-        if retry_round == 0:
-            session_id = f"{test_dir}_{metric_name}"
-        else:
-            session_id = f"{test_dir}_{metric_name}_{retry_round}"
 
-        print(f"Start time: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())}")
-        print(f"Starting to create session, session_id: {session_id} ...")
-        
-        
         # Skip if already completed
         if metric_name in completed_metrics:
             print(f"Skipping already completed metric: {metric_name}")
             continue
-        
-        session_response = construct_session(session_id)    
-        # 调用evaluate_single_metric，agent会自己写入JSON文件
-        result = evaluate_single_metric(metric_data, project_dir, session_id, retry_round, make_query, report_dir)
-        
-        # 检查agent是否成功生成了JSON文件并验证内容
-        metric_report_file = os.path.join(report_dir, f"{metric_name}.json")
-        if os.path.exists(metric_report_file):
-            # 验证JSON文件内容
-            try:
-                with open(metric_report_file, 'r', encoding='utf-8') as f:
-                    json_data = json.load(f)
-                
-                # 检查是否包含必需的字段
-                required_fields = ['metric', 'description', 'score', 'explanation']
-                if all(field in json_data for field in required_fields):
-                    # 检查score是否为有效数字
-                    if isinstance(json_data['score'], (int, float)) and 0 <= json_data['score'] <= 2:
-                        print(f"Successfully evaluated metric {metric_name} - valid JSON file generated")
-                    else:
-                        print(f"Warning: Metric {metric_name} JSON file exists but score is invalid: {json_data.get('score')}")
-                else:
-                    missing_fields = [field for field in required_fields if field not in json_data]
-                    print(f"Warning: Metric {metric_name} JSON file exists but missing required fields: {missing_fields}")
-            except json.JSONDecodeError as e:
-                print(f"Warning: Metric {metric_name} JSON file exists but is not valid JSON: {e}")
-            except Exception as e:
-                print(f"Warning: Error reading metric {metric_name} JSON file: {e}")
+        pending_metrics.append(metric_data)
+
+    batch_mode = getattr(args, 'batch_mode', 'none')
+    for batch_key, metrics in group_metrics(pending_metrics, batch_mode, getattr(args, 'batch_size', 1)):
+        if batch_key is None:
+            process_metric(test_dir, metrics[0], project_dir, report_dir, args, construct_session, make_query, retry_round)
         else:
-            print(f"Warning: Metric {metric_name} evaluation completed but no JSON file was generated")
+            process_metric_batch(test_dir, batch_key, metrics, project_dir, report_dir, args, construct_session, make_query, retry_round)
 
     print(f"dir_path: {dir_path}")
     print(f"=== Project {test_dir} evaluation completed ===\n")
@@ -467,7 +710,8 @@ def get_test_directories(root_path):
     
     for item in os.listdir(root_path):
         item_path = os.path.join(root_path, item)
-        if os.path.isdir(item_path):
+        # 跳过隐藏目录（例如metric并行模式的项目副本目录）
+        if os.path.isdir(item_path) and not item.startswith('.'):
             test_dirs.append(item)
     
     test_dirs.sort()  # 按名称排序，确保处理顺序一致
@@ -510,72 +754,20 @@ def evaluate_single_repo_wrapper(test_dir, args_dict, code_path):
     
     worker_name = multiprocessing.current_process().name
     
-    # 在子进程中重新定义 construct_session 函数
+    # 子进程中使用各自的连接池
+    adk_client = get_adk_client(local_port, model_name, args_dict.get('run_timeout'))
+
     def construct_session_local(session_id):
-        session_query = {
-            "url": f"http://localhost:{local_port}/apps/code_eval_agent_workspace_dir/users/{model_name}/sessions/s_{session_id}",
-            "method": "POST",
-            "headers": {"Content-Type": "application/json"}
-        }
-        delete_query = {
-            "url": f"http://localhost:{local_port}/apps/code_eval_agent_workspace_dir/users/{model_name}/sessions/s_{session_id}",
-            "method": "DELETE",
-            "headers": {"Content-Type": "application/json"}
-        }
-        
-        try:
-            delete_response = requests.delete(delete_query["url"], headers=delete_query["headers"])
-            print(f"[{worker_name}][{test_dir}] Delete session response status code: {delete_response.status_code}")
-            
-            response = requests.post(session_query["url"], headers=session_query["headers"])
-            print(f"[{worker_name}][{test_dir}] Create session response status code: {response.status_code}")
-            
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"[{worker_name}][{test_dir}] Create session failed, status code: {response.status_code}")
-                return response.json()
-                
-        except requests.exceptions.RequestException as e:
-            print(f"[{worker_name}][{test_dir}] Network request error: {e}")
-            return {"error": "network_error", "message": str(e)}
-        except json.JSONDecodeError as e:
-            print(f"[{worker_name}][{test_dir}] JSON parsing error: {e}")
-            return {"error": "json_decode_error", "text": response.text if 'response' in locals() else ""}
-    
-    # 在子进程中重新定义 make_query 函数
+        response = adk_client.create_session(f"s_{session_id}")
+        if isinstance(response, dict) and response.get("error"):
+            print(f"[{worker_name}][{test_dir}] Create session failed: {response}")
+        return response
+
     def make_query_local(prompt_data, session_id):
-        query_query = {
-            "url": f"http://localhost:{local_port}/run",
-            "method": "POST",
-            "headers": {"Content-Type": "application/json"},
-            "data": {
-                "appName": "code_eval_agent_workspace_dir",
-                "userId": model_name,
-                "sessionId": f"s_{session_id}",
-                "newMessage": {
-                    "role": "user",
-                    "parts": [{"text": prompt_data}]
-                }
-            }
-        }
-        
-        try:
-            response = requests.post(query_query["url"], headers=query_query["headers"], json=query_query["data"])
-            print(f"[{worker_name}][{test_dir}] Query response status code: {response.status_code}")
-            
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"[{worker_name}][{test_dir}] Query failed, status code: {response.status_code}")
-                return response.json()
-                
-        except requests.exceptions.RequestException as e:
-            print(f"[{worker_name}][{test_dir}] Network request error: {e}")
-            return {"error": "network_error", "message": str(e)}
-        except json.JSONDecodeError as e:
-            print(f"[{worker_name}][{test_dir}] JSON parsing error: {e}")
-            return {"error": "json_decode_error", "text": str(response) if 'response' in locals() else ""}
+        response = adk_client.run(f"s_{session_id}", prompt_data)
+        if isinstance(response, dict) and response.get("error"):
+            print(f"[{worker_name}][{test_dir}] Query failed: {response}")
+        return response
     
     # 重建 args 对象
     class Args:
@@ -583,6 +775,12 @@ def evaluate_single_repo_wrapper(test_dir, args_dict, code_path):
     args = Args()
     args.round = round_num
     args.retry_count = retry_count
+    args.prejudge = args_dict.get('prejudge', False)
+    args.prejudge_timeout = args_dict.get('prejudge_timeout', 300)
+    args.batch_mode = args_dict.get('batch_mode', 'none')
+    args.batch_size = args_dict.get('batch_size', 1)
+    args.prompt_layout = args_dict.get('prompt_layout', 'legacy')
+    args.project_context_chars = args_dict.get('project_context_chars', 0)
     
     print(f"\n[{worker_name}] === 开始评估项目 {test_dir} ===")
     start_time = time.time()
@@ -650,6 +848,181 @@ def evaluate_single_repo_wrapper(test_dir, args_dict, code_path):
             "elapsed_time": elapsed_time
         }
 
+SLOT_ROOT_NAME = ".metric_slots"
+
+class MetricWorkQueue:
+    """
+    全局 (project, metric) 工作队列
+
+    - 每个项目维护若干个并发槽位，一个槽位对应一个可供agent执行测试的项目目录，
+      同一项目最多同时评估 len(slots) 个metric
+    - 取任务时优先选择剩余metric最多、且有空闲槽位的项目，避免大项目成为长尾
+    """
+
+    def __init__(self, pending, slots):
+        """
+        Args:
+            pending: dict，{test_dir: [metric_data, ...]}
+            slots: dict，{test_dir: [project_dir, ...]}
+        """
+        self._pending = {test_dir: deque(metrics) for test_dir, metrics in pending.items() if metrics}
+        self._free_slots = {test_dir: list(slots[test_dir]) for test_dir in self._pending}
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """取出下一个可执行的 (test_dir, metric_data, project_dir)，全部完成时返回 None"""
+        with self._cond:
+            while True:
+                candidates = [test_dir for test_dir, metrics in self._pending.items()
+                              if metrics and self._free_slots[test_dir]]
+                if candidates:
+                    test_dir = max(candidates, key=lambda d: len(self._pending[d]))
+                    metric_data = self._pending[test_dir].popleft()
+                    project_dir = self._free_slots[test_dir].pop()
+                    return test_dir, metric_data, project_dir
+                if not any(self._pending.values()):
+                    return None
+                self._cond.wait()
+
+    def release(self, test_dir, project_dir):
+        """归还槽位"""
+        with self._cond:
+            self._free_slots[test_dir].append(project_dir)
+            self._cond.notify_all()
+
+    def remaining(self):
+        with self._cond:
+            return sum(len(metrics) for metrics in self._pending.values())
+
+def prepare_project_slots(code_path, test_dir, num_slots, isolate):
+    """
+    为项目准备并发槽位目录
+    槽位0始终是原项目目录；开启隔离时，其余槽位是不含reports的项目副本（每次运行重新复制）
+    """
+    project_dir = os.path.join(code_path, test_dir)
+    if not isolate:
+        return [project_dir] * num_slots
+
+    slots = [project_dir]
+    for slot_index in range(1, num_slots):
+        slot_dir = os.path.join(code_path, SLOT_ROOT_NAME, f"{test_dir}_{slot_index}")
+        if os.path.exists(slot_dir):
+            shutil.rmtree(slot_dir)
+        shutil.copytree(project_dir, slot_dir, symlinks=True, ignore=shutil.ignore_patterns('reports'))
+        slots.append(slot_dir)
+    return slots
+
+def collect_pending_metrics(code_path, test_dirs):
+    """收集所有项目中尚未完成的metric，返回 {test_dir: [metric_data, ...]}"""
+    pending = {}
+    for test_dir in test_dirs:
+        dir_path = os.path.join(code_path, test_dir)
+        report_dir = os.path.join(dir_path, "reports")
+        test_plan_path = os.path.join(dir_path, "evaluation", "detailed_test_plan.json")
+        if not os.path.exists(test_plan_path):
+            print(f"Warning: Test plan not found at {test_plan_path}, skipping...")
+            continue
+        test_plan = load_test_plan(test_plan_path)
+        if not test_plan:
+            print(f"Warning: Failed to load test plan from {test_plan_path}, skipping...")
+            continue
+        os.makedirs(report_dir, exist_ok=True)
+        completed_metrics = get_completed_metrics(report_dir)
+        pending[test_dir] = [metric_data for metric_data in test_plan
+                             if metric_data.get('metric', 'Unknown Metric') not in completed_metrics]
+    return pending
+
+def batch_pending_metrics(pending, batch_mode, batch_size):
+    """
+    合并会话模式下把每个项目的待评估metric分组，队列中的一个任务是一组metric：
+    单个metric的任务仍是 metric_data，合并的任务是 (分组键, [metric_data, ...])
+    """
+    batched = {}
+    for test_dir, metrics in pending.items():
+        batched[test_dir] = [group[0] if key is None else (key, group)
+                             for key, group in group_metrics(metrics, batch_mode, batch_size)]
+    return batched
+
+def run_metric_pass(args, code_path, pending, slots, retry_round=0):
+    """用全局工作队列跑完一轮所有待评估的metric"""
+    work_queue = MetricWorkQueue(pending, slots)
+    total = work_queue.remaining()
+    if total == 0:
+        return
+    counter = {'done': 0}
+    counter_lock = threading.Lock()
+
+    def worker():
+        while True:
+            unit = work_queue.acquire()
+            if unit is None:
+                return
+            test_dir, metric_data, project_dir = unit
+            report_dir = os.path.join(code_path, test_dir, "reports")
+            if isinstance(metric_data, tuple):
+                batch_key, metrics = metric_data
+                metric_name = f"合并会话 {batch_key}（{len(metrics)} 个metric）"
+            else:
+                metric_name = metric_data.get('metric', 'Unknown Metric')
+            try:
+                if isinstance(metric_data, tuple):
+                    process_metric_batch(test_dir, batch_key, metrics, project_dir, report_dir, args,
+                                         construct_session, make_query, retry_round)
+                else:
+                    process_metric(test_dir, metric_data, project_dir, report_dir, args,
+                                   construct_session, make_query, retry_round)
+            except Exception as e:
+                print(f"[{test_dir}] ✗ 评估metric {metric_name} 时发生异常: {e}")
+            finally:
+                work_queue.release(test_dir, project_dir)
+                with counter_lock:
+                    counter['done'] += 1
+                    print(f"[metric队列] [{counter['done']}/{total}] {test_dir} / {metric_name} 已处理")
+
+    max_workers = max(1, min(args.max_workers, total))
+    print(f"[metric队列] 第 {retry_round} 轮: {total} 个metric，{max_workers} 个worker")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(worker) for _ in range(max_workers)]
+        for future in as_completed(futures):
+            future.result()
+
+def main_metric_parallel(args, code_path):
+    """metric级并行版本：所有项目的 (project, metric) 进入同一个工作队列"""
+    test_dirs = get_test_directories(code_path)
+    if not test_dirs:
+        print("No test directories found, exiting...")
+        return
+
+    overall_start_time = time.time()
+    num_slots = max(1, args.max_metrics_per_project)
+    slots = {test_dir: prepare_project_slots(code_path, test_dir, num_slots, args.isolate_projects)
+             for test_dir in test_dirs}
+    print(f"使用 {args.max_workers} 个worker，每个项目最多 {num_slots} 个metric并发"
+          f"{'（独立项目副本）' if args.isolate_projects and num_slots > 1 else ''}")
+    print("=" * 80)
+
+    # 先做一轮初始评估，再最多补漏重试指定次数
+    for retry_round in range(0, args.retry_count + 1):
+        pending = collect_pending_metrics(code_path, test_dirs)
+        missing_count = sum(len(metrics) for metrics in pending.values())
+        if missing_count == 0:
+            print("✓ 所有metric打分结果已生成！")
+            break
+        if retry_round > 0:
+            print(f"补漏检查: 缺少{missing_count}个metrics，重试中...({retry_round}/{args.retry_count})")
+        if args.batch_mode != 'none':
+            pending = batch_pending_metrics(pending, args.batch_mode, args.batch_size)
+        run_metric_pass(args, code_path, pending, slots, retry_round)
+
+    if args.isolate_projects:
+        shutil.rmtree(os.path.join(code_path, SLOT_ROOT_NAME), ignore_errors=True)
+
+    overall_elapsed_time = time.time() - overall_start_time
+    print("=" * 80)
+    print("所有项目评测并补漏流程已完成！")
+    print(f"总耗时: {overall_elapsed_time:.2f}秒 ({overall_elapsed_time/60:.2f}分钟)")
+    print("=" * 80)
+
 def main(args, code_path, construct_session, make_query):
     """串行版本的main函数（保留用于兼容）"""
     # Get all test directories dynamically
@@ -718,7 +1091,14 @@ def main_parallel(args, code_path):
         'local_port': local_port,
         'model_name': model_name,
         'retry_count': args.retry_count,
-        'round': args.round
+        'round': args.round,
+        'prejudge': args.prejudge,
+        'prejudge_timeout': args.prejudge_timeout,
+        'run_timeout': args.run_timeout,
+        'batch_mode': args.batch_mode,
+        'batch_size': args.batch_size,
+        'prompt_layout': args.prompt_layout,
+        'project_context_chars': args.project_context_chars
     }
     
     # 记录开始时间
@@ -777,4 +1157,7 @@ def main_parallel(args, code_path):
 
 if __name__ == '__main__':
     # 使用并行版本
-    main_parallel(args, code_path)
+    if args.parallel_mode == "metric":
+        main_metric_parallel(args, code_path)
+    else:
+        main_parallel(args, code_path)
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+跨轮次 / 跨模型的评测结果仓库
+
+把各个评测目录（例如 /work/workspace/*_Dev_inference_eval）下的 reports/*.json
+连同 detailed_test_plan.json 中的 metric 元数据（类型、所属任务、章节）一起导入 SQLite，
+之后可以按 metric 类型 / 任务 / 模型 / 轮次 / 章节做分组统计，并对比任意两次运行。
+
+用法：
+  python Evaluation/results_warehouse.py ingest --base_path /work/workspace/xxx_Dev_inference_eval --round 1
+  python Evaluation/results_warehouse.py ingest --glob "/work/workspace/*_Dev_inference_eval" --round 1
+  python Evaluation/results_warehouse.py query --by model --by metric_type
+  python Evaluation/results_warehouse.py diff modelA@1 modelB@1 --by task
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+
+from score_cal import INDEX_FILENAME, ScoreIndex, parse_possible_json_string, scan_report_dir
+
+DEFAULT_DB = 'results_warehouse.sqlite'
+EVAL_DIR_SUFFIX = '_Dev_inference_eval'
+GROUP_COLUMNS = ('model', 'round', 'task', 'metric_type', 'section', 'metric')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    model TEXT,
+    round TEXT,
+    base_path TEXT,
+    ingested_at REAL
+);
+CREATE TABLE IF NOT EXISTS metric_results (
+    run_id TEXT,
+    model TEXT,
+    round TEXT,
+    task TEXT,
+    metric TEXT,
+    section TEXT,
+    metric_type TEXT,
+    status TEXT,
+    score REAL,
+    PRIMARY KEY (run_id, task, metric)
+);
+CREATE INDEX IF NOT EXISTS idx_metric_results_model_round ON metric_results (model, round);
+CREATE INDEX IF NOT EXISTS idx_metric_results_type ON metric_results (metric_type);
+CREATE INDEX IF NOT EXISTS idx_metric_results_task ON metric_results (task);
+"""
+
+
+def connect(db_path):
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def default_model_name(base_path):
+    """评测目录名去掉 _Dev_inference_eval 后缀即为模型名"""
+    name = os.path.basename(os.path.normpath(base_path))
+    return name[:-len(EVAL_DIR_SUFFIX)] if name.endswith(EVAL_DIR_SUFFIX) else name
+
+
+def metric_section(metric_name):
+    """metric 名称的章节号，例如 "2.1.3 Menu Navigation" -> "2" """
+    match = re.match(r'\s*(\d+)', metric_name)
+    return match.group(1) if match else ''
+
+
+def load_test_plan_metadata(test_plan_path):
+    """读取 detailed_test_plan.json，返回 {metric: type}；读取失败返回空 dict"""
+    try:
+        with open(test_plan_path, 'r', encoding='utf-8') as f:
+            data = json.loads(f.read().strip() or '[]')
+        if isinstance(data, str):
+            data = parse_possible_json_string(data)
+    except Exception:
+        return {}
+    if isinstance(data, dict):
+        data = [data]
+    metadata = {}
+    for item in data if isinstance(data, list) else []:
+        if isinstance(item, dict):
+            metric_name = item.get('metric') or item.get('metric_name') or item.get('name') or item.get('id')
+            if metric_name:
+                metadata[str(metric_name)] = item.get('type') or ''
+    return metadata
+
+
+def ingest(conn, base_path, model_name=None, round_id='', run_id=None):
+    """
+    导入一个评测目录；同一个 run_id 重复导入时整体替换
+    复用 score_cal 的分数索引，只重新解析有变化的报告文件：索引按 score_cal 默认的键（评测目录名）读写，
+    model_name（默认去掉 _Dev_inference_eval 后缀）只用于仓库中的 model 列
+
+    Returns:
+        (run_id, 导入的行数)
+    """
+    model_name = model_name or default_model_name(base_path)
+    # 与 score_cal.batch_calculate_and_average 未指定 model_name 时的索引键一致
+    index_key = os.path.basename(os.path.normpath(base_path))
+    round_id = str(round_id)
+    run_id = run_id or f"{model_name}@{round_id}"
+    index = ScoreIndex(os.path.join(base_path, INDEX_FILENAME))
+
+    rows = []
+    try:
+        with os.scandir(base_path) as entries:
+            tasks = sorted(entry.name for entry in entries if entry.is_dir() and not entry.name.startswith('.'))
+        for task in tasks:
+            task_dir = os.path.join(base_path, task)
+            metric_types = load_test_plan_metadata(os.path.join(task_dir, 'evaluation', 'detailed_test_plan.json'))
+            records = scan_report_dir(os.path.join(task_dir, 'reports'), index, index_key, round_id, task)
+
+            # 测试计划中的 metric 都要有一行，没有有效报告的记为 missing
+            for metric_name in sorted(set(metric_types) | set(records)):
+                record = records.get(metric_name)
+                if record is None:
+                    status, score = 'missing', None
+                else:
+                    status, score = record.status, record.score
+                rows.append((run_id, model_name, round_id, task, metric_name, metric_section(metric_name),
+                             metric_types.get(metric_name, ''), status, score))
+    finally:
+        index.close()
+
+    with conn:
+        conn.execute("DELETE FROM metric_results WHERE run_id = ?", (run_id,))
+        conn.executemany("INSERT INTO metric_results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.execute("INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?)",
+                     (run_id, model_name, round_id, os.path.abspath(base_path), time.time()))
+    return run_id, len(rows)
+
+
+def _filters(args):
+    clauses, params = [], []
+    for column in ('model', 'round', 'run_id', 'task', 'metric_type'):
+        values = getattr(args, column, None)
+        if values:
+            clauses.append(f"{column} IN ({', '.join('?' for _ in values)})")
+            params.extend(values)
+    return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+
+def query(conn, group_by, where='', params=()):
+    """
+    分组统计
+    avg_score 只在有效报告上求平均（0-2 分），normalized 与 score_cal 一致（avg_score / 2），
+    coverage 为有效报告数占测试计划 metric 数的比例
+    """
+    columns = ', '.join(group_by)
+    sql = f"""
+        SELECT {columns},
+               SUM(status = 'ok') AS scored,
+               COUNT(*) AS total,
+               AVG(CASE WHEN status = 'ok' THEN score END) AS avg_score
+        FROM metric_results{where}
+        GROUP BY {columns}
+        ORDER BY {columns}
+    """
+    results = []
+    for row in conn.execute(sql, list(params)):
+        keys = dict(zip(group_by, row[:len(group_by)]))
+        scored, total, avg_score = row[len(group_by):]
+        results.append(dict(keys, scored=scored, total=total,
+                            coverage=round(scored / total, 4) if total else 0,
+                            avg_score=round(avg_score, 4) if avg_score is not None else None,
+                            normalized=round(avg_score / 2, 4) if avg_score is not None else None))
+    return results
+
+
+def diff(conn, run_a, run_b, group_by=('metric_type',)):
+    """
+    对比两次运行
+    Returns:
+        (groups, changed)：groups 为分组后的平均分变化，changed 为分数有变化的 (task, metric) 列表
+    """
+    join = """
+        FROM metric_results a
+        JOIN metric_results b ON a.task = b.task AND a.metric = b.metric
+        WHERE a.run_id = ? AND b.run_id = ?
+    """
+    columns = ', '.join(f"a.{column}" for column in group_by)
+    groups = []
+    for row in conn.execute(f"""
+            SELECT {columns},
+                   COUNT(*),
+                   AVG(CASE WHEN a.status = 'ok' THEN a.score END),
+                   AVG(CASE WHEN b.status = 'ok' THEN b.score END)
+            {join}
+            GROUP BY {columns} ORDER BY {columns}""", (run_a, run_b)):
+        keys = dict(zip(group_by, row[:len(group_by)]))
+        count, avg_a, avg_b = row[len(group_by):]
+        delta = round(avg_b - avg_a, 4) if avg_a is not None and avg_b is not None else None
+        groups.append(dict(keys, count=count,
+                           avg_a=round(avg_a, 4) if avg_a is not None else None,
+                           avg_b=round(avg_b, 4) if avg_b is not None else None,
+                           delta=delta))
+
+    changed = [dict(zip(('task', 'metric', 'metric_type', 'score_a', 'score_b'), row))
+               for row in conn.execute(f"""
+                   SELECT a.task, a.metric, a.metric_type,
+                          CASE WHEN a.status = 'ok' THEN a.score END,
+                          CASE WHEN b.status = 'ok' THEN b.score END
+                   {join}
+                     AND (CASE WHEN a.status = 'ok' THEN a.score END) IS NOT
+                         (CASE WHEN b.status = 'ok' THEN b.score END)
+                   ORDER BY a.task, a.metric""", (run_a, run_b))]
+    return groups, changed
+
+
+def print_table(rows):
+    if not rows:
+        print("(无数据)")
+        return
+    headers = list(rows[0].keys())
+    cells = [[('' if row[h] is None else str(row[h])) for h in headers] for row in rows]
+    widths = [max(len(h), *(len(c[i]) for c in cells)) for i, h in enumerate(headers)]
+    print('  '.join(h.ljust(w) for h, w in zip(headers, widths)))
+    print('  '.join('-' * w for w in widths))
+    for row in cells:
+        print('  '.join(c.ljust(w) for c, w in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="评测结果仓库：导入、分组统计和对比")
+    parser.add_argument('--db', type=str, default=DEFAULT_DB, help='SQLite数据库路径')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ingest_parser = subparsers.add_parser('ingest', help='导入评测目录')
+    ingest_parser.add_argument('--base_path', type=str, action='append', default=[], help='评测目录（可重复）')
+    ingest_parser.add_argument('--glob', type=str, default=None, help='用通配符匹配多个评测目录')
+    ingest_parser.add_argument('--model_name', type=str, default=None, help='模型名称，默认由目录名推断（只导入单个目录时可用）')
+    ingest_parser.add_argument('--round', type=str, default='', help='评测轮次')
+    ingest_parser.add_argument('--run_id', type=str, default=None, help='运行ID，默认为 模型名@轮次')
+
+    query_parser = subparsers.add_parser('query', help='分组统计')
+    query_parser.add_argument('--by', type=str, action='append', choices=GROUP_COLUMNS,
+                              help='分组字段（可重复），默认按 model, round')
+    diff_parser = subparsers.add_parser('diff', help='对比两次运行')
+    diff_parser.add_argument('run_a', type=str, help='基准运行ID（模型名@轮次）')
+    diff_parser.add_argument('run_b', type=str, help='对比运行ID')
+    diff_parser.add_argument('--by', type=str, action='append', choices=GROUP_COLUMNS,
+                             help='分组字段（可重复），默认按 metric_type')
+    diff_parser.add_argument('--show_changed', action='store_true', help='列出分数有变化的metric')
+
+    for sub in (query_parser, diff_parser):
+        sub.add_argument('--json', action='store_true', help='以JSON格式输出')
+    for column in ('model', 'round', 'run_id', 'task', 'metric_type'):
+        query_parser.add_argument(f'--{column}', type=str, action='append', help=f'按{column}过滤（可重复）')
+    query_parser.add_argument('--runs', action='store_true', help='列出已导入的运行')
+
+    args = parser.parse_args()
+    conn = connect(args.db)
+
+    if args.command == 'ingest':
+        base_paths = list(args.base_path)
+        if args.glob:
+            base_paths.extend(sorted(p for p in glob.glob(args.glob) if os.path.isdir(p)))
+        if not base_paths:
+            parser.error('ingest 需要 --base_path 或 --glob')
+        if args.model_name and len(base_paths) > 1:
+            parser.error('--model_name 只能在导入单个目录时使用')
+        for base_path in base_paths:
+            start_time = time.time()
+            run_id, count = ingest(conn, base_path, args.model_name, args.round,
+                                   args.run_id if len(base_paths) == 1 else None)
+            print(f"导入 {base_path} -> {run_id}: {count} 个metric，耗时 {time.time() - start_time:.2f}秒")
+
+    elif args.command == 'query':
+        if args.runs:
+            rows = [dict(zip(('run_id', 'model', 'round', 'base_path', 'ingested_at'), row))
+                    for row in conn.execute("SELECT * FROM runs ORDER BY model, round")]
+            for row in rows:
+                row['ingested_at'] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(row['ingested_at']))
+        else:
+            where, params = _filters(args)
+            rows = query(conn, args.by or ['model', 'round'], where, params)
+        if args.json:
+            print(json.dumps(rows, ensure_ascii=False, indent=2))
+        else:
+            print_table(rows)
+
+    elif args.command == 'diff':
+        known = {row[0] for row in conn.execute("SELECT run_id FROM runs")}
+        for run in (args.run_a, args.run_b):
+            if run not in known:
+                print(f"运行 {run} 不存在，可用 query --runs 查看已导入的运行")
+                sys.exit(1)
+        groups, changed = diff(conn, args.run_a, args.run_b, args.by or ['metric_type'])
+        if args.json:
+            print(json.dumps({'groups': groups, 'changed': changed}, ensure_ascii=False, indent=2))
+        else:
+            print_table(groups)
+            print(f"\n分数有变化的metric: {len(changed)}")
+            if args.show_changed:
+                print_table(changed)
+
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,9 @@
 import os
 import json
+import time
+import sqlite3
 import argparse
+from collections import namedtuple
 
 def parse_possible_json_string(content):
     """
@@ -26,89 +29,198 @@ def parse_possible_json_string(content):
             return content
     return content
 
-def get_completed_metrics(report_dir):
+INDEX_FILENAME = '.score_index.sqlite'
+REASON_KEYS = ('file_empty', 'invalid_json', 'no_score_field', 'other_error')
+
+# 单个报告文件的解析结果；status 为 'ok' 或 REASON_KEYS 之一，detail 是异常原因的附加信息
+ReportRecord = namedtuple('ReportRecord', ['metric', 'mtime_ns', 'size', 'status', 'score', 'detail'])
+
+def parse_report_file(file_path, size=None):
     """
-    获取已经完成的评分项（检查reports目录下的非空且有效的JSON文件，且有score字段）。
-    返回：
-      - completed_metrics: set，已完成的评分项名
-      - reasons: dict，各类异常原因的详细列表（便于后续分析）
+    解析单个报告文件
+    返回 (status, score, detail)，status 为 'ok' 时 score 为分数，否则为 REASON_KEYS 中的异常原因
+    score 为数字字符串（如 "2"）时按数字处理；其他非数字的 score 记为 other_error，不计入已完成的评分项
+    （以前这类报告算作已完成，汇总分数时直接报错退出；ready_test 自己的完成判断不受影响，不会因此重新评估）
     """
-    completed_metrics = set()
-    reasons = {
-        'file_empty': [],
-        'invalid_json': [],
-        'no_score_field': [],
-        'other_error': []
-    }
+    if size is None:
+        size = os.path.getsize(file_path)
+    # 1. 判断文件是否为空
+    if size == 0:
+        return 'file_empty', None, {}
 
-    if os.path.exists(report_dir):
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read().strip()
+    except Exception as e:
+        return 'other_error', None, {'error': str(e)}
+    if not content:
+        return 'file_empty', None, {}
+
+    try:
+        data = json.loads(content)
+        if isinstance(data, str):
+            data = parse_possible_json_string(data)
+    except json.JSONDecodeError as e:
+        return 'invalid_json', None, {'error': str(e), 'content_preview': content[:200]}
+
+    if data == {} or data == []:
+        return 'file_empty', None, {}
+
+    if not isinstance(data, dict) or 'score' not in data:
+        return 'no_score_field', None, {
+            'data_type': type(data).__name__,
+            'keys': list(data.keys()) if isinstance(data, dict) else None
+        }
+
+    score = data['score']
+    if isinstance(score, str):
         try:
-            for filename in os.listdir(report_dir):
-                if not filename.endswith('.json'):
-                    continue
-                file_path = os.path.join(report_dir, filename)
-                metric_name = filename[:-5]
+            score = float(score.strip())
+        except ValueError:
+            pass
+    if isinstance(score, bool) or not isinstance(score, (int, float)):
+        return 'other_error', None, {'error': f"score is not a number: {score!r}"}
+    return 'ok', score, {}
 
-                # 1. 判断文件是否为空
-                if os.path.getsize(file_path) == 0:
-                    reasons['file_empty'].append({'metric': metric_name, 'file': file_path})
-                    continue
+class ScoreIndex:
+    """
+    报告文件的持久化索引（SQLite）
+    以 (model, round, project, metric) 为键记录报告文件的 mtime/size 和解析结果，
+    文件没有变化时直接复用索引中的结果，只重新解析有改动的报告
+    """
 
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read().strip()
-                    if not content:
-                        reasons['file_empty'].append({'metric': metric_name, 'file': file_path})
-                        continue
-                    try:
-                        data = json.loads(content)
-                        if isinstance(data, str):
-                            data = parse_possible_json_string(data)
-                    except json.JSONDecodeError as e:
-                        reasons['invalid_json'].append({
-                            'metric': metric_name,
-                            'file': file_path,
-                            'error': str(e),
-                            'content_preview': content[:200]
-                        })
-                        try:
-                            os.remove(file_path)
-                        except Exception as del_e:
-                            reasons['other_error'].append({
-                                'metric': metric_name,
-                                'file': file_path,
-                                'error': f"Failed to delete invalid JSON file: {del_e}"
-                            })
-                        continue
+    def __init__(self, index_path=':memory:'):
+        self.conn = sqlite3.connect(index_path, timeout=30)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS reports (
+                model TEXT, round TEXT, project TEXT, metric TEXT,
+                mtime_ns INTEGER, size INTEGER, status TEXT, score REAL, detail TEXT,
+                PRIMARY KEY (model, round, project, metric)
+            )""")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS test_plans (
+                path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, metrics TEXT
+            )""")
+        self.conn.commit()
 
-                    if data == {} or data == []:
-                        reasons['file_empty'].append({'metric': metric_name, 'file': file_path})
-                        continue
+    def load_reports(self, model, round_id, project):
+        rows = self.conn.execute(
+            "SELECT metric, mtime_ns, size, status, score, detail FROM reports "
+            "WHERE model = ? AND round = ? AND project = ?", (model, round_id, project))
+        return {row[0]: ReportRecord(row[0], row[1], row[2], row[3], row[4], json.loads(row[5]))
+                for row in rows}
+
+    def update_reports(self, model, round_id, project, changed, removed):
+        """写入有变化的记录，删除已经不存在的报告"""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO reports VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(model, round_id, project, r.metric, r.mtime_ns, r.size, r.status, r.score,
+                  json.dumps(r.detail, ensure_ascii=False)) for r in changed])
+            self.conn.executemany(
+                "DELETE FROM reports WHERE model = ? AND round = ? AND project = ? AND metric = ?",
+                [(model, round_id, project, metric) for metric in removed])
+
+    def expected_metrics(self, test_plan_path):
+        """带缓存的 load_expected_metrics，测试计划没有变化时不重新解析"""
+        try:
+            stat = os.stat(test_plan_path)
+        except OSError:
+            return None
+        row = self.conn.execute("SELECT mtime_ns, size, metrics FROM test_plans WHERE path = ?",
+                                (test_plan_path,)).fetchone()
+        if row and row[0] == stat.st_mtime_ns and row[1] == stat.st_size:
+            metrics = json.loads(row[2])
+            return set(metrics) if metrics is not None else None
+
+        metrics = load_expected_metrics(test_plan_path)
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO test_plans VALUES (?, ?, ?, ?)",
+                              (test_plan_path, stat.st_mtime_ns, stat.st_size,
+                               json.dumps(sorted(metrics) if metrics is not None else None, ensure_ascii=False)))
+        return metrics
 
-                    if not isinstance(data, dict) or 'score' not in data:
-                        reasons['no_score_field'].append({
-                            'metric': metric_name,
-                            'file': file_path,
-                            'data_type': type(data).__name__,
-                            'keys': list(data.keys()) if isinstance(data, dict) else None
-                        })
+    def close(self):
+        self.conn.close()
+
+def scan_report_dir(report_dir, index=None, model='', round_id='', project=None, delete_invalid=False):
+    """
+    单次遍历 reports 目录，返回 {metric: ReportRecord}
+    只重新解析 mtime/size 与索引不一致的文件；delete_invalid 为 True 时删除无法解析的 JSON 文件
+    """
+    if index is None:
+        index = ScoreIndex()
+    if project is None:
+        project = os.path.basename(os.path.dirname(os.path.abspath(report_dir)))
+    cached = index.load_reports(model, round_id, project)
+
+    records = {}
+    changed = []
+    if os.path.isdir(report_dir):
+        with os.scandir(report_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.json'):
+                    continue
+                metric_name = entry.name[:-5]
+                try:
+                    if not entry.is_file():
                         continue
+                    stat = entry.stat()
+                except OSError as e:
+                    records[metric_name] = ReportRecord(metric_name, 0, 0, 'other_error', None, {'error': str(e)})
+                    continue
 
-                    completed_metrics.add(metric_name)
+                record = cached.get(metric_name)
+                fresh = not (record and record.mtime_ns == stat.st_mtime_ns and record.size == stat.st_size)
+                if fresh:
+                    status, score, detail = parse_report_file(entry.path, stat.st_size)
+                    record = ReportRecord(metric_name, stat.st_mtime_ns, stat.st_size, status, score, detail)
+                records[metric_name] = record
+                # 索引中已记为 invalid_json 的文件没有变化时不会重新解析，同样要按 delete_invalid 删除
+                if record.status == 'invalid_json' and delete_invalid:
+                    try:
+                        os.remove(entry.path)
+                        # 文件已删除，不写入索引；已有的索引记录在下次扫描时随 removed 删除
+                        continue
+                    except Exception as del_e:
+                        record.detail['delete_error'] = f"Failed to delete invalid JSON file: {del_e}"
+                if fresh:
+                    changed.append(record)
 
-                except Exception as e:
-                    reasons['other_error'].append({
-                        'metric': metric_name,
-                        'file': file_path,
-                        'error': str(e)
-                    })
+    removed = [metric for metric in cached if metric not in records]
+    if changed or removed:
+        index.update_reports(model, round_id, project, changed, removed)
+    return records
 
-        except Exception as e:
-            reasons['other_error'].append({
-                'dir': report_dir,
-                'error': str(e)
-            })
+def summarize_records(records, report_dir):
+    """
+    汇总扫描结果
+    返回：
+      - completed_metrics: set，已完成的评分项名
+      - reasons: dict，各类异常原因的详细列表（便于后续分析）
+      - scores: list，已完成评分项的分数
+    """
+    completed_metrics = set()
+    reasons = {key: [] for key in REASON_KEYS}
+    scores = []
+    for metric_name, record in sorted(records.items()):
+        if record.status == 'ok':
+            completed_metrics.add(metric_name)
+            scores.append(record.score)
+        else:
+            file_path = os.path.join(report_dir, metric_name + '.json')
+            reasons[record.status].append(dict({'metric': metric_name, 'file': file_path}, **record.detail))
+    return completed_metrics, reasons, scores
 
+def get_completed_metrics(report_dir, delete_invalid=False):
+    """
+    获取已经完成的评分项（检查reports目录下的非空且有效的JSON文件，且有score字段）。
+    返回：
+      - completed_metrics: set，已完成的评分项名
+      - reasons: dict，各类异常原因的详细列表（便于后续分析）
+    """
+    records = scan_report_dir(report_dir, delete_invalid=delete_invalid)
+    completed_metrics, reasons, _ = summarize_records(records, report_dir)
     return completed_metrics, reasons
 
 def load_expected_metrics(test_plan_path):
@@ -149,95 +261,95 @@ def load_expected_metrics(test_plan_path):
     except Exception as e:
         return None
 
-def calculate_score_from_directory(reports_dir, test_plan_path=None):
+def calculate_score_from_directory(reports_dir, test_plan_path=None, index=None, model='', round_id='',
+                                   delete_invalid=False):
     """
-    使用 get_completed_metrics 统计有效评分项并计算平均分。
+    单次遍历 reports 目录统计有效评分项并计算平均分。
+    传入 index 时只重新解析有变化的报告文件。
     """
-    completed_metrics, reasons = get_completed_metrics(reports_dir)
-    total_score = 0
-    total_count = 0
+    if index is None:
+        index = ScoreIndex()
+    records = scan_report_dir(reports_dir, index, model, round_id, delete_invalid=delete_invalid)
+    completed_metrics, reasons, scores = summarize_records(records, reports_dir)
 
-    for metric_name in completed_metrics:
-        json_file = os.path.join(reports_dir, metric_name + '.json')
-        try:
-            with open(json_file, 'r', encoding='utf-8') as f:
-                content = f.read().strip()
-                try:
-                    item = json.loads(content)
-                    if isinstance(item, str):
-                        item = parse_possible_json_string(item)
-                except Exception:
-                    continue
-                if isinstance(item, dict) and 'score' in item:
-                    total_score += item['score']
-                    total_count += 1
-        except Exception:
-            continue
-
-    if total_count == 0:
+    if not scores:
         return None, None, reasons
 
-    final_score = total_score / total_count / 2
+    final_score = sum(scores) / len(scores) / 2
 
     missing_metrics = None
     if test_plan_path:
-        expected_metrics = load_expected_metrics(test_plan_path)
+        expected_metrics = index.expected_metrics(test_plan_path)
         if expected_metrics:
             missing_metrics = expected_metrics - completed_metrics
 
     return final_score, missing_metrics, reasons
 
-def batch_calculate_and_average(base_path):
+def batch_calculate_and_average(base_path, model_name=None, round_id='', index_path=None, delete_invalid=False):
     """
     批量计算所有项目的平均分
     从base_path下的各个子目录的reports文件夹读取json文件
     同时统计缺失的metric和异常原因
+
+    结果按 (model, round, project, metric, mtime) 记录在 base_path 下的 .score_index.sqlite 中，
+    重复调用时只重新解析有变化的报告文件
     """
+    if model_name is None:
+        model_name = os.path.basename(os.path.normpath(base_path))
+    index = ScoreIndex(index_path or os.path.join(base_path, INDEX_FILENAME))
+
     results = {}
     missing_metrics_info = {}
     reasons_info = {}
     total_sum = 0
     valid_count = 0
 
-    subdirs = [d for d in os.listdir(base_path)
-               if os.path.isdir(os.path.join(base_path, d)) and not d.startswith('.')]
+    with os.scandir(base_path) as entries:
+        subdirs = [entry.name for entry in entries if entry.is_dir() and not entry.name.startswith('.')]
 
-    for subdir in sorted(subdirs):
-        reports_dir = os.path.join(base_path, subdir, 'reports')
-        test_plan_path = os.path.join(base_path, subdir, 'evaluation', 'detailed_test_plan.json')
+    try:
+        for subdir in sorted(subdirs):
+            reports_dir = os.path.join(base_path, subdir, 'reports')
+            test_plan_path = os.path.join(base_path, subdir, 'evaluation', 'detailed_test_plan.json')
 
-        score, missing_metrics, reasons = calculate_score_from_directory(reports_dir, test_plan_path)
+            score, missing_metrics, reasons = calculate_score_from_directory(
+                reports_dir, test_plan_path, index, model_name, str(round_id), delete_invalid)
 
-        if score is not None:
-            results[subdir] = score
-            total_sum += score
-            valid_count += 1
+            if score is not None:
+                results[subdir] = score
+                total_sum += score
+                valid_count += 1
 
-            missing_metrics_info[subdir] = sorted(list(missing_metrics)) if missing_metrics else []
-            reasons_info[subdir] = reasons
-        else:
-            results[subdir] = "文件不存在或无有效数据"
-            missing_metrics_info[subdir] = "无法统计"
-            reasons_info[subdir] = reasons
+                missing_metrics_info[subdir] = sorted(list(missing_metrics)) if missing_metrics else []
+                reasons_info[subdir] = reasons
+            else:
+                results[subdir] = "文件不存在或无有效数据"
+                missing_metrics_info[subdir] = "无法统计"
+                reasons_info[subdir] = reasons
+    finally:
+        index.close()
 
     average_score = total_sum / valid_count if valid_count > 0 else 0
     return results, average_score, valid_count, missing_metrics_info, reasons_info
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description="批量计算平均分")
-    parser.add_argument('--base_path', type=str, required=True, help='基础路径，包含多个项目子目录')
-    args = parser.parse_args()
-
-    results, average_score, valid_count, missing_metrics_info, reasons_info = batch_calculate_and_average(args.base_path)
+def write_results(base_path, results, average_score, valid_count, model_name=None, round_id=''):
     output = {
         "scores": results,
         "valid_count": valid_count,
         "average_score": average_score
     }
-    output_path = os.path.join(args.base_path, 'results.json')
-    with open(output_path, 'w', encoding='utf-8') as f:
+    if model_name:
+        output["model"] = model_name
+    if round_id != '':
+        output["round"] = round_id
+    output_path = os.path.join(base_path, 'results.json')
+    # 先写临时文件再替换，watch 模式下读取方不会读到写了一半的文件
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
         json.dump(output, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, output_path)
 
+def print_missing_summary(missing_metrics_info, valid_count):
     # 打印缺失metric的统计信息
     total_missing = sum(len(v) for v in missing_metrics_info.values() if isinstance(v, list))
     projects_with_missing = sum(1 for v in missing_metrics_info.values() if isinstance(v, list) and len(v) > 0)
@@ -256,4 +368,45 @@ if __name__ == '__main__':
                 for metric in missing:
                     print(f"    - {metric}")
     else:
-        print(f"\n✓ 所有项目的metric都已完成！")
\ No newline at end of file
+        print(f"\n✓ 所有项目的metric都已完成！")
+
+def watch(args):
+    """持续增量计算分数并刷新 results.json，Ctrl+C 退出"""
+    previous = {}
+    try:
+        while True:
+            results, average_score, valid_count, missing_metrics_info, _ = batch_calculate_and_average(
+                args.base_path, args.model_name, args.round, args.index_path, args.delete_invalid)
+            write_results(args.base_path, results, average_score, valid_count, args.model_name, args.round)
+
+            changed = [subdir for subdir, score in results.items() if previous.get(subdir) != score]
+            total_missing = sum(len(v) for v in missing_metrics_info.values() if isinstance(v, list))
+            print(f"[{time.strftime('%H:%M:%S')}] 有效项目: {valid_count}/{len(results)}，"
+                  f"平均分: {average_score:.4f}，缺失metric: {total_missing}，分数变化的项目: {len(changed)}")
+            for subdir in changed:
+                if subdir in previous:
+                    print(f"    {subdir}: {previous[subdir]} -> {results[subdir]}")
+            previous = results
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print("\n已停止监控")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="批量计算平均分")
+    parser.add_argument('--base_path', type=str, required=True, help='基础路径，包含多个项目子目录')
+    parser.add_argument('--model_name', type=str, default=None, help='模型名称（索引键的一部分），默认取base_path的目录名')
+    parser.add_argument('--round', type=str, default='', help='评测轮次（索引键的一部分）')
+    parser.add_argument('--index_path', type=str, default=None,
+                        help=f'分数索引文件路径，默认为 base_path/{INDEX_FILENAME}；多个模型/轮次可共用同一个索引')
+    parser.add_argument('--delete_invalid', action='store_true', help='删除无法解析的报告JSON文件（默认只统计不删除）')
+    parser.add_argument('--watch', action='store_true', help='持续监控reports目录，增量刷新results.json')
+    parser.add_argument('--interval', type=float, default=30, help='watch模式下的刷新间隔（秒）')
+    args = parser.parse_args()
+
+    if args.watch:
+        watch(args)
+    else:
+        results, average_score, valid_count, missing_metrics_info, reasons_info = batch_calculate_and_average(
+            args.base_path, args.model_name, args.round, args.index_path, args.delete_invalid)
+        write_results(args.base_path, results, average_score, valid_count, args.model_name, args.round)
+        print_missing_summary(missing_metrics_info, valid_count)
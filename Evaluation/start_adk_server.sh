@@ -1,6 +1,7 @@
 # ==================== ADK服务器启动脚本 ====================
 # 功能：启动Claude 3.7 Sonnet ADK服务器，并运行代码生成脚本
 # 用法: ./start_adk_server.sh <test_type> <root_path> <port> <python_port> <file_port> <system_port>
+# port 可以是逗号分隔的多个端口（例如 8010,8011,8012），每个端口启动一个 api_server，驱动脚本按服务池使用
 
 # 请首先开启文件MCP服务（参考adk_example/readme.md）
 
@@ -22,6 +23,7 @@ echo "参数设置："
 echo "  test_type: $TEST_TYPE"
 echo "  root_path: $ROOT_PATH"
 echo "  port: $PORT"
+IFS=',' read -ra PORT_LIST <<< "$PORT"
 
 MODEL_NAME="qwen3_coder_480b_a35b_local"
 SESSION_NAME="adk_server_${MODEL_NAME}_2_$TEST_TYPE"
@@ -33,6 +35,9 @@ echo "SESSION NAME $SESSION_NAME"
 echo "FILE SERVER NAME $FILE_SERVER_NAME"
 echo "清理现有的ADK服务器tmux会话..."
 tmux kill-session -t $SESSION_NAME 2>/dev/null || true
+for P in "${PORT_LIST[@]}"; do
+    tmux kill-session -t ${SESSION_NAME}_${P} 2>/dev/null || true
+done
 echo "清理现有的文件服务tmux会话..."
 tmux kill-session -t $FILE_SERVER_NAME 2>/dev/null || true
 
@@ -45,39 +50,32 @@ echo "启动文件服务... $FILE_SERVER_NAME"
 tmux new-session -d -s $FILE_SERVER_NAME -n $FILE_SERVER_NAME
 tmux send-keys -t $FILE_SERVER_NAME "export PYTHON_INTERPRETER_PORT=${PYTHON_INTERPRETER_PORT} ; export FILE_OPERATIONS_PORT=${FILE_OPERATIONS_PORT} ; export SYSTEM_OPERATIONS_PORT=${SYSTEM_OPERATIONS_PORT} ; export CODE_AGENT_WORKSPACE_DIR=${ROOT_PATH} ; cd Evaluation/adk_example/code_eval_agent_workspace_dir ; ./start.sh" C-m
 
-# 等待文件服务启动
+# 等待文件服务就绪（轮询健康检查接口，而不是固定等待）
 echo "等待文件服务启动..."
-sleep 5
-
-# 启动一个共用的ADK服务器（只启动一次，工作目录设置为root_path）
-echo "启动共用的${MODEL_NAME} ADK服务器..."
-
-# 创建ADK服务器会话
-tmux new-session -d -s $SESSION_NAME -n $SESSION_NAME
-
-# 设置环境变量
-tmux send-keys -t $SESSION_NAME "export CONDA_ENV_PATH=${CONDA_ENV_PATH}" C-m
-tmux send-keys -t $SESSION_NAME "export ADK_MODEL=${MODEL_NAME}" C-m
-tmux send-keys -t $SESSION_NAME "export CODE_AGENT_WORKSPACE_DIR=${ROOT_PATH}" C-m
-tmux send-keys -t $SESSION_NAME "export PYTHON_INTERPRETER_PORT=${PYTHON_INTERPRETER_PORT}" C-m
-tmux send-keys -t $SESSION_NAME "export FILE_OPERATIONS_PORT=${FILE_OPERATIONS_PORT}" C-m
-tmux send-keys -t $SESSION_NAME "export SYSTEM_OPERATIONS_PORT=${SYSTEM_OPERATIONS_PORT}" C-m
-tmux send-keys -t $SESSION_NAME "cd Evaluation/adk_example" C-m
-
-# 等待环境设置完成
-sleep 2
-
-# 启动ADK服务器
-tmux send-keys -t $SESSION_NAME "adk api_server --port ${PORT}" C-m
-
-# 等待ADK服务器启动
+python Evaluation/adk_launcher.py --wait_only --ports "" --python_port ${PYTHON_INTERPRETER_PORT} --file_port ${FILE_OPERATIONS_PORT} || exit 1
+
+# 每个端口启动一个ADK服务器（工作目录都设置为root_path），tmux会话名带上端口避免互相覆盖
+for P in "${PORT_LIST[@]}"; do
+    SERVER_SESSION="${SESSION_NAME}_${P}"
+    echo "启动${MODEL_NAME} ADK服务器（端口 ${P}）... $SERVER_SESSION"
+
+    # 创建ADK服务器会话
+    tmux new-session -d -s $SERVER_SESSION -n $SERVER_SESSION
+
+    # 设置环境变量
+    tmux send-keys -t $SERVER_SESSION "export CONDA_ENV_PATH=${CONDA_ENV_PATH}" C-m
+    tmux send-keys -t $SERVER_SESSION "export ADK_MODEL=${MODEL_NAME}" C-m
+    tmux send-keys -t $SERVER_SESSION "export CODE_AGENT_WORKSPACE_DIR=${ROOT_PATH}" C-m
+    tmux send-keys -t $SERVER_SESSION "export PYTHON_INTERPRETER_PORT=${PYTHON_INTERPRETER_PORT}" C-m
+    tmux send-keys -t $SERVER_SESSION "export FILE_OPERATIONS_PORT=${FILE_OPERATIONS_PORT}" C-m
+    tmux send-keys -t $SERVER_SESSION "export SYSTEM_OPERATIONS_PORT=${SYSTEM_OPERATIONS_PORT}" C-m
+    tmux send-keys -t $SERVER_SESSION "cd Evaluation/adk_example" C-m
+
+    # 启动ADK服务器
+    tmux send-keys -t $SERVER_SESSION "adk api_server --port ${P}" C-m
+done
+
+# 等待ADK服务器就绪（轮询会话接口）
 echo "等待ADK服务器启动..."
-sleep 15
-
-# 检查服务器是否启动成功
-# echo "检查ADK服务器状态..."
-# if curl -s "http://localhost:${PORT}/health" > /dev/null 2>&1; then
-#     echo "ADK服务器启动成功！"
-# else
-#     echo "警告: ADK服务器可能未完全启动，继续执行..."
-# fi
+python Evaluation/adk_launcher.py --wait_only --ports ${PORT} --python_port ${PYTHON_INTERPRETER_PORT} --file_port ${FILE_OPERATIONS_PORT} || exit 1
+echo "ADK服务器启动成功！"
@@ -45,9 +45,9 @@ echo "启动文件服务... $FILE_SERVER_NAME"
 tmux new-session -d -s $FILE_SERVER_NAME -n $FILE_SERVER_NAME
 tmux send-keys -t $FILE_SERVER_NAME "export PYTHON_INTERPRETER_PORT=${PYTHON_INTERPRETER_PORT} ; export FILE_OPERATIONS_PORT=${FILE_OPERATIONS_PORT} ; export SYSTEM_OPERATIONS_PORT=${SYSTEM_OPERATIONS_PORT} ; export CODE_AGENT_WORKSPACE_DIR=${ROOT_PATH} ; cd Evaluation/adk_example/code_eval_agent_free ; ./start.sh" C-m
 
-# 等待文件服务启动
+# 等待文件服务就绪（轮询健康检查接口，而不是固定等待）
 echo "等待文件服务启动..."
-sleep 5
+python Evaluation/adk_launcher.py --wait_only --ports "" --python_port ${PYTHON_INTERPRETER_PORT} --file_port ${FILE_OPERATIONS_PORT} || exit 1
 
 # 启动一个共用的ADK服务器（只启动一次，工作目录设置为root_path）
 echo "启动共用的${MODEL_NAME} ADK服务器..."
@@ -63,20 +63,10 @@ tmux send-keys -t $SESSION_NAME "export FILE_OPERATIONS_PORT=${FILE_OPERATIONS_P
 tmux send-keys -t $SESSION_NAME "export SYSTEM_OPERATIONS_PORT=${SYSTEM_OPERATIONS_PORT}" C-m
 tmux send-keys -t $SESSION_NAME "cd Evaluation/adk_example" C-m
 
-# 等待环境设置完成
-sleep 2
-
 # 启动ADK服务器
 tmux send-keys -t $SESSION_NAME "adk api_server --port ${PORT}" C-m
 
-# 等待ADK服务器启动
+# 等待ADK服务器就绪（轮询会话接口）
 echo "等待ADK服务器启动..."
-sleep 15
-
-# 检查服务器是否启动成功
-# echo "检查ADK服务器状态..."
-# if curl -s "http://localhost:${PORT}/health" > /dev/null 2>&1; then
-#     echo "ADK服务器启动成功！"
-# else
-#     echo "警告: ADK服务器可能未完全启动，继续执行..."
-# fi
+python Evaluation/adk_launcher.py --wait_only --ports ${PORT} --python_port ${PYTHON_INTERPRETER_PORT} --file_port ${FILE_OPERATIONS_PORT} --app_name code_eval_agent || exit 1
+echo "ADK服务器启动成功！"
@@ -20,6 +20,5 @@ echo "[INFO] TEMPLATE_DIR=${TEMPLATE_DIR}"
 # 注意：不再在这里把 Dev_inference_eval 整体 cp 到 Debug_inference。
 # experiment_debug.sh 会在跑完后，针对 network_error 的 repo 做"清理 +（可选）从模板补全"。
 bash Generation/start_adk_server.sh "${MODEL_NAME}" "${ROOT_PATH}" "${PORT}" "${PYTHON_INTERPRETER_PORT}" "${FILE_OPERATIONS_PORT}" "${SYSTEM_OPERATIONS_PORT}"
-sleep 60
 bash Generation/experiment_debug.sh "${MODEL_NAME}" "${PORT}"
 sleep 2
@@ -4,8 +4,11 @@ ROOT_PATH=workspace/${MODEL_NAME}_Dev_free
 PYTHON_INTERPRETER_PORT=$3
 FILE_OPERATIONS_PORT=$4
 SYSTEM_OPERATIONS_PORT=$5
+# 可选：启动的ADK服务器数量，端口从 $port 开始连续分配（默认1个）
+NUM_SERVERS=${6:-1}
+PORTS=$(seq -s, ${port} $((port + NUM_SERVERS - 1)))
 python Generation/copy_free.py data/ ${ROOT_PATH}
-bash Generation/start_adk_server.sh ${MODEL_NAME} ${ROOT_PATH} ${port} ${PYTHON_INTERPRETER_PORT} ${FILE_OPERATIONS_PORT} ${SYSTEM_OPERATIONS_PORT}
-sleep 15
-bash Generation/experiment_free.sh $MODEL_NAME $port
-sleep 2
+# 启动并守护 MCP 服务和 ADK 服务，全部就绪后立即开始生成，结束后停止服务
+python Generation/adk_launcher.py --model_name ${MODEL_NAME} --root_path ${ROOT_PATH} --ports ${PORTS} \
+    --python_port ${PYTHON_INTERPRETER_PORT} --file_port ${FILE_OPERATIONS_PORT} --system_port ${SYSTEM_OPERATIONS_PORT} \
+    -- bash Generation/experiment_free.sh $MODEL_NAME $PORTS $((4 * NUM_SERVERS))
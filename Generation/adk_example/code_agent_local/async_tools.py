@@ -0,0 +1,120 @@
+"""
+工具的异步版本
+
+mcp_tools 中的 run_system_command / start_interative_shell / run_interactive_shell 是同步函数，
+在 ADK api_server 中执行时一次较慢的命令就会阻塞事件循环（或在线程池中排队），同一服务上的其他生成会话都要等待。
+这里提供同名、同签名的异步工具（config.ASYNC_TOOLS 开启时由 agent.py 注册）：
+  - run_system_command：asyncio 子进程，超时后结束整个进程组
+  - run_interactive_shell：pty 输出通过事件循环等待（interative_shell.step_async）
+  - start_interative_shell：会话启动后的 pty 输出同样通过事件循环等待
+"""
+
+import asyncio
+import os
+import signal
+import subprocess
+from typing import Any, Dict, Optional, Tuple
+
+from google.adk.tools import ToolContext
+
+from .interative_shell import step_async
+from .mcp_tools import (
+    OUTPUT_BUDGET, prepare_shell_input, prepare_shell_start,
+    prepare_system_command, shell_step_error, system_command_error, system_command_result
+)
+
+async def run_command_async(command: str, timeout: float, cwd: Optional[str] = None,
+                            env: Optional[Dict[str, str]] = None) -> Tuple[str, str, int]:
+    """
+    用 asyncio 子进程执行 shell 命令，返回 (stdout, stderr, 退出码)
+    超时后结束整个进程组并抛出 subprocess.TimeoutExpired（与 subprocess.run 一致）
+    """
+    process = await asyncio.create_subprocess_shell(
+        command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=cwd,
+        env=env,
+        start_new_session=True,
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        await process.wait()
+        raise subprocess.TimeoutExpired(command, timeout)
+    return (stdout.decode('utf-8', errors='replace'), stderr.decode('utf-8', errors='replace'),
+            process.returncode)
+
+
+@OUTPUT_BUDGET.limit("stdout", "stderr")
+async def run_system_command(tool_context: ToolContext, command: str, timeout: int = 15):
+    """
+    运行系统命令
+
+    Args:
+        tool_context: 工具上下文
+        command: 要执行的系统命令
+        timeout: 执行超时时间（秒），默认30秒
+
+    Returns:
+        dict: 包含执行结果的字典
+    """
+    error, workdir = prepare_system_command(command)
+    if error:
+        return error
+    try:
+        stdout, stderr, return_code = await run_command_async(command, timeout, cwd=workdir)
+        return system_command_result(stdout, stderr, return_code, workdir)
+    except Exception as e:
+        return system_command_error(e)
+
+
+async def run_interactive_shell(tool_context: ToolContext, session_id: Optional[str] = None, user_input: Optional[str] = None) -> Dict[str, Any]:
+    """
+    运行一个交互式shell会话。
+
+    第一次调用时需要提供cmd参数来启动新会话，后续调用需要提供session_id来继续之前的会话。
+    如果需要向shell输入内容，提供user_input参数。
+
+    参数:
+        session_id (str, optional): 会话ID，用于继续之前的会话
+        user_input (str, optional): 要发送到shell的输入内容
+
+    返回:
+        Dict[str, Any]: 包含以下字段的字典：
+            - session_id: str, 会话ID
+            - output: str, shell输出内容
+            - waiting: bool, 是否在等待输入
+            - finished: bool, 会话是否结束
+    """
+    error = prepare_shell_input(tool_context, session_id, user_input)
+    if error:
+        return error
+
+    try:
+        return await step_async(
+            session_id=session_id,
+            user_input=user_input
+        )
+    except Exception as e:
+        return shell_step_error(session_id, e)
+
+
+async def start_interative_shell(tool_context: ToolContext, cmd: str = "bash") -> Dict[str, Any]:
+    """
+    启动一个交互式shell会话。
+    
+    Args:
+        tool_context: 工具上下文
+        cmd: 要执行的shell命令
+    Returns:
+        dict: 包含执行结果的字典
+    """
+    try:
+        return await step_async(**prepare_shell_start(cmd))
+    except Exception as e:
+        return shell_step_error(None, e)
@@ -0,0 +1,125 @@
+"""
+conda 环境的一次性解析与缓存
+
+judge / start_interative_shell 原来每次调用都重新检测 conda 环境（CONDA_DEFAULT_ENV 时还要执行一次
+`conda info --envs`，约 1-2 秒），然后用 `source activate {env} && ...` 启动命令，每个测试用例都重新执行一遍
+conda 的激活脚本。这里在服务启动时解析一次：
+  - 环境路径：CONDA_ENV_PATH > CONDA_PREFIX > CONDA_DEFAULT_ENV（conda info --envs），与原来的检测顺序一致
+  - 环境变量：在子 shell 中真正执行一次 `source activate` 并导出激活后的完整环境（包含 activate.d 脚本设置的变量），
+    之后的命令直接以该环境启动，不再经过 shell 激活
+  - 激活失败时退回近似做法：PATH 前加 <env>/bin，设置 CONDA_PREFIX / CONDA_DEFAULT_ENV（与 prejudge 一致）
+"""
+
+import logging
+import os
+import shlex
+import subprocess
+import threading
+from typing import Dict, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# conda info / source activate 的超时（秒）
+CONDA_INFO_TIMEOUT = 5
+ACTIVATE_TIMEOUT = 30
+# bash 自身维护的变量，不从导出的环境中带出
+SHELL_VARIABLES = ('_', 'SHLVL', 'PWD', 'OLDPWD')
+
+
+class CondaEnv(NamedTuple):
+    """解析结果：env 为启动命令使用的完整环境（调用方不要修改），activated 表示是否来自真实的激活脚本"""
+    path: str
+    env: Dict[str, str]
+    activated: bool
+
+
+def resolve_conda_env_path(environ: Optional[Dict[str, str]] = None) -> Optional[str]:
+    """按 CONDA_ENV_PATH > CONDA_PREFIX > CONDA_DEFAULT_ENV 的顺序确定 conda 环境路径，检测不到时返回 None"""
+    environ = os.environ if environ is None else environ
+    # 方法1: 优先使用启动脚本设置的 CONDA_ENV_PATH 环境变量
+    if environ.get('CONDA_ENV_PATH', '').strip():
+        return environ['CONDA_ENV_PATH'].strip()
+    # 方法2: 检查 CONDA_PREFIX 环境变量（当前激活的 conda 环境）
+    if environ.get('CONDA_PREFIX', '').strip():
+        return environ['CONDA_PREFIX'].strip()
+    # 方法3: 检查 CONDA_DEFAULT_ENV 并尝试通过 conda info 获取完整路径
+    env_name = environ.get('CONDA_DEFAULT_ENV', '').strip()
+    if not env_name:
+        return None
+    try:
+        result = subprocess.run(['conda', 'info', '--envs'], capture_output=True, text=True,
+                                timeout=CONDA_INFO_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"获取 conda 环境信息时出错: {e}")
+        return None
+    if result.returncode != 0:
+        return None
+    for line in result.stdout.split('\n'):
+        if line.strip().startswith(env_name) or f'/{env_name}' in line:
+            # 提取路径（通常在环境名之后）
+            parts = line.split()
+            if len(parts) >= 2:
+                return parts[-1]
+    return None
+
+
+def capture_activated_env(conda_env_path: str, base_env: Dict[str, str]) -> Optional[Dict[str, str]]:
+    """在子 shell 中执行 source activate 并导出激活后的环境变量，失败时返回 None"""
+    command = f"source activate {shlex.quote(conda_env_path)} >/dev/null 2>&1 && env -0"
+    try:
+        result = subprocess.run(['/bin/bash', '-c', command], capture_output=True, env=base_env,
+                                timeout=ACTIVATE_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"执行 conda 激活脚本失败: {e}")
+        return None
+    if result.returncode != 0:
+        logger.warning(f"source activate {conda_env_path} 失败（退出码 {result.returncode}）")
+        return None
+    env = {}
+    for item in result.stdout.decode('utf-8', errors='surrogateescape').split('\0'):
+        name, sep, value = item.partition('=')
+        if sep and name:
+            env[name] = value
+    for name in SHELL_VARIABLES:
+        env.pop(name, None)
+    return env
+
+
+def approximate_env(conda_env_path: str, base_env: Dict[str, str]) -> Dict[str, str]:
+    """不执行激活脚本的近似环境：PATH 前加 <env>/bin，并设置 CONDA_PREFIX / CONDA_DEFAULT_ENV"""
+    env = dict(base_env)
+    env['PATH'] = f"{os.path.join(conda_env_path, 'bin')}:{env.get('PATH', '')}"
+    env['CONDA_PREFIX'] = conda_env_path
+    env['CONDA_DEFAULT_ENV'] = os.path.basename(conda_env_path.rstrip('/')) or conda_env_path
+    env.pop('PYTHONHOME', None)
+    return env
+
+
+_cached: Optional[CondaEnv] = None
+_resolved = False
+_lock = threading.Lock()
+
+
+def get_conda_env(refresh: bool = False) -> Optional[CondaEnv]:
+    """
+    返回缓存的 conda 环境（首次调用时解析，之后不再执行任何子进程），检测不到 conda 环境时返回 None
+
+    Args:
+        refresh: 重新解析（例如修改了 CONDA_ENV_PATH 之后）
+    """
+    global _cached, _resolved
+    with _lock:
+        if _resolved and not refresh:
+            return _cached
+        base_env = os.environ.copy()
+        conda_env_path = resolve_conda_env_path(base_env)
+        if conda_env_path:
+            env = capture_activated_env(conda_env_path, base_env)
+            _cached = CondaEnv(conda_env_path, env, True) if env else \
+                CondaEnv(conda_env_path, approximate_env(conda_env_path, base_env), False)
+            logger.info(f"conda 环境: {conda_env_path}（{'激活脚本导出' if _cached.activated else '近似环境'}）")
+        else:
+            _cached = None
+            logger.warning("未检测到 conda 环境（CONDA_ENV_PATH / CONDA_PREFIX / CONDA_DEFAULT_ENV）")
+        _resolved = True
+        return _cached
@@ -9,7 +9,18 @@ MAX_TOKENS = int(32768)
 MAX_SESSION_TIME = int(3600)
 # Firday的模型都是openai开头
 # api_key 不要外传
+# 每个模型可设置 rpm / tpm（每分钟请求数 / token 数）开启进程内共享限流，例如 rpm=60, tpm=2_000_000；
+# 未设置时不主动等待，只在收到 429 时按 Retry-After 暂停该模型的请求
 friday_model_dict = {
+    "mock_local": LiteLlmWithSleep(
+        # 本地模拟后端（Evaluation/adk_example/mock_llm_backend.py），用于测试 agent 流程和提示词缓存命中率
+        model="openai/mock",
+        api_base=os.getenv('MOCK_LLM_API_BASE', 'http://127.0.0.1:18000/v1'),
+        api_key='mock',
+        max_tokens_threshold=256_000-32000,
+        enable_compression=True,
+    ),
+
     "deepseek_v3": LiteLlmWithSleep(
             model="openai/deepseek-v3-friday",
             api_base='MASKED',
@@ -260,7 +271,37 @@ WORKSPACE_DIR = BASE_WORKSPACE_DIR
 
 # 安全配置
 ALLOWED_EXTENSIONS = ['.py', '.txt', '.md', '.json', '.yaml', '.yml', '.csv', '.sql']
-MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+
+# 工具输出预算：run_system_command / judge / read_file 单次返回给模型的输出字节数上限，<= 0 表示不限制
+# 超出时只保留首尾，完整输出写入溢出目录，agent 可用 read_file 的 offset / limit 分页查看
+TOOL_OUTPUT_MAX_BYTES = int(os.getenv('TOOL_OUTPUT_MAX_BYTES', '16384'))
+TOOL_OUTPUT_SPILL_DIR = os.getenv('TOOL_OUTPUT_SPILL_DIR', '/tmp/code_agent_tool_outputs')
+
+# list_workspace 默认跳过的文件 / 目录名（fnmatch 通配，逗号分隔）
+LIST_WORKSPACE_IGNORE = [pattern.strip() for pattern in os.getenv(
+    'LIST_WORKSPACE_IGNORE',
+    'venv,.venv,env,__pycache__,.git,.pytest_cache,.mypy_cache,node_modules,*.egg-info,*.pyc,.DS_Store'
+).split(',') if pattern.strip()]
+
+# 交互式 shell 会话池（start_interative_shell / run_interactive_shell）
+# 存活会话数上限（超出时关闭最久未使用的会话）、空闲回收时间（秒），<= 0 表示不回收
+SHELL_POOL_MAX_SESSIONS = int(os.getenv('SHELL_POOL_MAX_SESSIONS', '64'))
+SHELL_SESSION_IDLE_TTL = int(os.getenv('SHELL_SESSION_IDLE_TTL', '1800'))
+# 每个会话的 CPU 时间（秒）和单个进程的虚拟内存（MB）上限，<= 0 表示不限制
+SHELL_SESSION_CPU_SECONDS = int(os.getenv('SHELL_SESSION_CPU_SECONDS', '3600'))
+SHELL_SESSION_MEMORY_MB = int(os.getenv('SHELL_SESSION_MEMORY_MB', '16384'))
+# 预热的 bash 进程数，0 表示不预热
+SHELL_POOL_PREWARM = int(os.getenv('SHELL_POOL_PREWARM', '2'))
+# 会话池指标服务端口（GET /metrics），0 表示不启动
+SHELL_POOL_METRICS_PORT = int(os.getenv('SHELL_POOL_METRICS_PORT', '0'))
+
+# 使用异步版本的 run_system_command / start_interative_shell / run_interactive_shell：
+# 子进程和 pty 输出在事件循环上等待，一个 ADK 服务可以同时处理多个评测会话；设为 false 恢复同步工具
+ASYNC_TOOLS = os.getenv('ASYNC_TOOLS', 'true').lower() == 'true'
+
+# judge / start_interative_shell 启动命令时的 conda 激活方式：
+# cached: 服务启动时执行一次激活脚本并缓存导出的环境变量，之后直接以该环境启动命令；shell: 每次用 source activate 激活
+CONDA_ACTIVATION_MODE = os.getenv('CONDA_ACTIVATION_MODE', 'cached')
 SANDBOX_MODE = True
 
 print(f"🚀 当前执行ID: {CURRENT_EXECUTION_ID}")
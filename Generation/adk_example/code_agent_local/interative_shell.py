@@ -11,15 +11,20 @@ Author: ChatGPT (o3)
 """
 
 
+import asyncio
 import pexpect
 import shlex
-import uuid
 from typing import Dict, Optional, Any
 
+try:
+    from .shell_pool import ShellSessionPool, start_metrics_server
+except ImportError:
+    from shell_pool import ShellSessionPool, start_metrics_server
+
 # ---------------------------------------------------------------------------
-# Internal session registry  {session_id: pexpect.spawn}
+# Internal session pool (max live sessions, idle TTL, rlimits, pre-warmed bash)
 # ---------------------------------------------------------------------------
-_SESSIONS: Dict[str, pexpect.spawn] = {}
+_POOL = ShellSessionPool()
 
 
 # ---------------------------------------------------------------------------
@@ -31,6 +36,8 @@ def step(
     session_id: Optional[str] = None,
     user_input: Optional[str] = None,
     read_timeout: float = 0.3,
+    cwd: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None,
 ) -> Dict[str, Any]:
     """
     Execute *one* interaction step with a shell script running in a pseudo-TTY.
@@ -49,6 +56,10 @@ def step(
     read_timeout : float
         Seconds to wait for new output before deciding the process is idle /
         waiting for input.  Tweak per workload.
+    cwd : str | None
+        Working directory for the shell session. Only used when starting a new session.
+    env : Dict[str, str] | None
+        Environment variables for the shell session. Only used when starting a new session.
 
     Returns
     -------
@@ -72,21 +83,19 @@ def step(
         if not cmd:
             raise ValueError("`cmd` is required when starting a new session")
 
-        new_id = uuid.uuid4().hex
         # Spawn under /bin/bash -c "<cmd>" so users can give a full shell line
-        child = pexpect.spawn(
-            "/bin/bash",
-            ["-c", cmd],
-            encoding="utf-8",
-            echo=False,
-            timeout=read_timeout,
-        )
-        _SESSIONS[new_id] = child
-        session_id = new_id
+        session = _POOL.open(cmd, cwd=cwd, env=env, read_timeout=read_timeout)
+        session_id = session.session_id
     else:
-        child = _SESSIONS.get(session_id)
-        if child is None:
-            raise ValueError(f"Session {session_id!r} not found or already closed")
+        session = _POOL.get(session_id)
+
+    with session.lock:
+        return _interact(session, user_input, read_timeout)
+
+
+def _interact(session, user_input: Optional[str], read_timeout: float) -> Dict[str, Any]:
+    session_id = session.session_id
+    child = session.child
 
     # -----------------------------------------------------------------------
     # 2) Feed user input (if any)
@@ -118,9 +127,9 @@ def step(
     # -----------------------------------------------------------------------
     # 4) Clean up if the process is gone
     # -----------------------------------------------------------------------
+    session.touch()
     if finished:
-        child.close(force=True)
-        _SESSIONS.pop(session_id, None)
+        _POOL.close(session_id, "process exited")
 
     return {
         "session_id": session_id,
@@ -130,14 +139,107 @@ def step(
     }
 
 
+# ---------------------------------------------------------------------------
+# Async variant: wait for pty output on the event loop instead of blocking
+# ---------------------------------------------------------------------------
+async def step_async(
+    *,
+    cmd: Optional[str] = None,
+    session_id: Optional[str] = None,
+    user_input: Optional[str] = None,
+    read_timeout: float = 0.3,
+    cwd: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None,
+) -> Dict[str, Any]:
+    """
+    Same contract as `step()`, but the PTY is watched with `loop.add_reader`,
+    so a session waiting for output does not block the event loop (or a
+    worker thread) of the ADK server.
+    """
+    if session_id is None:
+        if not cmd:
+            raise ValueError("`cmd` is required when starting a new session")
+        session = _POOL.open(cmd, cwd=cwd, env=env, read_timeout=read_timeout)
+        session_id = session.session_id
+    else:
+        session = _POOL.get(session_id)
+
+    # session.lock is a thread lock shared with step(); never block the loop on it
+    while not session.lock.acquire(blocking=False):
+        await asyncio.sleep(0.01)
+    try:
+        child = session.child
+        if user_input is not None:
+            child.sendline(user_input)
+
+        output_chunks: list[str] = []
+        waiting = False
+        finished = False
+        while True:
+            if not await _wait_readable(child.child_fd, read_timeout):
+                # No more output within timeout: assume script is idle
+                waiting = child.isalive()
+                break
+            try:
+                output_chunks.append(child.read_nonblocking(size=1024, timeout=0))
+            except pexpect.TIMEOUT:
+                continue
+            except pexpect.EOF:
+                finished = True
+                break
+
+        session.touch()
+        if finished:
+            _POOL.close(session_id, "process exited")
+    finally:
+        session.lock.release()
+
+    return {
+        "session_id": session_id,
+        "output": "\n".join(output_chunks),
+        "waiting": waiting,
+        "finished": finished,
+    }
+
+
+async def _wait_readable(fd: int, timeout: float) -> bool:
+    """Wait until *fd* is readable (or hung up); False on timeout."""
+    loop = asyncio.get_running_loop()
+    ready = loop.create_future()
+    loop.add_reader(fd, lambda: ready.done() or ready.set_result(True))
+    try:
+        await asyncio.wait_for(ready, timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        loop.remove_reader(fd)
+
+
 # ---------------------------------------------------------------------------
 # Convenience: optional helper to kill a session early
 # ---------------------------------------------------------------------------
 def terminate(session_id: str) -> None:
-    """Force-kill a running session and remove it from the registry."""
-    child = _SESSIONS.pop(session_id, None)
-    if child and child.isalive():
-        child.terminate(force=True)
+    """Force-kill a running session and remove it from the pool."""
+    _POOL.close(session_id)
+
+
+# ---------------------------------------------------------------------------
+# Pool configuration and metrics
+# ---------------------------------------------------------------------------
+def configure_pool(**limits) -> None:
+    """Update pool limits: max_sessions, idle_ttl, cpu_seconds, memory_mb, prewarm."""
+    _POOL.configure(**limits)
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Live sessions and the CPU / memory usage of their process trees."""
+    return _POOL.stats()
+
+
+def serve_pool_metrics(port: int, host: str = "127.0.0.1"):
+    """Serve pool_stats() as JSON on http://<host>:<port>/metrics in a daemon thread."""
+    return start_metrics_server(_POOL, port, host)
 
 
 # ---------------------------------------------------------------------------
@@ -13,4 +13,12 @@ BASE_WORKSPACE_DIR = "/tmp/code_agent_workspace"
 
 # 支持环境变量覆盖工作目录，方便本地测试
 # 使用方法：export CODE_AGENT_WORKSPACE_DIR=/path/to/your/workspace
-WORKSPACE_DIR = os.getenv('CODE_AGENT_WORKSPACE_DIR', BASE_WORKSPACE_DIR)
\ No newline at end of file
+WORKSPACE_DIR = os.getenv('CODE_AGENT_WORKSPACE_DIR', BASE_WORKSPACE_DIR)
+
+# Python 解释器池：预热的 worker 数量（0 表示每次请求启动新的解释器）和 worker 启动时预加载的模块（逗号分隔，导入失败忽略）
+PYTHON_POOL_SIZE = int(os.getenv('PYTHON_POOL_SIZE', '4'))
+PYTHON_POOL_PRELOAD = [name.strip() for name in os.getenv('PYTHON_POOL_PRELOAD', 'numpy,pandas').split(',') if name.strip()]
+
+# 文件操作服务：read_file 单次返回的最大字节数（超出部分通过 next_offset 等翻页），list_files 默认每页条目数
+FILE_READ_MAX_BYTES = int(os.getenv('FILE_READ_MAX_BYTES', str(1024 * 1024)))
+LIST_FILES_PAGE_SIZE = int(os.getenv('LIST_FILES_PAGE_SIZE', '200'))
@@ -151,7 +151,7 @@ import subprocess
 import tempfile
 import shutil
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 from google.adk.tools import ToolContext
 from google.adk.tools.mcp_tool.mcp_toolset import MCPToolset
 from google.adk.tools.mcp_tool.mcp_session_manager import SseServerParams
@@ -161,7 +161,11 @@ import pexpect
 import asyncio
 from aiohttp import web
 from typing import Dict, Any, Optional
-from code_agent_local.interative_shell import step, terminate
+from code_agent_local.interative_shell import step, terminate, configure_pool, serve_pool_metrics
+from code_agent_local.conda_env import get_conda_env
+from code_agent_local.output_budget import OutputBudget, walk_workspace
+from code_agent_local.ranged_read import (DEFAULT_MAX_MATCHES, get_line_index, grep_file, read_byte_range,
+                                          read_line_range, tail_lines)
 
 logger = logging.getLogger(__name__)
 safe_commands = ['ls', 'pwd', 'echo', 'cat', 'head', 'tail', 'grep', 'find', 'python', 'python3', 'chmod', 'cd', 'lsof', 'mkdir']
@@ -173,11 +177,33 @@ from .config import (
     MCP_SSE_TIMEOUT,
     WORKSPACE_DIR,
     ALLOWED_EXTENSIONS,
-    MAX_FILE_SIZE,
     SANDBOX_MODE,
-    CURRENT_EXECUTION_ID
+    CURRENT_EXECUTION_ID,
+    TOOL_OUTPUT_MAX_BYTES,
+    TOOL_OUTPUT_SPILL_DIR,
+    LIST_WORKSPACE_IGNORE,
+    SHELL_POOL_MAX_SESSIONS,
+    SHELL_SESSION_IDLE_TTL,
+    SHELL_SESSION_CPU_SECONDS,
+    SHELL_SESSION_MEMORY_MB,
+    SHELL_POOL_PREWARM,
+    SHELL_POOL_METRICS_PORT,
+    CONDA_ACTIVATION_MODE
 )
 
+# 工具输出预算：超过 TOOL_OUTPUT_MAX_BYTES 的输出只保留首尾，完整内容写入 TOOL_OUTPUT_SPILL_DIR
+OUTPUT_BUDGET = OutputBudget(TOOL_OUTPUT_MAX_BYTES, TOOL_OUTPUT_SPILL_DIR)
+
+# 交互式 shell 会话池：限制存活会话数、回收空闲会话、限制每个会话的 CPU / 内存，并预热 bash 进程
+configure_pool(max_sessions=SHELL_POOL_MAX_SESSIONS, idle_ttl=SHELL_SESSION_IDLE_TTL,
+               cpu_seconds=SHELL_SESSION_CPU_SECONDS, memory_mb=SHELL_SESSION_MEMORY_MB, prewarm=SHELL_POOL_PREWARM)
+if SHELL_POOL_METRICS_PORT:
+    serve_pool_metrics(SHELL_POOL_METRICS_PORT)
+
+# conda 环境在服务启动时解析一次并缓存，judge / start_interative_shell 不再每次检测和激活
+if CONDA_ACTIVATION_MODE == 'cached':
+    get_conda_env()
+
 # 数据模型定义
 class PythonCode(BaseModel):
     """Python代码执行请求"""
@@ -343,16 +369,24 @@ data/*.json
     
     return result
 
-def list_workspace(tool_context: ToolContext, workspace_name: Optional[str] = None):
+def list_workspace(tool_context: ToolContext, workspace_name: Optional[str] = None, max_depth: int = 4,
+                   ignore: Optional[str] = None, max_entries: int = 500):
     """
     列出工作空间内容
+    名称匹配忽略规则（默认 venv、__pycache__、.git 等）的目录直接跳过，不会遍历其中的文件
     
     Args:
         tool_context: 工具上下文
         workspace_name: 工作空间名称，如果为None则使用当前执行ID
+        max_depth: 最大列出深度（1 表示只列出直接子项），默认 4
+        ignore: 额外的忽略规则，逗号分隔的名称通配（如 "*.log,data"）
+        max_entries: 最多返回的条目数，默认 500
     
     Returns:
         dict: 包含工作空间文件列表的字典
+            - files: 条目列表（path、type、size）
+            - skipped: 被忽略规则跳过的目录
+            - truncated: 是否因 max_entries 截断；可以缩小 workspace_name 或增加 ignore 后重新列出
     """
     if workspace_name is None:
         workspace_name = CURRENT_EXECUTION_ID
@@ -362,29 +396,17 @@ def list_workspace(tool_context: ToolContext, workspace_name: Optional[str] = No
     if not workspace_path.exists():
         return {"error": "工作空间不存在"}
     
-    files = []
-    for item in workspace_path.rglob("*"):
-        try:
-            if item.is_file():
-                files.append({
-                    "path": str(item.relative_to(workspace_path)),
-                    "size": item.stat().st_size,
-                    "type": "file"
-                })
-            elif item.is_dir():
-                files.append({
-                    "path": str(item.relative_to(workspace_path)),
-                    "type": "directory"
-                })
-        except (PermissionError, OSError) as e:
-            # 跳过无法访问的文件/目录（如 /proc 下的某些文件）
-            logger_patch.debug(f"跳过无法访问的路径: {item}, 错误: {e}")
-            continue
+    ignore_patterns = list(LIST_WORKSPACE_IGNORE)
+    if ignore:
+        ignore_patterns += [pattern.strip() for pattern in ignore.split(',') if pattern.strip()]
+    files, skipped, truncated = walk_workspace(str(workspace_path), ignore_patterns, max_depth, max_entries)
     
     return {
         "workspace_path": str(workspace_path),
         "workspace_name": workspace_name,
-        "files": files
+        "files": files,
+        "skipped": skipped,
+        "truncated": truncated
     }
 
 def validate_file_path(file_path: str) -> bool:
@@ -406,16 +428,33 @@ def validate_file_path(file_path: str) -> bool:
     
     return True
 
-def read_file(tool_context: ToolContext, file_path: str):
+def read_file(tool_context: ToolContext, file_path: str, offset: int = 0, limit: Optional[int] = None,
+              tail: Optional[int] = None, grep: Optional[str] = None, context: int = 0,
+              ignore_case: bool = False, byte_offset: Optional[int] = None):
     """
     读取文件内容
+    大文件分页返回：next_offset 不为 None 时，用 offset=next_offset 再次调用读取后续内容
+    只读取请求的部分，任意大小的文件都可以查看：tail 查看日志末尾，grep 在大文件中搜索，byte_offset 读取没有换行的文件
     
     Args:
         tool_context: 工具上下文
         file_path: 文件路径
+        offset: 起始行号（从 0 开始），默认 0
+        limit: 最多读取的行数，默认读到输出预算为止；grep 时为最多返回的匹配行数，byte_offset 时为字节数
+        tail: 可选，改为读取文件最后 N 行
+        grep: 可选，在文件中按正则（逐行匹配）搜索，而不是读取内容
+        context: grep 时每个匹配前后显示的行数，默认 0
+        ignore_case: grep 时忽略大小写，默认 False
+        byte_offset: 可选，从该字节偏移开始按字节读取
     
     Returns:
         dict: 包含文件内容的字典
+            - content: 文件第 [offset, next_offset) 行的内容
+            - total_lines: 文件总行数
+            - next_offset: 下一页的 offset，已读到文件末尾时为 None
+            tail 时返回 content 和 first_line（第一行的行号）
+            grep 时返回 matches（line、text、before、after）和 truncated
+            byte_offset 时返回 content、size（字节数）和 next_byte_offset
     """
     if not validate_file_path(file_path):
         return {"error": "文件路径不安全或文件类型不被允许"}
@@ -425,17 +464,43 @@ def read_file(tool_context: ToolContext, file_path: str):
         if not file_path.exists():
             return {"error": "文件不存在"}
         
-        if file_path.stat().st_size > MAX_FILE_SIZE:
-            return {"error": "文件过大"}
+        path = str(file_path)
+        max_bytes = OUTPUT_BUDGET.max_bytes
+        if grep:
+            found = grep_file(path, grep, ignore_case, max(context or 0, 0),
+                              limit or DEFAULT_MAX_MATCHES, max_bytes)
+            return {"file_path": path, "pattern": grep, **found}
         
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        return {
-            "file_path": str(file_path),
-            "content": content,
-            "size": len(content)
-        }
+        if tail is not None:
+            content, first_line = tail_lines(path, tail, max_bytes)
+            result = {
+                "file_path": path,
+                "content": content,
+                "size": len(content),
+                "first_line": first_line,
+                "total_lines": get_line_index(path).total_lines
+            }
+        elif byte_offset is not None:
+            content, size, next_byte_offset = read_byte_range(path, byte_offset, limit, max_bytes)
+            result = {
+                "file_path": path,
+                "content": content,
+                "byte_offset": max(byte_offset, 0),
+                "size": size,
+                "next_byte_offset": next_byte_offset
+            }
+        else:
+            content, total_lines, next_offset = read_line_range(path, offset, limit, max_bytes)
+            result = {
+                "file_path": path,
+                "content": content,
+                "size": len(content),
+                "offset": max(offset or 0, 0),
+                "total_lines": total_lines,
+                "next_offset": next_offset
+            }
+        # 单行超过预算（如压缩过的 js / json）时只保留首尾；原文件就在磁盘上，不需要另存
+        return OUTPUT_BUDGET.apply(result, ["content"], "read_file", spill=False)
     except Exception as e:
         return {"error": f"读取文件失败: {str(e)}"}
 
@@ -701,6 +766,41 @@ def execute_python_code(tool_context: ToolContext, code: str, timeout: int = 30,
     except Exception as e:
         return {"error": f"代码执行失败: {str(e)}"}
 
+def prepare_system_command(command: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    """
+    run_system_command（同步 / 异步版本）执行前的检查
+
+    返回:
+        tuple: (不允许执行时的错误结果，否则为 None, 命令的工作目录)
+    """
+    # 开放限制
+    SANDBOX_MODE = False
+
+    if SANDBOX_MODE:
+        # 在沙盒模式下，只允许安全的命令
+        if not any(cmd in command for cmd in safe_commands):
+            return {"error": "你执行的命令在沙盒模式下不被允许; 安全命令列表: " + str(safe_commands)}, WORKSPACE_DIR
+    logger.info(f"执行系统命令: {command}")
+    return None, WORKSPACE_DIR
+
+
+def system_command_result(stdout: str, stderr: str, return_code: int, workdir: str) -> Dict[str, Any]:
+    """run_system_command 的返回结果"""
+    return {
+        "stdout": stdout,
+        "stderr": stderr,
+        "return_code": return_code
+    }
+
+
+def system_command_error(error: Exception) -> Dict[str, Any]:
+    """run_system_command 执行出错（含超时）时的返回结果"""
+    if isinstance(error, subprocess.TimeoutExpired):
+        return {"error": "命令执行超时"}
+    return {"error": f"命令执行失败: {str(error)}"}
+
+
+@OUTPUT_BUDGET.limit("stdout", "stderr")
 def run_system_command(tool_context: ToolContext, command: str, timeout: int = 15):
     """
     运行系统命令
@@ -713,33 +813,21 @@ def run_system_command(tool_context: ToolContext, command: str, timeout: int = 1
     Returns:
         dict: 包含执行结果的字典
     """
-    # 开放限制
-    SANDBOX_MODE = False
-
-    if SANDBOX_MODE:
-        # 在沙盒模式下，只允许安全的命令
-        if not any(cmd in command for cmd in safe_commands):
-            return {"error": "你执行的命令在沙盒模式下不被允许; 安全命令列表: " + str(safe_commands)}
+    error, workdir = prepare_system_command(command)
+    if error:
+        return error
     try:
-        logger.info(f"执行系统命令: {command}")
         result = subprocess.run(
             command,
             shell=True,
             capture_output=True,
             text=True,
             timeout=timeout,
-            cwd=WORKSPACE_DIR
+            cwd=workdir
         )
-        
-        return {
-            "stdout": result.stdout,
-            "stderr": result.stderr,
-            "return_code": result.returncode
-        }
-    except subprocess.TimeoutExpired:
-        return {"error": "命令执行超时"}
+        return system_command_result(result.stdout, result.stderr, result.returncode, workdir)
     except Exception as e:
-        return {"error": f"命令执行失败: {str(e)}"}
+        return system_command_error(e)
 
 def interactive_system_command(
     tool_context: ToolContext,
@@ -817,6 +905,19 @@ def run_interactive_python_code(tool_context: ToolContext, cmd: str, session_id:
             "finished": True
         }
 
+def prepare_shell_start(cmd: str) -> Dict[str, Any]:
+    """start_interative_shell（同步 / 异步版本）启动会话的参数：按 conda 激活方式改写命令或设置环境变量"""
+    # conda 环境在服务启动时已解析并缓存（conda_env.py）
+    conda_env = get_conda_env()
+    env = None
+    if conda_env and CONDA_ACTIVATION_MODE == 'shell':
+        cmd = f"source activate {conda_env.path} && {cmd}"
+    elif conda_env:
+        # 直接以激活后的环境变量启动，不再执行 conda 激活脚本
+        env = dict(conda_env.env)
+    return {"cmd": cmd, "env": env}
+
+
 def start_interative_shell(tool_context: ToolContext, cmd: str = "bash") -> Dict[str, Any]:
     """
     启动一个交互式shell会话。
@@ -827,82 +928,26 @@ def start_interative_shell(tool_context: ToolContext, cmd: str = "bash") -> Dict
     Returns:
         dict: 包含执行结果的字典
     """
-    # 检查并获取 conda 环境路径
-    conda_env_path = None
-    # 方法1: 优先使用启动脚本设置的 CONDA_ENV_PATH 环境变量
-    if 'CONDA_ENV_PATH' in os.environ and os.environ['CONDA_ENV_PATH'].strip():
-        conda_env_path = os.environ['CONDA_ENV_PATH'].strip()
-    # 方法2: 检查 CONDA_PREFIX 环境变量（当前激活的 conda 环境）
-    elif 'CONDA_PREFIX' in os.environ:
-        conda_env_path = os.environ['CONDA_PREFIX']
-    # 方法3: 检查 CONDA_DEFAULT_ENV 并尝试获取完整路径
-    elif 'CONDA_DEFAULT_ENV' in os.environ:
-        try:
-            # 尝试通过 conda info 获取环境路径
-            result = subprocess.run(
-                ['conda', 'info', '--envs'],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-            if result.returncode == 0:
-                # 解析输出，查找当前环境
-                env_name = os.environ['CONDA_DEFAULT_ENV']
-                for line in result.stdout.split('\n'):
-                    if line.strip().startswith(env_name) or f'/{env_name}' in line:
-                        # 提取路径（通常在环境名之后）
-                        parts = line.split()
-                        if len(parts) >= 2:
-                            conda_env_path = parts[-1]
-                            break
-        except Exception as e:
-            logger.warning(f"获取 conda 环境信息时出错: {e}")
-    
-    # 如果检测到 conda 环境，在命令前添加 source activate
-    if conda_env_path and conda_env_path.strip():
-        cmd = f"source activate {conda_env_path} && {cmd}"
-    
-    session_id = None
     try:
-        result = step(
-            cmd=cmd,
-        )
-        return result
+        return step(**prepare_shell_start(cmd))
     except Exception as e:
-        return {
-            "error": str(e),
-            "session_id": session_id,
-            "output": session_id,
-            "waiting": False,
-            "finished": True
-        }
+        return shell_step_error(None, e)
 
 IS_IN_PYTHON_ENV = False
 
-def run_interactive_shell(tool_context: ToolContext, session_id: Optional[str] = None, user_input: Optional[str] = None) -> Dict[str, Any]:
+def prepare_shell_input(tool_context: ToolContext, session_id: Optional[str], user_input: Optional[str]) -> Optional[Dict[str, Any]]:
     """
-    运行一个交互式shell会话。
-    
-    第一次调用时需要提供cmd参数来启动新会话，后续调用需要提供session_id来继续之前的会话。
-    如果需要向shell输入内容，提供user_input参数。
-    
-    参数:
-        session_id (str, optional): 会话ID，用于继续之前的会话
-        user_input (str, optional): 要发送到shell的输入内容
-        
+    run_interactive_shell（同步 / 异步版本）发送输入前的检查，并更新会话的 python_env_state
+
     返回:
-        Dict[str, Any]: 包含以下字段的字典：
-            - session_id: str, 会话ID
-            - output: str, shell输出内容
-            - waiting: bool, 是否在等待输入
-            - finished: bool, 会话是否结束
+        不允许发送时的错误结果，否则为 None
     """
     # 获取当前会话的状态
     session_state = getattr(tool_context, 'python_env_state', {})
     if session_id not in session_state:
         session_state[session_id] = False
     is_in_python = session_state[session_id]
-    
+
     SANDBOX_MODE = False
 
     # 检查命令安全性
@@ -910,30 +955,58 @@ def run_interactive_shell(tool_context: ToolContext, session_id: Optional[str] =
         current_command = user_input.split()[0] if user_input else ''
         if not any(cmd in current_command for cmd in safe_commands):
             return {"error": "你执行的命令在沙盒模式下不被允许; 安全命令列表: " + str(safe_commands)}
-    
+
     # 更新Python环境状态
     if user_input and user_input.startswith("python"):
         session_state[session_id] = True
     elif user_input == "exit":
         session_state[session_id] = False
-    
+
     # 保存状态回上下文
     setattr(tool_context, 'python_env_state', session_state)
+    return None
+
+
+def shell_step_error(session_id: Optional[str], error: Exception) -> Dict[str, Any]:
+    """run_interactive_shell 执行出错时的返回结果"""
+    return {
+        "error": str(error),
+        "session_id": session_id,
+        "output": "",
+        "waiting": False,
+        "finished": True
+    }
+
+
+def run_interactive_shell(tool_context: ToolContext, session_id: Optional[str] = None, user_input: Optional[str] = None) -> Dict[str, Any]:
+    """
+    运行一个交互式shell会话。
     
+    第一次调用时需要提供cmd参数来启动新会话，后续调用需要提供session_id来继续之前的会话。
+    如果需要向shell输入内容，提供user_input参数。
+    
+    参数:
+        session_id (str, optional): 会话ID，用于继续之前的会话
+        user_input (str, optional): 要发送到shell的输入内容
+        
+    返回:
+        Dict[str, Any]: 包含以下字段的字典：
+            - session_id: str, 会话ID
+            - output: str, shell输出内容
+            - waiting: bool, 是否在等待输入
+            - finished: bool, 会话是否结束
+    """
+    error = prepare_shell_input(tool_context, session_id, user_input)
+    if error:
+        return error
+
     try:
-        result = step(
+        return step(
             session_id=session_id,
             user_input=user_input
         )
-        return result
     except Exception as e:
-        return {
-            "error": str(e),
-            "session_id": session_id,
-            "output": "",
-            "waiting": False,
-            "finished": True
-        }
+        return shell_step_error(session_id, e)
 
 def kill_shell_session(tool_context: ToolContext, session_id: str) -> Dict[str, Any]:
     """
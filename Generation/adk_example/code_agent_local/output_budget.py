@@ -0,0 +1,217 @@
+"""
+工具输出的大小预算
+
+read_file / run_system_command / judge 等工具会把完整输出原样放进模型上下文，
+一次 `pytest -v` 就可能带来上万 tokens，随后触发上下文压缩。这里统一限制返回给模型的输出大小：
+  - 超过预算的字段只保留开头和结尾（结尾通常是报错和测试汇总），中间替换为省略说明
+  - 完整内容写入溢出文件（spill file），省略说明中给出路径，agent 可以用 read_file 的 offset / limit 分页查看
+  - 多个字段（如 stdout / stderr）共用一个预算：较小的字段完整保留，剩余预算平分给较大的字段
+另外提供带忽略规则、深度限制的目录遍历（list_workspace）；read_file 的分段读取见 ranged_read.py。
+"""
+
+import fnmatch
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 截断时开头部分占预算的比例，其余留给结尾
+HEAD_RATIO = 1 / 3
+# 每个字段至少保留的字节数，避免多个大字段平分后几乎什么都不剩
+MIN_FIELD_BYTES = 1024
+# 溢出目录中最多保留的文件数，超出后删除最旧的
+MAX_SPILL_FILES = 500
+PRUNE_EVERY = 50
+
+OMITTED_TEMPLATE = ("\n\n... [{omitted_bytes} bytes / {omitted_lines} lines omitted{where}] ...\n\n")
+SPILL_HINT = "; full output saved to {path}, page through it with read_file(file_path=\"{path}\", offset=<line>, limit=<lines>)"
+
+
+def _cut_head(data: bytes, size: int) -> bytes:
+    """取开头 size 字节，尽量在换行处截断"""
+    head = data[:size]
+    newline = head.rfind(b'\n')
+    return head[:newline + 1] if newline >= size // 2 else head
+
+
+def _cut_tail(data: bytes, size: int) -> bytes:
+    """取结尾 size 字节，尽量从换行之后开始"""
+    tail = data[len(data) - size:] if size else b''
+    newline = tail.find(b'\n')
+    return tail[newline + 1:] if 0 <= newline < size // 2 else tail
+
+
+def head_tail(text: str, max_bytes: int, spill_path: Optional[str] = None) -> str:
+    """把 text 截断为开头 + 省略说明 + 结尾，总长度约为 max_bytes 字节"""
+    data = text.encode('utf-8', 'surrogateescape')
+    if len(data) <= max_bytes:
+        return text
+    head = _cut_head(data, int(max_bytes * HEAD_RATIO))
+    tail = _cut_tail(data, max_bytes - len(head))
+    omitted = data[len(head):len(data) - len(tail)]
+    where = SPILL_HINT.format(path=spill_path) if spill_path else ""
+    marker = OMITTED_TEMPLATE.format(omitted_bytes=len(omitted), omitted_lines=omitted.count(b'\n'), where=where)
+    return head.decode('utf-8', 'ignore') + marker + tail.decode('utf-8', 'ignore')
+
+
+def split_budget(sizes: Dict[str, int], max_bytes: int) -> Dict[str, int]:
+    """
+    在多个字段之间分配预算：从小到大依次分配，小于平均份额的字段完整保留，剩余预算平分给其余字段
+
+    Returns:
+        dict: 字段 -> 可用字节数（不小于 MIN_FIELD_BYTES，已完整保留的字段为其原始大小）
+    """
+    budgets = {}
+    remaining = max_bytes
+    pending = sorted(sizes, key=sizes.get)
+    while pending:
+        share = max(remaining // len(pending), MIN_FIELD_BYTES)
+        field = pending.pop(0)
+        budgets[field] = min(sizes[field], share)
+        remaining = max(remaining - budgets[field], 0)
+    return budgets
+
+
+class OutputBudget:
+    """
+    工具输出预算
+
+    Args:
+        max_bytes: 单次工具调用返回给模型的输出字段总字节数上限，<= 0 表示不限制
+        spill_dir: 溢出文件目录，为空时只截断不保存完整输出
+    """
+
+    def __init__(self, max_bytes: int, spill_dir: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self._spilled = 0
+        self._lock = threading.Lock()
+
+    def spill(self, tool_name: str, field: str, text: str) -> Optional[str]:
+        """把完整输出写入溢出文件，返回路径；写入失败时返回 None"""
+        if not self.spill_dir:
+            return None
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            name = f"{tool_name}_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}_{field}.txt"
+            path = os.path.join(self.spill_dir, name)
+            with open(path, 'w', encoding='utf-8', errors='surrogateescape') as f:
+                f.write(text)
+        except OSError as e:
+            logger.warning(f"写入工具输出溢出文件失败: {e}")
+            return None
+        with self._lock:
+            self._spilled += 1
+            prune = self._spilled % PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+        return path
+
+    def prune(self):
+        """溢出文件超过 MAX_SPILL_FILES 个时删除最旧的"""
+        try:
+            entries = sorted(os.scandir(self.spill_dir), key=lambda entry: entry.stat().st_mtime)
+        except OSError:
+            return
+        for entry in entries[:max(len(entries) - MAX_SPILL_FILES, 0)]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def apply(self, result, fields: Iterable[str], tool_name: str, spill: bool = True):
+        """
+        对工具返回的 dict 中的文本字段应用预算，返回新的 dict（不修改原结果）
+        被截断的字段会在 "truncated" 中列出，保存了完整输出的字段在 "full_output_files" 中给出路径
+        """
+        if self.max_bytes <= 0 or not isinstance(result, dict):
+            return result
+        sizes = {field: len(result[field].encode('utf-8', 'surrogateescape'))
+                 for field in fields if isinstance(result.get(field), str)}
+        if sum(sizes.values()) <= self.max_bytes:
+            return result
+        result = dict(result)
+        truncated = []
+        spill_files = {}
+        for field, budget in split_budget(sizes, self.max_bytes).items():
+            if sizes[field] <= budget:
+                continue
+            path = self.spill(tool_name, field, result[field]) if spill else None
+            result[field] = head_tail(result[field], budget, path)
+            truncated.append(field)
+            if path:
+                spill_files[field] = path
+        result["truncated"] = truncated
+        if spill_files:
+            result["full_output_files"] = spill_files
+        logger.info(f"{tool_name} 输出超过 {self.max_bytes} 字节，已截断字段 {truncated}")
+        return result
+
+    def limit(self, *fields: str, spill: bool = True):
+        """装饰器：对工具函数的返回值应用预算（保留原函数的签名和文档，ADK 据此生成工具声明），支持异步工具"""
+        def decorator(func):
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    return self.apply(await func(*args, **kwargs), fields, func.__name__, spill)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                return self.apply(func(*args, **kwargs), fields, func.__name__, spill)
+            return wrapper
+        return decorator
+
+
+def walk_workspace(root: str, ignore: Iterable[str] = (), max_depth: Optional[int] = None,
+                   max_entries: Optional[int] = None) -> Tuple[List[dict], List[str], bool]:
+    """
+    遍历目录，跳过名称匹配 ignore（fnmatch 通配）的文件和目录，被跳过的目录不会进入遍历
+
+    Args:
+        root: 根目录
+        ignore: 忽略规则，如 venv、__pycache__、*.pyc
+        max_depth: 最大深度（根目录下的直接子项深度为 1），None 表示不限
+        max_entries: 最多返回的条目数，None 表示不限
+
+    Returns:
+        tuple: (条目列表, 被忽略的目录（相对路径）, 是否因 max_entries 截断)
+    """
+    ignore = list(ignore)
+    entries = []
+    skipped = []
+
+    def ignored(name):
+        return any(fnmatch.fnmatch(name, pattern) for pattern in ignore)
+
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root)
+        depth = 0 if rel_dir == '.' else rel_dir.count(os.sep) + 1
+        kept_dirs = []
+        for name in sorted(dirnames):
+            rel_path = os.path.normpath(os.path.join(rel_dir, name))
+            if ignored(name):
+                skipped.append(rel_path)
+                continue
+            entries.append({"path": rel_path, "type": "directory"})
+            kept_dirs.append(name)
+        # 原地修改 dirnames，os.walk 不会进入被忽略或超过深度的目录
+        dirnames[:] = kept_dirs if max_depth is None or depth + 1 < max_depth else []
+        for name in sorted(filenames):
+            if ignored(name):
+                continue
+            rel_path = os.path.normpath(os.path.join(rel_dir, name))
+            try:
+                size = os.stat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                continue
+            entries.append({"path": rel_path, "size": size, "type": "file"})
+        if max_entries is not None and len(entries) >= max_entries:
+            return entries[:max_entries], skipped, True
+    return entries, skipped, False
@@ -0,0 +1,187 @@
+"""
+进程内共享的异步限流器（令牌桶）
+
+替代 LiteLlmWithSleep / RobustLiteLlmWithSleep 中每次响应后固定 sleep 的做法：
+  - 每个模型一个限流器，同一进程内所有 session 共用
+  - 按每分钟请求数（rpm）和每分钟 token 数（tpm）两个令牌桶限流，未配置的维度不限
+  - 收到 429 时按 Retry-After 暂停该模型的所有请求
+只有在即将超过限额时才会等待，未配置 rpm/tpm 且没有收到 429 时不会产生任何等待。
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 没有 Retry-After 头时，429 之后的默认等待时间（秒）
+DEFAULT_RETRY_AFTER = 5.0
+# Retry-After 的上限，防止异常值让整个进程长时间停顿
+MAX_RETRY_AFTER = 120.0
+
+
+class TokenBucket:
+    """容量为每分钟限额、按秒匀速补充的令牌桶（非线程安全，由 AsyncRateLimiter 加锁）"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """取出 amount 还需等待的秒数（超过容量的请求按容量计，避免永远等不到）"""
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+
+class AsyncRateLimiter:
+    """
+    单个模型的限流器
+
+    Args:
+        name: 限流器名称（模型名），用于日志
+        rpm: 每分钟请求数上限，None 表示不限
+        tpm: 每分钟 token 数上限，None 表示不限
+    """
+
+    def __init__(self, name: str, rpm: Optional[int] = None, tpm: Optional[int] = None):
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.blocked_until = 0.0
+        self.waited_seconds = 0.0
+        # 使用线程锁而不是 asyncio.Lock：限流器可能被多个事件循环（线程）共用
+        self._lock = threading.Lock()
+
+    def configure(self, rpm: Optional[int] = None, tpm: Optional[int] = None):
+        """更新限额（同一模型被多次构造时以最后一次配置为准）"""
+        with self._lock:
+            if rpm and (self.requests is None or self.requests.capacity != rpm):
+                self.requests = TokenBucket(rpm)
+            if tpm and (self.tokens is None or self.tokens.capacity != tpm):
+                self.tokens = TokenBucket(tpm)
+
+    def _try_acquire(self, estimated_tokens: int) -> float:
+        """尝试取令牌，成功返回 0，否则返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            wait = self.blocked_until - now
+            for bucket, amount in ((self.requests, 1), (self.tokens, estimated_tokens)):
+                if bucket is not None:
+                    bucket.refill(now)
+                    wait = max(wait, bucket.wait_time(amount))
+            if wait > 0:
+                return wait
+            if self.requests is not None:
+                self.requests.level -= 1
+            if self.tokens is not None:
+                self.tokens.level -= min(estimated_tokens, self.tokens.capacity)
+            return 0.0
+
+    async def acquire(self, estimated_tokens: int = 0) -> float:
+        """
+        等待直到可以发出一次请求
+
+        Args:
+            estimated_tokens: 本次请求预计消耗的 token 数（用于 tpm 限流）
+
+        Returns:
+            float: 实际等待的秒数
+        """
+        waited = 0.0
+        while True:
+            wait = self._try_acquire(estimated_tokens)
+            if wait <= 0:
+                if waited > 0:
+                    with self._lock:
+                        self.waited_seconds += waited
+                    logger.info(f"[rate_limiter] {self.name}: 等待 {waited:.1f}s 后发出请求")
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def record_usage(self, actual_tokens: int, estimated_tokens: int = 0):
+        """请求完成后按实际 token 数修正 tpm 令牌桶（允许透支，之后的请求会相应等待）"""
+        if self.tokens is None:
+            return
+        with self._lock:
+            self.tokens.level -= actual_tokens - estimated_tokens
+
+    def penalize(self, retry_after: Optional[float]):
+        """收到 429：在 retry_after 秒内暂停该模型的所有请求"""
+        delay = min(retry_after if retry_after else DEFAULT_RETRY_AFTER, MAX_RETRY_AFTER)
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+        logger.warning(f"[rate_limiter] {self.name}: 收到 429，暂停 {delay:.1f}s")
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "name": self.name,
+                "rpm": self.requests.capacity if self.requests else None,
+                "tpm": self.tokens.capacity if self.tokens else None,
+                "blocked_for": max(0.0, self.blocked_until - now),
+                "waited_seconds": self.waited_seconds,
+            }
+
+
+_limiters: Dict[str, AsyncRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str, rpm: Optional[int] = None, tpm: Optional[int] = None) -> AsyncRateLimiter:
+    """获取（并缓存）指定模型的限流器，同一进程内同名模型共用一个"""
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            limiter = AsyncRateLimiter(name, rpm, tpm)
+            _limiters[name] = limiter
+        else:
+            limiter.configure(rpm, tpm)
+        return limiter
+
+
+def _parse_retry_after(headers) -> Optional[float]:
+    if not headers:
+        return None
+    try:
+        value = headers.get('retry-after-ms') or headers.get('Retry-After-Ms')
+        if value is not None:
+            return float(value) / 1000.0
+        value = headers.get('retry-after') or headers.get('Retry-After')
+        if value is not None:
+            return float(value)
+    except (TypeError, ValueError):
+        # Retry-After 也可能是 HTTP 日期，这里按缺省等待处理
+        return None
+    return None
+
+
+def rate_limit_info(error: Exception) -> Tuple[bool, Optional[float]]:
+    """
+    判断异常是否为限流（HTTP 429），并尽量取出 Retry-After（秒）
+
+    兼容 litellm.RateLimitError（status_code / response.headers / litellm_response_headers）
+    以及 openai / httpx 风格的异常
+    """
+    status = getattr(error, 'status_code', None)
+    response = getattr(error, 'response', None)
+    if status is None and response is not None:
+        status = getattr(response, 'status_code', None)
+    is_rate_limited = status == 429 or type(error).__name__ == 'RateLimitError'
+    if not is_rate_limited:
+        return False, None
+    retry_after = _parse_retry_after(getattr(error, 'litellm_response_headers', None))
+    if retry_after is None and response is not None:
+        retry_after = _parse_retry_after(getattr(response, 'headers', None))
+    return True, retry_after
@@ -8,9 +8,14 @@ from google.adk.models.llm_request import LlmRequest
 from google.adk.models.llm_response import LlmResponse
 from google.genai import types
 from litellm import ChatCompletionAssistantMessage
+from rate_limiter import get_rate_limiter, rate_limit_info
+import tracing
 
 logger = logging.getLogger(__name__)
 
+# 收到 429 且尚未产生任何响应时的最大重试次数
+MAX_RATE_LIMIT_RETRIES = 3
+
 
 def _safe_json_loads(json_str: str, fallback_value: dict = None) -> dict:
     """
@@ -154,46 +159,81 @@ class RobustLiteLlmWithSleep(LiteLlm):
     Robust wrapper around LiteLlm that handles JSON parsing errors and adds sleep.
     
     This wrapper:
-    1. Adds configurable sleep between responses
+    1. Rate-limits requests with a process-wide token bucket per model (rpm / tpm)
+       and waits for Retry-After on 429
     2. Handles malformed JSON in function calls gracefully
     3. Provides detailed logging for debugging
     """
     
-    sleep_duration: float = Field(default=1.0, description="Time to sleep between responses in seconds")
+    sleep_duration: float = Field(default=0.0, description="Time to sleep between responses in seconds (legacy, prefer rpm/tpm)")
+    rpm: Optional[int] = Field(default=None, description="Max requests per minute for this model, shared by the whole process")
+    tpm: Optional[int] = Field(default=None, description="Max tokens per minute for this model, shared by the whole process")
     enable_json_fixing: bool = Field(default=True, description="Whether to attempt fixing malformed JSON")
     
-    def __init__(self, model: str, sleep_duration: float = 1.0, enable_json_fixing: bool = True, **kwargs):
+    def __init__(self, model: str, sleep_duration: float = 0.0, enable_json_fixing: bool = True,
+                 rpm: Optional[int] = None, tpm: Optional[int] = None, **kwargs):
         """
         Initialize the robust wrapper.
         
         Args:
             model: The name of the LiteLlm model
-            sleep_duration: Time to sleep between responses in seconds
+            sleep_duration: Time to sleep between responses in seconds (legacy, default 0)
             enable_json_fixing: Whether to attempt fixing malformed JSON
+            rpm: Max requests per minute, None for no limit
+            tpm: Max tokens per minute, None for no limit
             **kwargs: Additional arguments passed to LiteLlm
         """
         super().__init__(
             model=model, 
             sleep_duration=sleep_duration, 
             enable_json_fixing=enable_json_fixing,
+            rpm=rpm,
+            tpm=tpm,
             **kwargs
         )
+        self._rate_limiter = get_rate_limiter(model, rpm, tpm)
     
     async def generate_content_async(
         self, llm_request: LlmRequest, stream: bool = False
     ) -> AsyncGenerator[LlmResponse, None]:
         """
-        Generates content asynchronously with robust error handling and sleep.
+        Generates content asynchronously with robust error handling and rate limiting.
         """
+        rate_limit_retries = 0
+        yielded = False
         try:
-            # Get the original generator from the parent class
-            async for response in super().generate_content_async(llm_request, stream):
-                # Yield the response
-                yield response
-                
-                # Add sleep after each response
-                if self.sleep_duration > 0:
-                    await asyncio.sleep(self.sleep_duration)
+            while True:
+                with tracing.span("llm.rate_limit_wait", "llm", model=self.model):
+                    await self._rate_limiter.acquire()
+                try:
+                    # span 只统计等待模型的时间，不含 yield 之后 ADK 执行工具的时间
+                    with tracing.span("llm.generate", "llm", model=self.model,
+                                      retry=rate_limit_retries or None) as llm_span:
+                        # Get the original generator from the parent class
+                        async for response in llm_span.iterate(super().generate_content_async(llm_request, stream)):
+                            tracing.record_llm_usage(llm_span, response)
+                            if response.usage_metadata and self.tpm:
+                                self._rate_limiter.record_usage(
+                                    (response.usage_metadata.prompt_token_count or 0)
+                                    + (response.usage_metadata.candidates_token_count or 0))
+                            # Yield the response
+                            yielded = True
+                            yield response
+
+                            # Legacy fixed sleep after each response
+                            if self.sleep_duration > 0:
+                                await asyncio.sleep(self.sleep_duration)
+                    return
+                except json.JSONDecodeError:
+                    raise
+                except Exception as e:
+                    is_rate_limited, retry_after = rate_limit_info(e)
+                    # 已经产出部分响应时不能重发，否则会重复
+                    if not is_rate_limited or yielded or rate_limit_retries >= MAX_RATE_LIMIT_RETRIES:
+                        raise
+                    rate_limit_retries += 1
+                    self._rate_limiter.penalize(retry_after)
+                    logger.warning(f"Rate limited (429), retry {rate_limit_retries}/{MAX_RATE_LIMIT_RETRIES}")
                     
         except json.JSONDecodeError as e:
             logger.error(f"JSON decode error in LiteLLM: {e}")
@@ -286,7 +326,7 @@ async def example_robust_usage():
     # Use the robust wrapper
     model = RobustLiteLlmWithSleep(
         model="gpt-3.5-turbo",
-        sleep_duration=1.0,
+        rpm=60,  # 只在即将超过每分钟请求数时等待
         enable_json_fixing=True,
         **LiteLLMConfig.get_robust_config()  # Use robust configuration
     )
@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+轻量的调用追踪（span）
+
+评测会话的时间到底花在哪里（LLM 延迟、judge 等待、pytest 运行、上下文压缩）原来无从得知。这里在热点路径上记录 span：
+  - agent.py 注册的每个工具（trace_tool）
+  - LiteLLM 包装类中的每次 generate_content_async、限流等待和上下文压缩
+  - 驱动脚本（ready_test 等）经 adk_client 发出的每个 HTTP 请求，以及每个 metric 的整体评测
+每个 span 带有 session_id、project_id、metric、耗时、输入/输出字节数和 token 数（有的话）。
+
+设置环境变量 TRACE_DIR 后开启，未设置时 span() / trace_tool 几乎没有开销。
+每个进程写一个 JSONL 文件（TRACE_DIR/trace_<进程名>_<pid>.jsonl，一行一个 span），
+ADK 服务、MCP 服务和驱动脚本的 span 通过 session_id 关联。
+
+汇总与导出：
+  python tracing.py summary /tmp/traces              # 按 (类别, 名称) 列出耗时最多的项
+  python tracing.py summary /tmp/traces --by metric  # 按 metric / project / session / cat 汇总
+  python tracing.py chrome /tmp/traces -o trace.json # 导出为 Chrome trace（chrome://tracing 或 Perfetto 打开）
+注意 span 之间有嵌套（metric ⊃ http.run ⊃ llm / tool），不同类别的耗时不能直接相加。
+"""
+
+import argparse
+import functools
+import glob
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+TRACE_DIR_ENV = 'TRACE_DIR'
+
+
+def parse_session_id(session_id: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """
+    从驱动脚本的会话ID中解析 (project_id, metric)
+
+    ready_test 的会话ID为 s_<项目目录>_<metric 名>[_<重试轮次>]，批量模式为 s_<项目目录>_batch_<分组>_<摘要>；
+    无法解析时返回 (None, None)
+    """
+    if not session_id:
+        return None, None
+    name = session_id[2:] if session_id.startswith('s_') else session_id
+    project_id, sep, rest = name.partition('_')
+    if not sep:
+        return project_id or None, None
+    return project_id, rest or None
+
+
+class Span:
+    """一次记录中的属性；在 with 块内可以用 set() 补充（如输出字节数、token 数）"""
+
+    __slots__ = ('name', 'cat', 'attrs', 'start', 'active')
+
+    def __init__(self, name: str, cat: str, attrs: Dict[str, Any]):
+        self.name = name
+        self.cat = cat
+        self.attrs = attrs
+        self.start = time.time()
+        # 只统计实际执行时间时（iterate），累计的秒数
+        self.active = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add(self, **counts):
+        for key, value in counts.items():
+            if value:
+                self.attrs[key] = self.attrs.get(key, 0) + value
+
+    async def iterate(self, agen):
+        """
+        转发异步生成器的输出，只把等待生成器的时间计入 span
+        （ADK 在生成器暂停于 yield 时执行工具，这段时间不属于 LLM 调用）
+        """
+        self.active = 0.0
+        iterator = agen.__aiter__()
+        while True:
+            started = time.time()
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                self.active += time.time() - started
+                return
+            self.active += time.time() - started
+            yield item
+
+
+class _NoopSpan:
+    """未开启追踪时使用，所有操作为空"""
+
+    def set(self, **attrs):
+        pass
+
+    def add(self, **counts):
+        pass
+
+    async def iterate(self, agen):
+        async for item in agen:
+            yield item
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _SpanContext:
+    def __init__(self, tracer: 'Tracer', span: Span):
+        self.tracer = tracer
+        self.span = span
+
+    def __enter__(self):
+        return self.span
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            if exc_type.__name__ in ('CancelledError', 'GeneratorExit'):
+                self.span.attrs['status'] = 'cancelled'
+            else:
+                self.span.attrs['status'] = 'error'
+                self.span.attrs['error'] = f"{exc_type.__name__}: {exc_value}"[:500]
+        self.tracer.finish(self.span)
+        return False
+
+
+class Tracer:
+    """把 span 追加写入当前进程的 JSONL 文件（线程安全；fork 之后的子进程写自己的文件）"""
+
+    def __init__(self, trace_dir: str):
+        self.trace_dir = trace_dir
+        self._lock = threading.Lock()
+        self._file = None
+        self._pid = None
+
+    def _output(self):
+        pid = os.getpid()
+        if self._file is None or self._pid != pid:
+            os.makedirs(self.trace_dir, exist_ok=True)
+            process = os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0] or 'python'
+            path = os.path.join(self.trace_dir, f"trace_{process}_{pid}.jsonl")
+            self._file = open(path, 'a', encoding='utf-8', buffering=1)
+            self._pid = pid
+        return self._file
+
+    def span(self, name: str, cat: str, **attrs) -> _SpanContext:
+        session_id = attrs.get('session_id')
+        if session_id and 'project_id' not in attrs and 'metric' not in attrs:
+            project_id, metric = parse_session_id(session_id)
+            attrs['project_id'] = project_id
+            attrs['metric'] = metric
+        return _SpanContext(self, Span(name, cat, attrs))
+
+    def finish(self, span: Span):
+        end = time.time()
+        duration = span.active if span.active is not None else end - span.start
+        record = {
+            'name': span.name,
+            'cat': span.cat,
+            'ts': span.start,
+            'dur': round(duration, 6),
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+        }
+        record.update({key: value for key, value in span.attrs.items() if value is not None})
+        line = json.dumps(record, ensure_ascii=False, default=str) + '\n'
+        with self._lock:
+            try:
+                self._output().write(line)
+            except OSError:
+                pass
+
+
+_tracer: Optional[Tracer] = None
+_tracer_dir: Optional[str] = None
+
+
+def get_tracer() -> Optional[Tracer]:
+    """TRACE_DIR 已设置时返回当前进程的 Tracer，否则返回 None"""
+    global _tracer, _tracer_dir
+    trace_dir = os.environ.get(TRACE_DIR_ENV, '').strip()
+    if not trace_dir:
+        return None
+    if _tracer is None or _tracer_dir != trace_dir:
+        _tracer = Tracer(trace_dir)
+        _tracer_dir = trace_dir
+    return _tracer
+
+
+def span(name: str, cat: str, **attrs):
+    """
+    记录一个 span：with span("llm.generate", "llm", session_id=...) as s: ...; s.set(prompt_tokens=...)
+
+    未开启追踪时返回空操作对象
+    """
+    tracer = get_tracer()
+    if tracer is None:
+        return NOOP_SPAN
+    return tracer.span(name, cat, **attrs)
+
+
+def payload_size(value: Any) -> int:
+    """参数 / 返回值序列化后的字节数（近似）"""
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode('utf-8', errors='replace'))
+    try:
+        return len(json.dumps(value, ensure_ascii=False, default=str).encode('utf-8', errors='replace'))
+    except (TypeError, ValueError):
+        return len(str(value))
+
+
+def record_llm_usage(current, response):
+    """把 LlmResponse.usage_metadata 中的 token 数累加到 span"""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return
+    current.add(prompt_tokens=getattr(usage, 'prompt_token_count', None) or 0,
+                completion_tokens=getattr(usage, 'candidates_token_count', None) or 0,
+                cached_tokens=getattr(usage, 'cached_content_token_count', None) or 0)
+
+
+def tool_session_id(tool_context) -> Optional[str]:
+    """从 ADK 的 tool_context 中取出会话ID"""
+    session = getattr(tool_context, 'session', None)
+    if session is None:
+        session = getattr(getattr(tool_context, '_invocation_context', None), 'session', None)
+    return getattr(session, 'id', None)
+
+
+def trace_tool(func):
+    """
+    为工具函数记录 span（同步和异步工具均可），保留名称、签名和文档，ADK 据此生成工具声明
+
+    span 名称为 tool.<函数名>，输入字节数为除 tool_context 外的参数，输出字节数为返回值
+    """
+    def start(args, kwargs):
+        tool_context = kwargs.get('tool_context', args[0] if args else None)
+        arguments = {key: value for key, value in kwargs.items() if key != 'tool_context'}
+        arguments.update({str(index): value for index, value in enumerate(args[1:], 1)})
+        return span(f"tool.{func.__name__}", 'tool', session_id=tool_session_id(tool_context),
+                    bytes_in=payload_size(arguments))
+
+    def finish(current, result):
+        current.set(bytes_out=payload_size(result))
+        if isinstance(result, dict) and 'error' in result:
+            current.set(status='tool_error')
+        return result
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            if get_tracer() is None:
+                return await func(*args, **kwargs)
+            with start(args, kwargs) as current:
+                return finish(current, await func(*args, **kwargs))
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if get_tracer() is None:
+            return func(*args, **kwargs)
+        with start(args, kwargs) as current:
+            return finish(current, func(*args, **kwargs))
+    return wrapper
+
+
+# ---------------------------------------------------------------------------
+# 汇总与导出
+# ---------------------------------------------------------------------------
+
+def load_spans(paths: Iterable[str]) -> List[Dict[str, Any]]:
+    """读取目录（其中所有 .jsonl）或文件中的 span，跳过写了一半的行"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, '*.jsonl'))))
+        else:
+            files.append(path)
+    spans = []
+    for path in files:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    spans.append(json.loads(line))
+                except ValueError:
+                    continue
+    return spans
+
+
+def _percentile(values: List[float], ratio: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+
+def summarize(spans: List[Dict[str, Any]], by: str = 'name', top: int = 20) -> List[Dict[str, Any]]:
+    """按 by 分组（name 表示 (cat, name)），按总耗时从大到小返回前 top 组"""
+    groups = defaultdict(list)
+    for item in spans:
+        if by == 'name':
+            key = f"{item.get('cat')}/{item.get('name')}"
+        else:
+            key = str(item.get(by) or '-')
+        groups[key].append(item)
+    rows = []
+    for key, items in groups.items():
+        durations = [item.get('dur', 0.0) for item in items]
+        rows.append({
+            'group': key,
+            'count': len(items),
+            'total': sum(durations),
+            'mean': sum(durations) / len(durations),
+            'p95': _percentile(durations, 0.95),
+            'max': max(durations),
+            'errors': sum(1 for item in items if item.get('status') in ('error', 'tool_error')),
+            'bytes_out': sum(item.get('bytes_out', 0) for item in items),
+            'tokens': sum(item.get('prompt_tokens', 0) + item.get('completion_tokens', 0) for item in items),
+        })
+    rows.sort(key=lambda row: row['total'], reverse=True)
+    return rows[:top] if top else rows
+
+
+def print_summary(spans: List[Dict[str, Any]], by: str = 'name', top: int = 20):
+    if not spans:
+        print("没有 span")
+        return
+    start = min(item['ts'] for item in spans)
+    end = max(item['ts'] + item.get('dur', 0.0) for item in spans)
+    sessions = {item.get('session_id') for item in spans if item.get('session_id')}
+    print(f"{len(spans)} 个 span，{len(sessions)} 个会话，时间跨度 {end - start:.1f}s")
+    print(f"{'group':<48} {'count':>7} {'total(s)':>10} {'mean(s)':>9} {'p95(s)':>9} {'max(s)':>9} "
+          f"{'errors':>6} {'out(KB)':>9} {'tokens':>10}")
+    for row in summarize(spans, by, top):
+        print(f"{row['group'][:48]:<48} {row['count']:>7} {row['total']:>10.1f} {row['mean']:>9.2f} "
+              f"{row['p95']:>9.2f} {row['max']:>9.2f} {row['errors']:>6} {row['bytes_out'] / 1024:>9.1f} "
+              f"{row['tokens']:>10}")
+
+
+def to_chrome_trace(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """转换为 Chrome trace（每个会话一条轨道；没有会话的 span 按进程 / 线程分轨）"""
+    lanes = {}
+    events = []
+    base_keys = {'name', 'cat', 'ts', 'dur', 'pid', 'tid'}
+    for item in spans:
+        lane = item.get('session_id') or f"{item.get('pid')}:{item.get('tid')}"
+        if lane not in lanes:
+            lanes[lane] = len(lanes) + 1
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': lanes[lane], 'args': {'name': lane}})
+        events.append({
+            'name': item.get('name'),
+            'cat': item.get('cat'),
+            'ph': 'X',
+            'ts': int(item['ts'] * 1e6),
+            'dur': int(item.get('dur', 0.0) * 1e6),
+            'pid': 1,
+            'tid': lanes[lane],
+            'args': {key: value for key, value in item.items() if key not in base_keys},
+        })
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='汇总 / 导出 TRACE_DIR 中的 span')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    summary_parser = subparsers.add_parser('summary', help='列出耗时最多的项')
+    summary_parser.add_argument('paths', nargs='+', help='TRACE_DIR 目录或 .jsonl 文件')
+    summary_parser.add_argument('--by', default='name', choices=['name', 'cat', 'metric', 'project_id', 'session_id'],
+                                help='分组方式，默认 name（类别/名称）')
+    summary_parser.add_argument('--top', type=int, default=20, help='显示的组数，0 表示全部')
+
+    chrome_parser = subparsers.add_parser('chrome', help='导出为 Chrome trace JSON')
+    chrome_parser.add_argument('paths', nargs='+', help='TRACE_DIR 目录或 .jsonl 文件')
+    chrome_parser.add_argument('-o', '--output', default='trace.json', help='输出文件')
+
+    args = parser.parse_args()
+    spans = load_spans(args.paths)
+    if args.command == 'summary':
+        print_summary(spans, args.by, args.top)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(to_chrome_trace(spans), f, ensure_ascii=False)
+        print(f"已导出 {len(spans)} 个 span 到 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,22 @@
 #!/usr/bin/env python3
 import os
 import sys
-import shutil
 import argparse
 
+from materialize import SOURCE_MODES, Materializer
 
-def copy_project_files(source_dir, target_dir):
+
+def copy_project_files(source_dir, target_dir, link_mode='reflink'):
     """
     复制项目文件夹中的特定文件和目录到目标路径
 
     Args:
         source_dir: 原文件路径
         target_dir: 目标路径
+        link_mode: 文件放置方式（见 materialize.Materializer）：reflink 或复制；工作目录会被 agent 写入，不与基准源目录硬链接
     """
+    materializer = Materializer(link_mode)
+
     # 确保目标目录存在
     if not os.path.exists(target_dir):
         os.makedirs(target_dir)
@@ -48,9 +52,10 @@ def copy_project_files(source_dir, target_dir):
                     os.makedirs(src_dir_target)
 
                 # 复制 PRD.md 文件
-                shutil.copy2(
+                materializer.copy_file(
                     os.path.join(src_dir_source, prd_file),
-                    os.path.join(src_dir_target, prd_file)
+                    os.path.join(src_dir_target, prd_file),
+                    target_dir
                 )
                 print(f"已复制 {project}/src/{prd_file}")
             else:
@@ -64,15 +69,20 @@ def copy_project_files(source_dir, target_dir):
 
         # if os.path.exists(eval_dir_source):
         #     # 复制整个 evaluation 目录
-        #     shutil.copytree(eval_dir_source, eval_dir_target)
+        #     materializer.copy_tree(eval_dir_source, eval_dir_target, target_dir)
         #     print(f"已复制 {project}/evaluation 目录")
         # else:
         #     print(f"警告: {project} 中不存在 evaluation 目录")
 
+    materializer.write_manifest(target_dir, source_dir)
+    print(materializer.summary())
+
 def main():
     parser = argparse.ArgumentParser(description='复制项目文件夹中的特定文件和目录')
     parser.add_argument('source_dir', help='原文件路径')
     parser.add_argument('target_dir', help='目标路径')
+    parser.add_argument('--link_mode', choices=SOURCE_MODES, default='reflink',
+                       help='reflink: 文件系统支持时 reflink，否则复制；copy: 全部复制')
 
     args = parser.parse_args()
 
@@ -80,7 +90,7 @@ def main():
         print(f"错误: 源目录 '{args.source_dir}' 不存在")
         sys.exit(1)
 
-    copy_project_files(args.source_dir, args.target_dir)
+    copy_project_files(args.source_dir, args.target_dir, args.link_mode)
     print("复制完成!")
 
 if __name__ == "__main__":
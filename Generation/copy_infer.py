@@ -5,7 +5,9 @@ import shutil
 import argparse
 import json
 
-def copy_project_files(source_dir, target_dir, aux_data_path=None):
+from materialize import SOURCE_MODES, Materializer
+
+def copy_project_files(source_dir, target_dir, aux_data_path=None, link_mode='reflink'):
     """
     复制项目文件夹中的特定文件和目录到目标路径
 
@@ -13,7 +15,10 @@ def copy_project_files(source_dir, target_dir, aux_data_path=None):
         source_dir: 原文件路径
         target_dir: 目标路径
         aux_data_path: aux_data.json 文件路径，用于复制额外文件
+        link_mode: 文件放置方式（见 materialize.Materializer）：reflink 或复制；工作目录会被 agent 写入，不与基准源目录硬链接
     """
+    materializer = Materializer(link_mode)
+
     # 确保目标目录存在
     if not os.path.exists(target_dir):
         os.makedirs(target_dir)
@@ -61,9 +66,10 @@ def copy_project_files(source_dir, target_dir, aux_data_path=None):
                     os.makedirs(src_dir_target)
 
                 # 复制 PRD.md 文件
-                shutil.copy2(
+                materializer.copy_file(
                     os.path.join(src_dir_source, prd_file),
-                    os.path.join(src_dir_target, prd_file)
+                    os.path.join(src_dir_target, prd_file),
+                    target_dir
                 )
                 print(f"已复制 {project}/src/{prd_file}")
             else:
@@ -77,7 +83,7 @@ def copy_project_files(source_dir, target_dir, aux_data_path=None):
 
         if os.path.exists(eval_dir_source):
             # 复制整个 evaluation 目录
-            shutil.copytree(eval_dir_source, eval_dir_target)
+            materializer.copy_tree(eval_dir_source, eval_dir_target, target_dir)
             print(f"已复制 {project}/evaluation 目录")
         else:
             print(f"警告: {project} 中不存在 evaluation 目录")
@@ -100,14 +106,18 @@ def copy_project_files(source_dir, target_dir, aux_data_path=None):
                         if os.path.isdir(source_file):
                             if os.path.exists(target_file):
                                 shutil.rmtree(target_file)
-                            shutil.copytree(source_file, target_file)
+                            materializer.copy_tree(source_file, target_file, target_dir)
                             print(f"已复制 {project}/{file_path} (目录)")
                         else:
-                            shutil.copy2(source_file, target_file)
+                            materializer.copy_file(source_file, target_file, target_dir)
                             print(f"已复制 {project}/{file_path}")
                     else:
                         print(f"警告: 额外文件不存在: {project}/{file_path}")
 
+    # 记录不可变输入的哈希，评测前可用 materialize.py verify 检查是否被改动
+    materializer.write_manifest(target_dir, source_dir)
+    print(materializer.summary())
+
 def main():
     parser = argparse.ArgumentParser(description='复制项目文件夹中的特定文件和目录')
     parser.add_argument('source_dir', help='原文件路径')
@@ -115,6 +125,8 @@ def main():
     parser.add_argument('--aux_data', 
                        default='/work/Generation/aux_data.json',
                        help='aux_data.json 文件路径')
+    parser.add_argument('--link_mode', choices=SOURCE_MODES, default='reflink',
+                       help='reflink: 文件系统支持时 reflink，否则复制；copy: 全部复制')
 
     args = parser.parse_args()
 
@@ -122,7 +134,7 @@ def main():
         print(f"错误: 源目录 '{args.source_dir}' 不存在")
         sys.exit(1)
 
-    copy_project_files(args.source_dir, args.target_dir, args.aux_data)
+    copy_project_files(args.source_dir, args.target_dir, args.aux_data, args.link_mode)
     print("复制完成!")
 
 if __name__ == "__main__":
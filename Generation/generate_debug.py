@@ -1,71 +1,33 @@
-import requests
 import json
 import argparse
 import os
+from adk_client import base_urls_from_ports, get_sync_client
 import sys
-def construct_session(local_port, model_name, session_id):
-    delete_url = f"http://localhost:{local_port}/apps/code_agent_local/users/{model_name}/sessions/s_{session_id}"
-    try:
-        delete_response = requests.delete(delete_url, headers={"Content-Type": "application/json"})
-        print(f"删除会话响应状态码: {delete_response.status_code}")
-    except requests.exceptions.RequestException as e:
-        print(f"删除会话时网络请求错误: {e}")
+APP_NAME = "code_agent_local"
 
-    create_url = f"http://localhost:{local_port}/apps/code_agent_local/users/{model_name}/sessions/s_{session_id}"
-    try:
-        response = requests.post(create_url, headers={"Content-Type": "application/json"})
-        print(f"创建会话响应状态码: {response.status_code}")
-        print(f"创建会话响应内容: {response.text}")
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"网络请求错误: {e}")
-        return {"error": "network_error", "message": str(e)}
-    except json.JSONDecodeError as e:
-        print(f"JSON解析错误: {e}")
-        print(f"响应内容: {response.text}")
-        return {"error": "json_decode_error", "text": response.text}
+def construct_session(local_port, model_name, session_id):
+    # 先删除同名会话再创建
+    client = get_sync_client(base_urls_from_ports(local_port), APP_NAME, model_name)
+    response = client.create_session(f"s_{session_id}")
+    print(f"创建会话响应内容: {response}")
+    return response
 
-def make_query(local_port, model_name, session_id, prompt_data):
-    url = f"http://localhost:{local_port}/run"
-    data = {
-        "appName": "code_agent_local",
-        "userId": model_name,
-        "sessionId": f"s_{session_id}",
-        "newMessage": {
-            "role": "user",
-            "parts": [{
-                "text": prompt_data
-            }]
-        }
-    }
-    try:
-        response = requests.post(url, headers={"Content-Type": "application/json"}, json=data)
-        print(f"查询响应状态码: {response.status_code}")
-        print(f"查询响应内容: {response.text}")
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"网络请求错误: {e}")
-        return {"error": "network_error", "message": str(e)}
-    except json.JSONDecodeError as e:
-        print(f"JSON解析错误: {e}")
-        print(f"响应内容: {str(response)}")
-        return {"error": "json_decode_error", "text": str(response)}
+def make_query(local_port, model_name, session_id, prompt_data, timeout=None):
+    client = get_sync_client(base_urls_from_ports(local_port), APP_NAME, model_name)
+    response = client.run(f"s_{session_id}", prompt_data, timeout=timeout)
+    print(f"查询响应内容: {response}")
+    return response
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Interact with code agent via HTTP API.")
-    parser.add_argument("--local_port", type=str, default="9090", help="Local server port")
+    parser.add_argument("--local_port", type=str, default="9090", help="Local server port，多个端口用逗号分隔（组成服务池）")
     parser.add_argument("--model_name", type=str, default="gpt_5", help="Model name")
     parser.add_argument("--session_id", type=str, default="9", help="Session ID")
     parser.add_argument("--ID", type=str, default="9", help="Project ID")
     parser.add_argument("--project_path", type=str, default="/work/workspace_debug/ADK_gpt_5_Debug_inference/9", help="Project path")
     parser.add_argument("--prompt", type=str, default=None, help="Prompt data to send")
     parser.add_argument("--prompt_file", type=str, default=None, help="Path to file containing prompt text")
+    parser.add_argument("--run_timeout", type=int, default=7200, help="Deadline of the /run request in seconds")
     args = parser.parse_args()
     if not os.path.exists(args.project_path):
         sys.exit(0)
@@ -99,7 +61,7 @@ Please analyze the items in the score report where points were deducted, and mod
         prompt_data = default_prompt_template.format(ID=args.ID, project_path=args.project_path)
 
     session_response = construct_session(args.local_port, args.model_name, args.session_id)
-    query_response = make_query(args.local_port, args.model_name, args.session_id, prompt_data)
+    query_response = make_query(args.local_port, args.model_name, args.session_id, prompt_data, args.run_timeout)
     print("Session response:", session_response)
     print("Query response:", query_response)
     output_path = os.path.join(args.project_path, "query_response.json")
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+工作目录的写时复制物化（materialize）
+
+copy_infer.py 为每个项目 copytree 整个 evaluation/ 目录，Evaluation_infer.sh 又把整个推理工作目录 cp -r 到 _eval，
+模型数 × 轮数之后是几个 GB 的重复测试数据和数分钟的复制时间。这里按文件选择放置方式：
+  - reflink：文件系统支持时（btrfs / xfs reflink / bcachefs 等）使用 FICLONE 共享数据块，写入时才复制，所有文件都可用
+  - hardlink：不支持 reflink 时，只对不可变的输入（.in、测试数据、期望输出等，见 IMMUTABLE_PATTERNS）建立硬链接
+  - copy：其余可能被写入的文件（src/ 代码、测试脚本、测试计划等）照常复制
+硬链接与源文件共享同一个 inode，被原地改写会同时改动所有工作目录中的副本，因此只在派生的工作目录之间使用
+（推理工作目录 -> 评测工作目录）；从 PRDbench 等基准源目录复制（copy_infer.py / copy_free.py）只用 reflink 或复制，
+agent 的写入不会改动基准数据。
+测试计划（evaluation/detailed_test_plan.json）中测试命令会写入的文件（如 -o evaluation/expected_chart.png、
+> 重定向、cp 的目标）即使匹配 IMMUTABLE_PATTERNS 也按普通文件处理：不硬链接，也不记录到清单。
+物化时把不可变输入的 sha256 记录到清单（MANIFEST_NAME），verify 重新计算并报告被改动的文件（只报告，不中止评测）。
+源目录已有清单时（例如 copy_infer.py 生成的推理工作目录），新清单沿用其中的原始哈希，在推理阶段就被改动的输入同样会被发现。
+overlayfs 等分层挂载需要 mount 权限，这里不使用；reflink 在文件粒度上提供同样的写时复制语义。
+
+用法：
+  python Generation/materialize.py verify /work/workspace/gpt_5_Dev_inference
+  python Generation/materialize.py tree /work/workspace/gpt_5_Dev_inference /work/workspace/gpt_5_Dev_inference_eval
+  python Generation/materialize.py verify /work/workspace/gpt_5_Dev_inference_eval
+"""
+
+import argparse
+import errno
+import fcntl
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import shlex
+import shutil
+import sys
+import time
+
+MANIFEST_NAME = '.materialize_manifest.json'
+
+# 不可变输入：匹配 "/" + 相对路径（fnmatch 的 * 可以跨目录），可以安全地硬链接
+IMMUTABLE_PATTERNS = [
+    '*/evaluation/*.in',
+    '*/evaluation/inputs/*',
+    '*/evaluation/input_files/*',
+    '*/evaluation/test_inputs/*',
+    '*/evaluation/test_input/*',
+    '*/evaluation/DoneInputs/*',
+    '*/evaluation/test_data/*',
+    '*/evaluation/data/*',
+    '*/evaluation/golden_data/*',
+    '*/evaluation/invalid_data/*',
+    '*/evaluation/sample_data.*',
+    '*/evaluation/expected_*',
+]
+
+TEST_PLAN = 'evaluation/detailed_test_plan.json'
+# 测试命令中指定输出文件 / 目录的参数：-o、--output、--output-path、--output_dir、--jump_output_path 等
+OUTPUT_FLAG = re.compile(r'^(-o|--(?:[\w-]+[-_])?(?:out|output)(?:[-_](?:path|dir|file|directory))?)$')
+# 分隔简单命令的 shell 运算符
+SHELL_SEPARATORS = {'&&', '||', ';', '|', '&', '(', ')'}
+REDIRECTIONS = {'>', '>>', '<', '>&', '&>'}
+
+MODES = ('auto', 'reflink', 'hardlink', 'copy')
+# 从基准源目录复制到 agent 可写的工作目录时可用的方式（不硬链接）
+SOURCE_MODES = ('reflink', 'copy')
+
+# linux/fs.h: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+# reflink 不支持时 ioctl 返回的错误码
+REFLINK_UNSUPPORTED = {errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EPERM}
+
+HASH_CHUNK = 1024 * 1024
+
+
+def reflink(src, dst):
+    """用 FICLONE 创建 dst 作为 src 的写时复制副本；文件系统不支持时返回 False（不留下 dst）"""
+    with open(src, 'rb') as fsrc:
+        fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            fcntl.ioctl(fd, FICLONE, fsrc.fileno())
+        except OSError as e:
+            os.close(fd)
+            os.unlink(dst)
+            if e.errno in REFLINK_UNSUPPORTED:
+                return False
+            raise
+        os.close(fd)
+    shutil.copystat(src, dst)
+    return True
+
+
+def command_outputs(command):
+    """
+    测试命令会写入的路径（相对项目目录）：输出参数的值、> / >> 重定向的目标、cp / mv 的目标，会跟踪 cd
+    无法解析的命令返回空列表
+    """
+    try:
+        lexer = shlex.shlex(command, posix=True, punctuation_chars=True)
+        lexer.whitespace_split = True
+        tokens = list(lexer)
+    except ValueError:
+        return []
+
+    commands = [[]]
+    for token in tokens:
+        if token in SHELL_SEPARATORS:
+            commands.append([])
+        else:
+            commands[-1].append(token)
+
+    cwd = ''
+    outputs = []
+
+    def add(value):
+        path = os.path.normpath(os.path.join(cwd, value))
+        if not os.path.isabs(path) and path != '.' and not path.startswith('..'):
+            outputs.append(path.replace(os.sep, '/'))
+
+    for words in commands:
+        if not words:
+            continue
+        if words[0] == 'cd':
+            if len(words) > 1:
+                cwd = os.path.normpath(os.path.join(cwd, words[1]))
+            continue
+        for i, word in enumerate(words):
+            flag, sep, value = word.partition('=')
+            if word in ('>', '>>') and i + 1 < len(words):
+                add(words[i + 1])
+            elif sep and OUTPUT_FLAG.match(flag) and value:
+                add(value)
+            elif OUTPUT_FLAG.match(word) and i + 1 < len(words):
+                add(words[i + 1])
+        if words[0] in ('cp', 'mv'):
+            # 重定向之前的最后一个非选项参数是目标（去掉 2>/dev/null 中的文件描述符）
+            end = next((i for i, word in enumerate(words) if word in REDIRECTIONS), len(words))
+            args = [word for word in words[1:end] if not word.startswith('-')]
+            if end < len(words) and args and args[-1].isdigit():
+                args.pop()
+            if len(args) >= 2:
+                add(args[-1])
+    return outputs
+
+
+def written_paths(project_dir):
+    """项目测试计划中各测试命令会写入的路径集合（相对项目目录）"""
+    plan_path = os.path.join(project_dir, TEST_PLAN)
+    try:
+        with open(plan_path, 'r', encoding='utf-8') as f:
+            plan = json.load(f)
+    except (OSError, ValueError):
+        return set()
+    written = set()
+    for metric in plan if isinstance(plan, list) else []:
+        for testcase in (metric.get('testcases') or []) if isinstance(metric, dict) else []:
+            command = testcase.get('test_command') if isinstance(testcase, dict) else None
+            if isinstance(command, str):
+                written.update(command_outputs(command))
+    return written
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Materializer:
+    """
+    把源文件放置到目标工作目录，并在清单中记录不可变输入的哈希
+
+    Args:
+        mode: auto（reflink > 不可变文件硬链接 > 复制）、reflink（reflink > 复制，从不硬链接）、
+              hardlink（不尝试 reflink）、copy（全部复制，与原来的行为一致）
+        immutable: 不可变文件模式（可以硬链接，记录到清单），默认 IMMUTABLE_PATTERNS
+        baseline: 源目录清单中的条目 {相对路径: 清单条目}，这些文件沿用其中的原始哈希而不重新计算
+    """
+
+    def __init__(self, mode='auto', immutable=None, baseline=None):
+        if mode not in MODES:
+            raise ValueError(f"未知的物化方式: {mode}（可选 {', '.join(MODES)}）")
+        self.mode = mode
+        self.immutable = IMMUTABLE_PATTERNS if immutable is None else list(immutable)
+        self.baseline = baseline or {}
+        # 目标根目录 -> {相对路径: 清单条目}
+        self.tracked = {}
+        # 目标根目录 -> 本次按普通文件放置的相对路径（从已有清单中移除）
+        self.untracked = {}
+        self.stats = {'reflink': 0, 'hardlink': 0, 'copy': 0, 'shared_bytes': 0, 'copied_bytes': 0}
+        # 不支持 reflink 的 (源设备, 目标设备)，避免对每个文件重复尝试
+        self._no_reflink = set()
+        # (设备, inode, 大小, mtime) -> sha256，同一源文件被物化到多个目录时只计算一次
+        self._hashes = {}
+        # 源项目目录 -> 测试命令会写入的路径集合
+        self._written = {}
+
+    def is_immutable(self, rel_path):
+        path = '/' + rel_path.replace(os.sep, '/')
+        return any(fnmatch.fnmatch(path, pattern) for pattern in self.immutable)
+
+    def is_written(self, src, rel_path):
+        """src 是否会被所在项目的测试命令写入（按源项目的测试计划判断）"""
+        path = '/' + rel_path.replace(os.sep, '/')
+        index = path.find('/evaluation/')
+        if index < 0:
+            return False
+        # 项目内的相对路径（evaluation/...），源文件以同样的相对路径位于源项目目录下
+        project_path = path[index + 1:]
+        src_path = os.path.abspath(src).replace(os.sep, '/')
+        if not src_path.endswith('/' + project_path):
+            return False
+        project_dir = src_path[:-len(project_path) - 1]
+        if project_dir not in self._written:
+            self._written[project_dir] = written_paths(project_dir)
+        return any(project_path == written or project_path.startswith(written + '/')
+                   for written in self._written[project_dir])
+
+    def _hash(self, path, stat):
+        key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        if key not in self._hashes:
+            self._hashes[key] = file_sha256(path)
+        return self._hashes[key]
+
+    def place_file(self, src, dst, root, rel_path):
+        """
+        放置单个文件，返回使用的方式（reflink / hardlink / copy）
+
+        Args:
+            src: 源文件
+            dst: 目标文件（已存在时先删除，不会写穿到之前链接的源文件）
+            root: 目标根目录（清单所在目录）
+            rel_path: dst 相对 root 的路径
+        """
+        os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+        if os.path.lexists(dst):
+            os.unlink(dst)
+        if os.path.islink(src):
+            os.symlink(os.readlink(src), dst)
+            self.stats['copy'] += 1
+            return 'copy'
+
+        stat = os.stat(src)
+        devices = (stat.st_dev, os.stat(os.path.dirname(dst) or '.').st_dev)
+        immutable = self.is_immutable(rel_path) and not self.is_written(src, rel_path)
+        method = 'copy'
+        if self.mode in ('auto', 'reflink') and devices not in self._no_reflink:
+            if reflink(src, dst):
+                method = 'reflink'
+            else:
+                self._no_reflink.add(devices)
+        if method == 'copy' and self.mode in ('auto', 'hardlink') and immutable:
+            try:
+                os.link(src, dst)
+                method = 'hardlink'
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                    raise
+        if method == 'copy':
+            shutil.copy2(src, dst)
+            self.stats['copied_bytes'] += stat.st_size
+        else:
+            self.stats['shared_bytes'] += stat.st_size
+        self.stats[method] += 1
+
+        if immutable:
+            key = rel_path.replace(os.sep, '/')
+            if key in self.baseline:
+                # 沿用源目录清单中的原始哈希：源文件在此之前被改动时，目标目录的 verify 也会报告
+                entry = dict(self.baseline[key])
+            else:
+                entry = {'sha256': self._hash(src, stat), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+            entry.update(source=os.path.abspath(src), method=method)
+            self.tracked.setdefault(root, {})[key] = entry
+        else:
+            self.untracked.setdefault(root, set()).add(rel_path.replace(os.sep, '/'))
+        return method
+
+    def copy_file(self, src, dst, root):
+        """相当于 shutil.copy2(src, dst)"""
+        return self.place_file(src, dst, root, os.path.relpath(dst, root))
+
+    def copy_tree(self, src_dir, dst_dir, root=None):
+        """
+        相当于 shutil.copytree(src_dir, dst_dir)（目标已存在时合并），返回放置的文件数
+
+        Args:
+            root: 目标根目录（清单所在目录），默认为 dst_dir
+        """
+        root = root or dst_dir
+        count = 0
+        for dirpath, dirnames, filenames in os.walk(src_dir):
+            rel_dir = os.path.relpath(dirpath, src_dir)
+            target_dir = os.path.normpath(os.path.join(dst_dir, rel_dir))
+            os.makedirs(target_dir, exist_ok=True)
+            # 指向目录的符号链接按链接复制，不进入遍历
+            for name in list(dirnames):
+                if os.path.islink(os.path.join(dirpath, name)):
+                    dirnames.remove(name)
+                    filenames.append(name)
+            for name in filenames:
+                if name == MANIFEST_NAME:
+                    continue
+                target = os.path.join(target_dir, name)
+                self.place_file(os.path.join(dirpath, name), target, root, os.path.relpath(target, root))
+                count += 1
+            shutil.copystat(dirpath, target_dir)
+        return count
+
+    def write_manifest(self, root, source=None):
+        """写入 root 的不可变输入清单（与已有清单合并）"""
+        path = os.path.join(root, MANIFEST_NAME)
+        manifest = load_manifest(root) or {'version': 1, 'files': {}}
+        for key in self.untracked.get(root, ()):
+            manifest['files'].pop(key, None)
+        manifest['files'].update(self.tracked.get(root, {}))
+        manifest.update({
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'mode': self.mode,
+            'stats': self.stats,
+        })
+        if source:
+            manifest['source'] = os.path.abspath(source)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        return path
+
+    def summary(self):
+        s = self.stats
+        return (f"reflink {s['reflink']}，硬链接 {s['hardlink']}，复制 {s['copy']}；"
+                f"共享 {s['shared_bytes'] / 1024 / 1024:.1f} MB，复制 {s['copied_bytes'] / 1024 / 1024:.1f} MB")
+
+
+def load_manifest(root):
+    path = os.path.join(root, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def verify(root, quick=False):
+    """
+    检查清单中的不可变输入是否被改动
+
+    Args:
+        quick: 只比较大小和修改时间，不重新计算 sha256
+
+    Returns:
+        list: [(相对路径, 问题说明)]，为空表示未发现改动
+    """
+    manifest = load_manifest(root)
+    if manifest is None:
+        return []
+    problems = []
+    for rel_path, entry in sorted(manifest['files'].items()):
+        path = os.path.join(root, rel_path)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            problems.append((rel_path, "已删除"))
+            continue
+        unchanged_stat = stat.st_size == entry['size'] and stat.st_mtime_ns == entry['mtime_ns']
+        if quick:
+            changed = not unchanged_stat
+        else:
+            changed = file_sha256(path) != entry['sha256']
+        if not changed:
+            continue
+        try:
+            still_shared = os.path.samefile(path, entry['source'])
+        except OSError:
+            still_shared = False
+        if still_shared:
+            where = "，源文件和其他链接到它的工作目录也被改动"
+        elif entry.get('method', 'hardlink') == 'hardlink':
+            where = "（已不再与源文件共享）"
+        else:
+            where = ""
+        problems.append((rel_path, f"内容被改动{where}"))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='以 reflink / 硬链接物化工作目录，并校验共享文件是否被改动')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    tree_parser = subparsers.add_parser('tree', help='把 source 目录物化到 target（相当于 cp -r source/. target）')
+    tree_parser.add_argument('source', help='源目录')
+    tree_parser.add_argument('target', help='目标目录')
+    tree_parser.add_argument('--link_mode', choices=MODES, default='auto',
+                             help='auto: reflink > 不可变文件硬链接 > 复制；reflink: reflink > 复制；'
+                                  'hardlink: 不尝试 reflink；copy: 全部复制')
+
+    verify_parser = subparsers.add_parser('verify', help='校验 target 中的不可变输入是否被改动')
+    verify_parser.add_argument('target', help='物化得到的目录')
+    verify_parser.add_argument('--quick', action='store_true', help='只比较大小和修改时间')
+    verify_parser.add_argument('--strict', action='store_true', help='发现改动时以非零状态退出（默认只报告）')
+
+    args = parser.parse_args()
+
+    if args.command == 'tree':
+        if not os.path.isdir(args.source):
+            print(f"错误: 源目录 '{args.source}' 不存在")
+            sys.exit(1)
+        start_time = time.time()
+        source_manifest = load_manifest(args.source)
+        materializer = Materializer(args.link_mode, baseline=source_manifest['files'] if source_manifest else None)
+        count = materializer.copy_tree(args.source, args.target)
+        materializer.write_manifest(args.target, args.source)
+        print(f"已物化 {count} 个文件到 {args.target}（{materializer.summary()}），用时 {time.time() - start_time:.1f}s")
+    else:
+        problems = verify(args.target, args.quick)
+        for rel_path, reason in problems:
+            print(f"警告: 不可变输入 {rel_path} {reason}")
+        if problems:
+            projects = sorted({rel_path.split('/', 1)[0] for rel_path, _ in problems})
+            print(f"{len(problems)} 个不可变输入被改动，涉及项目: {', '.join(projects)}（这些项目的分数可能不可靠）")
+            if args.strict:
+                sys.exit(1)
+        else:
+            print("不可变输入未被改动")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+并发、可断点续跑的代码生成调度器（替代 experiment_dev.sh / experiment_free.sh 中的串行循环）
+
+- 多个项目同时向一个或多个 ADK 端口发起生成请求，同时在途的请求数由 --max_in_flight 限制；
+  多个端口组成服务池（adk_client.AdkServerPool），按在途请求最少分配，服务失效时自动切换
+- 进程内检测 network_error / "已重试 10 次" 等失败响应，按指数退避重新排队
+- 每次状态变化都写入状态文件，进程被杀后重新运行同一命令即可从中断处继续
+
+用法：
+  python Generation/run_generation.py --model_name gpt_5 --ports 8010,8011 --max_in_flight 8
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import generate_dev
+import generate_free
+from adk_client import AdkServerPool, base_urls_from_ports
+
+PROMPT_MODULES = {
+    'dev': generate_dev,
+    'free': generate_free,
+}
+DEFAULT_ROOT_PATHS = {
+    'dev': '/work/workspace/{model_name}_Dev_inference',
+    'free': 'workspace/{model_name}_Dev_free',
+}
+FAILURE_MARKERS = ('network_error', '已重试 10 次')
+STATE_FILENAME = '.generation_state.json'
+
+STATUS_PENDING = 'pending'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+def is_failed_response(content):
+    """与 delete_network_error.py 的判断一致：响应中出现网络错误或重试上限标记即视为失败"""
+    return any(marker in content for marker in FAILURE_MARKERS)
+
+
+def has_valid_response(project_path):
+    """项目目录下已有且不是失败的 query_response.json"""
+    query_response_path = os.path.join(project_path, "query_response.json")
+    if not os.path.exists(query_response_path):
+        return False
+    try:
+        with open(query_response_path, 'r', encoding='utf-8') as f:
+            return not is_failed_response(f.read())
+    except Exception:
+        return False
+
+
+class GenerationState:
+    """
+    生成任务状态，持久化到 JSON 文件
+    {"tasks": {"<ID>": {"status": ..., "attempts": n, "server": ..., "last_error": ..., "updated_at": ...}}}
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.tasks = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.tasks = json.load(f).get('tasks', {})
+
+    def get(self, task_id):
+        return self.tasks.setdefault(str(task_id), {"status": STATUS_PENDING, "attempts": 0})
+
+    def update(self, task_id, **fields):
+        task = self.get(task_id)
+        task.update(fields, updated_at=time.time())
+        self.save()
+
+    def save(self):
+        # 先写临时文件再替换，进程在写入过程中被杀也不会损坏状态文件
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"tasks": self.tasks}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+async def generate_one(task_id, project_path, prompt_module, pool, state, args, semaphore):
+    """生成单个项目，失败时退避后重新排队，直到成功或达到重试上限"""
+    task = state.get(task_id)
+    while True:
+        attempt = task["attempts"]
+        async with semaphore:
+            session_id = f"s_{task_id}"
+            start_time = time.time()
+            session_response = await pool.create_session(session_id)
+            server = pool.server_for(session_id)
+            state.update(task_id, status=STATUS_RUNNING, server=server)
+            print(f"[{task_id}] 开始生成（{server}，第 {attempt + 1} 次尝试）")
+            prompt = prompt_module.build_prompt(task_id, project_path, attempt)
+            query_response = await pool.run(session_id, prompt)
+
+        content = json.dumps(query_response, ensure_ascii=False)
+        elapsed = time.time() - start_time
+        attempts = attempt + 1
+        if not is_failed_response(content):
+            prompt_module.save_responses(project_path, session_response, query_response)
+            state.update(task_id, status=STATUS_DONE, attempts=attempts, last_error=None)
+            print(f"[{task_id}] ✓ 生成完成，耗时 {elapsed:.0f}秒")
+            return
+
+        last_error = content[:300]
+        if attempts > args.max_retries:
+            # 保留最后一次失败的响应，方便排查（delete_network_error.py 仍可识别并清理）
+            prompt_module.save_responses(project_path, session_response, query_response)
+            state.update(task_id, status=STATUS_FAILED, attempts=attempts, last_error=last_error)
+            print(f"[{task_id}] ✗ 重试 {args.max_retries} 次后仍失败: {last_error}")
+            return
+        state.update(task_id, status=STATUS_PENDING, attempts=attempts, last_error=last_error)
+        task = state.get(task_id)
+        # 退避期间不占用并发名额
+        delay = args.backoff * (2 ** (attempts - 1))
+        print(f"[{task_id}] 检测到失败响应，{delay:.0f}秒后重新排队: {last_error}")
+        await asyncio.sleep(delay)
+
+
+async def main_async(args):
+    prompt_module = PROMPT_MODULES[args.mode]
+    root_path = args.root_path or DEFAULT_ROOT_PATHS[args.mode].format(model_name=args.model_name)
+    state = GenerationState(args.state_file or os.path.join(root_path, STATE_FILENAME))
+
+    if args.ids:
+        task_ids = [task_id.strip() for task_id in args.ids.split(',') if task_id.strip()]
+    else:
+        task_ids = [str(i) for i in range(args.start_id, args.start_id + args.num_runs)]
+
+    pending = []
+    for task_id in task_ids:
+        project_path = os.path.join(root_path, task_id)
+        task = state.get(task_id)
+        if not os.path.isdir(project_path):
+            print(f"[{task_id}] 项目目录不存在，跳过: {project_path}")
+            continue
+        # 已有有效结果的项目直接跳过（与 generate_dev.py 的跳过逻辑一致）
+        if has_valid_response(project_path):
+            if task["status"] != STATUS_DONE:
+                state.update(task_id, status=STATUS_DONE)
+            continue
+        if task["status"] == STATUS_FAILED and not args.retry_failed:
+            print(f"[{task_id}] 上次已失败（{task.get('last_error')}），使用 --retry_failed 重新生成")
+            continue
+        if task["status"] in (STATUS_FAILED, STATUS_DONE):
+            task.update(status=STATUS_PENDING, attempts=0)
+        # 上次中断时仍在运行的任务按待生成处理，已用掉的重试次数保留
+        pending.append((task_id, project_path))
+    state.save()
+
+    base_urls = base_urls_from_ports(args.ports)
+    print(f"待生成项目: {len(pending)}/{len(task_ids)}，服务: {base_urls}，最大并发: {args.max_in_flight}")
+    pool = AdkServerPool(base_urls, args.app_name, args.model_name, run_timeout=args.run_timeout)
+    semaphore = asyncio.Semaphore(args.max_in_flight)
+    start_time = time.time()
+    try:
+        await asyncio.gather(*[generate_one(task_id, project_path, prompt_module, pool, state, args, semaphore)
+                               for task_id, project_path in pending])
+    finally:
+        await pool.close()
+
+    statuses = [state.get(task_id)["status"] for task_id in task_ids]
+    print("=" * 60)
+    print(f"生成完成，总耗时 {(time.time() - start_time) / 60:.1f}分钟")
+    print(f"  成功: {statuses.count(STATUS_DONE)}，失败: {statuses.count(STATUS_FAILED)}，"
+          f"未处理: {len(statuses) - statuses.count(STATUS_DONE) - statuses.count(STATUS_FAILED)}")
+    failed = [task_id for task_id in task_ids if state.get(task_id)["status"] == STATUS_FAILED]
+    if failed:
+        print(f"  失败的 ID: {' '.join(failed)}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="并发、可断点续跑的代码生成调度器")
+    parser.add_argument("--model_name", type=str, required=True, help="Model name")
+    parser.add_argument("--ports", type=str, required=True, help="ADK api_server 端口，多个用逗号分隔")
+    parser.add_argument("--mode", type=str, default="dev", choices=sorted(PROMPT_MODULES), help="使用的prompt模板")
+    parser.add_argument("--root_path", type=str, default=None, help="项目根目录，默认按mode和model_name推断")
+    parser.add_argument("--app_name", type=str, default=generate_dev.APP_NAME, help="ADK agent 包名")
+    parser.add_argument("--start_id", type=int, default=1, help="起始项目ID")
+    parser.add_argument("--num_runs", type=int, default=50, help="项目数量")
+    parser.add_argument("--ids", type=str, default=None, help="只生成指定ID（逗号分隔），优先于start_id/num_runs")
+    parser.add_argument("--max_in_flight", type=int, default=4, help="同时在途的生成请求数")
+    parser.add_argument("--max_retries", type=int, default=3, help="失败响应的最大重试次数")
+    parser.add_argument("--backoff", type=float, default=30, help="重试退避的基础时间（秒），按2的幂增长")
+    parser.add_argument("--run_timeout", type=int, default=7200, help="单次/run请求的截止时间（秒）")
+    parser.add_argument("--state_file", type=str, default=None, help=f"状态文件路径，默认为 root_path/{STATE_FILENAME}")
+    parser.add_argument("--retry_failed", action="store_true", help="重新生成上次运行中最终失败的项目")
+    args = parser.parse_args()
+
+    asyncio.run(main_async(args))